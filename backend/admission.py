@@ -0,0 +1,357 @@
+"""
+AFRO-GENOMICS Research Platform
+Request Admission Control
+
+Every API request passes two checks before it reaches a route handler (and
+the worker threadpool):
+
+1. Token buckets per user and per institution (read from the access token;
+   unauthenticated requests are keyed by client address). A request costs
+   ADMISSION_COSTS[route class] tokens from both buckets or is rejected.
+2. A concurrency limit per route class: cheap reads, writes, and compute
+   (exports, cohort queries, PCA, chain verification, password checks).
+   Requests over the limit wait in a FIFO queue for at most
+   ADMISSION_QUEUE_SECONDS[class]; a full queue or an expired wait rejects.
+
+Rejections are 429 with Retry-After. Buckets live in worker memory by
+default; ADMISSION_STORE=sqlite shares them between the workers of one host
+through a small SQLite file. Concurrency limits are always per worker, since
+they protect that worker's threadpool. Health, metrics, docs and the event
+stream (which has its own connection cap) are not limited. Change feed long
+polls (class poll) take tokens but no concurrency slot: they wait on the
+event loop rather than in the threadpool and have their own cap.
+"""
+
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, Dict, List, Optional, Tuple
+
+from auth import token_claims
+from instrumentation import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _per_class(value: str) -> Dict[str, float]:
+    return {name.strip(): float(n) for name, n in (item.split("=", 1) for item in value.split(",") if "=" in item)}
+
+
+# Configuration
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_USER_RATE = float(os.getenv("ADMISSION_USER_RATE", "20"))  # Tokens per second
+ADMISSION_USER_BURST = float(os.getenv("ADMISSION_USER_BURST", "40"))
+ADMISSION_INSTITUTION_RATE = float(os.getenv("ADMISSION_INSTITUTION_RATE", "100"))
+ADMISSION_INSTITUTION_BURST = float(os.getenv("ADMISSION_INSTITUTION_BURST", "200"))
+ADMISSION_COSTS = _per_class(os.getenv("ADMISSION_COSTS", "read=1,write=1,compute=5"))
+ADMISSION_CONCURRENCY = _per_class(os.getenv("ADMISSION_CONCURRENCY", "read=24,write=8,compute=2"))
+ADMISSION_QUEUE_SECONDS = _per_class(os.getenv("ADMISSION_QUEUE_SECONDS", "read=1,write=2,compute=5"))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "64"))  # Waiting requests per class and worker
+ADMISSION_STORE = os.getenv("ADMISSION_STORE", "memory")  # memory | sqlite
+ADMISSION_STORE_PATH = os.getenv(
+    "ADMISSION_STORE_PATH", os.path.join(tempfile.gettempdir(), "afro-genomics-admission.db")
+)
+
+# (method or None for any, path pattern, class); first match wins, the rest is read (GET) or write
+ROUTE_CLASSES: List[Tuple[Optional[str], "re.Pattern", Optional[str]]] = [
+    (None, re.compile(r"^/api/v1/(health|metrics|docs|redoc|openapi\.json)"), None),
+    ("GET", re.compile(r"^/api/v1/samples/events$"), None),
+    ("GET", re.compile(r"^/api/v1/changes$"), "poll"),
+    ("POST", re.compile(r"^/api/v1/auth/login$"), "compute"),
+    ("POST", re.compile(
+        r"^/api/v1/(data-export|cohorts/query|ancestry/pca|ancestry/recompute|consent/withdraw-batch)$"
+    ), "compute"),
+    ("GET", re.compile(r"^/api/v1/audit-logs/verify$"), "compute"),
+]
+
+# Every this many takes, buckets idle long enough to be full again are forgotten
+_PRUNE_EVERY = 4096
+
+metrics.counter("admission_decisions_total", "Admission decisions by route class, decision and reason")
+metrics.gauge("admission_in_flight", "Admitted requests being served per route class")
+metrics.gauge("admission_queued", "Requests waiting for a concurrency slot per route class")
+metrics.histogram(
+    "admission_queue_wait_seconds", "Time admitted requests waited for a slot",
+    (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+
+
+def route_class(method: str, path: str) -> Optional[str]:
+    """Route class of a request, or None if it is not limited"""
+    for route_method, pattern, name in ROUTE_CLASSES:
+        if (route_method is None or route_method == method) and pattern.match(path):
+            return name
+    if not path.startswith("/api/"):
+        return None
+    return "read" if method in ("GET", "HEAD") else "write"
+
+
+# ==================== TOKEN BUCKETS ====================
+
+Bucket = Tuple[str, float, float]  # (key, rate per second, burst)
+
+
+def _refill(tokens: float, stamp: float, now: float, rate: float, burst: float) -> float:
+    return min(burst, tokens + max(0.0, now - stamp) * rate)
+
+
+def _idle_horizon() -> float:
+    """Seconds after which any idle bucket is full again"""
+    return max(ADMISSION_USER_BURST / ADMISSION_USER_RATE, ADMISSION_INSTITUTION_BURST / ADMISSION_INSTITUTION_RATE)
+
+
+def _shortfall(buckets: List[Bucket], levels: List[float], cost: float) -> Tuple[float, Optional[str]]:
+    """Longest wait for any bucket to afford `cost`, and that bucket's key"""
+    wait, limiting = 0.0, None
+    for level, (key, rate, _) in zip(levels, buckets):
+        if (cost - level) / rate > wait:
+            wait, limiting = (cost - level) / rate, key
+    return wait, limiting
+
+
+class MemoryBucketStore:
+    """Buckets in this worker's memory"""
+
+    blocking = False
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}  # key -> (tokens, stamp)
+        self._lock = threading.Lock()
+        self._takes = 0
+
+    def take(self, buckets: List[Bucket], cost: float, now: float) -> Tuple[float, Optional[str]]:
+        """
+        Take `cost` tokens from every bucket, or from none
+
+        Returns:
+            (0, None) if taken, else (seconds until it could be, key of the limiting bucket)
+        """
+        with self._lock:
+            levels = []
+            for key, rate, burst in buckets:
+                tokens, stamp = self._buckets.get(key, (burst, now))
+                levels.append(_refill(tokens, stamp, now, rate, burst))
+            wait, limiting = _shortfall(buckets, levels, cost)
+            if wait > 0:
+                return wait, limiting
+            for level, (key, _, _) in zip(levels, buckets):
+                self._buckets[key] = (level - cost, now)
+            self._takes += 1
+            if self._takes % _PRUNE_EVERY == 0:
+                self._prune(now)
+        return 0.0, None
+
+    def _prune(self, now: float):
+        horizon = _idle_horizon()
+        self._buckets = {key: value for key, value in self._buckets.items() if now - value[1] < horizon}
+
+
+class SqliteBucketStore:
+    """
+    Buckets in a SQLite file shared by the workers of one host
+
+    Each take is one IMMEDIATE transaction, so concurrent workers serialize
+    on the file lock. Calls run on a dedicated thread, off the event loop.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str = ADMISSION_STORE_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._takes = 0
+
+    def executor(self) -> ThreadPoolExecutor:
+        # Created on first use, i.e. in the worker process after fork
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="admission-store")
+        return self._executor
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")  # Losing buckets in a crash only refills them
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, stamp REAL)")
+            self._conn = conn
+        return self._conn
+
+    def take(self, buckets: List[Bucket], cost: float, now: float) -> Tuple[float, Optional[str]]:
+        conn = self._connect()
+        keys = [key for key, _, _ in buckets]
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            stored = dict(
+                (key, (tokens, stamp)) for key, tokens, stamp in conn.execute(
+                    f"SELECT key, tokens, stamp FROM buckets WHERE key IN ({','.join('?' * len(keys))})", keys
+                )
+            )
+            levels = []
+            for key, rate, burst in buckets:
+                tokens, stamp = stored.get(key, (burst, now))
+                levels.append(_refill(tokens, stamp, now, rate, burst))
+            wait, limiting = _shortfall(buckets, levels, cost)
+            if wait <= 0:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO buckets (key, tokens, stamp) VALUES (?, ?, ?)",
+                    [(key, level - cost, now) for level, (key, _, _) in zip(levels, buckets)]
+                )
+                self._takes += 1
+                if self._takes % _PRUNE_EVERY == 0:
+                    conn.execute("DELETE FROM buckets WHERE stamp < ?", (now - _idle_horizon(),))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait, limiting
+
+
+# ==================== CONCURRENCY LIMITS ====================
+
+class ConcurrencyLimit:
+    """Slots for one route class with a bounded FIFO queue (event-loop only, not thread-safe)"""
+
+    def __init__(self, name: str, slots: int, queue_size: int, queue_seconds: float):
+        self.name = name
+        self.slots = slots
+        self.queue_size = queue_size
+        self.queue_seconds = queue_seconds
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    async def acquire(self) -> Optional[str]:
+        """None once a slot is held, else the rejection reason"""
+        if self.active < self.slots and not self._waiters:
+            self.active += 1
+            return None
+        if len(self._waiters) >= self.queue_size:
+            return "queue_full"
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        metrics.add("admission_queued", 1, route_class=self.name)
+        try:
+            await asyncio.wait_for(waiter, self.queue_seconds)
+        except asyncio.TimeoutError:
+            return "queue_timeout"
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # Handed a slot just as the client went away
+            raise
+        finally:
+            metrics.add("admission_queued", -1, route_class=self.name)
+            if not waiter.done() or waiter.cancelled():
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+        return None
+
+    def release(self):
+        # Hand the slot straight to the oldest live waiter so newcomers can't jump the queue
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+# ==================== ASGI MIDDLEWARE ====================
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware applying the token buckets and concurrency limits above"""
+
+    def __init__(self, app):
+        self.app = app
+        self.store = SqliteBucketStore() if ADMISSION_STORE == "sqlite" else MemoryBucketStore()
+        self.limits = {
+            name: ConcurrencyLimit(name, int(slots), ADMISSION_QUEUE_SIZE, ADMISSION_QUEUE_SECONDS.get(name, 1.0))
+            for name, slots in ADMISSION_CONCURRENCY.items()
+        }
+
+    async def __call__(self, scope, receive, send):
+        if not ADMISSION_ENABLED or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        name = route_class(scope["method"], scope["path"])
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        wait, limiting = await self._take_tokens(scope, name)
+        if wait > 0:
+            await self._reject(send, name, wait, f"{limiting.split(':', 1)[0]}_rate")
+            return
+
+        limit = self.limits.get(name)
+        if limit is None:
+            metrics.inc("admission_decisions_total", route_class=name, decision="admitted", reason="ok")
+            await self.app(scope, receive, send)
+            return
+
+        queued_at = time.perf_counter()
+        reason = await limit.acquire()
+        if reason is not None:
+            await self._reject(send, name, limit.queue_seconds, reason)
+            return
+        metrics.observe("admission_queue_wait_seconds", time.perf_counter() - queued_at, route_class=name)
+        metrics.inc("admission_decisions_total", route_class=name, decision="admitted", reason="ok")
+        metrics.add("admission_in_flight", 1, route_class=name)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            metrics.add("admission_in_flight", -1, route_class=name)
+            limit.release()
+
+    async def _take_tokens(self, scope, name: str) -> Tuple[float, Optional[str]]:
+        buckets = self._buckets(scope)
+        cost = ADMISSION_COSTS.get(name, 1.0)
+        now = time.time()
+        if not self.store.blocking:
+            return self.store.take(buckets, cost, now)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.store.executor(), self.store.take, buckets, cost, now
+            )
+        except Exception:
+            logger.warning("Admission store unavailable; admitting without rate limits", exc_info=True)
+            return 0.0, None
+
+    @staticmethod
+    def _buckets(scope) -> List[Bucket]:
+        authorization = None
+        for key, value in scope.get("headers") or []:
+            if key == b"authorization":
+                authorization = value.decode("latin-1")
+                break
+        claims = token_claims(authorization)
+        if claims is None:
+            client = scope.get("client")
+            return [(f"ip:{client[0] if client else '-'}", ADMISSION_USER_RATE, ADMISSION_USER_BURST)]
+        buckets = [(f"user:{claims['sub']}", ADMISSION_USER_RATE, ADMISSION_USER_BURST)]
+        if claims.get("inst"):
+            buckets.append((f"inst:{claims['inst']}", ADMISSION_INSTITUTION_RATE, ADMISSION_INSTITUTION_BURST))
+        return buckets
+
+    @staticmethod
+    async def _reject(send, name: str, retry_after: float, reason: str):
+        metrics.inc("admission_decisions_total", route_class=name, decision="rejected", reason=reason)
+        body = b'{"detail":"Too many requests; retry later"}'
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, int(retry_after + 0.999))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,445 @@
+"""
+AFRO-GENOMICS Research Platform
+Ancestry Recomputation
+
+When the reference dataset or methodology behind AncestryResult is
+superseded, a recomputation job brings every stale sample up to the new
+version:
+
+1. Plan: stale samples are active results on another version, found with a
+   range scan on idx_ancestry_version and walked by keyset on sample_id.
+2. Compute: batches are split into chunks and estimated in a process pool.
+3. Write: new rows go in inactive, next to the old ones (kept for provenance).
+4. Flip: one transaction recomputes stragglers (samples that got results on
+   the old reference behind the cursor while the job ran), deactivates the
+   old rows of every recomputed sample, activates the new ones and makes the
+   target reference current.
+
+Progress is committed per batch; throughput and ETA are derived from it.
+With institution shards (shards.py) steps 1-3 run shard by shard, and every
+shard is flipped in its own transaction once all of them are computed.
+"""
+
+import logging
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, select, update, and_, or_
+from sqlalchemy.orm import Session
+
+from models import (
+    AncestryResult, AncestryReference, AncestryRecomputeJob, AncestryRecomputeFailure, RecomputeStatus, Sample
+)
+from panels import REFERENCE_PANEL
+from shards import shard_router, DEFAULT_SHARD
+from sync import stamp_samples
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+ANCESTRY_RECOMPUTE_INTERVAL_SECONDS = int(os.getenv("ANCESTRY_RECOMPUTE_INTERVAL_SECONDS", "30"))
+ANCESTRY_RECOMPUTE_BATCH_SIZE = int(os.getenv("ANCESTRY_RECOMPUTE_BATCH_SIZE", "1000"))
+ANCESTRY_RECOMPUTE_CHUNK_SIZE = int(os.getenv("ANCESTRY_RECOMPUTE_CHUNK_SIZE", "100"))
+ANCESTRY_RECOMPUTE_PROCESSES = int(os.getenv("ANCESTRY_RECOMPUTE_PROCESSES", "0"))  # 0 = one per core
+
+# (population, percentage, ci_lower, ci_upper, reference_sample_size)
+Estimate = Tuple[str, float, float, float, int]
+
+
+class RecomputeConflict(Exception):
+    """A recomputation job is already pending or running"""
+
+
+# ==================== REFERENCE VERSIONS ====================
+
+def current_reference(db: Session) -> AncestryReference:
+    """The current reference version, registering the built-in panel on first use"""
+    reference = db.query(AncestryReference).filter(AncestryReference.is_current.is_(True)).first()
+    if reference is None:
+        reference = ensure_reference(
+            db, REFERENCE_PANEL.dataset, REFERENCE_PANEL.methodology_version, REFERENCE_PANEL.sample_size
+        )
+        reference.is_current = True
+        reference.activated_at = datetime.utcnow()
+        db.commit()
+    return reference
+
+
+def ensure_reference(db: Session, dataset: str, methodology_version: str, sample_size: int) -> AncestryReference:
+    """Get or register a reference version (caller commits)"""
+    reference = db.query(AncestryReference).filter(
+        AncestryReference.reference_dataset == dataset,
+        AncestryReference.methodology_version == methodology_version
+    ).first()
+    if reference is None:
+        reference = AncestryReference(
+            reference_dataset=dataset, methodology_version=methodology_version, reference_sample_size=sample_size
+        )
+        db.add(reference)
+        db.flush()
+    return reference
+
+
+# ==================== PLANNING ====================
+
+def _stale_condition(reference: AncestryReference):
+    return and_(
+        AncestryResult.is_active.is_(True),
+        or_(
+            AncestryResult.reference_dataset != reference.reference_dataset,
+            AncestryResult.methodology_version != reference.methodology_version
+        )
+    )
+
+
+def count_stale_samples(db: Session, reference: AncestryReference) -> int:
+    """Stale samples on every shard"""
+    with shard_router.shard_sessions(db) as sessions:
+        return sum(
+            s.query(AncestryResult.sample_id).filter(_stale_condition(reference)).distinct().count()
+            for s in sessions
+        )
+
+
+def request_recompute(
+    db: Session,
+    dataset: str,
+    methodology_version: str,
+    sample_size: int,
+    requested_by: Optional[str] = None
+) -> AncestryRecomputeJob:
+    """
+    Plan a recomputation against a reference version (caller commits)
+
+    Raises:
+        RecomputeConflict: another job has not finished yet
+    """
+    active = db.query(AncestryRecomputeJob).filter(
+        AncestryRecomputeJob.status.in_([RecomputeStatus.PENDING, RecomputeStatus.RUNNING])
+    ).first()
+    if active is not None:
+        raise RecomputeConflict(active.id)
+    reference = ensure_reference(db, dataset, methodology_version, sample_size)
+    job = AncestryRecomputeJob(
+        reference_id=reference.id,
+        requested_by=requested_by,
+        status=RecomputeStatus.PENDING,
+        total_samples=count_stale_samples(db, reference)
+    )
+    db.add(job)
+    db.flush()
+    return job
+
+
+def job_progress(job: AncestryRecomputeJob, now: Optional[datetime] = None) -> Dict:
+    """Percent complete, throughput (samples/s) and ETA derived from committed progress"""
+    now = now or datetime.utcnow()
+    done = job.processed_samples + job.failed_samples
+    percent = 100.0 if not job.total_samples else min(100.0, 100.0 * done / job.total_samples)
+    rate, eta = None, None
+    if job.started_at and done:
+        elapsed = ((job.completed_at or job.updated_at or now) - job.started_at).total_seconds()
+        if elapsed > 0:
+            rate = done / elapsed
+            if job.status == RecomputeStatus.RUNNING:
+                eta = max(0.0, (job.total_samples - done) / rate)
+    if job.status == RecomputeStatus.COMPLETED:
+        eta = 0.0
+    return {
+        "percent_complete": round(percent, 1),
+        "samples_per_second": round(rate, 2) if rate is not None else None,
+        "eta_seconds": round(eta, 1) if eta is not None else None,
+    }
+
+
+# ==================== ESTIMATION (runs in worker processes) ====================
+
+def recalibrate_estimates(estimates: List[Estimate], sample_size: int) -> List[Tuple[str, float, float, float]]:
+    """
+    Re-estimate one sample's ancestry against a reference of `sample_size`
+
+    Inference is mocked like the rest of the results pipeline: proportions
+    are renormalized and each interval is rescaled by sqrt(old_n / new_n),
+    the sampling-error term of a reference-panel CI.
+    """
+    total = sum(pct for _, pct, _, _, _ in estimates) or 1.0
+    results = []
+    for population, pct, lower, upper, old_size in estimates:
+        scale = math.sqrt(old_size / sample_size) if sample_size > 0 and old_size > 0 else 1.0
+        value = 100.0 * pct / total
+        results.append((
+            population,
+            round(value, 1),
+            round(max(0.0, value - (pct - lower) * scale), 1),
+            round(min(100.0, value + (upper - pct) * scale), 1),
+        ))
+    return results
+
+
+def _recompute_chunk(chunk: List[Tuple[str, List[Estimate]]], sample_size: int):
+    """Process-pool task: returns ([(sample_id, estimates)], [failed sample ids])"""
+    done, failed = [], []
+    for sample_id, estimates in chunk:
+        try:
+            done.append((sample_id, recalibrate_estimates(estimates, sample_size)))
+        except Exception:
+            failed.append(sample_id)
+    return done, failed
+
+
+# ==================== EXECUTION ====================
+
+def _load_estimates(data: Session, sample_ids: List[str]) -> Dict[str, List[Estimate]]:
+    estimates: Dict[str, List[Estimate]] = {}
+    for row in data.execute(
+        select(
+            AncestryResult.sample_id, AncestryResult.population_group, AncestryResult.percentage,
+            AncestryResult.confidence_interval_lower, AncestryResult.confidence_interval_upper,
+            AncestryResult.reference_sample_size
+        ).where(AncestryResult.sample_id.in_(sample_ids), AncestryResult.is_active.is_(True))
+    ):
+        estimates.setdefault(row[0], []).append(tuple(row[1:]))
+    return estimates
+
+
+def _insert_results(data: Session, job: AncestryRecomputeJob, done: List[Tuple[str, list]], now: datetime):
+    """Write the job's (inactive) rows for recomputed samples (caller commits)"""
+    reference = job.reference
+    data.bulk_insert_mappings(AncestryResult, [
+        {
+            "sample_id": sample_id, "population_group": population, "percentage": pct,
+            "confidence_interval_lower": lower, "confidence_interval_upper": upper,
+            "reference_dataset": reference.reference_dataset,
+            "reference_sample_size": reference.reference_sample_size,
+            "methodology_version": reference.methodology_version,
+            "is_active": False, "recompute_job_id": job.id, "computed_at": now
+        }
+        for sample_id, results in done
+        for population, pct, lower, upper in results
+    ])
+
+
+def _recompute_stragglers(data: Session, job: AncestryRecomputeJob, batch_size: int = ANCESTRY_RECOMPUTE_BATCH_SIZE):
+    """
+    Recompute, in-process, stale samples in `data` the job has no rows for (caller commits)
+
+    These got results on the old reference behind the job's cursor. Runs in
+    the flip transaction, so only results committed between the last scan
+    and the flip (like any computed against the old reference just before
+    it) are left for the next job. Samples that fail stay on the old rows;
+    those that already failed in a batch were counted then and are skipped.
+    """
+    reference = job.reference
+    recomputed = select(AncestryResult.sample_id).where(AncestryResult.recompute_job_id == job.id)
+    failed = set(data.execute(
+        select(AncestryRecomputeFailure.sample_id).where(AncestryRecomputeFailure.job_id == job.id)
+    ).scalars())
+    cursor = None
+    while True:
+        query = select(AncestryResult.sample_id).where(
+            _stale_condition(reference), AncestryResult.sample_id.not_in(recomputed)
+        )
+        if cursor:
+            query = query.where(AncestryResult.sample_id > cursor)
+        sample_ids = data.execute(
+            query.distinct().order_by(AncestryResult.sample_id).limit(batch_size)
+        ).scalars().all()
+        if not sample_ids:
+            break
+        cursor = sample_ids[-1]
+        sample_ids = [sample_id for sample_id in sample_ids if sample_id not in failed]
+        if not sample_ids:
+            continue
+        done, chunk_failed = _recompute_chunk(
+            list(_load_estimates(data, sample_ids).items()), reference.reference_sample_size
+        )
+        _insert_results(data, job, done, datetime.utcnow())
+        data.flush()
+        job.total_samples += len(done) + len(chunk_failed)
+        job.processed_samples += len(done)
+        job.failed_samples += len(chunk_failed)
+        logger.info(
+            "Ancestry recompute %s: %d stragglers recomputed at activation, %d failed",
+            job.id, len(done), len(chunk_failed)
+        )
+
+
+def _activate_results(data: Session, job: AncestryRecomputeJob):
+    """Switch every sample the job recomputed in `data` to the job's rows (caller commits)"""
+    _recompute_stragglers(data, job)
+    recomputed = select(AncestryResult.sample_id).where(AncestryResult.recompute_job_id == job.id)
+    data.execute(
+        update(AncestryResult).where(
+            AncestryResult.is_active.is_(True),
+            AncestryResult.sample_id.in_(recomputed)
+        ).values(is_active=False).execution_options(synchronize_session=False)
+    )
+    data.execute(
+        update(AncestryResult).where(AncestryResult.recompute_job_id == job.id)
+        .values(is_active=True).execution_options(synchronize_session=False)
+    )
+    stamp_samples(data, Sample.id.in_(recomputed))
+
+
+def _activate(db: Session, job: AncestryRecomputeJob):
+    """Atomically switch every recomputed sample to the job's rows and the target reference"""
+    for name in shard_router.names[1:]:
+        data = shard_router.session_factory(name)()
+        try:
+            _activate_results(data, job)
+            data.commit()
+        finally:
+            data.close()
+    _activate_results(db, job)
+    db.execute(update(AncestryReference).values(is_current=False))
+    db.execute(
+        update(AncestryReference).where(AncestryReference.id == job.reference_id)
+        .values(is_current=True, activated_at=datetime.utcnow())
+    )
+    job.status = RecomputeStatus.COMPLETED
+    job.completed_at = datetime.utcnow()
+    job.updated_at = job.completed_at
+    db.commit()
+
+
+def run_recompute(
+    db: Session,
+    job: AncestryRecomputeJob,
+    pool: ProcessPoolExecutor,
+    batch_size: int = ANCESTRY_RECOMPUTE_BATCH_SIZE,
+    chunk_size: int = ANCESTRY_RECOMPUTE_CHUNK_SIZE,
+    should_stop: Callable[[], bool] = lambda: False
+) -> bool:
+    """
+    Run one job batch by batch, shard by shard
+
+    Returns:
+        True if the job completed (and was activated), False if interrupted
+    """
+    if job.status != RecomputeStatus.RUNNING:
+        job.status = RecomputeStatus.RUNNING
+        job.started_at = job.started_at or datetime.utcnow()
+        db.commit()
+
+    names = shard_router.names
+    for name in names[names.index(job.shard) if job.shard in names else 0:]:
+        if job.shard != name:
+            job.shard, job.cursor = name, None
+            db.commit()
+        if name == DEFAULT_SHARD:
+            finished = _recompute_shard(db, db, job, pool, batch_size, chunk_size, should_stop)
+        else:
+            shard_router.sync_reference(name)  # Result rows reference the job and its reference
+            data = shard_router.session_factory(name)()
+            try:
+                finished = _recompute_shard(db, data, job, pool, batch_size, chunk_size, should_stop)
+            finally:
+                data.close()
+        if not finished:
+            return False
+
+    _activate(db, job)
+    return True
+
+
+def _recompute_shard(
+    db: Session,
+    data: Session,
+    job: AncestryRecomputeJob,
+    pool: ProcessPoolExecutor,
+    batch_size: int,
+    chunk_size: int,
+    should_stop: Callable[[], bool]
+) -> bool:
+    """Compute new rows for every stale sample in `data` (job progress is kept in `db`)"""
+    reference = job.reference
+    stale = _stale_condition(reference)
+    while not should_stop():
+        query = select(AncestryResult.sample_id).where(stale)
+        if job.cursor:
+            query = query.where(AncestryResult.sample_id > job.cursor)
+        sample_ids = data.execute(
+            query.distinct().order_by(AncestryResult.sample_id).limit(batch_size)
+        ).scalars().all()
+        if not sample_ids:
+            return True
+
+        items = list(_load_estimates(data, sample_ids).items())
+        chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+        now = datetime.utcnow()
+        failed: List[str] = []
+        if data is not db:
+            # A shard commits apart from the job's progress; drop rows a crash left between the two
+            data.execute(delete(AncestryResult).where(
+                AncestryResult.recompute_job_id == job.id, AncestryResult.sample_id.in_(sample_ids)
+            ))
+        for done, chunk_failed in pool.map(_recompute_chunk, chunks, [reference.reference_sample_size] * len(chunks)):
+            failed.extend(chunk_failed)
+            _insert_results(data, job, done, now)
+
+        db.add_all(AncestryRecomputeFailure(job_id=job.id, sample_id=sample_id) for sample_id in failed)
+        job.processed_samples += len(items) - len(failed)
+        job.failed_samples += len(failed)
+        job.cursor = sample_ids[-1]
+        job.updated_at = datetime.utcnow()
+        if data is not db:
+            data.commit()
+        db.commit()
+
+    return False
+
+
+def run_pending_recomputes(
+    session_factory: Callable[[], Session],
+    should_stop: Callable[[], bool] = lambda: False,
+    processes: int = ANCESTRY_RECOMPUTE_PROCESSES,
+    on_activated: Optional[Callable[[Session], None]] = None
+) -> int:
+    """
+    Run (or resume) pending recomputation jobs, oldest first
+
+    `on_activated` runs after each job goes live (e.g. to rebuild caches).
+
+    Returns:
+        Number of jobs completed
+    """
+    db = session_factory()
+    completed = 0
+    try:
+        jobs = db.query(AncestryRecomputeJob).filter(
+            AncestryRecomputeJob.status.in_([RecomputeStatus.PENDING, RecomputeStatus.RUNNING])
+        ).order_by(AncestryRecomputeJob.created_at).all()
+        if not jobs:
+            return 0
+
+        # spawn: the API process is multi-threaded, so forking it is unsafe
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=processes or os.cpu_count(), mp_context=context) as pool:
+            for job in jobs:
+                if should_stop():
+                    break
+                try:
+                    finished = run_recompute(db, job, pool, should_stop=should_stop)
+                except Exception as e:
+                    db.rollback()
+                    job.status = RecomputeStatus.FAILED
+                    job.error = str(e)[:2000]
+                    job.updated_at = datetime.utcnow()
+                    db.commit()
+                    logger.exception("Ancestry recompute %s failed", job.id)
+                    continue
+                if finished:
+                    completed += 1
+                    logger.info(
+                        "Ancestry recompute %s activated: %d samples, %d failed",
+                        job.id, job.processed_samples, job.failed_samples
+                    )
+                    if on_activated:
+                        on_activated(db)
+    finally:
+        db.close()
+    return completed
@@ -0,0 +1,291 @@
+"""
+AFRO-GENOMICS Research Platform
+Tamper-Evident Audit Chain
+
+Audit entries are sealed into batches. Each batch stores the Merkle root of
+its entry hashes and is chained to the previous batch's hash; every
+AUDIT_CHECKPOINT_EVERY batches an HMAC-signed checkpoint is written.
+
+Verifying a time range starts from the nearest signed checkpoint before it
+and ends at the nearest one after it, so the cost is O(range + checkpoint
+interval) rather than a rehash of the entire history. Editing or deleting an
+audit row changes its batch's Merkle root; rewriting batch rows breaks the
+chain up to a checkpoint whose signature cannot be forged without the key.
+
+Retention removes entries in two ways, and both are signed with the same
+key: a deleted sealed entry leaves an AuditRedaction whose HMAC binds its
+batch, entry id and leaf hash, and a batch dropped with an archived month
+gets an HMAC over its seq and hash when flagged pruned. Verification only
+skips a pruned batch, or counts a redaction towards a Merkle root, when the
+signature checks out; unsigned ones are reported as tampering.
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from models import AuditBatch, AuditCheckpoint, AuditRedaction
+from audit_store import live_tables, fetch_batch_entries
+from auth import SECRET_KEY
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+AUDIT_SIGNING_KEY = os.getenv("AUDIT_SIGNING_KEY", SECRET_KEY).encode("utf-8")
+AUDIT_CHAIN_BATCH_SIZE = int(os.getenv("AUDIT_CHAIN_BATCH_SIZE", "1000"))
+AUDIT_CHECKPOINT_EVERY = int(os.getenv("AUDIT_CHECKPOINT_EVERY", "64"))
+AUDIT_SEAL_INTERVAL_SECONDS = int(os.getenv("AUDIT_SEAL_INTERVAL_SECONDS", "30"))
+
+GENESIS_HASH = "0" * 64
+_LEAF_PREFIX = b"\x00"
+_NODE_PREFIX = b"\x01"
+
+
+# ==================== HASHING ====================
+
+def entry_hash(row: Dict) -> bytes:
+    """SHA-256 of an audit row's canonical encoding (field order fixed, details key-sorted)"""
+    details = row.get("details")
+    payload = "\x1f".join((
+        row["id"],
+        row["user_id"],
+        row["action"],
+        row.get("resource_accessed") or "",
+        row["timestamp"].isoformat(),
+        row.get("ip_address") or "",
+        row.get("user_agent") or "",
+        json.dumps(details, sort_keys=True, separators=(",", ":")) if details is not None else "",
+    ))
+    return hashlib.sha256(_LEAF_PREFIX + payload.encode("utf-8")).digest()
+
+
+def merkle_root(leaves: List[bytes]) -> bytes:
+    """Binary Merkle root; an odd node is promoted to the next level unchanged"""
+    if not leaves:
+        return hashlib.sha256(b"").digest()
+    sha256 = hashlib.sha256
+    level = leaves
+    while len(level) > 1:
+        paired = [sha256(_NODE_PREFIX + level[i] + level[i + 1]).digest() for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            paired.append(level[-1])
+        level = paired
+    return level[0]
+
+
+def batch_hash(seq: int, prev_hash: str, root: str, count: int, first: datetime, last: datetime) -> str:
+    material = f"{seq}|{prev_hash}|{root}|{count}|{first.isoformat()}|{last.isoformat()}"
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _sign(material: str) -> str:
+    return hmac.new(AUDIT_SIGNING_KEY, material.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def sign_checkpoint(seq: int, digest: str) -> str:
+    return _sign(f"{seq}|{digest}")
+
+
+def sign_redaction(batch_seq: int, entry_id: str, leaf_hash: str) -> str:
+    return _sign(f"redaction|{batch_seq}|{entry_id}|{leaf_hash}")
+
+
+def sign_pruned(seq: int, digest: str) -> str:
+    return _sign(f"pruned|{seq}|{digest}")
+
+
+def _redaction_ok(redaction: AuditRedaction) -> bool:
+    expected = sign_redaction(redaction.batch_seq, redaction.entry_id, redaction.leaf_hash)
+    return redaction.signature is not None and hmac.compare_digest(redaction.signature, expected)
+
+
+def _pruned_ok(batch: AuditBatch) -> bool:
+    expected = sign_pruned(batch.seq, batch.batch_hash)
+    return batch.pruned_signature is not None and hmac.compare_digest(batch.pruned_signature, expected)
+
+
+def _root_for(entries: Iterable[Dict], redactions: Iterable[AuditRedaction]) -> str:
+    """Merkle root over live entries plus hashes kept for redacted ones, ordered by entry id"""
+    leaves = {row["id"]: entry_hash(row) for row in entries}
+    for redaction in redactions:
+        leaves.setdefault(redaction.entry_id, bytes.fromhex(redaction.leaf_hash))
+    return merkle_root([leaves[entry_id] for entry_id in sorted(leaves)]).hex()
+
+
+# ==================== SEALING ====================
+
+def seal_pending(
+    session_factory: Callable[[], Session],
+    should_stop: Callable[[], bool] = lambda: False,
+    batch_size: int = AUDIT_CHAIN_BATCH_SIZE,
+    checkpoint_every: int = AUDIT_CHECKPOINT_EVERY
+) -> int:
+    """
+    Seal unsealed audit rows into chained batches, one transaction per batch
+
+    Returns:
+        Number of batches sealed
+    """
+    db = session_factory()
+    sealed = 0
+    try:
+        last = db.query(AuditBatch).order_by(AuditBatch.seq.desc()).first()
+        seq, prev = (last.seq, last.batch_hash) if last else (0, GENESIS_HASH)
+
+        # Older rolled partitions first, the hot table last
+        for table in reversed(live_tables(db.connection())):
+            while not should_stop():
+                rows = [dict(r) for r in db.execute(
+                    select(*table.columns).where(table.c.batch_seq.is_(None))
+                    .order_by(table.c.timestamp, table.c.id).limit(batch_size)
+                ).mappings()]
+                if not rows:
+                    break
+
+                seq += 1
+                root = _root_for(rows, [])
+                first, last_ts = rows[0]["timestamp"], rows[-1]["timestamp"]
+                digest = batch_hash(seq, prev, root, len(rows), first, last_ts)
+
+                db.add(AuditBatch(
+                    seq=seq, prev_hash=prev, merkle_root=root, batch_hash=digest,
+                    entry_count=len(rows), first_timestamp=first, last_timestamp=last_ts
+                ))
+                db.flush()
+                db.execute(update(table).where(table.c.id.in_([r["id"] for r in rows])).values(batch_seq=seq))
+                if seq % checkpoint_every == 0:
+                    db.add(AuditCheckpoint(seq=seq, batch_hash=digest, signature=sign_checkpoint(seq, digest)))
+                db.commit()
+
+                prev = digest
+                sealed += 1
+    finally:
+        db.close()
+    return sealed
+
+
+def record_redactions(db: Session, rows: Iterable[Dict]):
+    """Keep signed entry hashes of sealed rows about to be deleted by retention (caller commits)"""
+    for row in rows:
+        if row.get("batch_seq") is not None:
+            leaf = entry_hash(row).hex()
+            db.add(AuditRedaction(
+                batch_seq=row["batch_seq"], entry_id=row["id"], leaf_hash=leaf,
+                signature=sign_redaction(row["batch_seq"], row["id"], leaf)
+            ))
+
+
+def mark_pruned_before(db: Session, cutoff: datetime) -> int:
+    """Flag and sign batches whose entries were all dropped with archived months (caller commits)"""
+    batches = db.query(AuditBatch).filter(AuditBatch.last_timestamp < cutoff, AuditBatch.pruned.is_(False)).all()
+    for batch in batches:
+        batch.pruned = True
+        batch.pruned_signature = sign_pruned(batch.seq, batch.batch_hash)
+    return len(batches)
+
+
+# ==================== VERIFICATION ====================
+
+def _checkpoint_ok(checkpoint: AuditCheckpoint, batch: Optional[AuditBatch]) -> bool:
+    return (
+        batch is not None
+        and hmac.compare_digest(checkpoint.signature, sign_checkpoint(checkpoint.seq, checkpoint.batch_hash))
+        and checkpoint.batch_hash == batch.batch_hash
+    )
+
+
+def verify_range(db: Session, since: Optional[datetime] = None, until: Optional[datetime] = None) -> Dict:
+    """
+    Verify every sealed batch overlapping [since, until)
+
+    Only batches in range are rehashed from their entries; the stretch back to
+    the previous checkpoint and forward to the next one is checked by chain
+    links alone.
+
+    Returns:
+        Report with verified flag, counts, anchoring and any errors
+    """
+    query = db.query(AuditBatch.seq)
+    if since:
+        query = query.filter(AuditBatch.last_timestamp >= since)
+    if until:
+        query = query.filter(AuditBatch.first_timestamp < until)
+    seqs = [seq for (seq,) in query]
+    report = {
+        "verified": True, "batches_checked": 0, "entries_checked": 0,
+        "first_seq": None, "last_seq": None, "anchored": False, "errors": []
+    }
+    if not seqs:
+        return report
+    lo, hi = min(seqs), max(seqs)
+    report["first_seq"], report["last_seq"] = lo, hi
+    errors = report["errors"]
+
+    start = db.query(AuditCheckpoint).filter(AuditCheckpoint.seq < lo).order_by(AuditCheckpoint.seq.desc()).first()
+    end = db.query(AuditCheckpoint).filter(AuditCheckpoint.seq >= hi).order_by(AuditCheckpoint.seq).first()
+    walk_from = start.seq if start else 1
+    walk_to = end.seq if end else hi
+
+    batches = db.query(AuditBatch).filter(AuditBatch.seq.between(walk_from, walk_to)).order_by(AuditBatch.seq).all()
+    by_seq = {b.seq: b for b in batches}
+    if start and not _checkpoint_ok(start, by_seq.get(start.seq)):
+        errors.append(f"checkpoint {start.seq}: invalid signature or batch hash")
+
+    in_range = [b for b in batches if lo <= b.seq <= hi]
+    entries_by_seq: Dict[int, List[Dict]] = {}
+    if in_range:
+        for row in fetch_batch_entries(db, lo, hi, min(b.first_timestamp for b in in_range), max(b.last_timestamp for b in in_range)):
+            entries_by_seq.setdefault(row["batch_seq"], []).append(row)
+    redactions: Dict[int, List[AuditRedaction]] = {}
+    for redaction in db.query(AuditRedaction).filter(AuditRedaction.batch_seq.between(lo, hi)):
+        redactions.setdefault(redaction.batch_seq, []).append(redaction)
+
+    prev = by_seq[walk_from].prev_hash if walk_from in by_seq else GENESIS_HASH
+    if walk_from == 1 and prev != GENESIS_HASH:
+        errors.append("batch 1: does not start from genesis")
+    expected_seq = walk_from
+    for batch in batches:
+        if batch.seq != expected_seq:
+            errors.append(f"batch {expected_seq}: missing")
+            expected_seq = batch.seq
+        if batch.prev_hash != prev:
+            errors.append(f"batch {batch.seq}: chain link broken")
+        if batch_hash(batch.seq, batch.prev_hash, batch.merkle_root, batch.entry_count,
+                      batch.first_timestamp, batch.last_timestamp) != batch.batch_hash:
+            errors.append(f"batch {batch.seq}: batch hash mismatch")
+
+        if lo <= batch.seq <= hi and batch.pruned and not _pruned_ok(batch):
+            errors.append(f"batch {batch.seq}: pruned flag not signed")
+        elif lo <= batch.seq <= hi and not batch.pruned:
+            entries = entries_by_seq.get(batch.seq, [])
+            batch_redactions = []
+            for redaction in redactions.get(batch.seq, []):
+                if _redaction_ok(redaction):
+                    batch_redactions.append(redaction)
+                else:
+                    errors.append(f"batch {batch.seq}: redaction of entry {redaction.entry_id} not signed")
+            if len(entries) + len(batch_redactions) != batch.entry_count:
+                errors.append(f"batch {batch.seq}: expected {batch.entry_count} entries, found {len(entries) + len(batch_redactions)}")
+            elif _root_for(entries, batch_redactions) != batch.merkle_root:
+                errors.append(f"batch {batch.seq}: entries modified (Merkle root mismatch)")
+            report["batches_checked"] += 1
+            report["entries_checked"] += len(entries)
+
+        prev = batch.batch_hash
+        expected_seq += 1
+
+    if end:
+        if _checkpoint_ok(end, by_seq.get(end.seq)):
+            report["anchored"] = True
+        else:
+            errors.append(f"checkpoint {end.seq}: invalid signature or batch hash")
+
+    report["verified"] = not errors
+    return report
@@ -0,0 +1,386 @@
+"""
+AFRO-GENOMICS Research Platform
+Audit Log Partitioning & Archival
+
+Keeps the write path of `audit_logs` small as the trail grows:
+
+- PostgreSQL: `audit_logs` is natively RANGE-partitioned by month on
+  `timestamp`; rollover pre-creates upcoming partitions.
+- SQLite: `audit_logs` is the hot table for the current month; rollover moves
+  completed months into rolling tables `audit_logs_pYYYYMM`.
+
+Partitions older than AUDIT_ARCHIVE_AFTER_MONTHS are compacted into
+gzip-compressed, append-only JSON-lines files and dropped. Reads go through
+`query_audit_logs`, which stitches live partitions and (for older time ranges)
+archive files together transparently.
+"""
+
+import glob
+import gzip
+import json
+import logging
+import os
+import re
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Column, Index, MetaData, Table, func, select, insert, delete, inspect, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+AUDIT_ARCHIVE_DIR = os.getenv("AUDIT_ARCHIVE_DIR", "./audit_archive")
+AUDIT_ARCHIVE_AFTER_MONTHS = int(os.getenv("AUDIT_ARCHIVE_AFTER_MONTHS", "12"))
+AUDIT_PARTITIONS_AHEAD = int(os.getenv("AUDIT_PARTITIONS_AHEAD", "2"))
+AUDIT_ROLLOVER_INTERVAL_SECONDS = int(os.getenv("AUDIT_ROLLOVER_INTERVAL_SECONDS", "3600"))
+AUDIT_ROLLOVER_CHUNK_SIZE = int(os.getenv("AUDIT_ROLLOVER_CHUNK_SIZE", "5000"))
+
+HOT_TABLE = AuditLog.__table__
+PARTITION_PREFIX = "audit_logs_p"
+_PARTITION_RE = re.compile(rf"^{PARTITION_PREFIX}(\d{{4}})(\d{{2}})$")
+_ARCHIVE_SUFFIX = ".jsonl.gz"
+
+
+# ==================== MONTH HELPERS ====================
+
+def month_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, 1)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{PARTITION_PREFIX}{month.year:04d}{month.month:02d}"
+
+
+def partition_month(name: str) -> Optional[datetime]:
+    match = _PARTITION_RE.match(name)
+    return datetime(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def _is_postgres(bind) -> bool:
+    return bind.dialect.name == "postgresql"
+
+
+# ==================== PARTITION TABLES ====================
+
+_partition_metadata = MetaData()
+
+
+def _partition_table(name: str) -> Table:
+    """Table object for a rolling partition (same columns as audit_logs, own index names)"""
+    table = _partition_metadata.tables.get(name)
+    if table is not None:
+        return table
+    columns = [
+        Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable)
+        for c in HOT_TABLE.columns
+    ]
+    return Table(
+        name, _partition_metadata, *columns,
+        Index(f"idx_{name}_user_timestamp", "user_id", "timestamp"),
+        Index(f"idx_{name}_resource", "resource_accessed", "timestamp"),
+        Index(f"idx_{name}_timestamp", "timestamp"),
+        Index(f"idx_{name}_batch", "batch_seq"),
+    )
+
+
+def list_partitions(bind) -> List[Tuple[datetime, str]]:
+    """Existing monthly partitions, newest first"""
+    if _is_postgres(bind):
+        names = bind.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON i.inhrelid = c.oid "
+            "JOIN pg_class p ON i.inhparent = p.oid "
+            "WHERE p.relname = :parent"
+        ), {"parent": HOT_TABLE.name}).scalars().all()
+    else:
+        names = inspect(bind).get_table_names()
+    partitions = [(partition_month(n), n) for n in names if partition_month(n)]
+    return sorted(partitions, reverse=True)
+
+
+def ensure_partitions(bind: Connection, now: Optional[datetime] = None, ahead: int = AUDIT_PARTITIONS_AHEAD):
+    """
+    PostgreSQL only: create monthly partitions from the current month up to `ahead` months out
+
+    Inserts into a range-partitioned table fail without a matching partition,
+    so this runs at startup and on every rollover.
+    """
+    if not _is_postgres(bind):
+        return
+    current = month_start(now or datetime.utcnow())
+    for i in range(ahead + 1):
+        month = add_months(current, i)
+        bind.execute(text(
+            f'CREATE TABLE IF NOT EXISTS "{partition_name(month)}" PARTITION OF "{HOT_TABLE.name}" '
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+        ))
+
+
+def live_tables(bind) -> List[Table]:
+    """
+    Tables holding live (non-archived) audit rows, newest data first
+
+    On PostgreSQL the partitioned parent covers every partition.
+    """
+    if _is_postgres(bind):
+        return [HOT_TABLE]
+    return [HOT_TABLE] + [_partition_table(name) for _, name in list_partitions(bind)]
+
+
+# ==================== ROLLOVER & COMPACTION ====================
+
+def _roll_hot_month(db: Session, month: datetime, chunk_size: int) -> int:
+    """SQLite: move one completed month from the hot table into its rolling table"""
+    table = _partition_table(partition_name(month))
+    table.create(db.connection(), checkfirst=True)
+    db.commit()
+
+    start, end = month, add_months(month, 1)
+    moved = 0
+    while True:
+        ids = db.execute(
+            select(HOT_TABLE.c.id).where(HOT_TABLE.c.timestamp >= start, HOT_TABLE.c.timestamp < end).limit(chunk_size)
+        ).scalars().all()
+        if not ids:
+            return moved
+        db.execute(insert(table).from_select(
+            [c.name for c in HOT_TABLE.columns],
+            select(*HOT_TABLE.columns).where(HOT_TABLE.c.id.in_(ids))
+        ))
+        db.execute(delete(HOT_TABLE).where(HOT_TABLE.c.id.in_(ids)))
+        db.commit()
+        moved += len(ids)
+
+
+def _serialize(row: Dict) -> str:
+    row = dict(row)
+    row["timestamp"] = row["timestamp"].isoformat() if row["timestamp"] else None
+    return json.dumps(row, sort_keys=True, default=str)
+
+
+def archive_path(month: datetime, archive_dir: str = AUDIT_ARCHIVE_DIR) -> str:
+    return os.path.join(archive_dir, partition_name(month) + _ARCHIVE_SUFFIX)
+
+
+def _compact_partition(db: Session, month: datetime, name: str, archive_dir: str) -> int:
+    """Append a partition's rows to its compressed archive file, then drop the partition"""
+    table = _partition_table(name)
+    os.makedirs(archive_dir, exist_ok=True)
+    path = archive_path(month, archive_dir)
+
+    written = 0
+    # Each compaction appends one gzip member; readers handle multi-member files
+    with open(path, "ab") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as archive:
+            result = db.execute(select(*table.columns).order_by(table.c.timestamp).execution_options(yield_per=5000))
+            for row in result.mappings():
+                archive.write((_serialize(row) + "\n").encode("utf-8"))
+                written += 1
+        raw.flush()
+        os.fsync(raw.fileno())
+
+    db.execute(text(f'DROP TABLE "{name}"'))
+    db.commit()
+    _partition_metadata.remove(table)
+    return written
+
+
+def run_audit_rollover(
+    session_factory: Callable[[], Session],
+    should_stop: Callable[[], bool] = lambda: False,
+    now: Optional[datetime] = None,
+    archive_after_months: int = AUDIT_ARCHIVE_AFTER_MONTHS,
+    archive_dir: str = AUDIT_ARCHIVE_DIR,
+    chunk_size: int = AUDIT_ROLLOVER_CHUNK_SIZE
+) -> dict:
+    """
+    Roll completed months out of the hot table and archive old partitions
+
+    Returns:
+        Counts of rows rolled over and archived
+    """
+    now = now or datetime.utcnow()
+    current = month_start(now)
+    horizon = add_months(current, -archive_after_months)
+    stats = {"rolled": 0, "archived": 0}
+
+    db = session_factory()
+    try:
+        bind = db.connection()
+        if _is_postgres(bind):
+            ensure_partitions(bind, now)
+            db.commit()
+        else:
+            oldest = db.execute(select(func.min(HOT_TABLE.c.timestamp))).scalar()
+            month = month_start(oldest) if oldest else current
+            while month < current and not should_stop():
+                stats["rolled"] += _roll_hot_month(db, month, chunk_size)
+                month = add_months(month, 1)
+
+        for month, name in list_partitions(db.connection()):
+            if should_stop():
+                break
+            if month < horizon:
+                stats["archived"] += _compact_partition(db, month, name, archive_dir)
+    finally:
+        db.close()
+
+    if stats["rolled"] or stats["archived"]:
+        logger.info("Audit rollover: %d rows rolled, %d rows archived", stats["rolled"], stats["archived"])
+    return stats
+
+
+def drop_archives_before(cutoff: datetime, archive_dir: str = AUDIT_ARCHIVE_DIR) -> int:
+    """Delete archive files whose whole month precedes `cutoff` (retention enforcement)"""
+    dropped = 0
+    for month, path in _archive_files(archive_dir):
+        if add_months(month, 1) <= cutoff:
+            os.remove(path)
+            dropped += 1
+    return dropped
+
+
+# ==================== QUERYING ====================
+
+def _archive_files(archive_dir: str = AUDIT_ARCHIVE_DIR) -> List[Tuple[datetime, str]]:
+    files = []
+    for path in glob.glob(os.path.join(archive_dir, PARTITION_PREFIX + "*" + _ARCHIVE_SUFFIX)):
+        month = partition_month(os.path.basename(path)[:-len(_ARCHIVE_SUFFIX)])
+        if month:
+            files.append((month, path))
+    return sorted(files, reverse=True)
+
+
+def read_archive(path: str) -> Iterable[Dict]:
+    """Yield archived rows (deduplicated by id in case a compaction was retried)"""
+    seen = set()
+    with gzip.open(path, "rt", encoding="utf-8") as archive:
+        for line in archive:
+            row = json.loads(line)
+            if row["id"] in seen:
+                continue
+            seen.add(row["id"])
+            row["timestamp"] = datetime.fromisoformat(row["timestamp"]) if row["timestamp"] else None
+            yield row
+
+
+class _TableSource:
+    def __init__(self, table: Table, user_ids, resource, since, until):
+        conditions = [table.c.user_id.in_(user_ids)]
+        if resource:
+            conditions.append(table.c.resource_accessed == resource)
+        if since:
+            conditions.append(table.c.timestamp >= since)
+        if until:
+            conditions.append(table.c.timestamp < until)
+        self.table = table
+        self.conditions = conditions
+
+    def count(self, db: Session) -> int:
+        return db.execute(select(func.count()).select_from(self.table).where(*self.conditions)).scalar()
+
+    def fetch(self, db: Session, offset: int, limit: int) -> List[Dict]:
+        rows = db.execute(
+            select(*self.table.columns).where(*self.conditions)
+            .order_by(self.table.c.timestamp.desc()).offset(offset).limit(limit)
+        ).mappings().all()
+        return [dict(row) for row in rows]
+
+
+class _ArchiveSource:
+    def __init__(self, path: str, user_ids, resource, since, until):
+        user_ids = set(user_ids)
+        self.rows = sorted(
+            (
+                row for row in read_archive(path)
+                if row["user_id"] in user_ids
+                and (not resource or row["resource_accessed"] == resource)
+                and (not since or row["timestamp"] >= since)
+                and (not until or row["timestamp"] < until)
+            ),
+            key=lambda row: row["timestamp"], reverse=True
+        )
+
+    def count(self, db: Session) -> int:
+        return len(self.rows)
+
+    def fetch(self, db: Session, offset: int, limit: int) -> List[Dict]:
+        return self.rows[offset:offset + limit]
+
+
+def fetch_batch_entries(
+    db: Session,
+    first_seq: int,
+    last_seq: int,
+    first_timestamp: datetime,
+    last_timestamp: datetime,
+    archive_dir: str = AUDIT_ARCHIVE_DIR
+) -> List[Dict]:
+    """
+    All audit rows sealed into hash-chain batches first_seq..last_seq
+
+    Live partitions are read through their batch_seq index; archive files are
+    opened only for months within the batches' time span.
+    """
+    rows = []
+    for table in live_tables(db.connection()):
+        rows.extend(
+            dict(row) for row in db.execute(
+                select(*table.columns).where(table.c.batch_seq.between(first_seq, last_seq))
+            ).mappings()
+        )
+    for month, path in _archive_files(archive_dir):
+        if add_months(month, 1) > first_timestamp and month <= last_timestamp:
+            rows.extend(
+                row for row in read_archive(path)
+                if row.get("batch_seq") is not None and first_seq <= row["batch_seq"] <= last_seq
+            )
+    return rows
+
+
+def query_audit_logs(
+    db: Session,
+    user_ids: List[str],
+    resource: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = 100,
+    offset: int = 0,
+    archive_dir: str = AUDIT_ARCHIVE_DIR
+) -> Tuple[int, List[Dict]]:
+    """
+    Audit entries for the given users, newest first, across partitions and archives
+
+    Sources cover disjoint, ordered time ranges, so the global order is their
+    concatenation and pagination only reads from the sources the page touches.
+    Archive files are opened only when `since` reaches into an archived month.
+
+    Returns:
+        (total matching entries, page of row dicts)
+    """
+    bind = db.connection()
+    sources = [_TableSource(t, user_ids, resource, since, until) for t in live_tables(bind)]
+    if since:
+        for month, path in _archive_files(archive_dir):
+            if add_months(month, 1) > since and (not until or month < until):
+                sources.append(_ArchiveSource(path, user_ids, resource, since, until))
+
+    total, page = 0, []
+    for source in sources:
+        count = source.count(db)
+        total += count
+        if len(page) < limit and offset < count:
+            page.extend(source.fetch(db, offset, limit - len(page)))
+            offset = 0
+        else:
+            offset = max(0, offset - count)
+    return total, page
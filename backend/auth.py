@@ -9,7 +9,7 @@ from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status, Header
+from fastapi import Depends, HTTPException, status, Header, Query
 from sqlalchemy.orm import Session
 
 import os
@@ -22,6 +22,10 @@ SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-key-change-in-production-DO-NOT
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 REFRESH_TOKEN_EXPIRE_DAYS = 30
+STREAM_TICKET_EXPIRE_SECONDS = int(os.getenv("STREAM_TICKET_EXPIRE_SECONDS", "60"))
+
+# `scope` claim of stream tickets; they are refused everywhere else
+STREAM_TICKET_SCOPE = "stream"
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -68,6 +72,19 @@ def create_access_token(
     return encoded_jwt
 
 
+def create_stream_ticket(user_id: str) -> str:
+    """
+    Short-lived token that only opens event streams
+    
+    EventSource cannot set headers, so the browser puts this in the URL
+    instead of its access token; URLs end up in access logs and history.
+    """
+    return create_access_token(
+        {"sub": user_id, "scope": STREAM_TICKET_SCOPE},
+        expires_delta=timedelta(seconds=STREAM_TICKET_EXPIRE_SECONDS)
+    )
+
+
 def decode_token(token: str) -> Dict[str, Any]:
     """
     Decode and verify JWT token
@@ -111,10 +128,54 @@ def get_current_user(
         )
     
     token = authorization.split(" ")[1]
+    return _token_subject(token)
+
+
+def get_stream_user(
+    ticket: Optional[str] = Query(None),
+    authorization: Optional[str] = Header(None)
+):
+    """
+    Like get_current_user, but also accepts a stream ticket as `?ticket=`
+    
+    Browsers' EventSource cannot set headers, so streaming endpoints take
+    a ticket (create_stream_ticket) from the query string. Access tokens
+    are never accepted there.
+    """
+    if ticket:
+        return _token_subject(ticket, scope=STREAM_TICKET_SCOPE)
+    return get_current_user(authorization)
+
+
+def get_optional_user(
+    authorization: Optional[str] = Header(None)
+) -> Optional[str]:
+    """
+    User ID from the token if a valid one is present, else None
+    
+    Never rejects the request; used to tag database sessions with their
+    user (see replicas.py). Endpoints still authenticate via get_current_user.
+    """
+    claims = token_claims(authorization)
+    return claims["sub"] if claims else None
+
+
+def token_claims(authorization: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Claims of a valid bearer token with a subject, else None (never raises)"""
+    if not authorization or not authorization.startswith("Bearer "):
+        return None
+    try:
+        payload = jwt.decode(authorization.split(" ")[1], SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    return payload if payload.get("sub") else None
+
+
+def _token_subject(token: str, scope: Optional[str] = None) -> str:
     payload = decode_token(token)
     
     user_id: str = payload.get("sub")
-    if user_id is None:
+    if user_id is None or payload.get("scope") != scope:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid token claims"
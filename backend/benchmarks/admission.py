@@ -0,0 +1,140 @@
+"""
+AFRO-GENOMICS Research Platform
+Admission Control Check
+
+One lab's script hammers /samples/{id}/results from many closed-loop
+threads, ignoring Retry-After, while a researcher at another institution
+fetches results at a steady pace. Runs once with admission control disabled
+and once with it enabled, and reports the quiet researcher's latency and
+errors next to what the noisy script got served and rejected, plus the
+limiter decisions from /api/v1/metrics.
+
+Usage (from backend/):
+    python benchmarks/admission.py --noisy-threads 32 --duration 20
+"""
+
+import argparse
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Dict, List
+
+import httpx
+
+from load import seed, start_server, BENCH_PASSWORD, METRICS_HEADERS, _percentile
+
+_DECISION_RE = re.compile(r'^admission_decisions_total\{decision="([^"]+)",reason="([^"]+)",route_class="([^"]+)"\} (\S+)$')
+
+
+def login(client: httpx.Client, email: str) -> Dict[str, str]:
+    response = client.post("/api/v1/auth/login", json={"email": email, "password": BENCH_PASSWORD})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def run(base_url: str, fixture: Dict, noisy_threads: int, quiet_interval: float, duration: float) -> Dict:
+    noisy, quiet = fixture["institutions"][0], fixture["institutions"][1]
+    with httpx.Client(base_url=base_url, timeout=60) as client:
+        noisy_headers, quiet_headers = login(client, noisy["researcher"]), login(client, quiet["researcher"])
+    stop_at = time.perf_counter() + duration
+    noisy_codes: Counter = Counter()
+    quiet_latencies: List[float] = []
+    quiet_codes: Counter = Counter()
+    lock = threading.Lock()
+
+    def hammer(index: int):
+        codes = Counter()
+        with httpx.Client(base_url=base_url, timeout=60) as client:
+            while time.perf_counter() < stop_at:
+                sample_id = noisy["sample_ids"][index % len(noisy["sample_ids"])]
+                try:
+                    codes[client.get(f"/api/v1/samples/{sample_id}/results", headers=noisy_headers).status_code] += 1
+                except httpx.HTTPError:
+                    codes["error"] += 1
+                index += noisy_threads
+        with lock:
+            noisy_codes.update(codes)
+
+    def steady():
+        with httpx.Client(base_url=base_url, timeout=60) as client:
+            n = 0
+            while time.perf_counter() < stop_at:
+                sample_id = quiet["sample_ids"][n % len(quiet["sample_ids"])]
+                started = time.perf_counter()
+                try:
+                    status = client.get(f"/api/v1/samples/{sample_id}/results", headers=quiet_headers).status_code
+                except httpx.HTTPError:
+                    status = "error"
+                quiet_latencies.append(time.perf_counter() - started)
+                quiet_codes[status] += 1
+                n += 1
+                time.sleep(quiet_interval)
+
+    threads = [threading.Thread(target=hammer, args=(i,)) for i in range(noisy_threads)]
+    threads.append(threading.Thread(target=steady))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    quiet_latencies.sort()
+    return {
+        "quiet_ok": quiet_codes.get(200, 0),
+        "quiet_failed": sum(n for code, n in quiet_codes.items() if code != 200),
+        "quiet_p50_ms": _percentile(quiet_latencies, 0.50) * 1000,
+        "quiet_p95_ms": _percentile(quiet_latencies, 0.95) * 1000,
+        "quiet_p99_ms": _percentile(quiet_latencies, 0.99) * 1000,
+        "noisy_ok": noisy_codes.get(200, 0),
+        "noisy_rejected": noisy_codes.get(429, 0),
+        "noisy_other": sum(n for code, n in noisy_codes.items() if code not in (200, 429)),
+    }
+
+
+def decisions(base_url: str) -> Dict[str, int]:
+    counts = {}
+    for line in httpx.get(f"{base_url}/api/v1/metrics", headers=METRICS_HEADERS, timeout=30).text.splitlines():
+        match = _DECISION_RE.match(line)
+        if match:
+            counts[f"{match.group(3)} {match.group(1)} ({match.group(2)})"] = int(float(match.group(4)))
+    return counts
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Noisy-neighbour check for admission control")
+    parser.add_argument("--samples", type=int, default=2000)
+    parser.add_argument("--noisy-threads", type=int, default=32)
+    parser.add_argument("--quiet-interval", type=float, default=0.1)
+    parser.add_argument("--duration", type=float, default=20.0)
+    args = parser.parse_args(argv)
+
+    database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='admission-bench-'), 'bench.db')}"
+    fixture = seed(database_url, samples=args.samples, institutions=2, audit_logs=0)
+    results, limiter = {}, {}
+    for label, enabled in (("admission off", "false"), ("admission on", "true")):
+        process, base_url = start_server(database_url, ADMISSION_ENABLED=enabled)
+        try:
+            results[label] = run(base_url, fixture, args.noisy_threads, args.quiet_interval, args.duration)
+            if enabled == "true":
+                limiter = decisions(base_url)
+        finally:
+            process.terminate()
+            process.wait()
+
+    print(f"{args.noisy_threads} noisy threads vs one researcher every {args.quiet_interval * 1000:.0f} ms, "
+          f"{args.duration:.0f}s each")
+    print(f"{'':<15} {'quiet ok':>9} {'failed':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'noisy ok':>9} {'429':>7} {'other':>6}")
+    for label, r in results.items():
+        print(f"{label:<15} {r['quiet_ok']:>9} {r['quiet_failed']:>7} {r['quiet_p50_ms']:>8.1f} {r['quiet_p95_ms']:>8.1f} "
+              f"{r['quiet_p99_ms']:>8.1f} {r['noisy_ok']:>9} {r['noisy_rejected']:>7} {r['noisy_other']:>6}")
+    for key, count in sorted(limiter.items()):
+        print(f"  {key:<40} {count}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
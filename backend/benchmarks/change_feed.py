@@ -0,0 +1,158 @@
+"""
+AFRO-GENOMICS Research Platform
+Change Feed Consumer Benchmark
+
+Keeps a downstream copy of one institution's samples and consents (what a
+search index or analytics store holds) current after a round of changes,
+two ways:
+
+- rescan: read every sample and consent row and diff against the copy
+- feed: read the change feed after the copy's cursor and fetch only the
+  changed rows
+
+Reports rows read and wall time per refresh for growing numbers of changed
+samples, and what capturing the feed adds to a small write transaction
+(commit of one sample update, with the change feed listeners removed and
+in place).
+
+Usage (from backend/):
+    python benchmarks/change_feed.py --samples 50000 --changes 10,100,1000
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.orm import Session, sessionmaker
+
+from load import seed
+import changes
+from changes import read_changes
+from models import ConsentRecord, Sample, User
+from shards import shard_router
+
+_COPIED = (Sample.id, Sample.sample_id, Sample.status, Sample.relatedness_status, Sample.processed_at, Sample.notes)
+
+# (event name, listener) of the change feed's Session hooks
+_LISTENERS = (
+    ("after_flush", changes._collect_flushed),
+    ("do_orm_execute", changes._capture_bulk_changes),
+    ("before_commit", changes._write_events),
+    ("after_commit", changes._announce_events),
+)
+
+
+def rescan(db, institution_id: str, copy: Dict) -> Tuple[int, int]:
+    """(rows read, rows that differed)"""
+    rows = db.execute(select(*_COPIED).where(Sample.institution_id == institution_id)).all()
+    consents = db.execute(
+        select(ConsentRecord.id, ConsentRecord.withdrawal_status).join(User, User.id == ConsentRecord.user_id)
+        .where(User.institution_id == institution_id)
+    ).all()
+    changed = 0
+    for row in (*rows, *consents):
+        if copy.get(row[0]) != tuple(row):
+            copy[row[0]] = tuple(row)
+            changed += 1
+    return len(rows) + len(consents), changed
+
+
+def follow(db, institution_id: str, state: Dict, copy: Dict) -> Tuple[int, int]:
+    """(events and rows read, rows applied)"""
+    read = applied = 0
+    has_more = True
+    while has_more:
+        batch = read_changes(institution_id, state.get("cursor"), 1000)
+        state["cursor"], has_more = batch["cursor"], batch["has_more"]
+        sample_ids = [e["entity_id"] for e in batch["events"] if e["entity"] == "sample" and e["op"] != "delete"]
+        rows = db.execute(select(*_COPIED).where(Sample.id.in_(sample_ids))).all() if sample_ids else []
+        for row in rows:
+            copy[row[0]] = tuple(row)
+        read += len(batch["events"]) + len(rows)
+        applied += len(rows)
+    return read, applied
+
+
+def change_samples(session_factory, sample_ids: List[str], rng: random.Random, per_transaction: int = 50):
+    for start in range(0, len(sample_ids), per_transaction):
+        with session_factory() as db:
+            for sample in db.execute(select(Sample).where(Sample.id.in_(sample_ids[start:start + per_transaction]))).scalars():
+                sample.notes = f"reviewed {rng.random():.6f}"
+            db.commit()
+
+
+def write_cost(session_factory, sample_ids: List[str], commits: int) -> float:
+    """Microseconds per commit of one ORM sample update"""
+    started = time.perf_counter()
+    for n in range(commits):
+        with session_factory() as db:
+            db.get(Sample, sample_ids[n % len(sample_ids)]).notes = f"edit {n}"
+            db.commit()
+    return (time.perf_counter() - started) / commits * 1e6
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Refreshing a downstream copy: table rescan vs change feed")
+    parser.add_argument("--samples", type=int, default=50000)
+    parser.add_argument("--changes", default="10,100,1000", help="Changed samples per round")
+    parser.add_argument("--commits", type=int, default=500, help="Commits timed for the write overhead")
+    args = parser.parse_args(argv)
+    rng = random.Random(5)
+
+    database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='changes-bench-'), 'bench.db')}"
+    fixture = seed(database_url, samples=args.samples, institutions=1, audit_logs=0)
+    engine = create_engine(database_url)
+    session_factory = sessionmaker(bind=engine)
+    shard_router.configure(engine, {}, session_factory)
+    sample_ids = fixture["institutions"][0]["sample_ids"]
+    with session_factory() as db:
+        institution_id = db.get(Sample, sample_ids[0]).institution_id
+
+    rescanned, followed, state = {}, {}, {}
+    with session_factory() as db:
+        rescan(db, institution_id, rescanned)  # Initial load of both copies
+        rescan(db, institution_id, followed)
+        state["cursor"] = changes.feed_head()
+
+    print(f"{len(sample_ids)} samples; per refresh")
+    print(f"{'changed':>8} {'rescan rows':>12} {'ms':>8} {'feed rows':>10} {'ms':>8}")
+    for count in (int(n) for n in args.changes.split(",")):
+        change_samples(session_factory, rng.sample(sample_ids, count), rng)
+        with session_factory() as db:
+            started = time.perf_counter()
+            scan_rows, scan_changed = rescan(db, institution_id, rescanned)
+            scan_ms = (time.perf_counter() - started) * 1000
+        with session_factory() as db:
+            started = time.perf_counter()
+            feed_rows, feed_applied = follow(db, institution_id, state, followed)
+            feed_ms = (time.perf_counter() - started) * 1000
+        assert scan_changed == feed_applied == count, (scan_changed, feed_applied, count)
+        assert rescanned == followed, "copies differ"
+        print(f"{count:>8} {scan_rows:>12} {scan_ms:>8.1f} {feed_rows:>10} {feed_ms:>8.1f}")
+
+    def without_feed() -> float:
+        for name, listener in _LISTENERS:
+            event.remove(Session, name, listener)
+        try:
+            return write_cost(session_factory, sample_ids, args.commits)
+        finally:
+            for name, listener in _LISTENERS:
+                event.listen(Session, name, listener)
+
+    write_cost(session_factory, sample_ids, args.commits)  # Warm up
+    # Alternate the two and keep the best of three each, so neither pays for a cold cache
+    runs = [(without_feed(), write_cost(session_factory, sample_ids, args.commits)) for _ in range(3)]
+    without, with_feed = min(run[0] for run in runs), min(run[1] for run in runs)
+    print(f"commit of one sample update: {without:.0f} us without the change feed, {with_feed:.0f} us with it "
+          f"({with_feed / without - 1:+.0%})")
+    engine.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""
+AFRO-GENOMICS Research Platform
+Consent Index Benchmark
+
+Loads N synthetic consents into a SQLite file, builds the consent index from
+it and reports build time and memory per consent. Then compares one access
+decision (active, permits a use) made from the index with the per-request
+query + JSON check it replaces, and the consent check of a 1000-sample
+export both ways.
+
+Usage (from backend/):
+    python benchmarks/consent_index.py --consents 200000
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from models import Base, ConsentRecord, ConsentWithdrawalStatus, Institution, User, UserRole  # noqa: E402
+import consents  # noqa: E402
+from consents import ConsentIndex  # noqa: E402
+
+
+def populate(engine, consents: int, users: int, rng: random.Random):
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(insert(Institution), [{"id": "inst_0000", "name": "Bench", "country": "Kenya", "created_at": now}])
+        conn.execute(insert(User), [
+            {"id": f"usr_{u:05d}", "email": f"u{u}@bench.example.org", "hashed_password": "-",
+             "role": UserRole.RESEARCHER, "institution_id": "inst_0000", "created_at": now}
+            for u in range(users)
+        ])
+        for start in range(0, consents, 10000):
+            conn.execute(insert(ConsentRecord), [
+                {
+                    "id": f"con_{n:08d}", "user_id": f"usr_{rng.randrange(users):05d}", "consent_version": "v2.1",
+                    "data_retention_period": "60 months", "retention_months": 60,
+                    "permitted_uses": {
+                        "research": True, "publication": rng.random() < 0.8,
+                        "secondary_research": rng.random() < 0.6, "third_party_sharing": rng.random() < 0.1
+                    },
+                    "withdrawal_status": (
+                        ConsentWithdrawalStatus.WITHDRAWN if rng.random() < 0.02 else ConsentWithdrawalStatus.ACTIVE
+                    ),
+                    "signed_at": now, "created_at": now
+                }
+                for n in range(start, min(consents, start + 10000))
+            ])
+
+
+def query_decision(db, consent_id: str, use: str) -> bool:
+    """What the endpoints did before: load the consent row and check its JSON"""
+    consent = db.query(ConsentRecord).filter(ConsentRecord.id == consent_id).first()
+    return (
+        consent is not None
+        and consent.withdrawal_status == ConsentWithdrawalStatus.ACTIVE
+        and bool((consent.permitted_uses or {}).get(use))
+    )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Consent index build cost and decision latency")
+    parser.add_argument("--consents", type=int, default=200000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--export-size", type=int, default=1000)
+    args = parser.parse_args(argv)
+    rng = random.Random(7)
+
+    path = os.path.join(tempfile.mkdtemp(prefix="consent-bench-"), "bench.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    populate(engine, args.consents, args.users, rng)
+    db = sessionmaker(bind=engine)()
+
+    index = ConsentIndex()
+    started = time.perf_counter()
+    index.rebuild(db)
+    build_seconds = time.perf_counter() - started
+    tracemalloc.start()  # Second build only for the memory figure (tracing slows it down)
+    index = ConsentIndex()
+    index.rebuild(db)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    consent_ids = [f"con_{rng.randrange(args.consents):08d}" for _ in range(args.lookups)]
+    started = time.perf_counter()
+    from_index = [index.allows(db, consent_id, "publication") for consent_id in consent_ids]
+    index_us = (time.perf_counter() - started) / args.lookups * 1e6
+
+    query_ids = consent_ids[:2000]
+    started = time.perf_counter()
+    from_queries = [query_decision(db, consent_id, "publication") for consent_id in query_ids]
+    query_us = (time.perf_counter() - started) / len(query_ids) * 1e6
+    assert from_index[:len(query_ids)] == from_queries, "index and database disagree"
+
+    export = consent_ids[:args.export_size]
+    started = time.perf_counter()
+    refused = index.refused(db, set(export), "third_party_sharing")
+    export_index_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    refused_by_query = [c for c in set(export) if not query_decision(db, c, "third_party_sharing")]
+    export_query_ms = (time.perf_counter() - started) * 1000
+    assert sorted(refused) == sorted(refused_by_query)
+    consents.CONSENT_INDEX_TTL_SECONDS = 0  # Every active entry is re-read, as after a quiet spell
+    started = time.perf_counter()
+    refused_stale = index.refused(db, set(export), "third_party_sharing")
+    export_stale_ms = (time.perf_counter() - started) * 1000
+    assert sorted(refused_stale) == sorted(refused_by_query)
+
+    print(f"index build            {args.consents} consents in {build_seconds:.2f}s, "
+          f"{memory / args.consents:.0f} bytes per consent")
+    print(f"single decision        index {index_us:.2f} us   query + JSON {query_us:.0f} us "
+          f"({query_us / index_us:.0f}x)")
+    print(f"{args.export_size}-sample export   index {export_index_ms:.2f} ms   queries {export_query_ms:.0f} ms "
+          f"({len(refused)} consents refused for third_party_sharing)")
+    print(f"{args.export_size}-sample export   index past TTL {export_stale_ms:.2f} ms (batched re-read)")
+    db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+AFRO-GENOMICS Research Platform
+Sample Event Stream Benchmark
+
+Seeds a database and starts the API like load.py, holds N idle
+/samples/events connections for one institution, and reports the server's
+resident memory per connection. It then uploads samples and measures how
+long each sample.created event takes to reach every connected client
+(upload request included).
+
+Usage (from backend/):
+    python benchmarks/events.py --connections 5000
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from urllib.parse import urlparse
+
+import httpx
+
+from load import seed, start_server, BENCH_PASSWORD
+
+
+def rss_kib(pid: int) -> int:
+    """Resident set size from /proc (Linux)"""
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+async def open_stream(host: str, port: int, path: str, token: str):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write((
+        f"GET {path} HTTP/1.1\r\nHost: {host}\r\nAccept: text/event-stream\r\n"
+        f"Authorization: Bearer {token}\r\n\r\n"
+    ).encode())
+    await writer.drain()
+    await reader.readuntil(b"event: ready")
+    return reader, writer
+
+
+async def run(base_url: str, token: str, consent_id: str, pid: int, connections: int, events: int, batch: int):
+    url = urlparse(base_url)
+    path = "/api/v1/samples/events"
+    baseline = rss_kib(pid)
+
+    streams = []
+    started = time.perf_counter()
+    for start in range(0, connections, batch):
+        streams += await asyncio.gather(*(
+            open_stream(url.hostname, url.port, path, token) for _ in range(min(batch, connections - start))
+        ))
+    connect_seconds = time.perf_counter() - started
+    await asyncio.sleep(1)
+    held = rss_kib(pid)
+
+    delivery = []
+    async with httpx.AsyncClient(base_url=base_url, headers={"Authorization": f"Bearer {token}"}) as client:
+        for n in range(events):
+            marker = f"EVT-2025-{n:05d}".encode()
+
+            async def receive(reader):
+                await reader.readuntil(marker)
+                return time.perf_counter()
+
+            waiting = [asyncio.ensure_future(receive(reader)) for reader, _ in streams]
+            sent = time.perf_counter()
+            response = await client.post("/api/v1/samples", json={"sample_id": marker.decode(), "consent_id": consent_id})
+            response.raise_for_status()
+            arrivals = await asyncio.gather(*waiting)
+            delivery.append((statistics.median(arrivals) - sent, max(arrivals) - sent))
+
+    for _, writer in streams:
+        writer.close()
+
+    print(f"idle connections         {connections} (opened in {connect_seconds:.1f}s)")
+    print(f"server memory            {(held - baseline) / 1024:.1f} MiB for all streams, "
+          f"{(held - baseline) / connections:.1f} KiB per connection")
+    print(f"event delivery           median {1000 * statistics.median(d[0] for d in delivery):.1f} ms, "
+          f"last client {1000 * statistics.median(d[1] for d in delivery):.1f} ms "
+          f"(median over {events} uploads, upload request included)")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Sample event stream fan-out benchmark")
+    parser.add_argument("--database-url", default="sqlite:///./bench.db")
+    parser.add_argument("--connections", type=int, default=5000)
+    parser.add_argument("--events", type=int, default=20)
+    parser.add_argument("--connect-batch", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    fixture = seed(args.database_url, samples=100, institutions=1, audit_logs=0)
+    process, base_url = start_server(args.database_url)
+    try:
+        response = httpx.post(f"{base_url}/api/v1/auth/login", json={
+            "email": fixture["institutions"][0]["researcher"], "password": BENCH_PASSWORD
+        })
+        response.raise_for_status()
+        asyncio.run(run(
+            base_url, response.json()["access_token"], "con_0000", process.pid,
+            args.connections, args.events, args.connect_batch
+        ))
+    finally:
+        process.terminate()
+        process.wait()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
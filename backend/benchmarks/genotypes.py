@@ -0,0 +1,106 @@
+"""
+AFRO-GENOMICS Research Platform
+Packed Genotype Store Benchmark
+
+Measures encode throughput, bytes per sample, single-site random access,
+full decode and batch extraction (N sites x M samples) for genotype_store on
+synthetic array data, and checks every read against the source calls.
+
+Usage (from backend/):
+    python benchmarks/genotypes.py --sites 500000 --samples 500
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from models import Base, Sample  # noqa: E402
+import genotype_store  # noqa: E402
+from genotype_store import (  # noqa: E402
+    create_site_list, store_calls, open_calls, extract, PackedGenotypes, MISSING
+)
+
+
+def synthetic_calls(rng: np.random.Generator, samples: int, sites: int, missing_rate: float) -> np.ndarray:
+    """Calls drawn from per-site allele frequencies (mostly hom-ref, like real arrays)"""
+    frequencies = rng.beta(0.3, 2.0, size=sites)
+    calls = rng.binomial(2, frequencies, size=(samples, sites)).astype(np.uint8)
+    calls[rng.random((samples, sites)) < missing_rate] = MISSING
+    return calls
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Packed genotype store benchmark")
+    parser.add_argument("--sites", type=int, default=500000)
+    parser.add_argument("--samples", type=int, default=500)
+    parser.add_argument("--extract-sites", type=int, default=500)
+    parser.add_argument("--missing-rate", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    sample_ids = [f"smp_{i:06d}" for i in range(args.samples)]
+    db.execute(Sample.__table__.insert(), [
+        {"id": s, "sample_id": s, "user_id": "u", "institution_id": "i", "consent_id": "c"} for s in sample_ids
+    ])
+
+    site_list = create_site_list(
+        db, "synthetic",
+        chromosomes=[f"chr{1 + i % 22}" for i in range(args.sites)],
+        positions=np.arange(args.sites) * 1000 + 1,
+        rsids=[f"rs{i}" for i in range(args.sites)],
+    )
+    calls = synthetic_calls(rng, args.samples, args.sites, args.missing_rate)
+
+    started = time.perf_counter()
+    for sample_id, row in zip(sample_ids, calls):
+        store_calls(db, sample_id, site_list, row)
+    db.commit()
+    encode_s = time.perf_counter() - started
+    blob_bytes = sum(len(open_calls(db, s)[1]._blob) for s in sample_ids[:50]) / min(50, args.samples)
+
+    _, reader = open_calls(db, sample_ids[0])
+    probes = rng.integers(0, args.sites, size=2000)
+    started = time.perf_counter()
+    for index in probes:
+        fresh = PackedGenotypes(reader._blob.tobytes())
+        assert fresh[int(index)] == calls[0, index]
+    random_access_us = (time.perf_counter() - started) / probes.size * 1e6
+
+    started = time.perf_counter()
+    decoded = reader.decode()
+    decode_ms = (time.perf_counter() - started) * 1000
+    assert np.array_equal(decoded, calls[0])
+
+    site_indices = np.sort(rng.choice(args.sites, size=args.extract_sites, replace=False))
+    started = time.perf_counter()
+    matrix = extract(db, sample_ids, site_list, site_indices)
+    extract_s = time.perf_counter() - started
+    assert np.array_equal(matrix, calls[:, site_indices])
+
+    raw_row_bytes = args.sites * 45  # one (sample, variant, code) row per call
+    print(f"sites x samples          {args.sites} x {args.samples}")
+    print(f"encode                   {args.samples / encode_s:,.0f} samples/s")
+    print(f"blob size                {blob_bytes / 1024:,.1f} KiB/sample "
+          f"({blob_bytes * 8 / args.sites:.2f} bits/call, {raw_row_bytes / blob_bytes:,.0f}x smaller than call rows)")
+    print(f"single-site lookup       {random_access_us:,.1f} us (cold blob, one block inflated)")
+    print(f"full decode              {decode_ms:,.1f} ms/sample")
+    print(f"extract {args.extract_sites} sites          {extract_s * 1000:,.1f} ms for {args.samples} samples "
+          f"({args.samples * args.extract_sites / extract_s / 1e6:,.1f}M calls/s)")
+    print(f"block size               {genotype_store.GENOTYPE_BLOCK_SITES} sites")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""
+AFRO-GENOMICS Research Platform
+Idempotent Upload Check
+
+Uploads samples with Idempotency-Key headers, then retries every one of
+them, and compares latency and SQL statements per request for first
+attempts and retries (from /api/v1/metrics). Then fires bursts of identical
+requests (same key, sent concurrently, as a client with an aggressive retry
+timer would) and checks each burst created exactly one sample and every
+copy got the same response.
+
+Usage (from backend/):
+    python benchmarks/idempotency.py --uploads 500 --bursts 20
+"""
+
+import argparse
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Tuple
+
+import httpx
+from sqlalchemy import create_engine, func, select
+
+from load import seed, start_server, BENCH_PASSWORD, METRICS_HEADERS, _percentile
+from models import Sample
+
+_QUERIES_RE = re.compile(r'^http_request_db_queries_(sum|count)\{route="/api/v1/samples"\} (\S+)$')
+
+
+def upload_queries(client: httpx.Client) -> Dict[str, float]:
+    totals = {"sum": 0.0, "count": 0.0}
+    for line in client.get("/api/v1/metrics", headers=METRICS_HEADERS).text.splitlines():
+        match = _QUERIES_RE.match(line)
+        if match:
+            totals[match.group(1)] += float(match.group(2))
+    return totals
+
+
+def timed_uploads(client: httpx.Client, bodies: List[Tuple[str, dict]]) -> Tuple[List[float], List[int]]:
+    latencies, statuses = [], []
+    for key, body in bodies:
+        started = time.perf_counter()
+        response = client.post("/api/v1/samples", json=body, headers={"Idempotency-Key": key})
+        latencies.append(time.perf_counter() - started)
+        statuses.append(response.status_code)
+    return sorted(latencies), statuses
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Idempotency-Key replay cost and duplicate suppression")
+    parser.add_argument("--uploads", type=int, default=500)
+    parser.add_argument("--bursts", type=int, default=20)
+    parser.add_argument("--burst-size", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='idempotency-bench-'), 'bench.db')}"
+    fixture = seed(database_url, samples=2000, institutions=1, audit_logs=0)
+    process, base_url = start_server(database_url, ADMISSION_ENABLED="false")
+    try:
+        client = httpx.Client(base_url=base_url, timeout=60)
+        response = client.post(
+            "/api/v1/auth/login", json={"email": fixture["institutions"][0]["researcher"], "password": BENCH_PASSWORD}
+        )
+        response.raise_for_status()
+        client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+
+        bodies = [
+            (f"upload-{n}", {"sample_id": f"IDM-2025-{n:06d}", "consent_id": "con_0000"}) for n in range(args.uploads)
+        ]
+        phases = {}
+        for phase in ("first attempt", "retry"):
+            before = upload_queries(client)
+            latencies, statuses = timed_uploads(client, bodies)
+            after = upload_queries(client)
+            served = after["count"] - before["count"]
+            phases[phase] = {
+                "p50_ms": _percentile(latencies, 0.50) * 1000,
+                "p95_ms": _percentile(latencies, 0.95) * 1000,
+                "queries": (after["sum"] - before["sum"]) / served if served else 0.0,
+                "created": statuses.count(201),
+            }
+
+        duplicates, mismatched = 0, 0
+        for n in range(args.bursts):
+            key, body = f"burst-{n}", {"sample_id": f"BUR-2025-{n:06d}", "consent_id": "con_0000"}
+            responses: List[httpx.Response] = []
+            lock = threading.Lock()
+
+            def send():
+                with httpx.Client(base_url=base_url, timeout=60, headers=client.headers) as burst_client:
+                    result = burst_client.post("/api/v1/samples", json=body, headers={"Idempotency-Key": key})
+                with lock:
+                    responses.append(result)
+
+            threads = [threading.Thread(target=send) for _ in range(args.burst_size)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            bodies_seen = {r.text for r in responses if r.status_code == 201}
+            mismatched += len(bodies_seen) != 1 or any(r.status_code != 201 for r in responses)
+
+        engine = create_engine(database_url)
+        with engine.connect() as conn:
+            duplicates = conn.execute(
+                select(func.count()).select_from(
+                    select(Sample.sample_id).group_by(Sample.sample_id, Sample.institution_id)
+                    .having(func.count() > 1).subquery()
+                )
+            ).scalar()
+            burst_samples = conn.execute(
+                select(func.count()).select_from(Sample).where(Sample.sample_id.like("BUR-%"))
+            ).scalar()
+        engine.dispose()
+
+        print(f"{args.uploads} keyed uploads, then the same {args.uploads} again")
+        for phase, r in phases.items():
+            print(f"  {phase:<14} p50 {r['p50_ms']:6.2f} ms  p95 {r['p95_ms']:6.2f} ms  "
+                  f"{r['queries']:.1f} SQL statements/request  {r['created']} returned 201")
+        print(f"{args.bursts} bursts of {args.burst_size} concurrent identical requests: "
+              f"{burst_samples} samples created, {mismatched} bursts with differing responses")
+        print(f"duplicate (sample_id, institution_id) rows: {duplicates}")
+    finally:
+        process.terminate()
+        process.wait()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
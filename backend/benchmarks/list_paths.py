@@ -0,0 +1,140 @@
+"""
+AFRO-GENOMICS Research Platform
+List Endpoint Row-Path Benchmark
+
+Builds the sample list, audit log and institution list responses in-process
+the way the endpoints used to (ORM entities or response models per row) and
+through the plain row-dict path, including FastAPI's response_model
+validation and JSON rendering. Reports CPU time per page and peak memory
+per row while the page is read and mapped (before rendering, which both
+paths share) at page sizes 50, 100 and 1000 (institutions: all of them).
+
+Usage (from backend/):
+    python benchmarks/list_paths.py --pages 50
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from fastapi.responses import JSONResponse
+from fastapi.utils import create_response_field
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from load import seed
+from models import Institution, Sample, User
+from schemas import AuditLogListResponse, AuditLogResponse, InstitutionResponse, SampleListResponse, SampleResponse
+from audit_store import query_audit_logs
+from repository import institution_rows, institution_user_emails, samples_page
+
+PAGE_SIZES = (50, 100, 1000)
+
+
+def legacy_samples(db, institution_id: str, limit: int):
+    query = db.query(Sample).filter(Sample.institution_id == institution_id)
+    total = query.count()
+    samples = query.offset(0).limit(limit).all()
+    return SampleListResponse(
+        samples=[SampleResponse.from_orm(s) for s in samples], total=total, limit=limit, offset=0
+    )
+
+
+def row_samples(db, institution_id: str, limit: int):
+    total, samples = samples_page(db, institution_id, None, limit, 0)
+    return {"samples": samples, "total": total, "limit": limit, "offset": 0}
+
+
+def legacy_audit(db, institution_id: str, limit: int):
+    emails = dict(db.query(User.id, User.email).filter(User.institution_id == institution_id).all())
+    total, logs = query_audit_logs(db, list(emails), limit=limit)
+    return AuditLogListResponse(
+        logs=[AuditLogResponse(**log, user_email=emails.get(log["user_id"])) for log in logs],
+        total=total, limit=limit, offset=0
+    )
+
+
+def row_audit(db, institution_id: str, limit: int):
+    emails = institution_user_emails(db, institution_id)
+    total, logs = query_audit_logs(db, list(emails), limit=limit)
+    for log in logs:
+        log["user_email"] = emails.get(log["user_id"])
+    return {"logs": logs, "total": total, "limit": limit, "offset": 0}
+
+
+def render(field, content) -> bytes:
+    """What FastAPI does with an endpoint's return value: validate, serialize, encode"""
+    value, errors = field.validate(content, {}, loc=("response",))
+    assert not errors, errors
+    return JSONResponse(field.serialize(value)).body
+
+
+def measure(session_factory, field, build: Callable, pages: int) -> Dict[str, float]:
+    def page() -> bytes:
+        with session_factory() as db:
+            return render(field, build(db))
+
+    body = page()  # Warm statement caches
+    started = time.process_time()
+    for _ in range(pages):
+        page()
+    cpu = (time.process_time() - started) / pages
+
+    with session_factory() as db:
+        tracemalloc.start()
+        build(db)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {"cpu_ms": cpu * 1000, "peak": peak, "body": body}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="CPU and memory of list responses: ORM entities vs row dicts")
+    parser.add_argument("--pages", type=int, default=50, help="Pages timed per case")
+    parser.add_argument("--institutions", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='list-paths-bench-'), 'bench.db')}"
+    seed(database_url, samples=max(PAGE_SIZES) * 2, institutions=1, audit_logs=max(PAGE_SIZES) * 2)
+    engine = create_engine(database_url)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(insert(Institution), [
+            {"id": f"inst_x{i:05d}", "name": f"Extra Institution {i}", "country": "Uganda",
+             "data_retention_months": 60, "created_at": now}
+            for i in range(args.institutions - 1)
+        ])
+    session_factory = sessionmaker(bind=engine)
+    institution_id = "inst_0000"
+
+    cases: List = []
+    for limit in PAGE_SIZES:
+        cases.append((f"samples  limit {limit}", limit, SampleListResponse,
+                      lambda db, limit=limit: legacy_samples(db, institution_id, limit),
+                      lambda db, limit=limit: row_samples(db, institution_id, limit)))
+    for limit in PAGE_SIZES:
+        cases.append((f"audit    limit {limit}", limit, AuditLogListResponse,
+                      lambda db, limit=limit: legacy_audit(db, institution_id, limit),
+                      lambda db, limit=limit: row_audit(db, institution_id, limit)))
+    cases.append((f"institutions ({args.institutions})", args.institutions, List[InstitutionResponse],
+                   lambda db: db.query(Institution).all(), institution_rows))
+
+    print(f"{'':<24} {'before ms/page':>17} {'B/row':>7} {'rows ms/page':>13} {'B/row':>7} {'CPU saved':>10}")
+    for label, rows, response_type, legacy, fast in cases:
+        field = create_response_field(name="response", type_=response_type)
+        before = measure(session_factory, field, legacy, args.pages)
+        after = measure(session_factory, field, fast, args.pages)
+        assert before["body"] == after["body"], f"{label}: responses differ"
+        print(f"{label:<24} {before['cpu_ms']:>17.2f} {before['peak'] / rows:>7.0f} {after['cpu_ms']:>13.2f} "
+              f"{after['peak'] / rows:>7.0f} {1 - after['cpu_ms'] / before['cpu_ms']:>9.0%}")
+    engine.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
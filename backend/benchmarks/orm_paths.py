@@ -0,0 +1,154 @@
+"""
+AFRO-GENOMICS Research Platform
+Hot-Path ORM Overhead Microbenchmark
+
+Runs each hot data-access path in-process against a seeded SQLite file,
+first as the `db.query(...).filter(...)` the endpoints used to build per
+request and then through repository.py's cached statements. Per call it
+reports wall time, time inside the database driver (cursor execute) and
+the difference: what SQLAlchemy spent building, compiling and loading.
+
+Usage (from backend/):
+    python benchmarks/orm_paths.py --calls 5000
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from load import seed
+from models import AncestryResult, AuditLog, HealthMarker, Sample, User
+from repository import (
+    user_by_id, sample_by_id, samples_page, active_ancestry_results, health_marker_calls, insert_audit_rows
+)
+
+
+class DriverClock:
+    """Seconds spent in cursor execution on an engine"""
+
+    def __init__(self, engine):
+        self.seconds = 0.0
+        event.listen(engine, "before_cursor_execute", self._before)
+        event.listen(engine, "after_cursor_execute", self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info["driver_started"] = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        self.seconds += time.perf_counter() - conn.info.pop("driver_started")
+
+
+def audit_values(user_id: str, n: int) -> dict:
+    return {
+        "id": str(uuid.uuid4()), "user_id": user_id, "action": "accessed_results", "resource_accessed": f"smp_{n:08d}",
+        "timestamp": datetime.utcnow(), "ip_address": "10.0.0.1", "user_agent": "bench", "details": None
+    }
+
+
+def legacy_page(db, institution_id: str, status, limit: int, offset: int):
+    query = db.query(Sample).filter(Sample.institution_id == institution_id)
+    if status:
+        query = query.filter(Sample.status == status)
+    return query.count(), query.offset(offset).limit(limit).all()
+
+
+def legacy_audit(db, user_id: str, n: int):
+    db.add(AuditLog(**audit_values(user_id, n)))
+    db.flush()
+
+
+def paths(user_id: str, institution_id: str, sample_ids: List[str], rng: random.Random) -> Dict[str, Dict[str, Callable]]:
+    """name -> {"query": old expression, "cached": repository call}, each taking (db, n)"""
+    pick = lambda n: sample_ids[n % len(sample_ids)]  # noqa: E731
+    offset = lambda: rng.randrange(0, max(1, len(sample_ids) - 50))  # noqa: E731
+    return {
+        "principal lookup": {
+            "query": lambda db, n: db.query(User).filter(User.id == user_id).first(),
+            "cached": lambda db, n: user_by_id(db, user_id),
+        },
+        "sample by id": {
+            "query": lambda db, n: db.query(Sample).filter(Sample.id == pick(n)).first(),
+            "cached": lambda db, n: sample_by_id(db, pick(n)),
+        },
+        "sample list (status)": {
+            "query": lambda db, n: legacy_page(db, institution_id, "Results Available", 50, offset()),
+            "cached": lambda db, n: samples_page(db, institution_id, "Results Available", 50, offset()),
+        },
+        "ancestry by sample": {
+            "query": lambda db, n: db.query(AncestryResult).filter(
+                AncestryResult.sample_id == pick(n), AncestryResult.is_active.is_(True)
+            ).all(),
+            "cached": lambda db, n: active_ancestry_results(db, pick(n)),
+        },
+        "markers by sample": {
+            "query": lambda db, n: db.query(HealthMarker.variant_id, HealthMarker.genotype_code).filter(
+                HealthMarker.sample_id == pick(n)
+            ).all(),
+            "cached": lambda db, n: health_marker_calls(db, pick(n)),
+        },
+        "audit insert": {
+            "query": lambda db, n: legacy_audit(db, user_id, n),
+            "cached": lambda db, n: insert_audit_rows(db, [audit_values(user_id, n)]),
+        },
+    }
+
+
+def measure(session_factory, clock: DriverClock, call: Callable, calls: int) -> Dict[str, float]:
+    db = session_factory()
+    for n in range(min(200, calls)):  # Warm the statement cache and the page cache
+        call(db, n)
+    db.rollback()
+    db.expunge_all()
+    driver_before = clock.seconds
+    started = time.perf_counter()
+    for n in range(calls):
+        call(db, n)
+        if n % 100 == 99:
+            db.expunge_all()  # Keep the identity map from turning lookups into dict hits
+    total = time.perf_counter() - started
+    driver = clock.seconds - driver_before
+    db.rollback()
+    db.close()
+    return {"total_us": total / calls * 1e6, "driver_us": driver / calls * 1e6, "orm_us": (total - driver) / calls * 1e6}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Per-call ORM overhead of the hot data-access paths")
+    parser.add_argument("--samples", type=int, default=5000)
+    parser.add_argument("--calls", type=int, default=5000)
+    args = parser.parse_args(argv)
+    rng = random.Random(11)
+
+    database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='orm-paths-bench-'), 'bench.db')}"
+    fixture = seed(database_url, samples=args.samples, institutions=1, audit_logs=0)
+    engine = create_engine(database_url)
+    clock = DriverClock(engine)
+    session_factory = sessionmaker(bind=engine, autoflush=False)
+    institution = fixture["institutions"][0]
+    user_id = institution["researcher"].split("@")[0]
+    with session_factory() as db:
+        institution_id = user_by_id(db, user_id).institution_id
+
+    print(f"{args.calls} calls per path, SQLite, per-call microseconds")
+    print(f"{'':<22} {'query total':>12} {'ORM':>8} {'cached total':>13} {'ORM':>8} {'ORM saved':>10}")
+    for name, variants in paths(user_id, institution_id, institution["sample_ids"], rng).items():
+        before = measure(session_factory, clock, variants["query"], args.calls)
+        after = measure(session_factory, clock, variants["cached"], args.calls)
+        saved = 1 - after["orm_us"] / before["orm_us"] if before["orm_us"] else 0.0
+        print(f"{name:<22} {before['total_us']:>12.1f} {before['orm_us']:>8.1f} {after['total_us']:>13.1f} "
+              f"{after['orm_us']:>8.1f} {saved:>9.0%}")
+    engine.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+AFRO-GENOMICS Research Platform
+PCA Projection Benchmark
+
+Fits the reference PCA on a synthetic structured panel (Balding-Nichols
+populations drifted from shared ancestral frequencies), then projects a batch
+of new samples drawn from the same populations. Reports fit time, agreement
+of the randomized axes with an exact SVD, population separation on the
+projected coordinates and projection throughput, both end to end (blob
+extraction + projection) and for the matrix product alone.
+
+Usage (from backend/):
+    python benchmarks/pca.py --reference 2000 --projected 10000 --sites 50000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from models import Base, Sample  # noqa: E402
+import pca  # noqa: E402
+from genotype_store import create_site_list, store_calls, extract, MISSING  # noqa: E402
+
+
+def structured_calls(rng, population_frequencies, samples: int, chunk: int = 500):
+    """
+    Calls for `samples` individuals spread evenly over the populations, as
+    (first row, labels, calls) chunks so 10k x 50k never needs int64 temporaries
+    """
+    for start in range(0, samples, chunk):
+        labels = np.arange(start, min(start + chunk, samples)) % len(population_frequencies)
+        calls = rng.binomial(2, population_frequencies[labels]).astype(np.uint8)
+        calls[rng.random(calls.shape) < 0.01] = MISSING
+        yield start, labels, calls
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="PCA fit and projection benchmark")
+    parser.add_argument("--reference", type=int, default=2000)
+    parser.add_argument("--projected", type=int, default=10000)
+    parser.add_argument("--sites", type=int, default=50000)
+    parser.add_argument("--populations", type=int, default=6)
+    parser.add_argument("--fst", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    ancestral = rng.uniform(0.05, 0.95, size=args.sites)
+    drift = (1 - args.fst) / args.fst
+    population_frequencies = rng.beta(ancestral * drift, (1 - ancestral) * drift, size=(args.populations, args.sites))
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    reference_ids = [f"ref_{i:06d}" for i in range(args.reference)]
+    projected_ids = [f"smp_{i:06d}" for i in range(args.projected)]
+    db.execute(Sample.__table__.insert(), [
+        {"id": s, "sample_id": s, "user_id": "u", "institution_id": "i", "consent_id": "c"}
+        for s in reference_ids + projected_ids
+    ])
+    site_list = create_site_list(
+        db, "synthetic", [f"chr{1 + i % 22}" for i in range(args.sites)], np.arange(args.sites) * 1000 + 1,
+        [f"rs{i}" for i in range(args.sites)]
+    )
+    reference, labels = [], []
+    for start, _, calls in structured_calls(rng, population_frequencies, args.reference):
+        for sample_id, codes in zip(reference_ids[start:], calls):
+            store_calls(db, sample_id, site_list, codes)
+        reference.append(calls)
+    for start, chunk_labels, calls in structured_calls(rng, population_frequencies, args.projected):
+        for sample_id, codes in zip(projected_ids[start:], calls):
+            store_calls(db, sample_id, site_list, codes)
+        labels.append(chunk_labels)
+    db.commit()
+    reference, labels = np.concatenate(reference), np.concatenate(labels)
+
+    pca.PCA_MODEL_DIR = tempfile.mkdtemp(prefix="pca-bench-")
+    started = time.perf_counter()
+    model = pca.fit_model(db, site_list.version, reference_ids, "synthetic")
+    db.commit()
+    fit_seconds = time.perf_counter() - started
+    projector = pca.get_projector(model)
+
+    # Randomized axes vs an exact SVD of the same standardized matrix
+    codes = reference[:, projector.sites]
+    matrix = pca.standardize(codes, projector.means, np.sqrt(projector.means * (1 - projector.means / 2)))
+    _, _, exact = np.linalg.svd(matrix, full_matrices=False)
+    axes = projector.weights * np.sqrt(projector.means * (1 - projector.means / 2))[:, None]
+    separated = args.populations - 1
+    agreement = np.linalg.svd(exact[:separated] @ axes[:, :separated], compute_uv=False)
+
+    started = time.perf_counter()
+    coordinates, _ = pca.project_samples(db, model, projected_ids)
+    end_to_end = time.perf_counter() - started
+    batch = extract(db, projected_ids, site_list, projector.sites)
+    started = time.perf_counter()
+    scores = projector.project(batch)
+    matmul = time.perf_counter() - started
+
+    # Nearest population centroid on the separated components
+    points = scores[:, :separated]
+    centroids = np.stack([points[labels == p].mean(axis=0) for p in range(args.populations)])
+    nearest = np.argmin(((points[:, None, :] - centroids[None]) ** 2).sum(axis=2), axis=1)
+
+    print(f"reference x sites        {model.reference_samples} x {model.sites} "
+          f"(of {args.sites}, {args.populations} populations, Fst {args.fst})")
+    print(f"fit                      {fit_seconds:.2f}s ({model.components} components, "
+          f"{pca.PCA_POWER_ITERATIONS} power iterations)")
+    print(f"explained variance       {', '.join(f'{v:.2%}' for v in model.explained_variance[:separated + 1])}")
+    print(f"axes vs exact SVD        min canonical correlation {agreement.min():.4f} over PC1-{separated}")
+    print(f"projection end to end    {len(coordinates) / end_to_end:,.0f} samples/s "
+          f"({len(coordinates)} samples in {end_to_end:.2f}s)")
+    print(f"projection matmul only   {args.projected / matmul:,.0f} samples/s ({matmul * 1000:.1f} ms)")
+    print(f"population assignment    {100 * np.mean(nearest == labels):.2f}% to the true population's centroid")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""
+AFRO-GENOMICS Research Platform
+Relatedness Screening Benchmark
+
+Screens a synthetic cohort of unrelated founders plus planted duplicates
+(with genotyping error), parent-offspring pairs and full siblings, and
+reports screening throughput, LSH candidates per sample and recall /
+false positives per relationship class.
+
+Usage (from backend/):
+    python benchmarks/relatedness.py --founders 2000 --sites 100000
+    python benchmarks/relatedness.py --exhaustive    # verify against every sample instead of LSH candidates
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from models import Base, Sample, RelatedSamplePair  # noqa: E402
+import relatedness  # noqa: E402
+from genotype_store import create_site_list, store_calls, MISSING  # noqa: E402
+
+
+def transmit(rng: np.random.Generator, parent: np.ndarray) -> np.ndarray:
+    """One allele (0 = ref, 1 = alt) passed on from each parental genotype"""
+    return np.where(parent == 1, rng.integers(0, 2, parent.size), parent // 2).astype(np.uint8)
+
+
+def synthetic_cohort(rng, founders: int, sites: int, families: int, error_rate: float):
+    frequencies = rng.beta(0.3, 2.0, size=sites)
+    calls = [rng.binomial(2, frequencies).astype(np.uint8) for _ in range(founders)]
+    truth = {}
+
+    def add(row, relatives, relationship):
+        calls.append(row)
+        for relative in relatives:
+            truth[(len(calls) - 1, relative)] = relationship
+        return len(calls) - 1
+
+    for family in range(families):
+        mother, father = 2 * family, 2 * family + 1
+        child = transmit(rng, calls[mother]) + transmit(rng, calls[father])
+        sibling = transmit(rng, calls[mother]) + transmit(rng, calls[father])
+        child = add(child, [mother, father], "1st Degree")
+        add(sibling, [mother, father, child], "1st Degree")
+        duplicate = calls[2 * families + family].copy()
+        errors = rng.random(sites) < error_rate
+        duplicate[errors] = rng.integers(0, 3, int(errors.sum()))
+        add(duplicate, [2 * families + family], "Duplicate")
+
+    matrix = np.stack(calls)
+    matrix[rng.random(matrix.shape) < 0.01] = MISSING
+    return matrix, truth
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Relatedness screening benchmark")
+    parser.add_argument("--founders", type=int, default=2000)
+    parser.add_argument("--sites", type=int, default=100000)
+    parser.add_argument("--families", type=int, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.005)
+    parser.add_argument("--exhaustive", action="store_true")
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args(argv)
+
+    relatedness.RELATEDNESS_EXHAUSTIVE_MAX = 10 ** 9 if args.exhaustive else 0
+    rng = np.random.default_rng(args.seed)
+    matrix, truth = synthetic_cohort(rng, args.founders, args.sites, args.families, args.error_rate)
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    sample_ids = [f"smp_{i:06d}" for i in range(matrix.shape[0])]
+    db.execute(Sample.__table__.insert(), [
+        {"id": s, "sample_id": s, "user_id": "u", "institution_id": "i", "consent_id": "c"} for s in sample_ids
+    ])
+    site_list = create_site_list(
+        db, "synthetic", [f"chr{1 + i % 22}" for i in range(args.sites)], np.arange(args.sites) * 1000 + 1,
+        [f"rs{i}" for i in range(args.sites)]
+    )
+    for sample_id, row in zip(sample_ids, matrix):
+        store_calls(db, sample_id, site_list, row)
+    db.commit()
+
+    candidates = []
+    original = relatedness._candidates
+
+    def counting(db, institution_id, version, sample_id, cohort, buckets):
+        found = original(db, institution_id, version, sample_id, cohort, buckets)
+        candidates.append((cohort, len(found)))
+        return found
+
+    relatedness._candidates = counting
+    started = time.perf_counter()
+    for sample_id in sample_ids:
+        relatedness.screen_sample(db, sample_id)
+        db.commit()
+    elapsed = time.perf_counter() - started
+
+    found = {
+        (int(a[4:]), int(b[4:])): rel for a, b, rel in db.execute(
+            select(RelatedSamplePair.sample_id, RelatedSamplePair.related_sample_id, RelatedSamplePair.relationship)
+        )
+    }
+    print(f"samples x sites          {matrix.shape[0]} x {args.sites} "
+          f"({min(args.sites, relatedness.RELATEDNESS_SKETCH_SITES)} sketch sites)")
+    print(f"mode                     {'exhaustive' if args.exhaustive else 'LSH'} "
+          f"({relatedness.RELATEDNESS_LSH_BANDS} bands x {relatedness.RELATEDNESS_LSH_ROWS} rows, "
+          f"calibrated on {relatedness.RELATEDNESS_CALIBRATION_SAMPLES} samples)")
+    print(f"screening                {matrix.shape[0] / elapsed:,.0f} samples/s")
+    tail = [(cohort, n) for cohort, n in candidates if cohort >= matrix.shape[0] // 2]
+    print(f"candidates per sample    {np.mean([n for _, n in tail]):,.1f} mean in the second half "
+          f"({100 * np.mean([n / cohort for cohort, n in tail]):.1f}% of the cohort)")
+    for relationship in ("Duplicate", "1st Degree"):
+        planted = [pair for pair, rel in truth.items() if rel == relationship]
+        hits = sum(1 for pair in planted if found.get(pair) == relationship)
+        print(f"{relationship:<24} {hits}/{len(planted)} recovered")
+    expected = set(truth) | {(b, a) for a, b in truth}
+    false = sum(1 for pair in found if pair not in expected) // 2
+    print(f"unexpected pairs         {false}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""
+AFRO-GENOMICS Research Platform
+Read-Replica Routing Check
+
+Two-database stand-in for a primary and a streaming replica: the API runs
+against a primary SQLite file with DATABASE_REPLICA_URLS pointing at a
+second file that a replicator thread refreshes from the primary (SQLite
+backup API) every --replication-delay seconds.
+
+Per round the researcher uploads a sample and immediately lists samples
+(read-your-writes: must see it), while the lab admin lists right away (served
+by the lagging replica: normally doesn't see it yet) and again after the
+replica has caught up. Replication is then paused past REPLICA_MAX_LAG_SECONDS
+to check that reads fall back to the primary. Reports the routing counters
+from /api/v1/metrics.
+
+Usage (from backend/):
+    python benchmarks/replica_routing.py --rounds 20
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+
+from load import seed, start_server, BENCH_PASSWORD, METRICS_HEADERS
+
+_ROUTING_RE = re.compile(r'^db_read_sessions_total\{reason="([^"]+)",target="([^"]+)"\} (\S+)$')
+
+
+class Replicator(threading.Thread):
+    """Copies the primary file over the replica every `delay` seconds while not paused"""
+
+    def __init__(self, primary: str, replica: str, delay: float):
+        super().__init__(daemon=True)
+        self.primary, self.replica, self.delay = primary, replica, delay
+        self.paused = threading.Event()
+        self.stopped = threading.Event()
+
+    def copy(self):
+        source, target = sqlite3.connect(self.primary), sqlite3.connect(self.replica, timeout=30)
+        try:
+            source.backup(target)
+        finally:
+            source.close()
+            target.close()
+
+    def run(self):
+        while not self.stopped.wait(self.delay):
+            if not self.paused.is_set():
+                self.copy()
+
+
+def login(base_url: str, email: str) -> httpx.Client:
+    client = httpx.Client(base_url=base_url, timeout=30)
+    response = client.post("/api/v1/auth/login", json={"email": email, "password": BENCH_PASSWORD})
+    response.raise_for_status()
+    client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+    return client
+
+
+def received(client: httpx.Client) -> set:
+    response = client.get("/api/v1/samples", params={"status": "Received", "limit": 100})
+    response.raise_for_status()
+    return {s["sample_id"] for s in response.json()["samples"]}
+
+
+def routing(client: httpx.Client) -> dict:
+    counts = {}
+    for line in client.get("/api/v1/metrics", headers=METRICS_HEADERS).text.splitlines():
+        match = _ROUTING_RE.match(line)
+        if match:
+            counts[f"{match.group(2)} ({match.group(1)})"] = int(float(match.group(3)))
+    return counts
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Read-replica routing check on a two-database stand-in")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--replication-delay", type=float, default=2.0)
+    parser.add_argument("--max-lag", type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp(prefix="replica-bench-")
+    primary, replica = os.path.join(directory, "primary.db"), os.path.join(directory, "replica.db")
+    fixture = seed(f"sqlite:///{primary}", samples=200, institutions=1, audit_logs=0)
+    replicator = Replicator(primary, replica, args.replication_delay)
+    replicator.copy()
+    process, base_url = start_server(
+        f"sqlite:///{primary}", DATABASE_REPLICA_URLS=f"sqlite:///{replica}",
+        REPLICA_MAX_LAG_SECONDS=str(args.max_lag)
+    )
+    replicator.start()
+    try:
+        institution = fixture["institutions"][0]
+        researcher, admin = login(base_url, institution["researcher"]), login(base_url, institution["admin"])
+        time.sleep(args.replication_delay + 2)  # First heartbeat reaches the replica
+
+        own_misses = stale_for_others = caught_up = 0
+        for n in range(args.rounds):
+            marker = f"REP-2025-{n:05d}"
+            researcher.post(
+                "/api/v1/samples", json={"sample_id": marker, "consent_id": "con_0000"}
+            ).raise_for_status()
+            own_misses += marker not in received(researcher)
+            stale_for_others += marker not in received(admin)
+            time.sleep(args.replication_delay + 2)
+            caught_up += marker in received(admin)
+        before_pause = routing(researcher)
+
+        replicator.paused.set()
+        time.sleep(args.max_lag + 2)
+        marker = "REP-2025-PAUSED"
+        researcher.post("/api/v1/samples", json={"sample_id": marker, "consent_id": "con_0000"}).raise_for_status()
+        fallback_fresh = marker in received(admin)
+        after_pause = routing(researcher)
+
+        print(f"read-your-writes         {args.rounds - own_misses}/{args.rounds} uploads visible to the uploader at once")
+        print(f"replica reads            {stale_for_others}/{args.rounds} uploads not yet visible to another user "
+              f"(replica {args.replication_delay:.0f}s behind)")
+        print(f"replica caught up        {caught_up}/{args.rounds} visible to the other user after replication")
+        print(f"replication paused       other user sees new upload at once: {fallback_fresh} (primary fallback)")
+        for key in sorted(after_pause):
+            print(f"  {key:<32} {before_pause.get(key, 0):>5} -> {after_pause[key]}")
+    finally:
+        replicator.stopped.set()
+        process.terminate()
+        process.wait()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
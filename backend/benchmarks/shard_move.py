@@ -0,0 +1,134 @@
+"""
+AFRO-GENOMICS Research Platform
+Online Shard Move Check
+
+Runs the API against a directory SQLite file and a second file configured as
+shard "east" (DATABASE_SHARD_URLS), then moves one institution there with
+`python shards.py move` while its researcher keeps uploading samples.
+
+Reports the rows copied online and during the freeze, how long writes were
+paused, how many uploads got 503 (and succeeded on retry), whether every
+accepted upload ended up on the new shard and nothing was left behind, and
+the latency of a fan-out status query.
+
+Usage (from backend/):
+    python benchmarks/shard_move.py --samples 20000
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+from sqlalchemy import create_engine, func, select
+
+from load import seed, start_server, BENCH_PASSWORD, BACKEND_DIR
+from models import Sample
+
+
+class Uploader(threading.Thread):
+    """Uploads samples back to back, retrying after 503 until stopped"""
+
+    def __init__(self, base_url: str, email: str, consent_id: str):
+        super().__init__(daemon=True)
+        self.client = httpx.Client(base_url=base_url, timeout=30)
+        response = self.client.post("/api/v1/auth/login", json={"email": email, "password": BENCH_PASSWORD})
+        response.raise_for_status()
+        self.client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+        self.consent_id = consent_id
+        self.accepted, self.unavailable, self.failed = [], 0, 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        n = 0
+        while not self.stopped.is_set():
+            sample_id = f"MOV-2025-{n:06d}"
+            response = self.client.post("/api/v1/samples", json={"sample_id": sample_id, "consent_id": self.consent_id})
+            if response.status_code == 503:
+                self.unavailable += 1
+                time.sleep(float(response.headers.get("Retry-After", "1")))
+                continue
+            if response.status_code < 300:
+                self.accepted.append(sample_id)
+            else:
+                self.failed += 1
+            n += 1
+
+
+def count_samples(database_url: str, institution_id: str) -> int:
+    engine = create_engine(database_url)
+    try:
+        with engine.connect() as conn:
+            return conn.execute(
+                select(func.count()).select_from(Sample).where(Sample.institution_id == institution_id)
+            ).scalar()
+    finally:
+        engine.dispose()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Move an institution between shards under write load")
+    parser.add_argument("--samples", type=int, default=20000)
+    parser.add_argument("--institutions", type=int, default=4)
+    parser.add_argument("--map-refresh", type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp(prefix="shard-bench-")
+    directory_url = f"sqlite:///{os.path.join(directory, 'directory.db')}"
+    shard_url = f"sqlite:///{os.path.join(directory, 'east.db')}"
+    fixture = seed(directory_url, samples=args.samples, institutions=args.institutions, audit_logs=0)
+    institution = fixture["institutions"][0]
+    institution_id = f"inst_{0:04d}"
+    settings = {"DATABASE_SHARD_URLS": f"east={shard_url}", "SHARD_MAP_REFRESH_SECONDS": str(args.map_refresh)}
+    process, base_url = start_server(directory_url, **settings)
+    try:
+        before = count_samples(directory_url, institution_id)
+        uploader = Uploader(base_url, institution["researcher"], "con_0000")
+        uploader.start()
+        time.sleep(2)
+
+        started = time.perf_counter()
+        move = subprocess.run(
+            [sys.executable, "shards.py", "move", institution_id, "east"],
+            cwd=BACKEND_DIR, env=dict(os.environ, DATABASE_URL=directory_url, **settings),
+            capture_output=True, text=True, check=True
+        )
+        move_seconds = time.perf_counter() - started
+        time.sleep(2 * args.map_refresh)
+        uploader.stopped.set()
+        uploader.join()
+
+        on_target = count_samples(shard_url, institution_id)
+        left_behind = count_samples(directory_url, institution_id)
+        expected = before + len(uploader.accepted)
+
+        started = time.perf_counter()
+        status = subprocess.run(
+            [sys.executable, "shards.py", "status"],
+            cwd=BACKEND_DIR, env=dict(os.environ, DATABASE_URL=directory_url, **settings),
+            capture_output=True, text=True, check=True
+        )
+        status_seconds = time.perf_counter() - started
+
+        print(f"institution size         {before} samples (+{len(uploader.accepted)} uploaded during the move)")
+        for line in move.stdout.splitlines():
+            if not line.startswith("{"):
+                print(f"  {line}")
+        print(f"move wall time           {move_seconds:.1f}s")
+        print(f"uploads during move      {len(uploader.accepted)} accepted, {uploader.unavailable} got 503 "
+              f"and were retried, {uploader.failed} failed")
+        print(f"on target shard          {on_target}/{expected} samples, {left_behind} left on the source")
+        print(f"fan-out status           {status.stdout.strip().splitlines()[-1]} "
+              f"({status_seconds:.1f}s including interpreter start)")
+    finally:
+        process.terminate()
+        process.wait()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""
+AFRO-GENOMICS Research Platform
+Delta Sync Round-Trip and Bandwidth Check
+
+Plays one remote lab's day both ways against a seeded server: the initial
+download of its sample list, uploading samples recorded offline, and
+refreshing after the central lab produced results for some of them.
+
+- chatty: GET /samples page by page, one POST /samples per sample, then the
+  whole list again plus GET /samples/{id}/results for each new result
+- sync: GET /sync/samples pages, one gzip-compressed POST /sync/samples
+  batch, then one GET /sync/samples since the last watermark
+
+Reports requests and body bytes on the wire per phase, and an estimate of
+the time on a high-latency, narrow link (--rtt-ms, --kbps).
+
+Usage (from backend/):
+    python benchmarks/sync.py --samples 2000 --uploads 200 --results 100
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import tempfile
+from typing import Dict, List
+
+import httpx
+
+from load import seed, start_server, BENCH_PASSWORD
+
+
+class Wire:
+    """Requests and body bytes sent and received"""
+
+    def __init__(self):
+        self.requests = 0
+        self.sent = 0
+        self.received = 0
+
+    def record(self, response: httpx.Response) -> httpx.Response:
+        response.read()
+        self.requests += 1
+        self.sent += len(response.request.content)
+        self.received += response.num_bytes_downloaded
+        return response
+
+    def seconds(self, rtt_ms: float, kbps: float) -> float:
+        return self.requests * rtt_ms / 1000 + (self.sent + self.received) * 8 / (kbps * 1000)
+
+
+def chatty(client: httpx.Client, phase: str, uploads: List[dict], result_ids: List[str], known: Dict) -> Wire:
+    wire = Wire()
+    if phase in ("initial", "refresh"):
+        offset, total = 0, None
+        while total is None or offset < total:
+            page = wire.record(client.get("/api/v1/samples", params={"limit": 100, "offset": offset})).json()
+            total = page["total"]
+            offset += 100
+        for sample_id in result_ids if phase == "refresh" else []:
+            wire.record(client.get(f"/api/v1/samples/{sample_id}/results"))
+    else:
+        for body in uploads:
+            known[body["sample_id"]] = wire.record(client.post("/api/v1/samples", json=body)).json()["id"]
+    return wire
+
+
+def synced(client: httpx.Client, phase: str, uploads: List[dict], state: Dict) -> Wire:
+    wire = Wire()
+    if phase in ("initial", "refresh"):
+        has_more = True
+        while has_more:
+            params = {"since": state["watermark"]} if state.get("watermark") else {}
+            page = wire.record(client.get("/api/v1/sync/samples", params=params)).json()
+            state["watermark"], has_more = page["watermark"], page["has_more"]
+    else:
+        body = gzip.compress(json.dumps({"samples": uploads}).encode())
+        outcome = wire.record(client.post(
+            "/api/v1/sync/samples", content=body,
+            headers={"Content-Encoding": "gzip", "Content-Type": "application/json", "Idempotency-Key": "day-1"}
+        )).json()
+        for item in outcome["results"]:
+            state[item["sample_id"]] = item["id"]
+    return wire
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Requests and bytes for a remote lab: per-item API vs delta sync")
+    parser.add_argument("--samples", type=int, default=2000)
+    parser.add_argument("--uploads", type=int, default=200)
+    parser.add_argument("--results", type=int, default=100, help="Uploaded samples processed centrally before refresh")
+    parser.add_argument("--rtt-ms", type=float, default=300.0)
+    parser.add_argument("--kbps", type=float, default=256.0)
+    args = parser.parse_args(argv)
+
+    database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='sync-bench-'), 'bench.db')}"
+    fixture = seed(database_url, samples=args.samples, institutions=2, audit_logs=0)
+    process, base_url = start_server(database_url, ADMISSION_ENABLED="false")
+    report = {}
+    try:
+        for mode, institution, prefix in (("chatty", 0, "CHT"), ("sync", 1, "SYN")):
+            lab = fixture["institutions"][institution]
+            client = httpx.Client(base_url=base_url, timeout=120, headers={"Accept-Encoding": "gzip"})
+            response = client.post("/api/v1/auth/login", json={"email": lab["researcher"], "password": BENCH_PASSWORD})
+            response.raise_for_status()
+            client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+            consent_id = f"con_{institution:04d}"
+            uploads = [
+                {"sample_id": f"{prefix}-2025-{n:06d}", "participant_id": f"P{n:07d}", "consent_id": consent_id,
+                 "notes": "Collected at a field site, uploaded after reconnecting"}
+                for n in range(args.uploads)
+            ]
+            ids: Dict = {}
+            phases = {"initial": None, "upload": None, "refresh": None}
+            for phase in phases:
+                result_ids = []
+                if phase == "refresh":
+                    # The central lab processes some uploads (traffic not counted)
+                    result_ids = [ids[body["sample_id"]] for body in uploads[:args.results]]
+                    for sample_id in result_ids:
+                        client.get(f"/api/v1/samples/{sample_id}/results").raise_for_status()
+                if mode == "chatty":
+                    phases[phase] = chatty(client, phase, uploads, result_ids, ids)
+                else:
+                    phases[phase] = synced(client, phase, uploads, ids)
+            report[mode] = phases
+            client.close()
+    finally:
+        process.terminate()
+        process.wait()
+
+    print(f"{args.samples // 2} samples per lab, {args.uploads} uploads, {args.results} new results; "
+          f"estimate at {args.rtt_ms:.0f} ms RTT, {args.kbps:.0f} kbit/s (bodies only)")
+    print(f"{'':<18} {'requests':>9} {'KB up':>8} {'KB down':>9} {'est. s':>8}")
+    for mode, phases in report.items():
+        for phase, wire in phases.items():
+            print(f"{mode + ' ' + phase:<18} {wire.requests:>9} {wire.sent / 1024:>8.1f} {wire.received / 1024:>9.1f} "
+                  f"{wire.seconds(args.rtt_ms, args.kbps):>8.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
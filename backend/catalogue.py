@@ -0,0 +1,156 @@
+"""
+AFRO-GENOMICS Research Platform
+Variant Catalogue Cache
+
+In-memory copy of the `variants` table. Genotype calls are stored as
+(sample, variant_id, genotype_code); results assembly, cohort indexing and
+region counts decode them against this cache instead of joining or
+repeating annotation text per call.
+
+The catalogue is append-only, so a worker that meets an unknown variant id
+simply reloads it from the database; no cross-worker invalidation is needed.
+"""
+
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, Mapping, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import Variant
+from panels import MarkerDefinition
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MARKER_DISCLAIMER = (
+    "For research use only. Not diagnostic. Phenotype prediction has error rates. "
+    "Consult genetic counselor for clinical interpretation."
+)
+
+
+@dataclass(frozen=True)
+class CatalogueEntry:
+    """Immutable snapshot of one Variant row"""
+    id: int
+    rsid: str
+    gene: str
+    chromosome: Optional[str]
+    position: Optional[int]
+    genotypes: Tuple[str, ...]
+    phenotypes: Tuple[str, ...]
+    clinical_significance: Optional[str]
+    population_frequency: Optional[Mapping[str, str]]
+    disclaimer: str
+
+    def code(self, genotype: str) -> int:
+        try:
+            return self.genotypes.index(genotype)
+        except ValueError:
+            raise ValueError(f"Genotype {genotype} is not catalogued for {self.rsid}") from None
+
+    def genotype(self, code: int) -> str:
+        return self.genotypes[code]
+
+    def phenotype(self, code: int) -> str:
+        return self.phenotypes[code]
+
+
+def _entry(variant: Variant) -> CatalogueEntry:
+    return CatalogueEntry(
+        id=variant.id,
+        rsid=variant.variant_rsid,
+        gene=variant.gene_name,
+        chromosome=variant.chromosome,
+        position=variant.position,
+        genotypes=tuple(variant.genotypes),
+        phenotypes=tuple(variant.phenotypes),
+        clinical_significance=variant.clinical_significance,
+        population_frequency=variant.population_frequency,
+        disclaimer=variant.disclaimer,
+    )
+
+
+class VariantCatalogue:
+    """Thread-safe id/rsid lookup over the variants table"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_id: Dict[int, CatalogueEntry] = {}
+        self._by_rsid: Dict[str, CatalogueEntry] = {}
+
+    def load(self, db: Session):
+        """Replace the cache with the full catalogue"""
+        entries = [_entry(v) for v in db.query(Variant).all()]
+        with self._lock:
+            self._by_id = {e.id: e for e in entries}
+            self._by_rsid = {e.rsid: e for e in entries}
+
+    def _remember(self, entries: Iterable[CatalogueEntry]):
+        with self._lock:
+            for entry in entries:
+                self._by_id[entry.id] = entry
+                self._by_rsid[entry.rsid] = entry
+
+    def get_many(self, db: Session, variant_ids: Iterable[int]) -> Dict[int, CatalogueEntry]:
+        """Entries by id, fetching any not yet cached (added by another worker) in one query"""
+        variant_ids = set(variant_ids)
+        found = {i: self._by_id[i] for i in variant_ids if i in self._by_id}
+        missing = variant_ids - found.keys()
+        if missing:
+            fetched = [_entry(v) for v in db.query(Variant).filter(Variant.id.in_(missing)).all()]
+            self._remember(fetched)
+            found.update((e.id, e) for e in fetched)
+        return found
+
+    def get(self, db: Session, variant_id: int) -> Optional[CatalogueEntry]:
+        return self.get_many(db, [variant_id]).get(variant_id)
+
+    def find(self, db: Session, rsid: str) -> Optional[CatalogueEntry]:
+        """Entry by rsid, or None if not catalogued"""
+        entry = self._by_rsid.get(rsid)
+        if entry is None:
+            variant = db.query(Variant).filter(Variant.variant_rsid == rsid).first()
+            if variant is not None:
+                entry = _entry(variant)
+                self._remember([entry])
+        return entry
+
+    def ensure(self, db: Session, marker: MarkerDefinition) -> CatalogueEntry:
+        """Catalogue entry for a panel marker, inserting the Variant row on first use"""
+        entry = self._by_rsid.get(marker.variant)
+        if entry is not None:
+            return entry
+        variant = db.query(Variant).filter(Variant.variant_rsid == marker.variant).first()
+        if variant is None:
+            variant = Variant(
+                variant_rsid=marker.variant,
+                gene_name=marker.gene,
+                chromosome=marker.chromosome,
+                position=marker.position,
+                genotypes=list(marker.genotypes),
+                phenotypes=[marker.phenotype(g) for g in marker.genotypes],
+                clinical_significance=marker.significance,
+                population_frequency=dict(marker.frequencies),
+                disclaimer=DEFAULT_MARKER_DISCLAIMER,
+            )
+            db.add(variant)
+            try:
+                db.commit()
+            except IntegrityError:
+                # Another worker catalogued it first
+                db.rollback()
+                variant = db.query(Variant).filter(Variant.variant_rsid == marker.variant).one()
+        entry = _entry(variant)
+        self._remember([entry])
+        return entry
+
+    def decoder(self, db: Session) -> Dict[int, CatalogueEntry]:
+        """Snapshot of every entry (after a reload) for bulk decoding"""
+        self.load(db)
+        with self._lock:
+            return dict(self._by_id)
+
+
+variant_catalogue = VariantCatalogue()
@@ -0,0 +1,433 @@
+"""
+AFRO-GENOMICS Research Platform
+Change Feed for Downstream Consumers
+
+Analytics, cache invalidation and search indexing follow changes to samples,
+their results and consents through an ordered feed instead of rescanning the
+samples and consent_records tables:
+
+- Every transaction that inserts, updates or deletes one of those rows writes
+  ChangeEvent rows in the same transaction, so an event exists exactly when
+  its change committed. ORM changes are collected after each flush; bulk
+  UPDATE / DELETE statements on the tracked tables (purges, retention,
+  relatedness flags, ancestry activation) are captured as they execute by
+  first selecting the rows they are about to touch. Statements run with
+  execution option change_events=False (sync stamps) are not changes.
+- A transaction produces one event per entity: insert then update is an
+  insert, anything then delete a delete. "results" events carry the id of
+  the sample whose active ancestry results or marker calls changed.
+- Events are numbered when the transaction commits, from the database's
+  ChangeSequence row, which stays locked until the commit finishes. Events
+  therefore become visible in seq order and a consumer that has read up to
+  N can never miss one numbered below N later. The lock is the last one a
+  transaction takes and is held only for its commit.
+- Each database (directory and every shard) keeps the feed of the rows it
+  holds, so a cursor has one position per shard ("default:120,east:7").
+  Moving an institution copies its rows without producing events.
+
+Consumers read batches after their cursor from GET /api/v1/changes. With
+`wait` the request is held until events arrive (long polling): commits wake
+waiting readers of the institution on this worker and, over the
+InvalidationBus, on the others. Events older than CHANGE_FEED_RETENTION_HOURS
+are pruned; a cursor that points into the pruned part of a feed is refused
+and the consumer reloads, starting from GET /api/v1/changes/head.
+"""
+
+import asyncio
+import heapq
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import event, delete, func, insert, inspect, select, update
+from sqlalchemy.orm import Session
+
+from models import AncestryResult, ChangeEvent, ChangeSequence, ConsentRecord, HealthMarker, Sample, User
+from shards import DEFAULT_SHARD, shard_router
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+CHANGE_FEED_PAGE_SIZE = int(os.getenv("CHANGE_FEED_PAGE_SIZE", "500"))  # Events per batch unless asked for fewer
+CHANGE_FEED_MAX_PAGE_SIZE = int(os.getenv("CHANGE_FEED_MAX_PAGE_SIZE", "5000"))
+CHANGE_FEED_MAX_WAIT_SECONDS = float(os.getenv("CHANGE_FEED_MAX_WAIT_SECONDS", "30"))  # Longest long poll
+CHANGE_FEED_MAX_WAITERS = int(os.getenv("CHANGE_FEED_MAX_WAITERS", "1000"))  # Long polls held per worker
+CHANGE_FEED_RETENTION_HOURS = float(os.getenv("CHANGE_FEED_RETENTION_HOURS", "168"))
+CHANGE_FEED_PRUNE_INTERVAL_SECONDS = float(os.getenv("CHANGE_FEED_PRUNE_INTERVAL_SECONDS", "600"))
+CHANGE_FEED_PRUNE_BATCH_SIZE = int(os.getenv("CHANGE_FEED_PRUNE_BATCH_SIZE", "5000"))
+
+_PENDING = "change_events"  # session.info: (entity, id) -> [institution_id, op, fields] until commit
+_WRITTEN = "change_events_written"  # session.info: institutions whose events the transaction wrote
+
+# Op of an entity changed twice in one transaction (first, then) when it is not simply the later one
+_MERGED_OPS = {("insert", "update"): "insert", ("delete", "insert"): "update", ("delete", "update"): "update"}
+
+# Not a change of its own (see sync.py)
+_IGNORED_FIELDS = frozenset({"change_seq"})
+
+
+class ChangeFeedError(ValueError):
+    """Malformed change feed cursor"""
+
+
+class CursorExpired(Exception):
+    """The cursor points at events that have been pruned; the consumer has to reload"""
+
+
+# ==================== CAPTURE ====================
+
+def _record(session: Session, entity: str, entity_id: str, institution_id: Optional[str], op: str,
+            fields: Optional[Iterable[str]] = None):
+    pending = session.info.setdefault(_PENDING, {})
+    current = pending.get((entity, entity_id))
+    if current is None:
+        pending[(entity, entity_id)] = [institution_id, op, set(fields) if fields and op == "update" else None]
+        return
+    merged = _MERGED_OPS.get((current[1], op), op)
+    if merged == "update" and current[2] is not None and fields:
+        current[2].update(fields)
+    else:
+        current[2] = None
+    current[0] = current[0] or institution_id
+    current[1] = merged
+
+
+def _changed_fields(obj) -> Set[str]:
+    state = inspect(obj)
+    return {key for key in state.mapper.column_attrs.keys() if state.attrs[key].history.has_changes()}
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_flushed(session, flush_context):
+    changes: List[Tuple[object, str, Optional[Set[str]]]] = [(obj, "insert", None) for obj in session.new]
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            fields = _changed_fields(obj) - _IGNORED_FIELDS
+            if fields:
+                changes.append((obj, "update", fields))
+    changes.extend((obj, "delete", None) for obj in session.deleted)
+
+    consents: List[Tuple[ConsentRecord, str, Optional[Set[str]]]] = []
+    result_samples: Dict[str, str] = {}
+    for obj, op, fields in changes:
+        if isinstance(obj, Sample):
+            _record(session, "sample", obj.id, obj.institution_id, op, fields)
+        elif isinstance(obj, ConsentRecord):
+            consents.append((obj, op, fields))
+        elif isinstance(obj, HealthMarker) or (isinstance(obj, AncestryResult) and (obj.is_active or op != "insert")):
+            result_samples[obj.sample_id] = _MERGED_OPS.get((result_samples.get(obj.sample_id), op), op)
+
+    # Consents belong to their user's institution, results to their sample's
+    if consents:
+        institutions = dict(session.execute(
+            select(User.id, User.institution_id).where(User.id.in_({obj.user_id for obj, _, _ in consents}))
+        ).all())
+        for obj, op, fields in consents:
+            _record(session, "consent", obj.id, institutions.get(obj.user_id), op, fields)
+    if result_samples:
+        institutions = dict(session.execute(
+            select(Sample.id, Sample.institution_id).where(Sample.id.in_(list(result_samples)))
+        ).all())
+        for sample_id, op in result_samples.items():
+            _record(session, "results", sample_id, institutions.get(sample_id), op)
+
+
+def _affected_samples(is_delete: bool):
+    return select(Sample.id, Sample.institution_id)
+
+
+def _affected_consents(is_delete: bool):
+    return select(ConsentRecord.id, User.institution_id).outerjoin(User, User.id == ConsentRecord.user_id)
+
+
+def _affected_results(model):
+    def affected(is_delete: bool):
+        query = select(model.sample_id, Sample.institution_id).outerjoin(Sample, Sample.id == model.sample_id)
+        if is_delete and model is AncestryResult:
+            # Staged rows of a running recompute were never visible
+            query = query.where(AncestryResult.is_active.is_(True))
+        return query.distinct()
+    return affected
+
+
+# Tracked table -> (entity, (entity id, institution id) query for the rows a bulk statement touches)
+_BULK_CAPTURE: Dict[str, Tuple[str, Callable]] = {
+    Sample.__tablename__: ("sample", _affected_samples),
+    ConsentRecord.__tablename__: ("consent", _affected_consents),
+    AncestryResult.__tablename__: ("results", _affected_results(AncestryResult)),
+    HealthMarker.__tablename__: ("results", _affected_results(HealthMarker)),
+}
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _capture_bulk_changes(state):
+    if not (state.is_update or state.is_delete) or not state.execution_options.get("change_events", True):
+        return None
+    statement = state.statement
+    capture = _BULK_CAPTURE.get(getattr(statement.table, "name", None))
+    if capture is None:
+        return None
+
+    entity, affected = capture
+    query = affected(state.is_delete)
+    if statement.whereclause is not None:
+        query = query.where(statement.whereclause)
+    rows = state.session.execute(query).all()
+    result = state.invoke_statement()
+    op = "delete" if state.is_delete else "update"
+    for entity_id, institution_id in rows:
+        _record(state.session, entity, entity_id, institution_id, op)
+    return result
+
+
+# ==================== WRITE AT COMMIT ====================
+
+def _take_positions(db: Session, count: int) -> int:
+    """
+    First of `count` consecutive feed positions (caller commits)
+
+    Locks the database's counter until the transaction ends.
+    """
+    bumped = db.execute(
+        update(ChangeSequence).where(ChangeSequence.id == 1)
+        .values(value=ChangeSequence.value + count).execution_options(synchronize_session=False)
+    ).rowcount
+    if not bumped:
+        # First event of the database (a concurrent first commit fails on the key and is retried by its caller)
+        db.execute(insert(ChangeSequence).values(id=1, value=count, pruned_through=0))
+        return 1
+    return db.execute(select(ChangeSequence.value).where(ChangeSequence.id == 1)).scalar() - count + 1
+
+
+@event.listens_for(Session, "before_commit")
+def _write_events(session):
+    session.flush()  # Changes still pending are flushed (and collected) now rather than inside commit
+    pending = session.info.pop(_PENDING, None)
+    if not pending:
+        return
+    first = _take_positions(session, len(pending))
+    now = datetime.utcnow()
+    session.execute(insert(ChangeEvent), [
+        {
+            "seq": first + n, "entity": entity, "entity_id": entity_id, "institution_id": institution_id,
+            "op": op, "fields": sorted(fields) if fields else None, "changed_at": now
+        }
+        for n, ((entity, entity_id), (institution_id, op, fields)) in enumerate(pending.items())
+    ])
+    session.info[_WRITTEN] = {institution_id for institution_id, _, _ in pending.values() if institution_id}
+
+
+@event.listens_for(Session, "after_commit")
+def _announce_events(session):
+    institutions = session.info.pop(_WRITTEN, None)
+    if institutions:
+        change_notifier.notify(institutions)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _drop_pending(session, transaction):
+    if transaction.parent is None:
+        session.info.pop(_PENDING, None)  # Rolled back or closed without committing
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_written(session, previous_transaction):
+    session.info.pop(_WRITTEN, None)
+
+
+# ==================== READ ====================
+
+def parse_cursor(cursor: Optional[str]) -> Dict[str, int]:
+    """Shard -> last seq read; None or "" means from the beginning of every feed"""
+    positions = {}
+    for part in (cursor or "").split(","):
+        if not part.strip():
+            continue
+        shard, _, seq = part.strip().rpartition(":")
+        try:
+            positions[shard or DEFAULT_SHARD] = int(seq)
+        except ValueError:
+            raise ChangeFeedError(f"Invalid change feed cursor '{cursor}'")
+    return positions
+
+
+def format_cursor(positions: Dict[str, int]) -> str:
+    return ",".join(f"{shard}:{seq}" for shard, seq in sorted(positions.items()))
+
+
+def _shard_page(db: Session, institution_id: str, after: int, limit: int) -> Tuple[int, List[Dict]]:
+    pruned_through = db.execute(select(ChangeSequence.pruned_through).where(ChangeSequence.id == 1)).scalar() or 0
+    events = db.execute(
+        select(
+            ChangeEvent.seq, ChangeEvent.entity, ChangeEvent.entity_id, ChangeEvent.op, ChangeEvent.fields,
+            ChangeEvent.changed_at
+        ).where(ChangeEvent.institution_id == institution_id, ChangeEvent.seq > after)
+        .order_by(ChangeEvent.seq).limit(limit + 1)
+    ).mappings().all()
+    return pruned_through, [dict(row) for row in events]
+
+
+def read_changes(institution_id: str, cursor: Optional[str], limit: int) -> Dict:
+    """
+    One batch of an institution's changes after `cursor`, from every shard
+
+    Each shard's events come in seq order; shards are interleaved by commit
+    time. Positions missing from the cursor start at the beginning of that
+    shard's feed.
+
+    Returns:
+        {"cursor": cursor after this batch, "has_more": bool, "events": [...]}
+
+    Raises:
+        ChangeFeedError: Malformed cursor
+        CursorExpired: A position points into the pruned part of its feed
+    """
+    positions = parse_cursor(cursor)
+    pages = shard_router.fan_out(
+        lambda db: _shard_page(db, institution_id, positions.get(_shard_name(db), 0), limit)
+    )
+    for shard, (pruned_through, _) in pages.items():
+        if shard in positions and positions[shard] < pruned_through:
+            raise CursorExpired(shard)
+
+    merged = heapq.merge(
+        *([(row["changed_at"], shard, row) for row in events] for shard, (_, events) in sorted(pages.items())),
+        key=lambda entry: entry[:2]
+    )
+    batch = []
+    for changed_at, shard, row in merged:
+        if len(batch) == limit:
+            break
+        positions[shard] = row["seq"]
+        batch.append({"shard": shard, **row})
+    has_more = sum(len(events) for _, events in pages.values()) > len(batch)
+    return {"cursor": format_cursor(positions), "has_more": has_more, "events": batch}
+
+
+def feed_head() -> str:
+    """Cursor at the current end of every shard's feed (start following from here after a full load)"""
+    positions = shard_router.fan_out(
+        lambda db: db.execute(select(ChangeSequence.value).where(ChangeSequence.id == 1)).scalar() or 0
+    )
+    return format_cursor(positions)
+
+
+def _shard_name(db: Session) -> str:
+    engine = db.info.get("shard")
+    return next((name for name, shard in shard_router.engines.items() if shard is engine), DEFAULT_SHARD)
+
+
+# ==================== RETENTION ====================
+
+def prune_change_events(session_factory: Callable[[], Session], should_stop: Callable[[], bool] = lambda: False) -> int:
+    """Delete events older than CHANGE_FEED_RETENTION_HOURS from one database, in batches"""
+    deleted = 0
+    db = session_factory()
+    try:
+        while not should_stop():
+            cutoff = datetime.utcnow() - timedelta(hours=CHANGE_FEED_RETENTION_HOURS)
+            oldest = select(ChangeEvent.seq).where(ChangeEvent.changed_at < cutoff).order_by(ChangeEvent.seq) \
+                .limit(CHANGE_FEED_PRUNE_BATCH_SIZE).subquery()
+            last = db.execute(select(func.max(oldest.c.seq))).scalar()
+            if last is None:
+                break
+            count = db.execute(delete(ChangeEvent).where(ChangeEvent.seq <= last)).rowcount
+            db.execute(
+                update(ChangeSequence).where(ChangeSequence.id == 1, ChangeSequence.pruned_through < last)
+                .values(pruned_through=last)
+            )
+            db.commit()
+            deleted += count
+            if count < CHANGE_FEED_PRUNE_BATCH_SIZE:
+                break
+    finally:
+        db.close()
+    if deleted:
+        logger.info("Pruned %d change feed events", deleted)
+    return deleted
+
+
+# ==================== LONG POLLING ====================
+
+class ChangeNotifier:
+    """
+    Wakes long-polling feed readers of this worker when an institution's changes commit
+
+    Commits on this worker call notify() (any thread); those on other workers
+    arrive over the InvalidationBus. Waiters are futures on the event loop,
+    resolved through call_soon_threadsafe.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = 0
+        self._waiters: Dict[str, Dict[asyncio.Future, asyncio.AbstractEventLoop]] = {}  # institution -> waiters
+        self._count = 0
+        self._bus = None
+
+    @property
+    def version(self) -> int:
+        """Bumped by every notification; read it before reading the feed and pass it to wait()"""
+        return self._version
+
+    def accepting(self) -> bool:
+        return self._count < CHANGE_FEED_MAX_WAITERS
+
+    def notify(self, institution_ids: Iterable[str]):
+        """Changes of these institutions committed (call after commit)"""
+        institution_ids = sorted(institution_ids)
+        self._wake(institution_ids)
+        if self._bus is not None:
+            try:
+                self._bus.publish("change_feed", {"institutions": institution_ids})
+            except Exception:
+                logger.exception("Could not publish change feed notification")
+
+    def _wake(self, institution_ids: Iterable[str]):
+        with self._lock:
+            self._version += 1
+            woken = [item for institution_id in institution_ids
+                     for item in self._waiters.get(institution_id, {}).items()]
+        for future, loop in woken:
+            try:
+                loop.call_soon_threadsafe(_resolve, future)
+            except RuntimeError:
+                pass  # Loop shut down
+
+    async def wait(self, institution_id: str, version: int, timeout: float) -> bool:
+        """Wait up to `timeout` seconds for the institution's next change after `version`; True if one came"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if self._version != version:
+                return True
+            self._waiters.setdefault(institution_id, {})[future] = loop
+            self._count += 1
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(institution_id, {})
+                waiters.pop(future, None)
+                if not waiters:
+                    self._waiters.pop(institution_id, None)
+                self._count -= 1
+
+    def attach(self, bus):
+        """Wake readers for changes committed on other workers (see coordination.py)"""
+        self._bus = bus
+        bus.subscribe("change_feed", lambda message: self._wake(message.get("institutions", [])))
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+# Global notifier instance
+change_notifier = ChangeNotifier()
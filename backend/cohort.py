@@ -0,0 +1,586 @@
+"""
+AFRO-GENOMICS Research Platform
+Cohort Query Engine
+
+Answers researcher queries such as "samples with >70% Nilotic ancestry and
+HBB A/S" without multi-way joins. Sample ids are mapped to dense ordinals and
+every population bucket / genotype is kept as a compressed bitmap, so a query
+is evaluated as set operations (AND / OR / ANDNOT) over bitmaps.
+
+Filter language:
+    ancestry:Nilotic > 70 AND HBB = A/S
+    ancestry:"North African" >= 20 OR (G6PD != A/G AND NOT DUFFY = -/-)
+"""
+
+import logging
+import re
+import threading
+from array import array
+from itertools import chain
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from models import Sample, ConsentRecord, AncestryResult, HealthMarker, ConsentWithdrawalStatus
+from catalogue import variant_catalogue
+from shards import shard_router
+
+logger = logging.getLogger(__name__)
+
+# Sample ids per invalidation message (keeps each under the NOTIFY payload limit)
+_REMOVAL_CHUNK = 150
+
+
+# ==================== BITMAP ====================
+
+CHUNK_BITS = 16
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+CHUNK_BYTES = (1 << CHUNK_BITS) // 8
+
+_NONZERO_BYTE_RE = re.compile(rb"[^\x00]")
+_BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+
+class SampleBitmap:
+    """
+    Roaring-style bitmap of sample ordinals
+
+    Ordinals are split into 2^16-wide chunks keyed by their high bits; each
+    chunk is stored as a Python int used as a bitset. Empty chunks are never
+    stored, so sparse sets stay small and set operations only touch chunks
+    present on both sides.
+    """
+
+    __slots__ = ("_chunks",)
+
+    def __init__(self, chunks: Optional[Dict[int, int]] = None):
+        self._chunks: Dict[int, int] = chunks if chunks is not None else {}
+
+    @classmethod
+    def from_ordinals(cls, ordinals: Iterable[int]) -> "SampleBitmap":
+        """Bulk-build a bitmap; far cheaper than repeated add() for large sets"""
+        buffers: Dict[int, bytearray] = {}
+        for ordinal in ordinals:
+            key = ordinal >> CHUNK_BITS
+            buffer = buffers.get(key)
+            if buffer is None:
+                buffer = buffers[key] = bytearray(CHUNK_BYTES)
+            low = ordinal & CHUNK_MASK
+            buffer[low >> 3] |= 1 << (low & 7)
+        return cls({key: int.from_bytes(buffer, "little") for key, buffer in buffers.items()})
+
+    def add(self, ordinal: int):
+        key = ordinal >> CHUNK_BITS
+        self._chunks[key] = self._chunks.get(key, 0) | (1 << (ordinal & CHUNK_MASK))
+
+    def discard(self, ordinal: int):
+        key = ordinal >> CHUNK_BITS
+        chunk = self._chunks.get(key)
+        if chunk is None:
+            return
+        chunk &= ~(1 << (ordinal & CHUNK_MASK))
+        if chunk:
+            self._chunks[key] = chunk
+        else:
+            del self._chunks[key]
+
+    def __contains__(self, ordinal: int) -> bool:
+        chunk = self._chunks.get(ordinal >> CHUNK_BITS, 0)
+        return bool((chunk >> (ordinal & CHUNK_MASK)) & 1)
+
+    def __and__(self, other: "SampleBitmap") -> "SampleBitmap":
+        small, large = sorted((self._chunks, other._chunks), key=len)
+        chunks = {}
+        for key, chunk in small.items():
+            merged = chunk & large.get(key, 0)
+            if merged:
+                chunks[key] = merged
+        return SampleBitmap(chunks)
+
+    def __or__(self, other: "SampleBitmap") -> "SampleBitmap":
+        chunks = dict(self._chunks)
+        for key, chunk in other._chunks.items():
+            chunks[key] = chunks.get(key, 0) | chunk
+        return SampleBitmap(chunks)
+
+    def __sub__(self, other: "SampleBitmap") -> "SampleBitmap":
+        chunks = {}
+        for key, chunk in self._chunks.items():
+            remaining = chunk & ~other._chunks.get(key, 0)
+            if remaining:
+                chunks[key] = remaining
+        return SampleBitmap(chunks)
+
+    def __len__(self) -> int:
+        return sum(chunk.bit_count() for chunk in self._chunks.values())
+
+    def __bool__(self) -> bool:
+        return bool(self._chunks)
+
+    def __iter__(self) -> Iterator[int]:
+        return self.iter_from(0)
+
+    def iter_from(self, skip: int) -> Iterator[int]:
+        """Iterate ordinals in ascending order, skipping the first `skip` members"""
+        for key in sorted(self._chunks):
+            chunk = self._chunks[key]
+            if skip:
+                count = chunk.bit_count()
+                if skip >= count:
+                    skip -= count
+                    continue
+            base = key << CHUNK_BITS
+            data = chunk.to_bytes(CHUNK_BYTES, "little")
+            for match in _NONZERO_BYTE_RE.finditer(data):
+                offset = match.start()
+                for bit in _BYTE_BITS[data[offset]]:
+                    if skip:
+                        skip -= 1
+                        continue
+                    yield base + (offset << 3) + bit
+
+
+def _union(bitmaps: Iterable[SampleBitmap]) -> SampleBitmap:
+    chunks: Dict[int, int] = {}
+    for bitmap in bitmaps:
+        for key, chunk in bitmap._chunks.items():
+            chunks[key] = chunks.get(key, 0) | chunk
+    return SampleBitmap(chunks)
+
+
+# ==================== QUERY LANGUAGE ====================
+
+class CohortQueryError(ValueError):
+    """Raised when a cohort filter expression cannot be parsed"""
+
+
+_TOKEN_RE = re.compile(r"""
+    \s*(?:
+        (?P<lparen>\() |
+        (?P<rparen>\)) |
+        (?P<colon>:) |
+        (?P<op>>=|<=|!=|=|>|<) |
+        (?P<string>"[^"]*") |
+        (?P<number>\d+(?:\.\d+)?)%?(?![\w/\-]) |
+        (?P<word>[A-Za-z0-9_\-]+(?:/[A-Za-z0-9_\-]+)?)
+    )""", re.VERBOSE)
+
+_KEYWORDS = {"AND", "OR", "NOT"}
+_ANCESTRY_OPS = {">", ">=", "<", "<=", "="}
+_GENOTYPE_OPS = {"=", "!="}
+_MAX_NESTING = 32  # Parentheses and NOTs around one predicate (keeps parsing and evaluation off the recursion limit)
+
+
+def _tokenize(query: str) -> List[Tuple[str, str]]:
+    tokens = []
+    position = 0
+    query = query.rstrip()
+    while position < len(query):
+        match = _TOKEN_RE.match(query, position)
+        if not match or match.end() == position:
+            raise CohortQueryError(f"Unexpected character at position {position}: {query[position:position + 10]!r}")
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "string":
+            value = value[1:-1]
+        elif kind == "word" and value.upper() in _KEYWORDS:
+            kind, value = "keyword", value.upper()
+        tokens.append((kind, value))
+        position = match.end()
+    return tokens
+
+
+class _Parser:
+    """
+    Recursive-descent parser producing a small AST of tuples:
+        ("or", left, right) | ("and", left, right) | ("not", operand)
+        ("ancestry", population, op, value) | ("genotype", gene, op, genotype)
+    """
+
+    def __init__(self, tokens: List[Tuple[str, str]]):
+        self.tokens = tokens
+        self.position = 0
+        self.depth = 0
+
+    def parse(self):
+        if not self.tokens:
+            raise CohortQueryError("Empty query")
+        node = self._expr()
+        if self.position != len(self.tokens):
+            raise CohortQueryError(f"Unexpected token {self.tokens[self.position][1]!r}")
+        return node
+
+    def _peek(self) -> Tuple[Optional[str], Optional[str]]:
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None, None
+
+    def _take(self, *kinds: str) -> str:
+        kind, value = self._peek()
+        if kind not in kinds:
+            expected = " or ".join(kinds)
+            raise CohortQueryError(f"Expected {expected}, got {value!r}" if value else f"Expected {expected} at end of query")
+        self.position += 1
+        return value
+
+    def _expr(self):
+        node = self._term()
+        while self._peek() == ("keyword", "OR"):
+            self.position += 1
+            node = ("or", node, self._term())
+        return node
+
+    def _term(self):
+        node = self._factor()
+        while self._peek() == ("keyword", "AND"):
+            self.position += 1
+            node = ("and", node, self._factor())
+        return node
+
+    def _factor(self):
+        kind, value = self._peek()
+        if (kind, value) == ("keyword", "NOT") or kind == "lparen":
+            self.depth += 1
+            if self.depth > _MAX_NESTING:
+                raise CohortQueryError(f"Query nests deeper than {_MAX_NESTING} levels")
+            self.position += 1
+            if kind == "lparen":
+                node = self._expr()
+                self._take("rparen")
+            else:
+                node = ("not", self._factor())
+            self.depth -= 1
+            return node
+        return self._predicate()
+
+    def _predicate(self):
+        name = self._take("word", "string")
+        if name.lower() == "ancestry" and self._peek()[0] == "colon":
+            self.position += 1
+            population = self._take("word", "string")
+            op = self._take("op")
+            if op not in _ANCESTRY_OPS:
+                raise CohortQueryError(f"Operator {op!r} is not valid for ancestry filters")
+            value = float(self._take("number"))
+            if not 0 <= value <= 100:
+                raise CohortQueryError("Ancestry percentage must be between 0 and 100")
+            return ("ancestry", population, op, value)
+        op = self._take("op")
+        if op not in _GENOTYPE_OPS:
+            raise CohortQueryError(f"Operator {op!r} is not valid for genotype filters")
+        genotype = self._take("word", "string", "number")
+        return ("genotype", name, op, genotype)
+
+
+def parse_query(query: str):
+    """Parse a cohort filter expression into an AST"""
+    return _Parser(_tokenize(query)).parse()
+
+
+# ==================== COHORT INDEX ====================
+
+_MISSING = float("nan")
+
+
+class CohortIndex:
+    """
+    In-memory bitmap index over samples with active consent
+
+    - institution -> bitmap of samples
+    - population -> integer percentage bucket (0-100) -> bitmap
+    - (gene, genotype) -> bitmap, gene -> bitmap of genotyped samples
+
+    Exact percentages are kept in a flat per-population float array so only
+    the single boundary bucket of a threshold query needs a value check.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._bus = None
+        self._session_factory = None
+        self._reset()
+
+    def _reset(self):
+        self._ordinals: Dict[str, int] = {}
+        self._sample_ids: List[Optional[str]] = []
+        self._sample_institution: Dict[int, str] = {}
+        self._institutions: Dict[str, SampleBitmap] = {}
+        self._populations: Dict[str, str] = {}  # lower-case key -> canonical name
+        self._ancestry_buckets: Dict[str, Dict[int, SampleBitmap]] = {}
+        self._ancestry_values: Dict[str, array] = {}
+        self._genes: Dict[str, SampleBitmap] = {}
+        self._genotypes: Dict[Tuple[str, str], SampleBitmap] = {}
+
+    # ---------- maintenance ----------
+
+    def rebuild(self, db: Session):
+        """Rebuild the whole index from the database (every shard)"""
+        variants = variant_catalogue.decoder(db)
+        with shard_router.shard_sessions(db) as sessions:
+            samples = chain.from_iterable(
+                s.query(Sample.id, Sample.institution_id).join(
+                    ConsentRecord, Sample.consent_id == ConsentRecord.id
+                ).filter(ConsentRecord.withdrawal_status == ConsentWithdrawalStatus.ACTIVE).yield_per(10000)
+                for s in sessions
+            )
+            ancestry = chain.from_iterable(
+                s.query(
+                    AncestryResult.sample_id, AncestryResult.population_group, AncestryResult.percentage
+                ).filter(AncestryResult.is_active.is_(True)).yield_per(10000)
+                for s in sessions
+            )
+            markers = chain.from_iterable(
+                s.query(HealthMarker.sample_id, HealthMarker.variant_id, HealthMarker.genotype_code).yield_per(10000)
+                for s in sessions
+            )
+            genotypes = (
+                (sample_id, variants[variant_id].gene, variants[variant_id].genotype(code))
+                for sample_id, variant_id, code in markers
+                if variant_id in variants
+            )
+            self.load(samples, ancestry, genotypes)
+
+    def load(
+        self,
+        samples: Iterable[Tuple[str, str]],
+        ancestry: Iterable[Tuple[str, str, float]],
+        genotypes: Iterable[Tuple[str, str, str]],
+    ):
+        """Replace the index contents from (sample, institution), (sample, population, %) and (sample, gene, genotype) rows"""
+        with self._lock:
+            self._reset()
+            institutions: Dict[str, List[int]] = {}
+            for sample_id, institution_id in samples:
+                if sample_id in self._ordinals:
+                    continue
+                ordinal = len(self._sample_ids)
+                self._ordinals[sample_id] = ordinal
+                self._sample_ids.append(sample_id)
+                self._sample_institution[ordinal] = institution_id
+                institutions.setdefault(institution_id, []).append(ordinal)
+
+            size = len(self._sample_ids)
+            buckets: Dict[Tuple[str, int], List[int]] = {}
+            for sample_id, population, percentage in ancestry:
+                ordinal = self._ordinals.get(sample_id)
+                if ordinal is None:
+                    continue
+                population = self._populations.setdefault(population.lower(), population)
+                values = self._ancestry_values.get(population)
+                if values is None:
+                    values = self._ancestry_values[population] = array("d", [_MISSING]) * size
+                percentage = min(max(float(percentage), 0.0), 100.0)
+                values[ordinal] = percentage
+                buckets.setdefault((population, int(percentage)), []).append(ordinal)
+
+            genes: Dict[str, List[int]] = {}
+            calls: Dict[Tuple[str, str], List[int]] = {}
+            for sample_id, gene, genotype in genotypes:
+                ordinal = self._ordinals.get(sample_id)
+                if ordinal is None:
+                    continue
+                gene = gene.upper()
+                genes.setdefault(gene, []).append(ordinal)
+                calls.setdefault((gene, genotype), []).append(ordinal)
+
+            # Bucket maps may hold stale ordinals if a population appeared twice for a sample
+            for (population, bucket), ordinals in buckets.items():
+                values = self._ancestry_values[population]
+                self._ancestry_buckets.setdefault(population, {})[bucket] = SampleBitmap.from_ordinals(
+                    o for o in ordinals if int(values[o]) == bucket
+                )
+            self._institutions = {k: SampleBitmap.from_ordinals(v) for k, v in institutions.items()}
+            self._genes = {k: SampleBitmap.from_ordinals(v) for k, v in genes.items()}
+            self._genotypes = {k: SampleBitmap.from_ordinals(v) for k, v in calls.items()}
+
+    def add_sample(self, sample_id: str, institution_id: str):
+        with self._lock:
+            self._add_sample(sample_id, institution_id)
+        self._publish({"op": "add_sample", "sample": sample_id, "institution": institution_id})
+
+    def add_ancestry(self, sample_id: str, estimates: Iterable[Tuple[str, float]]):
+        estimates = [(population, float(percentage)) for population, percentage in estimates]
+        self._apply_ancestry(sample_id, estimates)
+        self._publish({"op": "add_ancestry", "sample": sample_id, "estimates": estimates})
+
+    def add_genotypes(self, sample_id: str, genotypes: Iterable[Tuple[str, str]]):
+        genotypes = list(genotypes)
+        self._apply_genotypes(sample_id, genotypes)
+        self._publish({"op": "add_genotypes", "sample": sample_id, "genotypes": genotypes})
+
+    def remove_samples(self, sample_ids: Iterable[str]):
+        """Drop samples (e.g. after consent withdrawal) from every bitmap"""
+        sample_ids = list(sample_ids)
+        self._apply_removal(sample_ids)
+        for start in range(0, len(sample_ids), _REMOVAL_CHUNK):
+            self._publish({"op": "remove_samples", "samples": sample_ids[start:start + _REMOVAL_CHUNK]})
+
+    def rebuild_everywhere(self, db: Session):
+        """Rebuild here and ask every other worker to rebuild (after bulk changes such as a reference switch)"""
+        self.rebuild(db)
+        self._publish({"op": "rebuild"})
+
+    # ---------- cross-worker sync ----------
+
+    def attach(self, bus, session_factory: Optional[Callable[[], Session]] = None):
+        """
+        Mirror every mutation to the other workers on an InvalidationBus (see coordination.py)
+
+        `session_factory` lets this worker honour remote rebuild requests.
+        """
+        self._bus = bus
+        self._session_factory = session_factory
+        bus.subscribe("cohort", self._apply_remote)
+
+    def _publish(self, message: dict):
+        if self._bus is not None:
+            try:
+                self._bus.publish("cohort", message)
+            except Exception:
+                logger.exception("Could not publish cohort index change")
+
+    def _apply_remote(self, message: dict):
+        op = message.get("op")
+        if op == "add_sample":
+            with self._lock:
+                self._add_sample(message["sample"], message["institution"])
+        elif op == "add_ancestry":
+            self._apply_ancestry(message["sample"], message["estimates"])
+        elif op == "add_genotypes":
+            self._apply_genotypes(message["sample"], message["genotypes"])
+        elif op == "remove_samples":
+            self._apply_removal(message["samples"])
+        elif op == "rebuild" and self._session_factory is not None:
+            db = self._session_factory()
+            try:
+                self.rebuild(db)
+            finally:
+                db.close()
+
+    def _apply_ancestry(self, sample_id: str, estimates: Iterable[Tuple[str, float]]):
+        with self._lock:
+            ordinal = self._ordinals.get(sample_id)
+            if ordinal is None:
+                return
+            for population, percentage in estimates:
+                self._add_ancestry(ordinal, population, percentage)
+
+    def _apply_genotypes(self, sample_id: str, genotypes: Iterable[Tuple[str, str]]):
+        with self._lock:
+            ordinal = self._ordinals.get(sample_id)
+            if ordinal is None:
+                return
+            for gene, genotype in genotypes:
+                self._add_genotype(ordinal, gene, genotype)
+
+    def _apply_removal(self, sample_ids: Iterable[str]):
+        with self._lock:
+            for sample_id in sample_ids:
+                ordinal = self._ordinals.pop(sample_id, None)
+                if ordinal is None:
+                    continue
+                self._sample_ids[ordinal] = None
+                institution_id = self._sample_institution.pop(ordinal)
+                self._institutions[institution_id].discard(ordinal)
+                for population, buckets in self._ancestry_buckets.items():
+                    values = self._ancestry_values[population]
+                    if ordinal < len(values) and values[ordinal] == values[ordinal]:
+                        buckets[int(values[ordinal])].discard(ordinal)
+                        values[ordinal] = _MISSING
+                for bitmap in self._genes.values():
+                    bitmap.discard(ordinal)
+                for bitmap in self._genotypes.values():
+                    bitmap.discard(ordinal)
+
+    def _add_sample(self, sample_id: str, institution_id: str):
+        if sample_id in self._ordinals:
+            return
+        ordinal = len(self._sample_ids)
+        self._ordinals[sample_id] = ordinal
+        self._sample_ids.append(sample_id)
+        self._sample_institution[ordinal] = institution_id
+        self._institutions.setdefault(institution_id, SampleBitmap()).add(ordinal)
+
+    def _add_ancestry(self, ordinal: int, population: str, percentage: float):
+        population = self._populations.setdefault(population.lower(), population)
+        values = self._ancestry_values.setdefault(population, array("d"))
+        if len(values) <= ordinal:
+            values.extend([_MISSING] * (len(self._sample_ids) - len(values)))
+        buckets = self._ancestry_buckets.setdefault(population, {})
+        previous = values[ordinal]
+        if previous == previous:
+            buckets[int(previous)].discard(ordinal)
+        percentage = min(max(float(percentage), 0.0), 100.0)
+        values[ordinal] = percentage
+        buckets.setdefault(int(percentage), SampleBitmap()).add(ordinal)
+
+    def _add_genotype(self, ordinal: int, gene: str, genotype: str):
+        gene = gene.upper()
+        self._genes.setdefault(gene, SampleBitmap()).add(ordinal)
+        self._genotypes.setdefault((gene, genotype), SampleBitmap()).add(ordinal)
+
+    # ---------- querying ----------
+
+    def query(self, expression: str, institution_id: str, limit: int, offset: int) -> Tuple[int, List[str]]:
+        """
+        Evaluate a filter expression within one institution
+
+        Returns:
+            (total matching samples, sample ids for the requested page)
+        """
+        ast = parse_query(expression)
+        with self._lock:
+            universe = self._institutions.get(institution_id, SampleBitmap())
+            result = self._evaluate(ast, universe) & universe
+            page = []
+            for ordinal in result.iter_from(offset):
+                if len(page) >= limit:
+                    break
+                page.append(self._sample_ids[ordinal])
+            return len(result), page
+
+    def _evaluate(self, node, universe: SampleBitmap) -> SampleBitmap:
+        kind = node[0]
+        if kind == "and":
+            return self._evaluate(node[1], universe) & self._evaluate(node[2], universe)
+        if kind == "or":
+            return self._evaluate(node[1], universe) | self._evaluate(node[2], universe)
+        if kind == "not":
+            return universe - self._evaluate(node[1], universe)
+        if kind == "ancestry":
+            return self._ancestry_match(*node[1:])
+        return self._genotype_match(*node[1:])
+
+    def _ancestry_match(self, population: str, op: str, value: float) -> SampleBitmap:
+        population = self._populations.get(population.lower())
+        if population is None:
+            return SampleBitmap()
+        buckets = self._ancestry_buckets[population]
+        values = self._ancestry_values[population]
+        boundary = int(value)
+        if op in (">", ">="):
+            full = [bitmap for bucket, bitmap in buckets.items() if bucket > boundary]
+        elif op in ("<", "<="):
+            full = [bitmap for bucket, bitmap in buckets.items() if bucket < boundary]
+        else:
+            full = []
+
+        compare = {
+            ">": value.__lt__, ">=": value.__le__,
+            "<": value.__gt__, "<=": value.__ge__,
+            "=": value.__eq__,
+        }[op]
+        edge = SampleBitmap.from_ordinals(
+            ordinal for ordinal in buckets.get(boundary, SampleBitmap()) if compare(values[ordinal])
+        )
+        return _union(full + [edge])
+
+    def _genotype_match(self, gene: str, op: str, genotype: str) -> SampleBitmap:
+        gene = gene.upper()
+        matched = self._genotypes.get((gene, genotype), SampleBitmap())
+        if op == "=":
+            return matched
+        return self._genes.get(gene, SampleBitmap()) - matched
+
+
+cohort_index = CohortIndex()
@@ -0,0 +1,245 @@
+"""
+AFRO-GENOMICS Research Platform
+Consent Access Decisions
+
+Every consent is reduced to one small integer: its status and the uses it
+permits (permitted_uses) as bits. Result reads, uploads and exports check a
+bit in this per-worker index instead of loading the consent row and parsing
+its JSON.
+
+The index covers every shard and is rebuilt at startup. Withdrawals update
+it after commit and are mirrored to the other workers over the
+InvalidationBus. A consent the index has not seen (created after the last
+rebuild by something other than this API) is loaded from the database on
+first use.
+
+The bus is best effort, so the index never grants access on stale data:
+
+- An entry that says "active" is trusted for CONSENT_INDEX_TTL_SECONDS
+  after it was last read from the database (by a rebuild or on demand);
+  after that the decision re-reads the row. Refusals need no re-read.
+- Every worker reconciles its index every CONSENT_INDEX_RECONCILE_SECONDS
+  against the consents that are no longer active, which repairs entries a
+  lost message left behind.
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from itertools import chain
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from models import ConsentRecord, ConsentWithdrawalStatus
+from shards import shard_router
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+CONSENT_INDEX_TTL_SECONDS = float(os.getenv("CONSENT_INDEX_TTL_SECONDS", "5"))  # Age before "active" is re-read
+CONSENT_INDEX_RECONCILE_SECONDS = float(os.getenv("CONSENT_INDEX_RECONCILE_SECONDS", "60"))
+
+# Permitted uses in bit order; the names are the keys of ConsentRecord.permitted_uses
+PERMITTED_USES = ("research", "publication", "secondary_research", "third_party_sharing")
+USE_BITS = {use: 1 << bit for bit, use in enumerate(PERMITTED_USES)}
+
+_STATUS_SHIFT = 5
+_STATUSES = list(ConsentWithdrawalStatus)
+
+# Consent ids per invalidation message (keeps each under the NOTIFY payload limit)
+_WITHDRAWAL_CHUNK = 150
+
+# Consent ids per re-read query
+_LOAD_CHUNK = 500
+
+
+def encode(status: ConsentWithdrawalStatus, permitted_uses: Optional[dict]) -> int:
+    """Status and permitted-use bits of one consent"""
+    flags = _STATUSES.index(ConsentWithdrawalStatus(status)) << _STATUS_SHIFT
+    for use, allowed in (permitted_uses or {}).items():
+        if allowed and use in USE_BITS:
+            flags |= USE_BITS[use]
+    return flags
+
+
+def consent_permits(flags: int, use: Optional[str] = None) -> bool:
+    """Consent is active and (if given) allows `use`"""
+    if flags >> _STATUS_SHIFT != 0:  # ACTIVE is the first status
+        return False
+    return use is None or bool(flags & USE_BITS[use])
+
+
+class ConsentIndex:
+    """consent_id -> (owner user_id, flags) for every consent"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flags: Dict[str, int] = {}
+        self._owners: Dict[str, str] = {}
+        self._built_at = float("-inf")  # Monotonic time the last rebuild started reading
+        self._verified: Dict[str, float] = {}  # consent_id -> monotonic time read since the rebuild
+        self._bus = None
+
+    # ---------- maintenance ----------
+
+    def rebuild(self, db: Session):
+        """Reload every consent from the database (every shard)"""
+        started = time.monotonic()
+        with shard_router.shard_sessions(db) as sessions:
+            rows = chain.from_iterable(
+                s.query(
+                    ConsentRecord.id, ConsentRecord.user_id, ConsentRecord.withdrawal_status, ConsentRecord.permitted_uses
+                ).yield_per(10000)
+                for s in sessions
+            )
+            flags, owners = {}, {}
+            for consent_id, user_id, status, permitted_uses in rows:
+                flags[consent_id] = encode(status, permitted_uses)
+                owners[consent_id] = sys.intern(user_id)
+        with self._lock:
+            self._flags, self._owners = flags, owners
+            self._built_at = started
+            self._verified = {}
+        logger.info("Consent index loaded: %d consents", len(flags))
+
+    def reconcile(self, session_factory: Callable[[], Session]) -> int:
+        """
+        Apply the status of every consent that is no longer active (every shard)
+
+        Repairs withdrawals this worker missed on the bus.
+
+        Returns:
+            Number of entries corrected
+        """
+        db = session_factory()
+        try:
+            with shard_router.shard_sessions(db) as sessions:
+                rows = list(chain.from_iterable(
+                    s.query(ConsentRecord.id, ConsentRecord.withdrawal_status).filter(
+                        ConsentRecord.withdrawal_status != ConsentWithdrawalStatus.ACTIVE
+                    )
+                    for s in sessions
+                ))
+        finally:
+            db.close()
+        corrected = 0
+        now = time.monotonic()
+        with self._lock:
+            for consent_id, status in rows:
+                flags = self._flags.get(consent_id)
+                if flags is not None and flags >> _STATUS_SHIFT != _STATUSES.index(status):
+                    self._flags[consent_id] = _with_status(flags, status)
+                    corrected += 1
+            self._verified = {
+                consent_id: at for consent_id, at in self._verified.items() if now - at < CONSENT_INDEX_TTL_SECONDS
+            }
+        if corrected:
+            logger.warning("Consent index: corrected %d consents whose status change was missed", corrected)
+        return corrected
+
+    def withdraw(self, consent_ids: Iterable[str]):
+        """Mark consents withdrawn here and on every other worker (call after commit)"""
+        consent_ids = list(consent_ids)
+        self._apply_status(consent_ids, ConsentWithdrawalStatus.WITHDRAWN)
+        for start in range(0, len(consent_ids), _WITHDRAWAL_CHUNK):
+            self._publish({
+                "consents": consent_ids[start:start + _WITHDRAWAL_CHUNK],
+                "status": ConsentWithdrawalStatus.WITHDRAWN.value
+            })
+
+    # ---------- decisions ----------
+
+    def lookup(self, db: Session, consent_id: str) -> Optional[Tuple[str, int]]:
+        """(owner user_id, flags) of a consent, or None if it does not exist"""
+        with self._lock:
+            flags = self._flags.get(consent_id)
+            if flags is not None and (not consent_permits(flags) or self._fresh(consent_id, time.monotonic())):
+                return self._owners[consent_id], flags
+        return self._load(db, [consent_id]).get(consent_id)
+
+    def allows(self, db: Session, consent_id: str, use: Optional[str] = None) -> bool:
+        """Consent exists, is active and (if given) permits `use`"""
+        entry = self.lookup(db, consent_id)
+        return entry is not None and consent_permits(entry[1], use)
+
+    def refused(self, db: Session, consent_ids: Iterable[str], use: Optional[str] = None) -> List[str]:
+        """The given consents that do not allow `use` (or are not active)"""
+        consent_ids = list(consent_ids)
+        now = time.monotonic()
+        with self._lock:
+            unsure = [
+                consent_id for consent_id in consent_ids
+                if (flags := self._flags.get(consent_id)) is None
+                or (consent_permits(flags) and not self._fresh(consent_id, now))
+            ]
+        for start in range(0, len(unsure), _LOAD_CHUNK):
+            self._load(db, unsure[start:start + _LOAD_CHUNK])
+        with self._lock:
+            return [
+                consent_id for consent_id in consent_ids
+                if (flags := self._flags.get(consent_id)) is None or not consent_permits(flags, use)
+            ]
+
+    def _fresh(self, consent_id: str, now: float) -> bool:
+        """Entry was read from the database within the TTL (caller holds the lock)"""
+        return now - max(self._built_at, self._verified.get(consent_id, float("-inf"))) < CONSENT_INDEX_TTL_SECONDS
+
+    def _load(self, db: Session, consent_ids: List[str]) -> Dict[str, Tuple[str, int]]:
+        """Read consents from the database into the index (request's shard first); (owner, flags) of those that exist"""
+        now = time.monotonic()
+        loaded: Dict[str, Tuple[str, int]] = {}
+        with shard_router.shard_sessions(db) as sessions:
+            for shard_db in sessions:
+                missing = [consent_id for consent_id in consent_ids if consent_id not in loaded]
+                if not missing:
+                    break
+                rows = shard_db.query(
+                    ConsentRecord.id, ConsentRecord.user_id, ConsentRecord.withdrawal_status,
+                    ConsentRecord.permitted_uses,
+                ).filter(ConsentRecord.id.in_(missing))
+                for row in rows:
+                    loaded[row.id] = sys.intern(row.user_id), encode(row.withdrawal_status, row.permitted_uses)
+        with self._lock:
+            for consent_id, (owner, flags) in loaded.items():
+                self._flags[consent_id] = flags
+                self._owners[consent_id] = owner
+                self._verified[consent_id] = now
+        return loaded
+
+    def __len__(self) -> int:
+        return len(self._flags)
+
+    # ---------- cross-worker sync ----------
+
+    def attach(self, bus):
+        """Mirror withdrawals to the other workers on an InvalidationBus (see coordination.py)"""
+        self._bus = bus
+        bus.subscribe("consents", self._apply_remote)
+
+    def _publish(self, message: dict):
+        if self._bus is not None:
+            try:
+                self._bus.publish("consents", message)
+            except Exception:
+                logger.exception("Could not publish consent status change")
+
+    def _apply_remote(self, message: dict):
+        self._apply_status(message["consents"], ConsentWithdrawalStatus(message["status"]))
+
+    def _apply_status(self, consent_ids: Iterable[str], status: ConsentWithdrawalStatus):
+        with self._lock:
+            for consent_id in consent_ids:
+                flags = self._flags.get(consent_id)
+                if flags is not None:
+                    self._flags[consent_id] = _with_status(flags, status)
+
+
+def _with_status(flags: int, status: ConsentWithdrawalStatus) -> int:
+    return (flags & ((1 << _STATUS_SHIFT) - 1)) | (_STATUSES.index(ConsentWithdrawalStatus(status)) << _STATUS_SHIFT)
+
+
+# Global index instance
+consent_index = ConsentIndex()
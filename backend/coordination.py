@@ -0,0 +1,327 @@
+"""
+AFRO-GENOMICS Research Platform
+Cross-Worker Coordination
+
+Each API worker keeps its own in-memory caches (cohort bitmaps, etc.). When
+one worker changes the underlying data it publishes a small invalidation
+message; every other worker applies it to its own copy. Transports:
+
+- local:    single process, nothing to broadcast
+- unix:     datagram socket per worker in a shared directory (one host)
+- postgres: LISTEN/NOTIFY on the application database (any number of hosts)
+
+Maintenance workers (purges, retention, audit sealing) must run once per
+deployment, not once per worker. On PostgreSQL one process holds a session
+advisory lock (any number of hosts); otherwise MaintenanceLeader takes an
+exclusive file lock (one host). The others retry on every tick.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import select
+import socket
+import tempfile
+import threading
+import uuid
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+INVALIDATION_BACKEND = os.getenv("INVALIDATION_BACKEND", "auto")  # auto | local | unix | postgres
+INVALIDATION_SOCKET_DIR = os.getenv("INVALIDATION_SOCKET_DIR", "")
+INVALIDATION_PG_CHANNEL = os.getenv("INVALIDATION_PG_CHANNEL", "afro_invalidation")
+MAINTENANCE_LOCK_FILE = os.getenv(
+    "MAINTENANCE_LOCK_FILE", os.path.join(tempfile.gettempdir(), "afro-genomics-maintenance.lock")
+)
+MAINTENANCE_PG_LOCK_KEY = int(os.getenv("MAINTENANCE_PG_LOCK_KEY", "4170536015"))  # pg_try_advisory_lock key
+
+# PostgreSQL NOTIFY payloads are capped at 8000 bytes; publishers chunk below this
+MAX_MESSAGE_BYTES = 7800
+
+
+# ==================== INVALIDATION BUS ====================
+
+class InvalidationBus:
+    """
+    Publish/subscribe between workers; the base class is the single-process no-op
+
+    Handlers run on the listener thread and must do their own locking.
+    Publishers are expected to call publish() after the change is committed.
+    """
+
+    def __init__(self):
+        self.origin = uuid.uuid4().hex
+        self._handlers: Dict[str, List[Callable[[dict], None]]] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self, channel: str, handler: Callable[[dict], None]):
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def publish(self, channel: str, data: dict):
+        payload = json.dumps({"o": self.origin, "c": channel, "d": data}, separators=(",", ":"))
+        if len(payload) > MAX_MESSAGE_BYTES:
+            raise ValueError(f"Invalidation message on {channel} exceeds {MAX_MESSAGE_BYTES} bytes")
+        self._send(payload)
+
+    def start(self):
+        """Begin listening (call in the worker process, after fork)"""
+        self._thread = threading.Thread(target=self._listen, name="invalidation-bus", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def _send(self, payload: str):
+        pass
+
+    def _listen(self):
+        pass
+
+    def _dispatch(self, payload: str):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            logger.warning("Dropping malformed invalidation message")
+            return
+        if message.get("o") == self.origin:
+            return
+        for handler in self._handlers.get(message.get("c"), []):
+            try:
+                handler(message.get("d") or {})
+            except Exception:
+                logger.exception("Invalidation handler for %s failed", message.get("c"))
+
+
+class UnixSocketBus(InvalidationBus):
+    """Datagram socket per worker in `socket_dir`; publish fans out to every peer socket"""
+
+    def __init__(self, socket_dir: str):
+        super().__init__()
+        self.socket_dir = socket_dir
+        self.path: Optional[str] = None
+        self._sock: Optional[socket.socket] = None
+
+    def start(self):
+        os.makedirs(self.socket_dir, exist_ok=True)
+        self.path = os.path.join(self.socket_dir, f"worker-{os.getpid()}.sock")
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(self.path)
+        self._sock.settimeout(0.5)
+        super().start()
+
+    def stop(self, timeout: float = 5.0):
+        super().stop(timeout)
+        if self._sock:
+            self._sock.close()
+        if self.path and os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def _peers(self) -> List[str]:
+        try:
+            names = os.listdir(self.socket_dir)
+        except FileNotFoundError:
+            return []
+        return [
+            os.path.join(self.socket_dir, name) for name in names
+            if name.startswith("worker-") and name.endswith(".sock") and os.path.join(self.socket_dir, name) != self.path
+        ]
+
+    def _send(self, payload: str):
+        data = payload.encode("utf-8")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as out:
+            out.settimeout(1.0)
+            for peer in self._peers():
+                try:
+                    out.sendto(data, peer)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Socket left behind by a worker that died without cleanup
+                    try:
+                        os.unlink(peer)
+                    except OSError:
+                        pass
+                except OSError:
+                    logger.error("Invalidation message to %s lost; its caches may be stale until restart", peer)
+
+    def _listen(self):
+        while not self._stop.is_set():
+            try:
+                data = self._sock.recv(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            self._dispatch(data.decode("utf-8"))
+
+
+class PostgresNotifyBus(InvalidationBus):
+    """LISTEN/NOTIFY on a dedicated connection detached from the engine pool"""
+
+    def __init__(self, engine: Engine, channel: str = INVALIDATION_PG_CHANNEL):
+        super().__init__()
+        self.engine = engine
+        self.channel = channel
+        self._listener = None
+
+    def start(self):
+        raw = self.engine.raw_connection()
+        raw.detach()
+        self._listener = raw.driver_connection
+        self._listener.autocommit = True
+        with self._listener.cursor() as cursor:
+            cursor.execute(f'LISTEN "{self.channel}"')
+        super().start()
+
+    def stop(self, timeout: float = 5.0):
+        super().stop(timeout)
+        if self._listener is not None:
+            self._listener.close()
+
+    def _send(self, payload: str):
+        with self.engine.begin() as conn:
+            conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": self.channel, "payload": payload})
+
+    def _listen(self):
+        conn = self._listener
+        while not self._stop.is_set():
+            try:
+                if not select.select([conn], [], [], 0.5)[0]:
+                    continue
+                conn.poll()
+            except Exception:
+                logger.exception("Invalidation listener connection failed")
+                return
+            while conn.notifies:
+                self._dispatch(conn.notifies.pop(0).payload)
+
+
+def create_bus(engine: Engine, backend: str = INVALIDATION_BACKEND, socket_dir: str = INVALIDATION_SOCKET_DIR) -> InvalidationBus:
+    """
+    Pick the transport: PostgreSQL databases use LISTEN/NOTIFY, otherwise Unix
+    sockets when a socket directory is configured (multi-worker), else local
+    """
+    if backend == "auto":
+        if engine.dialect.name == "postgresql":
+            backend = "postgres"
+        elif socket_dir:
+            backend = "unix"
+        else:
+            backend = "local"
+    if backend == "postgres":
+        return PostgresNotifyBus(engine)
+    if backend == "unix":
+        if not socket_dir:
+            raise ValueError("INVALIDATION_SOCKET_DIR is required for the unix invalidation backend")
+        return UnixSocketBus(socket_dir)
+    if backend == "local":
+        return InvalidationBus()
+    raise ValueError(f"Unknown invalidation backend: {backend}")
+
+
+# ==================== MAINTENANCE LEADER ====================
+
+class MaintenanceLeader:
+    """
+    Exclusive flock on `path`; whichever worker holds it runs maintenance
+
+    The lock is released by the kernel when the holder exits, so a surviving
+    worker takes over on its next is_leader() call.
+    """
+
+    def __init__(self, path: str = MAINTENANCE_LOCK_FILE):
+        self.path = path
+        self._fd: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def is_leader(self) -> bool:
+        with self._lock:
+            if self._fd is not None:
+                return True
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+            self._fd = fd
+            logger.info("Process %d is now the maintenance leader", os.getpid())
+            return True
+
+    def release(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+
+class AdvisoryLockLeader:
+    """
+    PostgreSQL session advisory lock held on a dedicated connection
+
+    The server releases the lock when the holder's connection ends, so a
+    worker on any host takes over on its next is_leader() call. The holder
+    checks its connection on every call and steps down if it was lost.
+    """
+
+    def __init__(self, engine: Engine, key: int = MAINTENANCE_PG_LOCK_KEY):
+        self.engine = engine
+        self.key = key
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def is_leader(self) -> bool:
+        with self._lock:
+            if self._conn is not None:
+                try:
+                    with self._conn.cursor() as cursor:
+                        cursor.execute("SELECT 1")
+                    return True
+                except Exception:
+                    logger.warning("Process %d lost its maintenance lock connection", os.getpid())
+                    self._close()
+            try:
+                raw = self.engine.raw_connection()
+                raw.detach()
+                conn = raw.driver_connection
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT pg_try_advisory_lock(%s)", (self.key,))
+                    acquired = cursor.fetchone()[0]
+            except Exception:
+                logger.exception("Maintenance lock attempt failed")
+                return False
+            if not acquired:
+                conn.close()
+                return False
+            self._conn = conn
+            logger.info("Process %d is now the maintenance leader", os.getpid())
+            return True
+
+    def release(self):
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()  # Ending the session releases the advisory lock
+            except Exception:
+                pass
+            self._conn = None
+
+
+def create_leader(engine: Engine, lock_file: str = MAINTENANCE_LOCK_FILE):
+    """Advisory lock on PostgreSQL (leader across hosts), else a file lock (one host)"""
+    if engine.dialect.name == "postgresql":
+        return AdvisoryLockLeader(engine)
+    return MaintenanceLeader(lock_file)
@@ -0,0 +1,197 @@
+"""
+AFRO-GENOMICS Research Platform
+Sample Event Streaming
+
+Pushes sample lifecycle events to lab dashboards over Server-Sent Events, so
+clients learn about changes instead of polling /samples:
+
+- sample.created        upload accepted (Received)
+- sample.status         other status transitions (Processing, Archived)
+- sample.results_ready  results generated (Results Available)
+- sample.deleted        removed by a consent purge or retention deletion
+
+Publishers (request threads, background tasks) call sample_events.publish()
+after committing. Events are fanned out to this worker's subscribers and sent
+over the InvalidationBus so every other worker fans them out to its own.
+
+Fan-out is one bounded asyncio.Queue per connection, grouped by institution
+and fed on the event loop through call_soon_threadsafe. An idle connection
+costs a suspended task and an empty queue: keep-alive comments come from one
+ticker per worker rather than a timer per client. A client that falls
+SAMPLE_EVENTS_QUEUE_SIZE events behind gets `resync` and is disconnected; it
+reconnects and refetches. The same ticker closes streams older than
+SAMPLE_EVENTS_MAX_AGE_SECONDS: EventSource reconnects on its own, which
+spreads clients over new workers and lets a stopping worker drain.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
+
+from models import Sample, SampleStatus
+from instrumentation import metrics
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+SAMPLE_EVENTS_QUEUE_SIZE = int(os.getenv("SAMPLE_EVENTS_QUEUE_SIZE", "256"))
+SAMPLE_EVENTS_KEEPALIVE_SECONDS = int(os.getenv("SAMPLE_EVENTS_KEEPALIVE_SECONDS", "15"))
+SAMPLE_EVENTS_MAX_CONNECTIONS = int(os.getenv("SAMPLE_EVENTS_MAX_CONNECTIONS", "10000"))  # Per worker
+SAMPLE_EVENTS_RETRY_MS = int(os.getenv("SAMPLE_EVENTS_RETRY_MS", "3000"))
+SAMPLE_EVENTS_MAX_AGE_SECONDS = int(os.getenv("SAMPLE_EVENTS_MAX_AGE_SECONDS", "600"))
+
+_PUBLISH_CHUNK = 25  # Events per bus message, well under the bus size limit
+
+_KEEPALIVE = object()
+_RESYNC = object()
+_RECONNECT = object()
+
+metrics.gauge("sample_event_connections", "Open sample event streams on this worker")
+metrics.counter("sample_event_resyncs_total", "Event streams dropped for falling behind")
+
+
+def sample_event(event_type: str, sample: str, institution_id: str, **fields) -> dict:
+    """Event payload for sample id `sample`; `fields` are JSON-ready extras such as sample_id (external) and status"""
+    return {
+        "type": event_type, "id": sample, "institution_id": institution_id,
+        "at": datetime.utcnow().isoformat(), **fields
+    }
+
+
+def status_event(sample: Sample) -> dict:
+    """Event for a sample's current status (created / results_ready / status)"""
+    if sample.status == SampleStatus.RECEIVED:
+        event_type = "sample.created"
+    elif sample.status == SampleStatus.RESULTS_AVAILABLE:
+        event_type = "sample.results_ready"
+    else:
+        event_type = "sample.status"
+    return sample_event(
+        event_type, sample.id, sample.institution_id, sample_id=sample.sample_id, status=sample.status.value,
+        uploaded_at=sample.uploaded_at.isoformat() if sample.uploaded_at else None
+    )
+
+
+class SampleEventBroadcaster:
+    """Per-worker fan-out of sample events to SSE connections"""
+
+    def __init__(self):
+        self._subscribers: Dict[str, Dict[asyncio.Queue, float]] = {}  # institution -> queue -> close-by time
+        self._connections = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._keepalive: Optional[asyncio.Task] = None
+        self._bus = None
+
+    @property
+    def connections(self) -> int:
+        return self._connections
+
+    def accepting(self) -> bool:
+        return self._connections < SAMPLE_EVENTS_MAX_CONNECTIONS
+
+    # ---------- publishing (any thread) ----------
+
+    def publish(self, events: List[dict]):
+        """Deliver events here and on every other worker (call after commit)"""
+        if not events:
+            return
+        self._deliver(events)
+        if self._bus is not None:
+            for start in range(0, len(events), _PUBLISH_CHUNK):
+                try:
+                    self._bus.publish("sample_events", {"events": events[start:start + _PUBLISH_CHUNK]})
+                except Exception:
+                    logger.exception("Could not publish sample events")
+
+    def _deliver(self, events: List[dict]):
+        loop = self._loop
+        if loop is None or loop.is_closed() or not self._connections:
+            return
+        try:
+            loop.call_soon_threadsafe(self._fan_out, events)
+        except RuntimeError:
+            pass  # Loop shut down between the check and the call
+
+    def _fan_out(self, events: List[dict]):
+        for event in events:
+            for queue in self._subscribers.get(event["institution_id"], ()):
+                self._offer(queue, event)
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, item):
+        if not queue.full():
+            queue.put_nowait(item)
+            return
+        # Too far behind to catch up: drop the backlog and make the client refetch
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(_RESYNC)
+        metrics.inc("sample_event_resyncs_total")
+
+    # ---------- subscribing (event loop) ----------
+
+    async def stream(self, institution_id: str) -> AsyncIterator[str]:
+        """SSE frames for one connection until the client disconnects or must resync"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._keepalive = None
+        if self._keepalive is None or self._keepalive.done():
+            self._keepalive = loop.create_task(self._keepalive_ticker())
+
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SAMPLE_EVENTS_QUEUE_SIZE)
+        self._subscribers.setdefault(institution_id, {})[queue] = loop.time() + SAMPLE_EVENTS_MAX_AGE_SECONDS
+        self._connections += 1
+        metrics.add("sample_event_connections", 1)
+        try:
+            yield f"retry: {SAMPLE_EVENTS_RETRY_MS}\nevent: ready\ndata: {{}}\n\n"
+            while True:
+                item = await queue.get()
+                if item is _KEEPALIVE:
+                    yield ": keep-alive\n\n"
+                elif item is _RESYNC:
+                    yield "event: resync\ndata: {}\n\n"
+                    return
+                elif item is _RECONNECT:
+                    return
+                else:
+                    yield f"event: {item['type']}\ndata: {json.dumps(item, separators=(',', ':'))}\n\n"
+        finally:
+            self._connections -= 1
+            metrics.add("sample_event_connections", -1)
+            subscribers = self._subscribers.get(institution_id)
+            if subscribers is not None:
+                subscribers.pop(queue, None)
+                if not subscribers:
+                    del self._subscribers[institution_id]
+
+    async def _keepalive_ticker(self):
+        """Keeps idle connections (and proxies in front of them) alive and retires old ones"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(SAMPLE_EVENTS_KEEPALIVE_SECONDS)
+            now = loop.time()
+            for subscribers in list(self._subscribers.values()):
+                for queue, close_by in subscribers.items():
+                    if close_by <= now:
+                        subscribers[queue] = float("inf")
+                        self._offer(queue, _RECONNECT)
+                    elif queue.empty():
+                        queue.put_nowait(_KEEPALIVE)
+
+    # ---------- cross-worker sync ----------
+
+    def attach(self, bus):
+        """Fan out events published by other workers on an InvalidationBus (see coordination.py)"""
+        self._bus = bus
+        bus.subscribe("sample_events", self._apply_remote)
+
+    def _apply_remote(self, message: dict):
+        self._deliver(message.get("events", []))
+
+
+# Global broadcaster instance
+sample_events = SampleEventBroadcaster()
@@ -0,0 +1,389 @@
+"""
+AFRO-GENOMICS Research Platform
+Population Allele Frequencies
+
+Allele and genotype frequencies derived from the platform's own calls
+instead of the static figures shipped with the marker panel.
+
+Running counts live in `genotype_counts`, keyed by (variant, population
+group, institution, genotype). Storing or deleting a sample's calls adjusts
+them in the same transaction, so nothing is ever rescanned on the request
+path; a full rebuild is only needed after bulk changes that move samples
+between populations (an ancestry reference switch) or to backfill.
+
+Each worker keeps a lookup table of the per-population frequencies served in
+HealthMarkerResponse.population_frequency. When counts change, the variant
+ids are broadcast and every worker reloads just those rows.
+
+Only samples whose consent is not withdrawn are counted: withdrawal
+subtracts a participant's calls straight away (purge.schedule_withdrawal)
+rather than when the data is purged at the end of the grace period.
+
+A sample's population group is its highest-percentage active ancestry
+estimate. Groups with fewer than FREQUENCY_MIN_SAMPLES samples are
+suppressed (small-cell protection); while no group for a variant qualifies,
+the catalogue's reference figures are served instead.
+"""
+
+import logging
+import os
+import threading
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import GenotypeCount, HealthMarker, Sample, AncestryResult, ConsentRecord, ConsentWithdrawalStatus
+from catalogue import variant_catalogue, CatalogueEntry
+from shards import shard_router
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+FREQUENCY_MIN_SAMPLES = int(os.getenv("FREQUENCY_MIN_SAMPLES", "5"))
+
+_PUBLISH_CHUNK = 500
+_UNASSIGNED = "Unassigned"
+
+# (variant_id, population_group, institution_id, genotype_code) -> +/- samples
+CountKey = Tuple[int, str, str, int]
+
+
+# ==================== STATISTICS ====================
+
+def genotype_alleles(genotype: str) -> List[str]:
+    """'A/S' -> ['A', 'S']; hemizygous calls such as 'A' give one allele"""
+    return genotype.split("/")
+
+
+def hwe_exact_p(het: int, hom1: int, hom2: int) -> float:
+    """
+    Hardy-Weinberg exact test p-value for a biallelic site (Wigginton et al., 2005)
+
+    Sums the probabilities of every heterozygote count, given the allele
+    counts, that is no more likely than the observed one.
+    """
+    n = het + hom1 + hom2
+    if n == 0:
+        return 1.0
+    rare_homs, common_homs = sorted((hom1, hom2))
+    rare = 2 * rare_homs + het
+
+    probs = [0.0] * (rare + 1)
+    mid = rare * (2 * n - rare) // (2 * n)
+    if mid % 2 != rare % 2:
+        mid += 1
+    probs[mid] = 1.0
+    total = 1.0
+
+    homr, homc = (rare - mid) // 2, n - mid - (rare - mid) // 2
+    h = mid
+    while h >= 2:
+        probs[h - 2] = probs[h] * h * (h - 1) / (4.0 * (homr + 1) * (homc + 1))
+        total += probs[h - 2]
+        homr, homc, h = homr + 1, homc + 1, h - 2
+
+    homr, homc = (rare - mid) // 2, n - mid - (rare - mid) // 2
+    h = mid
+    while h <= rare - 2:
+        probs[h + 2] = probs[h] * 4.0 * homr * homc / ((h + 2.0) * (h + 1.0))
+        total += probs[h + 2]
+        homr, homc, h = homr - 1, homc - 1, h + 2
+
+    observed = probs[het]
+    return min(1.0, sum(p for p in probs if p <= observed * (1 + 1e-9)) / total)
+
+
+def frequency_statistics(variant: CatalogueEntry, counts: Mapping[int, int]) -> Dict:
+    """
+    Genotype/allele frequencies and Hardy-Weinberg statistics from genotype counts
+
+    HWE fields are None unless the variant is biallelic with the usual three
+    diploid genotypes (hom-ref, het, hom-alt).
+    """
+    samples = sum(counts.values())
+    genotype_counts = {variant.genotype(code): n for code, n in sorted(counts.items()) if n}
+    allele_counts: Dict[str, int] = {}
+    for genotype, n in genotype_counts.items():
+        for allele in genotype_alleles(genotype):
+            allele_counts[allele] = allele_counts.get(allele, 0) + n
+    allele_total = sum(allele_counts.values())
+
+    stats = {
+        "samples": samples,
+        "genotype_counts": genotype_counts,
+        "genotype_frequencies": {g: round(n / samples, 4) for g, n in genotype_counts.items()} if samples else {},
+        "allele_frequencies": {a: round(n / allele_total, 4) for a, n in allele_counts.items()} if allele_total else {},
+        "observed_heterozygosity": None,
+        "expected_heterozygosity": None,
+        "inbreeding_coefficient": None,
+        "hwe_chi_square": None,
+        "hwe_p_value": None,
+    }
+
+    ref = genotype_alleles(variant.genotypes[0])
+    alt = genotype_alleles(variant.genotypes[-1])
+    if samples == 0 or len(variant.genotypes) != 3 or len(ref) != 2 or ref[0] != ref[1] or alt[0] != alt[1]:
+        return stats
+
+    hom_ref, het, hom_alt = (counts.get(code, 0) for code in range(3))
+    p = (2 * hom_ref + het) / (2 * samples)
+    q = 1 - p
+    expected = (p * p * samples, 2 * p * q * samples, q * q * samples)
+    chi_square = sum((o - e) ** 2 / e for o, e in zip((hom_ref, het, hom_alt), expected) if e > 0)
+    observed_het, expected_het = het / samples, 2 * p * q
+
+    stats.update(
+        observed_heterozygosity=round(observed_het, 4),
+        expected_heterozygosity=round(expected_het, 4),
+        inbreeding_coefficient=round(1 - observed_het / expected_het, 4) if expected_het else None,
+        hwe_chi_square=round(chi_square, 4),
+        hwe_p_value=hwe_exact_p(het, hom_ref, hom_alt),
+    )
+    return stats
+
+
+def alternate_allele_frequency(variant: CatalogueEntry, counts: Mapping[int, int]) -> Optional[float]:
+    """Frequency of the allele that is homozygous in the variant's last genotype"""
+    alt = genotype_alleles(variant.genotypes[-1])[0]
+    alleles = hits = 0
+    for code, n in counts.items():
+        called = genotype_alleles(variant.genotype(code))
+        alleles += n * len(called)
+        hits += n * called.count(alt)
+    return hits / alleles if alleles else None
+
+
+# ==================== RUNNING COUNTS ====================
+
+def predominant_populations(db: Session, sample_ids: List[str]) -> Dict[str, str]:
+    """Predominant active ancestry population per sample"""
+    groups: Dict[str, Tuple[float, str]] = {}
+    for sample_id, population, percentage in db.execute(
+        select(AncestryResult.sample_id, AncestryResult.population_group, AncestryResult.percentage).where(
+            AncestryResult.sample_id.in_(sample_ids), AncestryResult.is_active.is_(True)
+        )
+    ):
+        if sample_id not in groups or percentage > groups[sample_id][0]:
+            groups[sample_id] = (percentage, population)
+    return {sample_id: population for sample_id, (_, population) in groups.items()}
+
+
+def _sample_counts(db: Session, sample_ids: List[str]) -> Dict[CountKey, int]:
+    """Count contributions of the stored calls of `sample_ids` (withdrawn consents contribute nothing)"""
+    counts: Dict[CountKey, int] = {}
+    if not sample_ids:
+        return counts
+    groups = predominant_populations(db, sample_ids)
+    for sample_id, institution_id, variant_id, code in db.execute(
+        select(HealthMarker.sample_id, Sample.institution_id, HealthMarker.variant_id, HealthMarker.genotype_code)
+        .join(Sample, HealthMarker.sample_id == Sample.id)
+        .join(ConsentRecord, Sample.consent_id == ConsentRecord.id)
+        .where(
+            HealthMarker.sample_id.in_(sample_ids),
+            ConsentRecord.withdrawal_status != ConsentWithdrawalStatus.WITHDRAWN
+        )
+    ):
+        key = (variant_id, groups.get(sample_id, _UNASSIGNED), institution_id, code)
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def _increment(db: Session, counts: Dict[CountKey, int]):
+    rows = [
+        {"variant_id": v, "population_group": p, "institution_id": i, "genotype_code": c, "sample_count": n}
+        for (v, p, i, c), n in counts.items()
+    ]
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        stmt = insert(GenotypeCount)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["variant_id", "population_group", "institution_id", "genotype_code"],
+            set_={"sample_count": GenotypeCount.sample_count + stmt.excluded.sample_count}
+        ), rows)
+        return
+    for row in rows:
+        updated = db.execute(update(GenotypeCount).where(
+            GenotypeCount.variant_id == row["variant_id"],
+            GenotypeCount.population_group == row["population_group"],
+            GenotypeCount.institution_id == row["institution_id"],
+            GenotypeCount.genotype_code == row["genotype_code"],
+        ).values(sample_count=GenotypeCount.sample_count + row["sample_count"])).rowcount
+        if not updated:
+            db.execute(GenotypeCount.__table__.insert(), [row])
+
+
+def _decrement(db: Session, counts: Dict[CountKey, int]):
+    for (variant_id, population, institution_id, code), n in counts.items():
+        db.execute(update(GenotypeCount).where(
+            GenotypeCount.variant_id == variant_id,
+            GenotypeCount.population_group == population,
+            GenotypeCount.institution_id == institution_id,
+            GenotypeCount.genotype_code == code,
+        ).values(sample_count=GenotypeCount.sample_count - n))
+    db.execute(delete(GenotypeCount).where(GenotypeCount.sample_count <= 0))
+
+
+class AlleleFrequencyTable:
+    """
+    Per-worker lookup of served population frequencies, backed by running counts
+
+    Writers stage count changes in their own transaction and call publish()
+    with the returned variant ids after committing.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bus = None
+        self._session_factory = None
+        self._served: Dict[int, Dict[str, str]] = {}
+
+    # ---------- count maintenance ----------
+
+    def stage_samples(self, db: Session, sample_ids: Iterable[str]) -> List[int]:
+        """Add the (flushed) calls of new samples to the running counts (caller commits)"""
+        counts = _sample_counts(db, list(sample_ids))
+        if counts:
+            _increment(db, counts)
+        return sorted({key[0] for key in counts})
+
+    def stage_removal(self, db: Session, sample_ids: Iterable[str]) -> List[int]:
+        """Subtract samples' calls before they are deleted or their consent is withdrawn (caller commits)"""
+        counts = _sample_counts(db, list(sample_ids))
+        if counts:
+            _decrement(db, counts)
+        return sorted({key[0] for key in counts})
+
+    def rebuild_counts(self, db: Session):
+        """Recount everything from stored calls on every shard (backfill, or after an ancestry reference switch)"""
+        db.execute(delete(GenotypeCount))
+        with shard_router.shard_sessions(db) as sessions:
+            for shard_db in sessions:
+                sample_ids = shard_db.execute(select(HealthMarker.sample_id).distinct()).scalars().all()
+                for start in range(0, len(sample_ids), 1000):
+                    counts = _sample_counts(shard_db, sample_ids[start:start + 1000])
+                    if counts:
+                        _increment(db, counts)
+        db.commit()
+        self.load(db)
+        self._publish({"reload": True})
+
+    def backfill_counts(self, db: Session):
+        """Build the running counts once if calls exist but were never counted"""
+        if db.query(GenotypeCount).first() is None and db.query(HealthMarker).first() is not None:
+            self.rebuild_counts(db)
+            logger.info("Backfilled genotype counts")
+
+    # ---------- lookup table ----------
+
+    def load(self, db: Session, variant_ids: Optional[Iterable[int]] = None):
+        """(Re)build served frequencies, for every variant or just `variant_ids`"""
+        query = select(
+            GenotypeCount.variant_id, GenotypeCount.population_group,
+            GenotypeCount.genotype_code, func.sum(GenotypeCount.sample_count)
+        ).group_by(GenotypeCount.variant_id, GenotypeCount.population_group, GenotypeCount.genotype_code)
+        if variant_ids is not None:
+            variant_ids = list(variant_ids)
+            query = query.where(GenotypeCount.variant_id.in_(variant_ids))
+
+        by_variant: Dict[int, Dict[str, Dict[int, int]]] = {}
+        for variant_id, population, code, n in db.execute(query):
+            by_variant.setdefault(variant_id, {}).setdefault(population, {})[code] = int(n)
+        variants = variant_catalogue.get_many(db, by_variant)
+
+        served: Dict[int, Dict[str, str]] = {}
+        for variant_id, populations in by_variant.items():
+            variant = variants.get(variant_id)
+            if variant is None:
+                continue
+            frequencies = {}
+            for population, counts in sorted(populations.items()):
+                if population == _UNASSIGNED or sum(counts.values()) < FREQUENCY_MIN_SAMPLES:
+                    continue
+                frequency = alternate_allele_frequency(variant, counts)
+                if frequency is not None:
+                    frequencies[population] = f"{frequency:.2f}"
+            if frequencies:
+                served[variant_id] = frequencies
+
+        with self._lock:
+            if variant_ids is None:
+                self._served = served
+            else:
+                for variant_id in variant_ids:
+                    if variant_id in served:
+                        self._served[variant_id] = served[variant_id]
+                    else:
+                        self._served.pop(variant_id, None)
+
+    def population_frequency(self, variant: CatalogueEntry) -> Optional[Mapping[str, str]]:
+        """Served frequencies for a variant, falling back to the catalogue's reference figures"""
+        return self._served.get(variant.id) or variant.population_frequency
+
+    def publish(self, variant_ids: List[int]):
+        """Refresh changed variants here and on every other worker (call after commit)"""
+        if not variant_ids:
+            return
+        if self._session_factory is not None:
+            db = self._session_factory()
+            try:
+                self.load(db, variant_ids)
+            finally:
+                db.close()
+        for start in range(0, len(variant_ids), _PUBLISH_CHUNK):
+            self._publish({"variants": variant_ids[start:start + _PUBLISH_CHUNK]})
+
+    # ---------- cross-worker sync ----------
+
+    def attach(self, bus, session_factory: Callable[[], Session]):
+        """Reload changed variants announced by other workers on an InvalidationBus (see coordination.py)"""
+        self._bus = bus
+        self._session_factory = session_factory
+        bus.subscribe("frequencies", self._apply_remote)
+
+    def _publish(self, message: dict):
+        if self._bus is not None:
+            try:
+                self._bus.publish("frequencies", message)
+            except Exception:
+                logger.exception("Could not publish allele frequency change")
+
+    def _apply_remote(self, message: dict):
+        db = self._session_factory()
+        try:
+            self.load(db, None if message.get("reload") else message.get("variants", []))
+        finally:
+            db.close()
+
+
+def population_statistics(db: Session, variant: CatalogueEntry) -> List[Tuple[str, Dict]]:
+    """Per-population statistics for a variant, across institutions (small cells suppressed)"""
+    populations: Dict[str, Dict[int, int]] = {}
+    for population, code, n in db.execute(
+        select(GenotypeCount.population_group, GenotypeCount.genotype_code, func.sum(GenotypeCount.sample_count))
+        .where(GenotypeCount.variant_id == variant.id)
+        .group_by(GenotypeCount.population_group, GenotypeCount.genotype_code)
+    ):
+        populations.setdefault(population, {})[code] = int(n)
+    return [
+        (population, frequency_statistics(variant, counts))
+        for population, counts in sorted(populations.items())
+        if population != _UNASSIGNED and sum(counts.values()) >= FREQUENCY_MIN_SAMPLES
+    ]
+
+
+def institution_statistics(db: Session, variant: CatalogueEntry, institution_id: str) -> Dict:
+    """Statistics for a variant within one institution, over all populations"""
+    counts = {
+        code: int(n) for code, n in db.execute(
+            select(GenotypeCount.genotype_code, func.sum(GenotypeCount.sample_count))
+            .where(GenotypeCount.variant_id == variant.id, GenotypeCount.institution_id == institution_id)
+            .group_by(GenotypeCount.genotype_code)
+        )
+    }
+    return frequency_statistics(variant, counts)
+
+
+allele_frequencies = AlleleFrequencyTable()
@@ -0,0 +1,313 @@
+"""
+AFRO-GENOMICS Research Platform
+Packed Genotype Store
+
+Whole-panel genotype storage: one blob per sample holding every call at two
+bits per site (0 = hom ref, 1 = het, 2 = hom alt, 3 = missing), four sites
+per byte, in the order of a versioned GenotypeSiteList.
+
+Blob layout (little-endian):
+    "GT2\\x01" | uint32 site_count | uint32 block_sites | uint32 n_blocks
+    uint32 offsets[n_blocks + 1]        byte offsets into the block section
+    zlib blocks, each block_sites / 4 packed bytes before compression
+
+Blocks are compressed independently, so reading one site (or a few hundred
+panel sites) inflates only the blocks holding them. Decoding works on NumPy
+views over the decompressed buffers; no Python object is created per call.
+"""
+
+import hashlib
+import io
+import os
+import struct
+import threading
+import zlib
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models import GenotypeSiteList, GenotypeBlob
+
+# Configuration
+GENOTYPE_BLOCK_SITES = int(os.getenv("GENOTYPE_BLOCK_SITES", "16384"))  # Multiple of 4
+GENOTYPE_COMPRESSION_LEVEL = int(os.getenv("GENOTYPE_COMPRESSION_LEVEL", "6"))
+
+HOM_REF, HET, HOM_ALT, MISSING = 0, 1, 2, 3
+
+_MAGIC = b"GT2\x01"
+_HEADER = struct.Struct("<4sIII")
+_SHIFTS = np.array([0, 2, 4, 6], dtype=np.uint8)
+
+
+class GenotypeStoreError(ValueError):
+    """Malformed blob or calls that do not match their site list"""
+
+
+# ==================== PACKING ====================
+
+def pack_calls(codes: np.ndarray) -> np.ndarray:
+    """Pack 2-bit call codes four to a byte (site i -> byte i // 4, bits 2 * (i % 4))"""
+    codes = np.asarray(codes, dtype=np.uint8)
+    if codes.size and int(codes.max()) > MISSING:
+        raise GenotypeStoreError("Call codes must be 0-3")
+    padded = np.full(-(-codes.size // 4) * 4, MISSING, dtype=np.uint8)
+    padded[:codes.size] = codes
+    quads = padded.reshape(-1, 4)
+    return quads[:, 0] | (quads[:, 1] << 2) | (quads[:, 2] << 4) | (quads[:, 3] << 6)
+
+
+def unpack_calls(packed: np.ndarray, count: int) -> np.ndarray:
+    """Inverse of pack_calls for the first `count` sites"""
+    return ((packed[:, None] >> _SHIFTS) & 3).reshape(-1)[:count]
+
+
+def encode_blob(codes: np.ndarray, block_sites: int = GENOTYPE_BLOCK_SITES,
+                level: int = GENOTYPE_COMPRESSION_LEVEL) -> bytes:
+    """Encode a full call vector as a block-compressed blob"""
+    if block_sites <= 0 or block_sites % 4:
+        raise GenotypeStoreError("block_sites must be a positive multiple of 4")
+    packed = pack_calls(codes)
+    block_bytes = block_sites // 4
+    blocks = [
+        zlib.compress(packed[start:start + block_bytes].tobytes(), level)
+        for start in range(0, packed.size, block_bytes)
+    ]
+    offsets = np.zeros(len(blocks) + 1, dtype="<u4")
+    if blocks:
+        np.cumsum([len(b) for b in blocks], out=offsets[1:])
+    header = _HEADER.pack(_MAGIC, int(np.asarray(codes).size), block_sites, len(blocks))
+    return b"".join([header, offsets.tobytes(), *blocks])
+
+
+class PackedGenotypes:
+    """
+    Random access to one sample's blob
+
+    Inflated blocks are kept for the lifetime of the object, so a batch of
+    lookups against the same sample pays each block's decompression once.
+    """
+
+    def __init__(self, blob: bytes):
+        if len(blob) < _HEADER.size:
+            raise GenotypeStoreError("Genotype blob is truncated")
+        magic, self.site_count, self.block_sites, n_blocks = _HEADER.unpack_from(blob)
+        if magic != _MAGIC:
+            raise GenotypeStoreError("Not a packed genotype blob")
+        self._blob = memoryview(blob)
+        self._offsets = np.frombuffer(blob, dtype="<u4", count=n_blocks + 1, offset=_HEADER.size)
+        self._data_start = _HEADER.size + self._offsets.nbytes
+        self._blocks: Dict[int, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return self.site_count
+
+    def _block(self, block: int) -> np.ndarray:
+        packed = self._blocks.get(block)
+        if packed is None:
+            start = self._data_start + int(self._offsets[block])
+            end = self._data_start + int(self._offsets[block + 1])
+            packed = self._blocks[block] = np.frombuffer(zlib.decompress(self._blob[start:end]), dtype=np.uint8)
+        return packed
+
+    def __getitem__(self, index: int) -> int:
+        if not 0 <= index < self.site_count:
+            raise IndexError(index)
+        local = index % self.block_sites
+        return int(self._block(index // self.block_sites)[local >> 2] >> ((local & 3) * 2)) & 3
+
+    def take(self, indices: np.ndarray, plan: Optional["TakePlan"] = None) -> np.ndarray:
+        """Calls at the given site indices (negative / out-of-range -> MISSING)"""
+        plan = plan or TakePlan(indices, self.site_count, self.block_sites)
+        out = np.full(plan.size, MISSING, dtype=np.uint8)
+        for block, positions, byte_index, shift in plan.groups:
+            out[positions] = (self._block(block)[byte_index] >> shift) & 3
+        return out
+
+    def decode(self) -> np.ndarray:
+        """Every call as a uint8 array"""
+        if not self.site_count:
+            return np.empty(0, dtype=np.uint8)
+        packed = np.concatenate([self._block(b) for b in range(len(self._offsets) - 1)])
+        return unpack_calls(packed, self.site_count)
+
+
+class TakePlan:
+    """
+    Site indices grouped by block, computed once and reused for every sample
+    of a batch extract (all blobs of one site list share the block layout)
+    """
+
+    def __init__(self, indices: np.ndarray, site_count: int, block_sites: int):
+        indices = np.asarray(indices, dtype=np.int64)
+        self.size = indices.size
+        self.site_count = site_count
+        self.block_sites = block_sites
+        valid = np.flatnonzero((indices >= 0) & (indices < site_count))
+        order = valid[np.argsort(indices[valid], kind="stable")]
+        blocks = indices[order] // block_sites
+        bounds = np.flatnonzero(np.diff(blocks)) + 1
+        self.groups: List[Tuple[int, np.ndarray, np.ndarray, np.ndarray]] = []
+        for positions in np.split(order, bounds) if order.size else []:
+            block = int(indices[positions[0]] // block_sites)
+            local = indices[positions] - block * block_sites
+            self.groups.append((block, positions, local >> 2, ((local & 3) * 2).astype(np.uint8)))
+
+    def matches(self, reader: "PackedGenotypes") -> bool:
+        return reader.site_count == self.site_count and reader.block_sites == self.block_sites
+
+
+# ==================== SITE LISTS ====================
+
+class SiteList:
+    """Decoded, immutable site list; sites are addressed by index"""
+
+    def __init__(self, version: int, name: str, chromosomes: np.ndarray, positions: np.ndarray, rsids: np.ndarray):
+        self.version = version
+        self.name = name
+        self.chromosomes = chromosomes
+        self.positions = positions
+        self.rsids = rsids
+        self._by_rsid = {rsid: i for i, rsid in enumerate(rsids.tolist())}
+
+    def __len__(self) -> int:
+        return int(self.positions.size)
+
+    def indices(self, rsids: Iterable[str]) -> np.ndarray:
+        """Site index per rsid (-1 when the site is not on this list)"""
+        return np.fromiter((self._by_rsid.get(r, -1) for r in rsids), dtype=np.int64)
+
+
+_site_lists: Dict[int, SiteList] = {}
+_site_lists_lock = threading.Lock()
+
+
+def _pack_sites(chromosomes: Sequence[str], positions: Sequence[int], rsids: Sequence[str]) -> bytes:
+    buffer = io.BytesIO()
+    np.savez_compressed(
+        buffer,
+        chromosome=np.asarray(chromosomes, dtype="U5"),
+        position=np.asarray(positions, dtype=np.int64),
+        rsid=np.asarray(rsids, dtype="U20"),
+    )
+    return buffer.getvalue()
+
+
+def create_site_list(
+    db: Session,
+    name: str,
+    chromosomes: Sequence[str],
+    positions: Sequence[int],
+    rsids: Sequence[str]
+) -> SiteList:
+    """Register a new site list version (caller commits)"""
+    if not len(chromosomes) == len(positions) == len(rsids):
+        raise GenotypeStoreError("Site columns must have equal length")
+    data = _pack_sites(chromosomes, positions, rsids)
+    row = GenotypeSiteList(
+        name=name, site_count=len(positions), data=data, checksum=hashlib.sha256(data).hexdigest()
+    )
+    db.add(row)
+    db.flush()
+    return load_site_list(db, row.version)
+
+
+def load_site_list(db: Session, version: int) -> SiteList:
+    """Site list by version; versions are immutable so they are cached for good"""
+    site_list = _site_lists.get(version)
+    if site_list is not None:
+        return site_list
+    row = db.query(GenotypeSiteList).filter(GenotypeSiteList.version == version).first()
+    if row is None:
+        raise GenotypeStoreError(f"Unknown site list version {version}")
+    if hashlib.sha256(row.data).hexdigest() != row.checksum:
+        raise GenotypeStoreError(f"Site list {version} failed its checksum")
+    with np.load(io.BytesIO(row.data), allow_pickle=False) as arrays:
+        site_list = SiteList(version, row.name, arrays["chromosome"], arrays["position"], arrays["rsid"])
+    with _site_lists_lock:
+        return _site_lists.setdefault(version, site_list)
+
+
+# ==================== SAMPLE BLOBS ====================
+
+def store_calls(db: Session, sample_id: str, site_list: SiteList, codes: np.ndarray):
+    """Write (or replace) one sample's calls, ordered by `site_list` (caller commits)"""
+    codes = np.asarray(codes, dtype=np.uint8)
+    if codes.size != len(site_list):
+        raise GenotypeStoreError(f"Expected {len(site_list)} calls for site list {site_list.version}, got {codes.size}")
+    db.merge(GenotypeBlob(
+        sample_id=sample_id,
+        site_list_version=site_list.version,
+        called_sites=int(np.count_nonzero(codes != MISSING)),
+        data=encode_blob(codes),
+    ))
+
+
+def open_calls(db: Session, sample_id: str) -> Optional[Tuple[int, PackedGenotypes]]:
+    """(site list version, reader) for a sample, or None when it has no blob"""
+    row = db.execute(
+        select(GenotypeBlob.site_list_version, GenotypeBlob.data).where(GenotypeBlob.sample_id == sample_id)
+    ).first()
+    return (row[0], PackedGenotypes(row[1])) if row else None
+
+
+def extract(
+    db: Session,
+    sample_ids: Sequence[str],
+    site_list: SiteList,
+    site_indices: np.ndarray,
+    chunk_size: int = 500
+) -> np.ndarray:
+    """
+    Calls for N sites across M samples as an (M, N) uint8 matrix
+
+    Rows follow `sample_ids`; samples without a blob on this site list stay
+    MISSING. Blobs are streamed in chunks so memory holds one chunk at a time.
+    """
+    site_indices = np.asarray(site_indices, dtype=np.int64)
+    matrix = np.full((len(sample_ids), site_indices.size), MISSING, dtype=np.uint8)
+    row_of = {sample_id: row for row, sample_id in enumerate(sample_ids)}
+    plan: Optional[TakePlan] = None
+    for start in range(0, len(sample_ids), chunk_size):
+        chunk = list(sample_ids[start:start + chunk_size])
+        blobs = db.execute(
+            select(GenotypeBlob.sample_id, GenotypeBlob.data).where(
+                GenotypeBlob.sample_id.in_(chunk),
+                GenotypeBlob.site_list_version == site_list.version
+            )
+        )
+        for sample_id, data in blobs:
+            reader = PackedGenotypes(data)
+            if plan is None or not plan.matches(reader):
+                plan = TakePlan(site_indices, reader.site_count, reader.block_sites)
+            matrix[row_of[sample_id]] = reader.take(site_indices, plan)
+    return matrix
+
+
+def variant_calls(db: Session, sample_ids: Sequence[str], rsids: Sequence[str]) -> Dict[str, List[Tuple[int, int]]]:
+    """
+    Non-missing (position in `rsids`, call code) per sample, for every sample with a blob
+
+    Samples are grouped by site list version so each group is one extract().
+    Call codes 0/1/2 correspond to a biallelic variant's ref/ref, het and
+    alt/alt genotypes, in that order.
+    """
+    versions: Dict[int, List[str]] = {}
+    for start in range(0, len(sample_ids), 1000):
+        for sample_id, version in db.execute(
+            select(GenotypeBlob.sample_id, GenotypeBlob.site_list_version).where(
+                GenotypeBlob.sample_id.in_(list(sample_ids[start:start + 1000]))
+            )
+        ):
+            versions.setdefault(version, []).append(sample_id)
+
+    calls: Dict[str, List[Tuple[int, int]]] = {}
+    for version, group in versions.items():
+        site_list = load_site_list(db, version)
+        indices = site_list.indices(rsids)
+        matrix = extract(db, group, site_list, indices)
+        for row, sample_id in enumerate(group):
+            present = np.flatnonzero(matrix[row] != MISSING)
+            calls[sample_id] = list(zip(present.tolist(), matrix[row, present].tolist()))
+    return calls
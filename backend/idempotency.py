@@ -0,0 +1,114 @@
+"""
+AFRO-GENOMICS Research Platform
+Idempotent Requests
+
+Clients on unreliable links retry POSTs they never saw a response to. A
+request sent with an `Idempotency-Key` header stores its response under
+(user, key) in the same transaction as its effect; a retry with the same key
+is answered from that row by one primary-key lookup, without repeating the
+write, audit entry or commit. Two copies racing each other both try to
+insert the key: the loser rolls back and replays the winner's response.
+
+A key reused for a different request (route or body) is refused with 422.
+Keys expire after IDEMPOTENCY_TTL_HOURS and are deleted by the maintenance
+leader.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, Callable, Optional
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.orm import Session
+
+from models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+IDEMPOTENCY_TTL_HOURS = float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+IDEMPOTENCY_PURGE_INTERVAL_SECONDS = float(os.getenv("IDEMPOTENCY_PURGE_INTERVAL_SECONDS", "600"))
+IDEMPOTENCY_PURGE_BATCH_SIZE = int(os.getenv("IDEMPOTENCY_PURGE_BATCH_SIZE", "1000"))
+
+MAX_KEY_LENGTH = 255
+
+
+def request_fingerprint(route: str, payload: Any) -> str:
+    """SHA-256 over the route and the canonical JSON of the request body"""
+    body = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{route}\n{body}".encode("utf-8")).hexdigest()
+
+
+def check_idempotency_key(key: Optional[str]) -> Optional[str]:
+    if key is not None and not 0 < len(key) <= MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+    return key
+
+
+def replay_response(db: Session, user_id: str, key: str, fingerprint: str) -> Optional[JSONResponse]:
+    """
+    The stored response for (user, key), or None if the key is new or expired
+
+    Raises:
+        HTTPException 422: the key was used for a different request
+    """
+    row = db.execute(
+        select(IdempotencyKey.fingerprint, IdempotencyKey.status_code, IdempotencyKey.response, IdempotencyKey.expires_at)
+        .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+    ).first()
+    if row is None:
+        return None
+    if row.expires_at <= datetime.utcnow():
+        # Not purged yet; clear it in the request's transaction so the key can be stored again
+        db.execute(delete(IdempotencyKey).where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key))
+        return None
+    if row.fingerprint != fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+    return JSONResponse(
+        status_code=row.status_code,
+        content=json.loads(row.response),
+        headers={"Idempotent-Replayed": "true"}
+    )
+
+
+def remember_response(db: Session, user_id: str, key: str, fingerprint: str, status_code: int, response: Any):
+    """Stage the response for (user, key) in the request's transaction (caller commits)"""
+    now = datetime.utcnow()
+    db.add(IdempotencyKey(
+        user_id=user_id,
+        key=key,
+        fingerprint=fingerprint,
+        status_code=status_code,
+        response=json.dumps(jsonable_encoder(response), separators=(",", ":")),
+        created_at=now,
+        expires_at=now + timedelta(hours=IDEMPOTENCY_TTL_HOURS)
+    ))
+
+
+def purge_expired_keys(session_factory: Callable[[], Session], should_stop: Callable[[], bool] = lambda: False) -> int:
+    """Delete expired keys in batches"""
+    deleted = 0
+    db = session_factory()
+    try:
+        while not should_stop():
+            batch = select(IdempotencyKey.user_id, IdempotencyKey.key).where(
+                IdempotencyKey.expires_at <= datetime.utcnow()
+            ).limit(IDEMPOTENCY_PURGE_BATCH_SIZE)
+            count = db.execute(
+                delete(IdempotencyKey).where(tuple_(IdempotencyKey.user_id, IdempotencyKey.key).in_(batch))
+            ).rowcount
+            db.commit()
+            deleted += count
+            if count < IDEMPOTENCY_PURGE_BATCH_SIZE:
+                break
+    finally:
+        db.close()
+    if deleted:
+        logger.info("Deleted %d expired idempotency keys", deleted)
+    return deleted
@@ -0,0 +1,392 @@
+"""
+AFRO-GENOMICS Research Platform
+Request Instrumentation & Metrics
+
+- ASGI middleware recording per-route latency histograms and status counts
+- SQLAlchemy cursor hooks counting queries and DB time per request
+- Slow-query logging with bound parameters redacted
+- Prometheus text exposition for /api/v1/metrics (bearer METRICS_TOKEN)
+- Opt-in sampling profiler for a single request (admin header)
+- Access log lines without query strings (stream tickets travel in the URL)
+"""
+
+import hmac
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN", "")  # Empty disables the profiler
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")  # Bearer token for /api/v1/metrics; empty disables it
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "2"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+_IDLE_MODULES = {"threading.py", "selectors.py", "queue.py"}  # Innermost frame => thread is parked
+
+
+# ==================== METRICS REGISTRY ====================
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Cumulative-bucket histogram in Prometheus layout"""
+
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms keyed by metric name and labels"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[str, Dict[LabelSet, float]] = {}
+        self._gauges: Dict[str, Dict[LabelSet, float]] = {}
+        self._histograms: Dict[str, Dict[LabelSet, Histogram]] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+
+    def counter(self, name: str, help_text: str):
+        self._help[name] = ("counter", help_text)
+        self._counters.setdefault(name, {})
+
+    def gauge(self, name: str, help_text: str):
+        self._help[name] = ("gauge", help_text)
+        self._gauges.setdefault(name, {})
+
+    def histogram(self, name: str, help_text: str, buckets: Tuple[float, ...]):
+        self._help[name] = ("histogram", help_text)
+        self._histograms.setdefault(name, {})
+        self._buckets[name] = buckets
+
+    def inc(self, name: str, amount: float = 1.0, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters[name]
+            series[key] = series.get(key, 0.0) + amount
+
+    def set(self, name: str, value: float, **labels: str):
+        with self._lock:
+            self._gauges[name][tuple(sorted(labels.items()))] = value
+
+    def add(self, name: str, amount: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._gauges[name]
+            series[key] = series.get(key, 0.0) + amount
+
+    def observe(self, name: str, value: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms[name]
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self._buckets[name])
+            histogram.observe(value)
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        with self._lock:
+            for name, (kind, help_text) in sorted(self._help.items()):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == "histogram":
+                    for labels, histogram in sorted(self._histograms[name].items()):
+                        cumulative = 0
+                        for bound, count in zip(histogram.buckets, histogram.counts):
+                            cumulative += count
+                            lines.append(f"{name}_bucket{_labels(labels, le=_number(bound))} {cumulative}")
+                        lines.append(f'{name}_bucket{_labels(labels, le="+Inf")} {histogram.count}')
+                        lines.append(f"{name}_sum{_labels(labels)} {_number(histogram.total)}")
+                        lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+                else:
+                    series = self._counters[name] if kind == "counter" else self._gauges[name]
+                    for labels, value in sorted(series.items()):
+                        lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _number(value: float) -> str:
+    return repr(int(value)) if float(value).is_integer() else repr(value)
+
+
+def _labels(labels: Iterable[Tuple[str, str]], **extra: str) -> str:
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = (
+        f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for key, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+metrics = MetricsRegistry()
+metrics.counter("http_requests_total", "HTTP requests by method, route and status")
+metrics.gauge("http_requests_in_flight", "HTTP requests currently being served")
+metrics.histogram("http_request_duration_seconds", "HTTP request latency", LATENCY_BUCKETS)
+metrics.histogram("http_request_db_queries", "SQL queries issued per HTTP request", QUERY_COUNT_BUCKETS)
+metrics.histogram("http_request_db_seconds", "Time spent in SQL per HTTP request", LATENCY_BUCKETS)
+metrics.counter("db_queries_total", "SQL queries by origin (request route or background)")
+metrics.counter("db_slow_queries_total", "SQL queries slower than SLOW_QUERY_MS")
+metrics.histogram("db_query_duration_seconds", "SQL query latency", LATENCY_BUCKETS)
+
+
+# ==================== REQUEST CONTEXT ====================
+
+@dataclass
+class RequestStats:
+    """Per-request accounting shared across the event loop and threadpool"""
+    scope: dict = field(default_factory=dict)
+    method: str = ""
+    client_ip: Optional[str] = None
+    user_agent: Optional[str] = None
+    queries: int = 0
+    db_seconds: float = 0.0
+    started: float = field(default_factory=time.perf_counter)
+
+    @property
+    def route(self) -> str:
+        """Matched route template (set on the scope by the router), never the raw path"""
+        route = self.scope.get("route")
+        return route.path if route is not None else "unmatched"
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def current_request() -> Optional[RequestStats]:
+    """Stats for the request being served, or None outside a request"""
+    return _current.get()
+
+
+# ==================== SQL HOOKS ====================
+
+def _redact(parameters) -> object:
+    """Replace bound values with their type names so slow-query logs carry no data"""
+    if isinstance(parameters, dict):
+        return {key: f"<{type(value).__name__}>" for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (list, tuple, dict)):
+            return f"<{len(parameters)} parameter sets>"
+        return tuple(f"<{type(value).__name__}>" for value in parameters)
+    return "<redacted>"
+
+
+def instrument_engine(engine: Engine):
+    """Attach query counting, timing and slow-query logging to an engine"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        stats = _current.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+        origin = stats.route if stats is not None else "background"
+        metrics.inc("db_queries_total", origin=origin)
+        metrics.observe("db_query_duration_seconds", elapsed)
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            metrics.inc("db_slow_queries_total", origin=origin)
+            logger.warning(
+                "Slow query (%.1f ms, %s): %s params=%s",
+                elapsed * 1000, origin, " ".join(statement.split()), _redact(parameters)
+            )
+
+
+class StripQueryStringFilter(logging.Filter):
+    """Drop the query string from uvicorn access log lines (args: client, method, path, http version, status)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        args = record.args
+        if isinstance(args, tuple) and len(args) == 5 and isinstance(args[2], str) and "?" in args[2]:
+            record.args = (args[0], args[1], args[2].split("?", 1)[0], *args[3:])
+        return True
+
+
+def strip_access_log_queries():
+    """Install StripQueryStringFilter on uvicorn's access logger (also used under gunicorn's UvicornWorker)"""
+    logging.getLogger("uvicorn.access").addFilter(StripQueryStringFilter())
+
+
+# ==================== SAMPLING PROFILER ====================
+
+class SamplingProfiler:
+    """
+    Statistical profiler for one request
+
+    Samples every thread's Python stack at a fixed interval and keeps stacks
+    that pass through application code, so sync endpoints running in the
+    threadpool are captured. Output is collapsed-stack text (flamegraph.pl /
+    speedscope compatible). One profile runs at a time per worker.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, interval_seconds: float = PROFILER_INTERVAL_MS / 1000):
+        self.interval_seconds = interval_seconds
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self) -> bool:
+        """Start sampling; False if another request is already being profiled"""
+        if not self._lock.acquire(blocking=False):
+            return False
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._lock.release()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval_seconds):
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == own or os.path.basename(frame.f_code.co_filename) in _IDLE_MODULES:
+                    continue
+                stack = []
+                in_app = False
+                while frame is not None:
+                    code = frame.f_code
+                    if code.co_filename.startswith(_APP_DIR) and not code.co_filename.endswith("instrumentation.py"):
+                        in_app = True
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                if in_app:
+                    self.stacks[";".join(reversed(stack))] += 1
+
+    def report(self, total_seconds: float) -> str:
+        header = f"# {self.samples} samples over {total_seconds * 1000:.1f} ms (interval {self.interval_seconds * 1000:.1f} ms)\n"
+        return header + "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+# ==================== ACCESS TOKENS ====================
+
+def token_matches(supplied: Optional[str], expected: str) -> bool:
+    """Constant-time comparison of a presented secret; an empty `expected` matches nothing"""
+    return bool(expected) and supplied is not None and hmac.compare_digest(
+        supplied.encode("utf-8"), expected.encode("utf-8")
+    )
+
+
+def metrics_authorized(authorization: Optional[str]) -> bool:
+    """`Authorization: Bearer <METRICS_TOKEN>` (what Prometheus sends with `authorization.credentials`)"""
+    scheme, _, credentials = (authorization or "").partition(" ")
+    return scheme.lower() == "bearer" and token_matches(credentials, METRICS_TOKEN)
+
+
+# ==================== ASGI MIDDLEWARE ====================
+
+class InstrumentationMiddleware:
+    """
+    Pure ASGI middleware (no response buffering) recording latency, status,
+    and per-request SQL counts under the matched route template
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        client = scope.get("client")
+        stats = RequestStats(
+            scope=scope,
+            method=scope["method"],
+            client_ip=client[0] if client else None,
+            user_agent=headers.get(b"user-agent", b"").decode("latin-1")[:500] or None,
+        )
+        token = _current.set(stats)
+        status_code = 500
+
+        profiler = None
+        if token_matches(headers.get(b"x-profile", b"").decode("latin-1"), PROFILER_TOKEN):
+            profiler = SamplingProfiler()
+            if not profiler.start():
+                profiler = None
+        profiling = profiler is not None
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            if not profiling:
+                await send(message)
+
+        metrics.add("http_requests_in_flight", 1)
+        try:
+            if profiling:
+                try:
+                    await self.app(scope, receive, send_wrapper)
+                finally:
+                    profiler.stop()
+                await self._send_profile(send, profiler, stats)
+            else:
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - stats.started
+            metrics.add("http_requests_in_flight", -1)
+            metrics.inc("http_requests_total", method=stats.method, route=stats.route, status=str(status_code))
+            metrics.observe("http_request_duration_seconds", elapsed, method=stats.method, route=stats.route)
+            metrics.observe("http_request_db_queries", stats.queries, route=stats.route)
+            metrics.observe("http_request_db_seconds", stats.db_seconds, route=stats.route)
+            _current.reset(token)
+
+    @staticmethod
+    async def _send_profile(send, profiler: SamplingProfiler, stats: RequestStats):
+        elapsed = time.perf_counter() - stats.started
+        body = (
+            profiler.report(elapsed)
+            + f"\n# queries={stats.queries} db_ms={stats.db_seconds * 1000:.1f}\n"
+        ).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/plain; charset=utf-8"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -5,48 +5,165 @@ Backend API - Main Application
 FastAPI application with authentication, database setup, and endpoints
 """
 
-from fastapi import FastAPI, Depends, HTTPException, status, Header
+from fastapi import FastAPI, Depends, HTTPException, status, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker, Session
 from datetime import datetime, timedelta
 from typing import Optional, List
 import json
+import os
+import time
 import uuid
 
 from models import (
-    Base, User, Institution, ConsentRecord, Sample, AncestryResult, HealthMarker, AuditLog,
-    UserRole, SampleStatus, ConsentWithdrawalStatus
+    Base, User, Institution, ConsentRecord, Sample, AncestryResult, HealthMarker, RelatedSamplePair,
+    AncestryRecomputeJob, GenotypeBlob, UserRole, SampleStatus, ConsentWithdrawalStatus
 )
 from schemas import (
-    LoginRequest, LoginResponse, UserResponse,
+    LoginRequest, LoginResponse, StreamTicketResponse, UserResponse,
     InstitutionResponse, ConsentRecordResponse, ConsentWithdrawRequest, ConsentWithdrawResponse,
+    ConsentBatchWithdrawRequest, ConsentBatchWithdrawResponse,
     SampleCreate, SampleResponse, SampleListResponse, SampleResultsResponse,
+    SyncPullResponse, SyncUploadRequest, SyncUploadResponse, SyncUploadItemResponse, SyncUploadStatusEnum,
+    ChangeFeedResponse, ChangeFeedHeadResponse,
+    RelatedSampleResponse, SampleRelativesResponse,
     PopulationEstimate, ConfidenceInterval, AncestryResultsResponse,
-    HealthMarkerResponse, AuditLogResponse, AuditLogListResponse,
+    HealthMarkerResponse, AuditLogListResponse, AuditChainVerifyResponse,
+    CohortQueryRequest, CohortQueryResponse, VariantSiteResponse, RegionQueryResponse,
+    FrequencyStatistics, VariantFrequencyResponse,
+    AncestryRecomputeRequest, AncestryRecomputeJobResponse,
+    PcaProjectionRequest, PcaModelResponse, PcaCoordinate, PcaProjectionResponse,
     DataExportRequest, DataExportResponse
 )
-from auth import create_access_token, verify_password, get_password_hash, get_current_user
+from auth import (
+    create_access_token, create_stream_ticket, verify_password, get_password_hash, get_current_user, get_stream_user,
+    get_optional_user, STREAM_TICKET_EXPIRE_SECONDS
+)
+from cohort import cohort_index, CohortQueryError
+from consents import CONSENT_INDEX_RECONCILE_SECONDS, consent_index, consent_permits
+from events import sample_events, status_event
+from catalogue import variant_catalogue
+from genotype_store import variant_calls
+from ancestry import (
+    current_reference, request_recompute, run_pending_recomputes, job_progress,
+    RecomputeConflict, ANCESTRY_RECOMPUTE_INTERVAL_SECONDS
+)
+from frequencies import (
+    allele_frequencies, population_statistics, institution_statistics, predominant_populations,
+    FREQUENCY_MIN_SAMPLES
+)
+from pca import current_model, project_samples, PCA_PROJECTION_MAX_SAMPLES
+from relatedness import run_relatedness_screening, RELATEDNESS_INTERVAL_SECONDS
+from regions import site_index, parse_region, region_genotype_counts, RegionQueryError
+from purge import schedule_withdrawal, run_due_purges, PURGE_INTERVAL_SECONDS
+from retention import run_retention_sweep, RETENTION_INTERVAL_SECONDS
+from audit_store import ensure_partitions, query_audit_logs, run_audit_rollover, AUDIT_ROLLOVER_INTERVAL_SECONDS
+from audit_chain import seal_pending, verify_range, AUDIT_SEAL_INTERVAL_SECONDS
+from migrations import upgrade_schema, migrate_health_markers
+from instrumentation import (
+    InstrumentationMiddleware, instrument_engine, current_request, metrics, strip_access_log_queries,
+    metrics_authorized, METRICS_TOKEN
+)
+from admission import AdmissionMiddleware
+from scheduler import PeriodicTask
+from coordination import create_bus, create_leader
+from replicas import (
+    RoutingSession, session_router, DATABASE_REPLICA_URLS, REPLICA_HEARTBEAT_SECONDS, REPLICA_LAG_CHECK_SECONDS
+)
+from idempotency import (
+    check_idempotency_key, request_fingerprint, replay_response, remember_response, purge_expired_keys,
+    IDEMPOTENCY_PURGE_INTERVAL_SECONDS
+)
+from sync import (
+    changes_since, compact_results, has_results, encode_json, compressed_response, GzipRequestMiddleware, SyncError,
+    SYNC_PAGE_SIZE, SYNC_MAX_PAGE_SIZE, SYNC_UPLOAD_MAX_SAMPLES
+)
+from changes import (
+    read_changes, feed_head, change_notifier, prune_change_events, ChangeFeedError, CursorExpired,
+    CHANGE_FEED_PAGE_SIZE, CHANGE_FEED_MAX_PAGE_SIZE, CHANGE_FEED_MAX_WAIT_SECONDS, CHANGE_FEED_PRUNE_INTERVAL_SECONDS
+)
+from shards import (
+    shard_router, InstitutionMoving, DATABASE_SHARD_URLS, SHARD_MAP_REFRESH_SECONDS, SHARD_REFERENCE_SYNC_SECONDS
+)
+from repository import (
+    user_by_id, user_by_email, sample_by_id, samples_page, institution_rows, institution_user_emails,
+    active_ancestry_results, health_marker_calls, insert_audit_rows
+)
+from panels import MARKER_PANEL
 from mock_data import generate_mock_data
 
 # ==================== DATABASE SETUP ====================
 
-DATABASE_URL = "sqlite:///./afro_genomics.db"  # SQLite for demo; PostgreSQL for production
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./afro_genomics.db")  # SQLite for demo; PostgreSQL for production
 
-# Create tables
-Base.metadata.create_all(bind=engine)
 
-def get_db():
-    """Dependency: get database session"""
-    db = SessionLocal()
+def _create_engine(url: str):
+    engine = create_engine(url, connect_args={"check_same_thread": False} if url.startswith("sqlite") else {})
+    instrument_engine(engine)
+    return engine
+
+
+engine = _create_engine(DATABASE_URL)
+replica_engines = [_create_engine(url) for url in DATABASE_REPLICA_URLS]
+shard_engines = {name: _create_engine(url) for name, url in DATABASE_SHARD_URLS.items()}
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False, bind=engine)
+session_router.configure(engine, replica_engines)
+shard_router.configure(engine, shard_engines, SessionLocal)
+
+# Create tables (and the current audit partitions on PostgreSQL); shards get the same schema.
+# Tables of databases created by earlier releases are upgraded in place.
+for schema_engine in (engine, *shard_engines.values()):
+    Base.metadata.create_all(bind=schema_engine)
+    upgrade_schema(schema_engine)
+migrate_health_markers(SessionLocal)
+with engine.begin() as conn:
+    ensure_partitions(conn)
+shard_router.refresh()
+
+
+def _session_info(user_id: Optional[str]) -> dict:
+    """Principal and shard routing for a request's session"""
+    institution_id = shard_router.institution_of(user_id) if user_id and shard_engines else None
+    return {"user_id": user_id, **shard_router.session_info(institution_id)}
+
+
+def get_db(user_id: Optional[str] = Depends(get_optional_user)):
+    """Dependency: get database session (primary only)"""
+    db = SessionLocal(info=_session_info(user_id))
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_read_db(user_id: Optional[str] = Depends(get_optional_user)):
+    """Dependency: read-intent session; queries may be served by a replica (see replicas.py)"""
+    db = SessionLocal(info={**_session_info(user_id), "replica": session_router.read_bind(user_id)})
     try:
         yield db
     finally:
         db.close()
 
 
+def read_from_primary(db: Session) -> bool:
+    """
+    Send the rest of a read-intent session's queries to the primary
+    
+    For reads that decide a write: a replica may not show what another
+    request just wrote. Loaded objects are expired so they reload from the
+    primary. Returns True if the session was reading from a replica.
+    """
+    if db.info.get("replica") is None or db.info.get("wrote"):
+        return False
+    db.info["replica"] = None
+    db.expire_all()
+    return True
+
+
 # ==================== FASTAPI APP ====================
 
 app = FastAPI(
@@ -57,6 +174,14 @@ app = FastAPI(
     openapi_url="/api/v1/openapi.json"
 )
 
+# Inflate gzip request bodies (sync batches from low-bandwidth sites, see sync.py); innermost,
+# so admission control can refuse a request before its body is decompressed
+app.add_middleware(GzipRequestMiddleware)
+
+# Per-user / per-institution rate limits and per-route-class concurrency (see admission.py);
+# added before CORS and instrumentation so it runs inside them and its 429s get both
+app.add_middleware(AdmissionMiddleware)
+
 # CORS configuration
 app.add_middleware(
     CORSMiddleware,
@@ -66,6 +191,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route latency, SQL counts and opt-in profiling (see instrumentation.py)
+app.add_middleware(InstrumentationMiddleware)
+strip_access_log_queries()
+
+
+@app.exception_handler(InstitutionMoving)
+def institution_moving_handler(request, exc: InstitutionMoving):
+    """Writes hit an institution in the final phase of a shard move (see shards.py)"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Institution data is being moved; retry shortly"},
+        headers={"Retry-After": str(int(2 * SHARD_MAP_REFRESH_SECONDS) + 1)}
+    )
+
 # ==================== AUTHENTICATION ENDPOINTS ====================
 
 @app.post("/api/v1/auth/login", response_model=LoginResponse, tags=["Authentication"])
@@ -82,7 +221,7 @@ def login(request: LoginRequest, db: Session = Depends(get_db)):
     }
     ```
     """
-    user = db.query(User).filter(User.email == request.email).first()
+    user = user_by_email(db, request.email)
     
     if not user or not verify_password(request.password, user.hashed_password):
         raise HTTPException(
@@ -109,7 +248,7 @@ def login(request: LoginRequest, db: Session = Depends(get_db)):
     
     # Create tokens
     access_token = create_access_token(
-        data={"sub": user.id, "email": user.email, "role": user.role}
+        data={"sub": user.id, "email": user.email, "role": user.role, "inst": user.institution_id}
     )
     refresh_token = create_access_token(
         data={"sub": user.id, "type": "refresh"},
@@ -134,10 +273,9 @@ def logout(user_id: str = Depends(get_current_user)):
 # ==================== INSTITUTION ENDPOINTS ====================
 
 @app.get("/api/v1/institutions", response_model=List[InstitutionResponse], tags=["Institutions"])
-def list_institutions(db: Session = Depends(get_db)):
+def list_institutions(db: Session = Depends(get_read_db)):
     """List all partner institutions"""
-    institutions = db.query(Institution).all()
-    return institutions
+    return institution_rows(db)
 
 
 # ==================== SAMPLES ENDPOINTS ====================
@@ -148,7 +286,7 @@ def list_samples(
     limit: int = 50,
     offset: int = 0,
     user_id: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     List samples for user's institution
@@ -159,26 +297,58 @@ def list_samples(
     - offset: Pagination offset (default: 0)
     """
     # Fetch current user
-    current_user = db.query(User).filter(User.id == user_id).first()
+    current_user = user_by_id(db, user_id)
     if not current_user:
         raise HTTPException(status_code=401, detail="User not found")
     
-    query = db.query(Sample).filter(Sample.institution_id == current_user.institution_id)
-    
-    if status:
-        query = query.filter(Sample.status == status)
-    
-    total = query.count()
-    samples = query.offset(offset).limit(limit).all()
+    total, samples = samples_page(db, current_user.institution_id, status, limit, offset)
     
     # Log access
     log_audit(db, current_user.id, "accessed_samples_list", None)
     
-    return SampleListResponse(
-        samples=[SampleResponse.from_orm(s) for s in samples],
-        total=total,
-        limit=limit,
-        offset=offset
+    # Plain row dicts, validated once against the response_model
+    return {"samples": samples, "total": total, "limit": limit, "offset": offset}
+
+
+@app.post("/api/v1/samples/events/ticket", response_model=StreamTicketResponse, tags=["Samples"])
+def create_sample_events_ticket(user_id: str = Depends(get_current_user)):
+    """Short-lived ticket for opening /samples/events from a browser (keeps the access token out of URLs)"""
+    return StreamTicketResponse(ticket=create_stream_ticket(user_id), expires_in=STREAM_TICKET_EXPIRE_SECONDS)
+
+
+@app.get("/api/v1/samples/events", tags=["Samples"])
+def stream_sample_events(
+    user_id: str = Depends(get_stream_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Server-Sent Events stream of the institution's sample changes
+    
+    Replaces polling /samples: events are `sample.created`, `sample.status`,
+    `sample.results_ready` and `sample.deleted`, each carrying the sample's
+    id, external sample_id and status. Clients refetch after `ready` (sent on
+    every (re)connect) and `resync` (sent before dropping a client that
+    fell behind). Browsers pass a ticket from POST /samples/events/ticket
+    as `?ticket=` because EventSource cannot set headers.
+    """
+    # Fetch current user
+    current_user = user_by_id(db, user_id)
+    if not current_user:
+        raise HTTPException(status_code=401, detail="User not found")
+    
+    if not sample_events.accepting():
+        raise HTTPException(status_code=503, detail="Too many event stream connections", headers={"Retry-After": "30"})
+    
+    # One audit entry per subscription instead of one per poll
+    log_audit(db, current_user.id, "subscribed_sample_events", None)
+    institution_id = current_user.institution_id
+    # The stream outlives the request's session; release it now rather than at disconnect
+    db.close()
+    
+    return StreamingResponse(
+        sample_events.stream(institution_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
 
@@ -186,6 +356,7 @@ def list_samples(
 def upload_sample(
     sample_data: SampleCreate,
     user_id: str = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
     """
@@ -193,25 +364,33 @@ def upload_sample(
     
     **Sample ID Format:** {COUNTRY_CODE}-{YEAR}-{SEQUENCE}
     - Example: KEN-2024-00523
+    
+    **Retries:** send an `Idempotency-Key` header (unique per upload). A retry with
+    the same key returns the original response instead of uploading again. A sample
+    ID the institution already has is refused with 409.
     """
+    idempotency_key = check_idempotency_key(idempotency_key)
+    fingerprint = request_fingerprint("POST /api/v1/samples", sample_data) if idempotency_key else None
+    if idempotency_key:
+        replayed = replay_response(db, user_id, idempotency_key, fingerprint)
+        if replayed is not None:
+            return replayed
+    
     # Fetch current user
-    current_user = db.query(User).filter(User.id == user_id).first()
+    current_user = user_by_id(db, user_id)
     if not current_user:
         raise HTTPException(status_code=401, detail="User not found")
     
-    # Verify consent exists and belongs to user
-    consent = db.query(ConsentRecord).filter(
-        ConsentRecord.id == sample_data.consent_id,
-        ConsentRecord.user_id == current_user.id
-    ).first()
+    # Verify consent exists and belongs to user (consent index, see consents.py)
+    consent = consent_index.lookup(db, sample_data.consent_id)
     
-    if not consent:
+    if consent is None or consent[0] != current_user.id:
         raise HTTPException(status_code=404, detail="Consent record not found")
     
-    if consent.withdrawal_status != ConsentWithdrawalStatus.ACTIVE:
+    if not consent_permits(consent[1]):
         raise HTTPException(status_code=400, detail="Consent is not active")
     
-    # Create sample
+    # Create sample, audit entry and stored response in one transaction
     sample = Sample(
         sample_id=sample_data.sample_id,
         participant_id=sample_data.participant_id,
@@ -221,22 +400,35 @@ def upload_sample(
         status=SampleStatus.RECEIVED,
         notes=sample_data.notes
     )
-    
     db.add(sample)
-    db.commit()
-    db.refresh(sample)
+    try:
+        db.flush()
+        response = SampleResponse.from_orm(sample)
+        _add_audit(db, current_user.id, "uploaded_sample", sample.id)
+        if idempotency_key:
+            remember_response(db, user_id, idempotency_key, fingerprint, 201, response)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        # A concurrent copy of this request may have committed first
+        replayed = replay_response(db, user_id, idempotency_key, fingerprint) if idempotency_key else None
+        if replayed is not None:
+            return replayed
+        raise HTTPException(
+            status_code=409, detail=f"Sample ID {sample_data.sample_id} already exists in this institution"
+        )
     
-    # Log audit
-    log_audit(db, current_user.id, "uploaded_sample", sample.id)
+    cohort_index.add_sample(sample.id, sample.institution_id)
+    sample_events.publish([status_event(sample)])
     
-    return SampleResponse.from_orm(sample)
+    return response
 
 
 @app.get("/api/v1/samples/{sample_id}/results", response_model=SampleResultsResponse, tags=["Samples"])
 def get_sample_results(
     sample_id: str,
     user_id: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     Retrieve ancestry and health results for a sample
@@ -248,11 +440,11 @@ def get_sample_results(
     - Research-use disclaimers
     """
     # Fetch current user
-    current_user = db.query(User).filter(User.id == user_id).first()
+    current_user = user_by_id(db, user_id)
     if not current_user:
         raise HTTPException(status_code=401, detail="User not found")
     
-    sample = db.query(Sample).filter(Sample.id == sample_id).first()
+    sample = sample_by_id(db, sample_id)
     
     if not sample:
         raise HTTPException(status_code=404, detail="Sample not found")
@@ -262,43 +454,49 @@ def get_sample_results(
         raise HTTPException(status_code=403, detail="Access denied")
     
     # Verify consent is active
-    consent = sample.consent_record
-    if consent.withdrawal_status != ConsentWithdrawalStatus.ACTIVE:
+    if not consent_index.allows(db, sample.consent_id):
         raise HTTPException(status_code=400, detail="Consent is withdrawn")
     
+    # Results not ready yet means writes below: decide them on the primary, where another
+    # request may already have generated the results the replica does not show yet
+    if sample.status != SampleStatus.RESULTS_AVAILABLE and read_from_primary(db):
+        sample = sample_by_id(db, sample_id)
+    
+    if sample.status == SampleStatus.ARCHIVED:
+        raise HTTPException(status_code=410, detail="Sample results archived under data retention policy")
+    
     # Simulate sample processing if not done
     if sample.status == SampleStatus.RECEIVED:
         sample.status = SampleStatus.PROCESSING
         db.commit()
+        sample_events.publish([status_event(sample)])
     
     # Get ancestry results
-    ancestry_results = db.query(AncestryResult).filter(
-        AncestryResult.sample_id == sample.id
-    ).all()
+    ancestry_results = active_ancestry_results(db, sample.id)
+    if not ancestry_results and read_from_primary(db):
+        ancestry_results = active_ancestry_results(db, sample.id)
     
     if not ancestry_results:
         # Generate mock results if not present
         _generate_sample_results(db, sample)
-        ancestry_results = db.query(AncestryResult).filter(
-            AncestryResult.sample_id == sample.id
-        ).all()
+        ancestry_results = active_ancestry_results(db, sample.id)
     
-    # Get health markers
-    health_markers = db.query(HealthMarker).filter(
-        HealthMarker.sample_id == sample.id
-    ).all()
+    # Get health markers (compact calls, decoded against the variant catalogue)
+    health_markers = health_marker_calls(db, sample.id)
+    if not health_markers and read_from_primary(db):
+        health_markers = health_marker_calls(db, sample.id)
     
     if not health_markers:
         _generate_sample_health_markers(db, sample)
-        health_markers = db.query(HealthMarker).filter(
-            HealthMarker.sample_id == sample.id
-        ).all()
+        health_markers = health_marker_calls(db, sample.id)
+    variants = variant_catalogue.get_many(db, (variant_id for variant_id, _ in health_markers))
     
     # Update sample status
     if sample.status != SampleStatus.RESULTS_AVAILABLE:
         sample.status = SampleStatus.RESULTS_AVAILABLE
         sample.processed_at = datetime.utcnow()
         db.commit()
+        sample_events.publish([status_event(sample)])
     
     # Log audit
     log_audit(db, current_user.id, "accessed_results", sample.id)
@@ -328,15 +526,16 @@ def get_sample_results(
     
     health_markers_response = [
         HealthMarkerResponse(
-            gene=hm.gene_name,
-            variant=hm.variant_rsid,
-            phenotype=hm.phenotype,
-            genotype=hm.genotype,
-            clinical_significance=hm.clinical_significance,
-            population_frequency=hm.population_frequency,
-            disclaimer=hm.disclaimer
+            gene=variants[variant_id].gene,
+            variant=variants[variant_id].rsid,
+            phenotype=variants[variant_id].phenotype(code),
+            genotype=variants[variant_id].genotype(code),
+            clinical_significance=variants[variant_id].clinical_significance,
+            population_frequency=allele_frequencies.population_frequency(variants[variant_id]),
+            disclaimer=variants[variant_id].disclaimer
         )
-        for hm in health_markers
+        for variant_id, code in health_markers
+        if variant_id in variants
     ]
     
     return SampleResultsResponse(
@@ -348,6 +547,275 @@ def get_sample_results(
     )
 
 
+@app.get("/api/v1/samples/{sample_id}/relatives", response_model=SampleRelativesResponse, tags=["Samples"])
+def get_sample_relatives(
+    sample_id: str,
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Duplicates and relatives of a sample found by genotype screening
+    
+    Samples are screened against their institution shortly after their
+    genotypes are stored; `relatedness_status` is null until then.
+    """
+    # Fetch current user
+    current_user = user_by_id(db, user_id)
+    if not current_user:
+        raise HTTPException(status_code=401, detail="User not found")
+    
+    sample = sample_by_id(db, sample_id)
+    if not sample:
+        raise HTTPException(status_code=404, detail="Sample not found")
+    
+    if sample.institution_id != current_user.institution_id:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    pairs = db.query(RelatedSamplePair, Sample.sample_id).join(
+        Sample, RelatedSamplePair.related_sample_id == Sample.id
+    ).filter(
+        RelatedSamplePair.sample_id == sample.id
+    ).order_by(RelatedSamplePair.kinship.desc()).all()
+    
+    log_audit(db, current_user.id, "accessed_sample_relatives", sample.id)
+    
+    return SampleRelativesResponse(
+        sample_id=sample.id,
+        relatedness_status=sample.relatedness_status,
+        relatives=[
+            RelatedSampleResponse(
+                id=pair.related_sample_id,
+                sample_id=external_id,
+                relationship=pair.relationship,
+                kinship=pair.kinship,
+                ibs0=pair.ibs0,
+                concordance=pair.concordance,
+                shared_sites=pair.shared_sites,
+                detected_at=pair.detected_at
+            )
+            for pair, external_id in pairs
+        ]
+    )
+
+
+# ==================== SYNC ENDPOINTS ====================
+
+@app.get("/api/v1/sync/samples", response_model=SyncPullResponse, tags=["Sync"])
+def pull_sample_changes(
+    since: Optional[str] = None,
+    limit: int = Query(SYNC_PAGE_SIZE, ge=1, le=SYNC_MAX_PAGE_SIZE),
+    accept_encoding: Optional[str] = Header(None),
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Samples and results of the user's institution changed since a watermark (delta sync)
+    
+    Start without `since`, apply the page, and send its `watermark` back as
+    `since` until `has_more` is false; keep the last watermark for the next
+    sync. Results are included in short form once available (while consent is
+    active); deleted samples are listed in `deleted`. The response is
+    gzip-compressed when the client sends `Accept-Encoding: gzip`.
+    """
+    # Fetch current user
+    current_user = user_by_id(db, user_id)
+    if not current_user:
+        raise HTTPException(status_code=401, detail="User not found")
+    
+    try:
+        changed, deleted, watermark, has_more = changes_since(db, current_user.institution_id, since, limit)
+    except SyncError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    readable = [row["id"] for row in changed if has_results(row) and consent_index.allows(db, row["consent_id"])]
+    results = compact_results(db, readable)
+    for row in changed:
+        row["results"] = results.get(row["id"])
+    
+    # Results sent count as accessed, like GET /samples/{id}/results
+    insert_audit_rows(db, [
+        _audit_row(current_user.id, "synced_samples", None, details={"samples": len(changed), "deleted": len(deleted)}),
+        *(_audit_row(current_user.id, "accessed_results", sample_id, details={"sync": True}) for sample_id in readable)
+    ])
+    db.commit()
+    
+    return compressed_response(
+        encode_json({"watermark": watermark, "has_more": has_more, "samples": changed, "deleted": deleted}),
+        accept_encoding
+    )
+
+
+@app.post("/api/v1/sync/samples", response_model=SyncUploadResponse, tags=["Sync"])
+def push_samples(
+    batch: SyncUploadRequest,
+    accept_encoding: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None),
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Upload a batch of samples recorded offline (delta sync)
+    
+    Each sample is created, reported as already existing (a retried batch;
+    `id` is the existing sample) or rejected with a reason; outcomes come back
+    in request order. The body may be sent gzip-compressed
+    (`Content-Encoding: gzip`). Send an `Idempotency-Key` to have a retry
+    return the original response.
+    """
+    if len(batch.samples) > SYNC_UPLOAD_MAX_SAMPLES:
+        raise HTTPException(status_code=413, detail=f"At most {SYNC_UPLOAD_MAX_SAMPLES} samples per batch")
+    
+    idempotency_key = check_idempotency_key(idempotency_key)
+    fingerprint = request_fingerprint("POST /api/v1/sync/samples", batch) if idempotency_key else None
+    if idempotency_key:
+        replayed = replay_response(db, user_id, idempotency_key, fingerprint)
+        if replayed is not None:
+            return replayed
+    
+    # Fetch current user
+    current_user = user_by_id(db, user_id)
+    if not current_user:
+        raise HTTPException(status_code=401, detail="User not found")
+    
+    existing = dict(db.query(Sample.sample_id, Sample.id).filter(
+        Sample.institution_id == current_user.institution_id,
+        Sample.sample_id.in_([item.sample_id for item in batch.samples])
+    ).all())
+    
+    outcomes, created = [], []
+    for item in batch.samples:
+        if item.sample_id in existing:
+            outcomes.append((item, SyncUploadStatusEnum.EXISTS, existing[item.sample_id], None))
+            continue
+        consent = consent_index.lookup(db, item.consent_id)
+        if consent is None or consent[0] != current_user.id:
+            outcomes.append((item, SyncUploadStatusEnum.REJECTED, None, "Consent record not found"))
+        elif not consent_permits(consent[1]):
+            outcomes.append((item, SyncUploadStatusEnum.REJECTED, None, "Consent is not active"))
+        else:
+            sample = Sample(
+                sample_id=item.sample_id,
+                participant_id=item.participant_id,
+                user_id=current_user.id,
+                institution_id=current_user.institution_id,
+                consent_id=item.consent_id,
+                status=SampleStatus.RECEIVED,
+                notes=item.notes
+            )
+            db.add(sample)
+            created.append(sample)
+            existing[item.sample_id] = sample  # A repeat later in the batch reports this one
+            outcomes.append((item, SyncUploadStatusEnum.CREATED, sample, None))
+    
+    # Samples, audit entries and stored response in one transaction
+    try:
+        db.flush()
+        response = SyncUploadResponse(
+            results=[
+                SyncUploadItemResponse(
+                    sample_id=item.sample_id,
+                    status=outcome,
+                    id=sample.id if isinstance(sample, Sample) else sample,
+                    detail=detail
+                )
+                for item, outcome, sample, detail in outcomes
+            ],
+            created=len(created)
+        )
+        insert_audit_rows(db, (_audit_row(current_user.id, "uploaded_sample", s.id, details={"sync": True}) for s in created))
+        if idempotency_key:
+            remember_response(db, user_id, idempotency_key, fingerprint, 200, response)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        # A concurrent copy of this batch may have committed first
+        replayed = replay_response(db, user_id, idempotency_key, fingerprint) if idempotency_key else None
+        if replayed is not None:
+            return replayed
+        raise HTTPException(
+            status_code=409, detail="Some samples were uploaded concurrently; retry the batch"
+        )
+    
+    for sample in created:
+        cohort_index.add_sample(sample.id, sample.institution_id)
+    sample_events.publish([status_event(sample) for sample in created])
+    
+    return compressed_response(encode_json(response), accept_encoding)
+
+
+# ==================== CHANGE FEED ENDPOINTS ====================
+
+def _change_feed_institution(db: Session, user_id: str) -> str:
+    """Institution whose change feed the user reads (lab admins only)"""
+    # Fetch current user
+    current_user = user_by_id(db, user_id)
+    if not current_user:
+        raise HTTPException(status_code=401, detail="User not found")
+    
+    if current_user.role != UserRole.LAB_ADMIN:
+        raise HTTPException(status_code=403, detail="Only lab admins can read the change feed")
+    
+    institution_id = current_user.institution_id
+    # A long poll outlives this lookup; don't hold a connection while it waits
+    db.close()
+    return institution_id
+
+
+@app.get("/api/v1/changes", response_model=ChangeFeedResponse, tags=["Changes"])
+async def read_change_feed(
+    cursor: Optional[str] = None,
+    limit: int = Query(CHANGE_FEED_PAGE_SIZE, ge=1, le=CHANGE_FEED_MAX_PAGE_SIZE),
+    wait: float = Query(0, ge=0, le=CHANGE_FEED_MAX_WAIT_SECONDS),
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Committed changes to the institution's samples, results and consents after a cursor
+    
+    For downstream stores (analytics, caches, search). Start without `cursor`
+    (or from GET /changes/head after a full load), apply the batch and send
+    its `cursor` back; `has_more` means the next batch is ready. With `wait`
+    (seconds) an empty batch is held until a change commits or the time is
+    up (long polling). Each event names the entity and its id, not its
+    contents: consumers fetch what they need. A cursor behind the retained
+    feed gets 410: reload and follow from the head.
+    """
+    institution_id = await run_in_threadpool(_change_feed_institution, db, user_id)
+    if wait and not change_notifier.accepting():
+        raise HTTPException(status_code=503, detail="Too many waiting change feed requests", headers={"Retry-After": "5"})
+    
+    deadline = time.monotonic() + wait
+    while True:
+        version = change_notifier.version
+        try:
+            batch = await run_in_threadpool(read_changes, institution_id, cursor, limit)
+        except ChangeFeedError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except CursorExpired as e:
+            raise HTTPException(
+                status_code=410, detail=f"Cursor is behind the retained change feed of shard {e}; reload from the head"
+            )
+        remaining = deadline - time.monotonic()
+        if batch["events"] or remaining <= 0 or not await change_notifier.wait(institution_id, version, remaining):
+            break
+    
+    if batch["events"]:
+        await run_in_threadpool(
+            log_audit, db, user_id, "read_change_feed", None, {"events": len(batch["events"]), "cursor": cursor}
+        )
+    return batch
+
+
+@app.get("/api/v1/changes/head", response_model=ChangeFeedHeadResponse, tags=["Changes"])
+def change_feed_head(
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """Cursor at the current end of the change feed: take it before a full load, then follow the feed from it"""
+    _change_feed_institution(db, user_id)
+    return {"cursor": feed_head()}
+
+
 # ==================== CONSENT ENDPOINTS ====================
 
 @app.get("/api/v1/consent/{user_id}", response_model=List[ConsentRecordResponse], tags=["Consent"])
@@ -359,7 +827,7 @@ def get_user_consents(
     """Retrieve consent records for a user"""
     
     # Fetch current user
-    current_user = db.query(User).filter(User.id == current_user_id).first()
+    current_user = user_by_id(db, current_user_id)
     if not current_user:
         raise HTTPException(status_code=401, detail="User not found")
     
@@ -380,11 +848,15 @@ def withdraw_consent(
     """Withdraw consent and schedule data deletion"""
     
     # Fetch current user
-    current_user = db.query(User).filter(User.id == user_id).first()
+    current_user = user_by_id(db, user_id)
     if not current_user:
         raise HTTPException(status_code=401, detail="User not found")
     
-    consent = db.query(ConsentRecord).filter(ConsentRecord.id == request.consent_id).first()
+    # Consents of other institutions are not visible (withdrawal purges their data)
+    consent = db.query(ConsentRecord).join(User, ConsentRecord.user_id == User.id).filter(
+        ConsentRecord.id == request.consent_id,
+        User.institution_id == current_user.institution_id
+    ).first()
     
     if not consent:
         raise HTTPException(status_code=404, detail="Consent not found")
@@ -393,13 +865,18 @@ def withdraw_consent(
     if consent.user_id != current_user.id and current_user.role != UserRole.LAB_ADMIN:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    consent.withdrawal_status = ConsentWithdrawalStatus.WITHDRAWN
+    deletion_date, changed_variants = schedule_withdrawal(db, consent)
     db.commit()
+    consent_index.withdraw([consent.id])
+    allele_frequencies.publish(changed_variants)
     
-    # Log audit
-    log_audit(db, current_user.id, "withdrew_consent", consent.id)
+    # Withdrawn samples must no longer appear in cohort queries
+    cohort_index.remove_samples(
+        sid for (sid,) in db.query(Sample.id).filter(Sample.consent_id == consent.id)
+    )
     
-    deletion_date = datetime.utcnow() + timedelta(days=7)
+    # Log audit
+    log_audit(db, current_user.id, "withdrew_consent", consent.id, details={"reason": request.reason})
     
     return ConsentWithdrawResponse(
         consent_id=consent.id,
@@ -408,54 +885,439 @@ def withdraw_consent(
     )
 
 
+@app.post("/api/v1/consent/withdraw-batch", response_model=ConsentBatchWithdrawResponse, tags=["Consent"])
+def withdraw_consent_batch(
+    request: ConsentBatchWithdrawRequest,
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Withdraw a group of consents and schedule their data deletion (lab admin only)
+    
+    Only consents belonging to users of the admin's institution are withdrawn;
+    unknown or out-of-institution ids are reported in `not_found`.
+    """
+    
+    # Fetch current user
+    current_user = user_by_id(db, user_id)
+    if not current_user:
+        raise HTTPException(status_code=401, detail="User not found")
+    
+    if current_user.role != UserRole.LAB_ADMIN:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    consent_ids = list(dict.fromkeys(request.consent_ids))
+    consents = db.query(ConsentRecord).join(User, ConsentRecord.user_id == User.id).filter(
+        ConsentRecord.id.in_(consent_ids),
+        User.institution_id == current_user.institution_id
+    ).all()
+    
+    now = datetime.utcnow()
+    withdrawn = []
+    changed_variants = set()
+    for consent in consents:
+        deletion_date, changed = schedule_withdrawal(db, consent, now)
+        changed_variants.update(changed)
+        withdrawn.append(ConsentWithdrawResponse(
+            consent_id=consent.id,
+            withdrawal_status=ConsentWithdrawalStatus.WITHDRAWN,
+            deletion_scheduled_for=deletion_date
+        ))
+    
+    insert_audit_rows(db, (
+        _audit_row(current_user.id, "withdrew_consent", consent.id, details={"reason": request.reason, "batch": True})
+        for consent in consents
+    ))
+    db.commit()
+    consent_index.withdraw(c.id for c in consents)
+    allele_frequencies.publish(sorted(changed_variants))
+    
+    cohort_index.remove_samples(
+        sid for (sid,) in db.query(Sample.id).filter(Sample.consent_id.in_([c.id for c in consents]))
+    )
+    
+    found = {c.id for c in consents}
+    return ConsentBatchWithdrawResponse(
+        withdrawn=withdrawn,
+        not_found=[cid for cid in consent_ids if cid not in found]
+    )
+
+
+# ==================== COHORT ENDPOINTS ====================
+
+@app.post("/api/v1/cohorts/query", response_model=CohortQueryResponse, tags=["Cohorts"])
+def query_cohort(
+    request: CohortQueryRequest,
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Select samples by ancestry and genotype (institution-scoped)
+    
+    **Filter language:**
+    - `ancestry:Nilotic > 70` (operators: >, >=, <, <=, =)
+    - `ancestry:"North African" >= 20`
+    - `HBB = A/S`, `G6PD != A/A`
+    - Combine with `AND`, `OR`, `NOT` and parentheses
+    
+    **Example:** `ancestry:Nilotic > 70 AND HBB = A/S`
+    """
+    # Fetch current user
+    current_user = user_by_id(db, user_id)
+    if not current_user:
+        raise HTTPException(status_code=401, detail="User not found")
+    
+    try:
+        total, page_ids = cohort_index.query(
+            request.query, current_user.institution_id, request.limit, request.offset
+        )
+    except CohortQueryError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cohort query: {e}")
+    
+    samples_by_id = {
+        s.id: s for s in db.query(Sample).filter(Sample.id.in_(page_ids)).all()
+    } if page_ids else {}
+    
+    # Log access
+    log_audit(
+        db, current_user.id, "queried_cohort", None,
+        details={"query": request.query, "total": total}
+    )
+    
+    return CohortQueryResponse(
+        query=request.query,
+        samples=[SampleResponse.from_orm(samples_by_id[i]) for i in page_ids if i in samples_by_id],
+        total=total,
+        limit=request.limit,
+        offset=request.offset
+    )
+
+
+# ==================== VARIANT REGION ENDPOINTS ====================
+
+@app.get("/api/v1/variants/region", response_model=RegionQueryResponse, tags=["Variants"])
+def query_region(
+    region: str,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    List variant sites in a genomic region with genotype counts for your institution
+    
+    **Query Parameters:**
+    - region: UCSC-style, 1-based inclusive (e.g. `chr11:5,200,000-5,300,000`)
+    - limit: Sites per page (default: 50, max: 500)
+    - offset: Pagination offset over sites
+    """
+    # Fetch current user
+    current_user = user_by_id(db, user_id)
+    if not current_user:
+        raise HTTPException(status_code=401, detail="User not found")
+    
+    try:
+        chromosome, start, end = parse_region(region)
+    except RegionQueryError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid region: {e}")
+    
+    total, sites = site_index.query(chromosome, start, end, limit, offset)
+    counts = region_genotype_counts(
+        db, current_user.institution_id, chromosome, sites[0][1], sites[-1][1]
+    ) if sites else {}
+    
+    # Log access
+    log_audit(
+        db, current_user.id, "queried_region", None,
+        details={"region": f"{chromosome}:{start}-{end}", "total": total}
+    )
+    
+    variants = []
+    for chrom, position, rsid, gene in sites:
+        genotype_counts = counts.get((position, rsid), {})
+        variants.append(VariantSiteResponse(
+            chromosome=chrom,
+            position=position,
+            variant=rsid,
+            gene=gene,
+            samples=sum(genotype_counts.values()),
+            genotype_counts=genotype_counts
+        ))
+    
+    return RegionQueryResponse(
+        region=region,
+        chromosome=chromosome,
+        start=start,
+        end=end,
+        variants=variants,
+        total=total,
+        limit=limit,
+        offset=offset
+    )
+
+
+@app.get("/api/v1/variants/{rsid}/frequencies", response_model=VariantFrequencyResponse, tags=["Variants"])
+def get_variant_frequencies(
+    rsid: str,
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Allele/genotype frequencies and Hardy-Weinberg statistics from platform data
+    
+    Population groups pool every institution and are suppressed below the
+    minimum group size; institution figures cover your own institution only.
+    """
+    # Fetch current user
+    current_user = user_by_id(db, user_id)
+    if not current_user:
+        raise HTTPException(status_code=401, detail="User not found")
+    
+    variant = variant_catalogue.find(db, rsid)
+    if not variant:
+        raise HTTPException(status_code=404, detail="Variant not found")
+    
+    populations = population_statistics(db, variant)
+    institution = institution_statistics(db, variant, current_user.institution_id)
+    
+    log_audit(db, current_user.id, "accessed_variant_frequencies", None, details={"variant": rsid})
+    
+    return VariantFrequencyResponse(
+        variant=variant.rsid,
+        gene=variant.gene,
+        populations=[FrequencyStatistics(group=group, **stats) for group, stats in populations],
+        institution=FrequencyStatistics(group=current_user.institution_id, **institution),
+        min_group_size=FREQUENCY_MIN_SAMPLES
+    )
+
+
 # ==================== AUDIT LOG ENDPOINTS ====================
 
 @app.get("/api/v1/audit-logs", response_model=AuditLogListResponse, tags=["Audit"])
 def get_audit_logs(
     sample_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
     limit: int = 100,
     offset: int = 0,
     user_id: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     Retrieve audit logs (admin/lab admin only)
     
     Shows all data access and modifications
+    
+    **Query Parameters:**
+    - sample_id: Filter by accessed resource
+    - since / until: Time range; ranges older than the live partitions are
+      served from the compressed audit archive
     """
     # Fetch current user
-    current_user = db.query(User).filter(User.id == user_id).first()
+    current_user = user_by_id(db, user_id)
     if not current_user:
         raise HTTPException(status_code=401, detail="User not found")
     
     if current_user.role not in [UserRole.LAB_ADMIN]:
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    query = db.query(AuditLog).filter(
-        AuditLog.user_id.in_(
-            db.query(User.id).filter(User.institution_id == current_user.institution_id)
-        )
+    emails = institution_user_emails(db, current_user.institution_id)
+    
+    total, logs = query_audit_logs(
+        db, list(emails), resource=sample_id, since=since, until=until, limit=limit, offset=offset
     )
     
-    if sample_id:
-        query = query.filter(AuditLog.resource_accessed == sample_id)
+    # Enrich with user emails; plain dicts, validated once against the response_model
+    for log in logs:
+        log["user_email"] = emails.get(log["user_id"])
+    
+    return {"logs": logs, "total": total, "limit": limit, "offset": offset}
+
+
+@app.get("/api/v1/audit-logs/verify", response_model=AuditChainVerifyResponse, tags=["Audit"])
+def verify_audit_logs(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Verify the tamper-evident audit hash chain over a time range (lab admin only)
+    
+    Entries not yet sealed into a batch (the last few seconds) are not covered.
+    """
+    # Fetch current user
+    current_user = user_by_id(db, user_id)
+    if not current_user:
+        raise HTTPException(status_code=401, detail="User not found")
     
-    total = query.count()
-    logs = query.order_by(AuditLog.timestamp.desc()).offset(offset).limit(limit).all()
+    if current_user.role not in [UserRole.LAB_ADMIN]:
+        raise HTTPException(status_code=403, detail="Admin access required")
     
-    # Enrich with user emails
-    log_responses = []
-    for log in logs:
-        user = db.query(User).filter(User.id == log.user_id).first()
-        log_resp = AuditLogResponse.from_orm(log)
-        log_resp.user_email = user.email if user else None
-        log_responses.append(log_resp)
+    report = verify_range(db, since, until)
     
-    return AuditLogListResponse(
-        logs=log_responses,
-        total=total,
-        limit=limit,
-        offset=offset
+    log_audit(db, current_user.id, "verified_audit_chain", None, details={
+        "verified": report["verified"], "first_seq": report["first_seq"], "last_seq": report["last_seq"]
+    })
+    
+    return AuditChainVerifyResponse(**report)
+
+
+# ==================== ANCESTRY RECOMPUTE ENDPOINTS ====================
+
+def _recompute_job_response(job: AncestryRecomputeJob) -> AncestryRecomputeJobResponse:
+    return AncestryRecomputeJobResponse(
+        job_id=job.id,
+        status=job.status.value,
+        reference_dataset=job.reference.reference_dataset,
+        methodology_version=job.reference.methodology_version,
+        total_samples=job.total_samples,
+        processed_samples=job.processed_samples,
+        failed_samples=job.failed_samples,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        completed_at=job.completed_at,
+        error=job.error,
+        **job_progress(job)
+    )
+
+
+@app.post("/api/v1/ancestry/recompute", response_model=AncestryRecomputeJobResponse, tags=["Ancestry"], status_code=202)
+def start_ancestry_recompute(
+    request: AncestryRecomputeRequest,
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Recompute ancestry for every sample on an older reference version (lab admin only)
+    
+    The job runs in the background; old results keep being served until every
+    stale sample is recomputed, then all switch to the new version at once.
+    """
+    # Fetch current user
+    current_user = user_by_id(db, user_id)
+    if not current_user:
+        raise HTTPException(status_code=401, detail="User not found")
+    
+    if current_user.role not in [UserRole.LAB_ADMIN]:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    try:
+        job = request_recompute(
+            db, request.reference_dataset, request.methodology_version,
+            request.reference_sample_size, requested_by=current_user.id
+        )
+    except RecomputeConflict as e:
+        raise HTTPException(status_code=409, detail=f"Recompute job {e} is still in progress")
+    
+    log_audit(db, current_user.id, "requested_ancestry_recompute", job.id, details={
+        "reference_dataset": request.reference_dataset,
+        "methodology_version": request.methodology_version,
+        "total_samples": job.total_samples
+    })
+    
+    return _recompute_job_response(job)
+
+
+@app.get("/api/v1/ancestry/recompute/{job_id}", response_model=AncestryRecomputeJobResponse, tags=["Ancestry"])
+def get_ancestry_recompute(
+    job_id: str,
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Recompute job progress, throughput and ETA (lab admin only)"""
+    # Fetch current user
+    current_user = user_by_id(db, user_id)
+    if not current_user:
+        raise HTTPException(status_code=401, detail="User not found")
+    
+    if current_user.role not in [UserRole.LAB_ADMIN]:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    job = db.query(AncestryRecomputeJob).filter(AncestryRecomputeJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Recompute job not found")
+    
+    return _recompute_job_response(job)
+
+
+@app.post("/api/v1/ancestry/pca", response_model=PcaProjectionResponse, tags=["Ancestry"])
+def project_ancestry_pca(
+    request: PcaProjectionRequest,
+    user_id: str = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Principal component coordinates of samples on the reference panel's axes
+    
+    Without `sample_ids`, the institution's most recently uploaded samples
+    genotyped on the model's site list are projected (for the Dashboard
+    scatter plot). Samples without genotypes are listed in `not_genotyped`,
+    and samples whose consent is withdrawn are listed in `consent_withdrawn`
+    instead of being projected.
+    """
+    # Fetch current user
+    current_user = user_by_id(db, user_id)
+    if not current_user:
+        raise HTTPException(status_code=401, detail="User not found")
+    
+    model = current_model(db)
+    if not model:
+        raise HTTPException(status_code=404, detail="No reference PCA model has been fitted")
+    
+    if request.sample_ids is not None:
+        sample_ids = list(dict.fromkeys(request.sample_ids))
+        samples = {
+            sample.id: sample
+            for sample in db.query(Sample).filter(
+                Sample.id.in_(sample_ids), Sample.institution_id == current_user.institution_id
+            )
+        }
+        for sample_id in sample_ids:
+            if sample_id not in samples:
+                raise HTTPException(status_code=404, detail=f"Sample {sample_id} not found")
+    else:
+        recent = db.query(Sample).join(GenotypeBlob, GenotypeBlob.sample_id == Sample.id).filter(
+            Sample.institution_id == current_user.institution_id,
+            GenotypeBlob.site_list_version == model.site_list_version
+        ).order_by(Sample.uploaded_at.desc()).limit(PCA_PROJECTION_MAX_SAMPLES).all()
+        samples = {sample.id: sample for sample in recent}
+        sample_ids = list(samples)
+    
+    # Withdrawn participants are excluded like everywhere results are served
+    refused = set(consent_index.refused(db, {samples[sample_id].consent_id for sample_id in sample_ids}))
+    consent_withdrawn = [sample_id for sample_id in sample_ids if samples[sample_id].consent_id in refused]
+    sample_ids = [sample_id for sample_id in sample_ids if samples[sample_id].consent_id not in refused]
+    
+    coordinates, not_genotyped = project_samples(db, model, sample_ids)
+    populations = predominant_populations(db, list(coordinates))
+    
+    log_audit(db, current_user.id, "projected_ancestry_pca", None, details={
+        "model_version": model.version,
+        "samples": len(coordinates)
+    })
+    
+    return PcaProjectionResponse(
+        model=PcaModelResponse(
+            version=model.version,
+            reference_dataset=model.reference_dataset,
+            site_list_version=model.site_list_version,
+            reference_samples=model.reference_samples,
+            sites=model.sites,
+            explained_variance=model.explained_variance,
+            created_at=model.created_at
+        ),
+        coordinates=[
+            PcaCoordinate(
+                id=sample_id,
+                sample_id=samples[sample_id].sample_id,
+                population=populations.get(sample_id),
+                components=components
+            )
+            for sample_id, components in coordinates.items()
+        ],
+        not_genotyped=not_genotyped,
+        consent_withdrawn=consent_withdrawn
     )
 
 
@@ -475,19 +1337,39 @@ def request_data_export(
     2. Lab admin reviews justification
     3. On approval, data is packaged
     4. User notified via email
+    
+    Every sample's consent must be active and permit `purpose` (research,
+    publication, secondary_research or third_party_sharing); otherwise 403
+    lists the samples refused.
     """
     
     # Fetch current user
-    current_user = db.query(User).filter(User.id == user_id).first()
+    current_user = user_by_id(db, user_id)
     if not current_user:
         raise HTTPException(status_code=401, detail="User not found")
     
     # Verify all samples belong to user's institution
+    consent_of = dict(
+        db.query(Sample.id, Sample.consent_id).filter(
+            Sample.id.in_(request.sample_ids),
+            Sample.institution_id == current_user.institution_id
+        ).all()
+    )
     for sample_id in request.sample_ids:
-        sample = db.query(Sample).filter(Sample.id == sample_id).first()
-        if not sample or sample.institution_id != current_user.institution_id:
+        if sample_id not in consent_of:
             raise HTTPException(status_code=404, detail=f"Sample {sample_id} not found")
     
+    # Every sample's consent must be active and permit the export's purpose
+    refused = set(consent_index.refused(db, set(consent_of.values()), request.purpose.value))
+    if refused:
+        raise HTTPException(
+            status_code=403,
+            detail={
+                "message": f"Consent is not active or does not permit {request.purpose.value} use for some samples",
+                "sample_ids": [sample_id for sample_id in request.sample_ids if consent_of[sample_id] in refused]
+            }
+        )
+    
     # Log audit
     log_audit(
         db, current_user.id, "requested_data_export",
@@ -495,6 +1377,7 @@ def request_data_export(
         details={
             "sample_ids": request.sample_ids,
             "export_format": request.export_format,
+            "purpose": request.purpose.value,
             "justification_length": len(request.justification)
         }
     )
@@ -521,25 +1404,52 @@ def health_check():
     }
 
 
+@app.get("/api/v1/metrics", response_class=PlainTextResponse, tags=["Health"])
+def prometheus_metrics(authorization: Optional[str] = Header(None)):
+    """
+    Prometheus metrics: per-route latency, SQL query counts and DB time
+    
+    Scrapers authenticate with `Authorization: Bearer <METRICS_TOKEN>`;
+    the endpoint does not exist while METRICS_TOKEN is unset.
+    """
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not metrics_authorized(authorization):
+        raise HTTPException(status_code=401, detail="Invalid metrics token", headers={"WWW-Authenticate": "Bearer"})
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 # ==================== HELPER FUNCTIONS ====================
 
 def log_audit(db: Session, user_id: str, action: str, resource_id: Optional[str], details: Optional[dict] = None):
     """Log audit event"""
-    log = AuditLog(
-        user_id=user_id,
-        action=action,
-        resource_accessed=resource_id,
-        timestamp=datetime.utcnow(),
-        ip_address="127.0.0.1",  # In production: extract from request
-        user_agent="Mozilla/5.0",  # In production: extract from request
-        details=details
-    )
-    db.add(log)
+    _add_audit(db, user_id, action, resource_id, details)
     db.commit()
 
 
+def _add_audit(db: Session, user_id: str, action: str, resource_id: Optional[str], details: Optional[dict] = None):
+    """Write an audit event in the current transaction (caller commits)"""
+    insert_audit_rows(db, [_audit_row(user_id, action, resource_id, details)])
+
+
+def _audit_row(user_id: str, action: str, resource_id: Optional[str], details: Optional[dict] = None) -> dict:
+    """AuditLog column values for an event of the current request"""
+    request = current_request()
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "action": action,
+        "resource_accessed": resource_id,
+        "timestamp": datetime.utcnow(),
+        "ip_address": request.client_ip if request else None,  # Behind a proxy, run uvicorn with --proxy-headers
+        "user_agent": request.user_agent if request else None,
+        "details": details
+    }
+
+
 def _generate_sample_results(db: Session, sample: Sample):
-    """Generate mock ancestry results for a sample"""
+    """Generate mock ancestry results for a sample against the current reference"""
+    reference = current_reference(db)
     populations = [
         ("Bantu", 85, 78, 92),
         ("Nilotic", 12, 7, 18),
@@ -553,81 +1463,182 @@ def _generate_sample_results(db: Session, sample: Sample):
             percentage=pct,
             confidence_interval_lower=lower,
             confidence_interval_upper=upper,
-            reference_dataset="1KG-African-2023",
-            reference_sample_size=2847,
-            methodology_version="PCA v2.1"
+            reference_dataset=reference.reference_dataset,
+            reference_sample_size=reference.reference_sample_size,
+            methodology_version=reference.methodology_version
         )
         db.add(result)
     
     db.commit()
+    cohort_index.add_ancestry(sample.id, [(pop, pct) for pop, pct, _, _ in populations])
 
 
 def _generate_sample_health_markers(db: Session, sample: Sample):
-    """Generate mock health markers for a sample"""
-    markers = [
-        {
-            "gene": "LCT",
-            "variant": "rs4988235",
-            "chromosome": "chr2",
-            "position": 136594750,
-            "genotype": "C/C",
-            "phenotype": "Lactase Persistent",
-            "significance": "Associated with lactose tolerance in adulthood",
-            "frequencies": {"East African": "0.70", "West African": "0.05"}
-        },
-        {
-            "gene": "HBB",
-            "variant": "rs334",
-            "chromosome": "chr11",
-            "position": 5248232,
-            "genotype": "A/S",
-            "phenotype": "Sickle Cell Trait (AS)",
-            "significance": "Heterozygous carrier. Potential malarial resistance benefit.",
-            "frequencies": {"East African": "0.18", "West African": "0.25"}
-        },
-        {
-            "gene": "G6PD",
-            "variant": "rs1050829",
-            "chromosome": "chrX",
-            "position": 154519747,
-            "genotype": "A/A",
-            "phenotype": "G6PD Deficiency",
-            "significance": "Risk of hemolysis with fava beans, infections, certain drugs",
-            "frequencies": {"East African": "0.08", "West African": "0.15"}
-        }
-    ]
-    
-    for marker in markers:
-        health_marker = HealthMarker(
+    """Call panel markers from the sample's packed genotypes, or generate mock ones"""
+    variants = [variant_catalogue.ensure(db, marker) for marker in MARKER_PANEL]
+    measured = variant_calls(db, [sample.id], [v.rsid for v in variants]).get(sample.id)
+    
+    if measured is not None:
+        calls = [(variants[i], code) for i, code in measured if len(variants[i].genotypes) == 3]
+    else:
+        mock = {"LCT": "C/C", "HBB": "A/S", "G6PD": "A/A"}
+        calls = [(v, v.code(mock[v.gene])) for v in variants if v.gene in mock]
+    
+    for variant, code in calls:
+        db.add(HealthMarker(
             sample_id=sample.id,
-            gene_name=marker["gene"],
-            variant_rsid=marker["variant"],
-            chromosome=marker["chromosome"],
-            position=marker["position"],
-            genotype=marker["genotype"],
-            phenotype=marker["phenotype"],
-            clinical_significance=marker["significance"],
-            population_frequency=marker["frequencies"],
-            disclaimer="For research use only. Not diagnostic. Phenotype prediction subject to error."
-        )
-        db.add(health_marker)
+            variant_id=variant.id,
+            genotype_code=code
+        ))
     
+    db.flush()
+    changed_variants = allele_frequencies.stage_samples(db, [sample.id])
     db.commit()
+    allele_frequencies.publish(changed_variants)
+    cohort_index.add_genotypes(sample.id, [(v.gene, v.genotype(code)) for v, code in calls])
+    site_index.add_sites((v.chromosome, v.position, v.rsid, v.gene) for v, _ in calls)
 
 
 # ==================== STARTUP ====================
 
-@app.on_event("startup")
-def startup_event():
-    """Initialize mock data on startup"""
-    db = SessionLocal()
-    
-    # Check if database is empty
+def seed_mock_data(db: Session):
+    """Load the demo dataset into an empty database and backfill derived counts (serve.py calls this before forking workers)"""
     if db.query(Institution).count() == 0:
         generate_mock_data(db)
         print("✓ Mock data initialized")
+    allele_frequencies.backfill_counts(db)
+
+
+def _after_ancestry_switch(db: Session):
+    """Predominant populations may have changed: rebuild everything keyed by them"""
+    cohort_index.rebuild_everywhere(db)
+    allele_frequencies.rebuild_counts(db)
+
+
+# One worker runs maintenance (per deployment on PostgreSQL, per host on SQLite); every worker keeps its caches in sync over the bus
+maintenance_leader = create_leader(engine)
+invalidation_bus = create_bus(engine)
+cohort_index.attach(invalidation_bus, session_factory=SessionLocal)
+consent_index.attach(invalidation_bus)
+site_index.attach(invalidation_bus)
+sample_events.attach(invalidation_bus)
+change_notifier.attach(invalidation_bus)
+allele_frequencies.attach(invalidation_bus, session_factory=SessionLocal)
+session_router.attach(invalidation_bus)
+
+
+def _shard_maintenance_gate() -> bool:
+    """Jobs over institution-owned rows run on the leader and pause while an institution moves"""
+    return maintenance_leader.is_leader() and not shard_router.move_in_progress()
+
+
+purge_task = PeriodicTask(
+    "consent-purge", PURGE_INTERVAL_SECONDS,
+    lambda should_stop: shard_router.each_shard(lambda factory: run_due_purges(factory, should_stop)),
+    gate=_shard_maintenance_gate
+)
+retention_task = PeriodicTask(
+    "retention-sweep", RETENTION_INTERVAL_SECONDS,
+    lambda should_stop: shard_router.each_shard(lambda factory: run_retention_sweep(factory, should_stop)),
+    gate=_shard_maintenance_gate
+)
+audit_rollover_task = PeriodicTask(
+    "audit-rollover", AUDIT_ROLLOVER_INTERVAL_SECONDS,
+    lambda should_stop: run_audit_rollover(SessionLocal, should_stop),
+    gate=maintenance_leader.is_leader
+)
+audit_seal_task = PeriodicTask(
+    "audit-seal", AUDIT_SEAL_INTERVAL_SECONDS,
+    lambda should_stop: seal_pending(SessionLocal, should_stop),
+    gate=maintenance_leader.is_leader
+)
+relatedness_task = PeriodicTask(
+    "relatedness-screen", RELATEDNESS_INTERVAL_SECONDS,
+    lambda should_stop: shard_router.each_shard(lambda factory: run_relatedness_screening(factory, should_stop)),
+    gate=_shard_maintenance_gate
+)
+ancestry_recompute_task = PeriodicTask(
+    "ancestry-recompute", ANCESTRY_RECOMPUTE_INTERVAL_SECONDS,
+    lambda should_stop: run_pending_recomputes(SessionLocal, should_stop, on_activated=_after_ancestry_switch),
+    gate=_shard_maintenance_gate
+)
+replica_heartbeat_task = PeriodicTask(
+    "replica-heartbeat", REPLICA_HEARTBEAT_SECONDS, session_router.stamp_heartbeat,
+    gate=maintenance_leader.is_leader
+)
+replica_check_task = PeriodicTask("replica-lag-check", REPLICA_LAG_CHECK_SECONDS, session_router.check_replicas)
+consent_reconcile_task = PeriodicTask(
+    "consent-index-reconcile", CONSENT_INDEX_RECONCILE_SECONDS,
+    lambda should_stop: consent_index.reconcile(SessionLocal)
+)
+idempotency_purge_task = PeriodicTask(
+    "idempotency-purge", IDEMPOTENCY_PURGE_INTERVAL_SECONDS,
+    lambda should_stop: purge_expired_keys(SessionLocal, should_stop),
+    gate=maintenance_leader.is_leader
+)
+change_feed_prune_task = PeriodicTask(
+    "change-feed-prune", CHANGE_FEED_PRUNE_INTERVAL_SECONDS,
+    lambda should_stop: shard_router.each_shard(lambda factory: prune_change_events(factory, should_stop)),
+    gate=maintenance_leader.is_leader
+)
+shard_map_task = PeriodicTask("shard-map-refresh", SHARD_MAP_REFRESH_SECONDS, shard_router.refresh)
+shard_reference_task = PeriodicTask(
+    "shard-reference-sync", SHARD_REFERENCE_SYNC_SECONDS, shard_router.sync_references,
+    gate=maintenance_leader.is_leader
+)
+
+
+@app.on_event("startup")
+def startup_event():
+    """Initialize mock data and background workers on startup"""
+    # Listen before rebuilding so changes made by other workers meanwhile are not missed
+    invalidation_bus.start()
     
+    db = SessionLocal()
+    seed_mock_data(db)
+    variant_catalogue.load(db)
+    cohort_index.rebuild(db)
+    consent_index.rebuild(db)
+    site_index.rebuild(db)
+    allele_frequencies.load(db)
     db.close()
+    
+    purge_task.start()
+    retention_task.start()
+    audit_rollover_task.start()
+    audit_seal_task.start()
+    relatedness_task.start()
+    ancestry_recompute_task.start()
+    idempotency_purge_task.start()
+    change_feed_prune_task.start()
+    consent_reconcile_task.start()
+    if replica_engines:
+        session_router.stamp_heartbeat()
+        replica_heartbeat_task.start()
+        replica_check_task.start()
+    if shard_engines:
+        shard_map_task.start()
+        shard_reference_task.start()
+
+
+@app.on_event("shutdown")
+def shutdown_event():
+    """Stop background workers"""
+    purge_task.stop()
+    retention_task.stop()
+    audit_rollover_task.stop()
+    audit_seal_task.stop()
+    relatedness_task.stop()
+    ancestry_recompute_task.stop()
+    idempotency_purge_task.stop()
+    change_feed_prune_task.stop()
+    consent_reconcile_task.stop()
+    replica_heartbeat_task.stop()
+    replica_check_task.stop()
+    shard_map_task.stop()
+    shard_reference_task.stop()
+    invalidation_bus.stop()
+    maintenance_leader.release()
 
 
 if __name__ == "__main__":
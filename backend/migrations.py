@@ -0,0 +1,129 @@
+"""
+AFRO-GENOMICS Research Platform
+Schema Upgrades
+
+`create_all` only creates missing tables, so a database created by an
+earlier release keeps its old tables as they were. At startup, after
+`create_all`, every table of the models is brought up to date in place:
+
+- Missing columns are added (`ALTER TABLE ... ADD COLUMN`) with the model's
+  scalar default, so NOT NULL columns are filled for existing rows.
+- Missing indexes are created.
+- Marker calls in the legacy `health_markers` table are copied into the
+  variant catalogue and `marker_genotypes` once.
+
+Every step checks the live schema first, so running it again does nothing.
+"""
+
+import logging
+from typing import Callable, List
+
+from sqlalchemy import Column, inspect, literal, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.types import SchemaType
+
+from catalogue import variant_catalogue
+from models import Base, HealthMarker
+from panels import MARKER_PANEL
+
+logger = logging.getLogger(__name__)
+
+# Table the health markers lived in before the variant catalogue
+LEGACY_HEALTH_MARKERS_TABLE = "health_markers"
+
+
+def _column_default(column: Column, engine: Engine) -> str:
+    """DDL DEFAULT clause for an added column ("" if it has none)"""
+    if column.server_default is not None:
+        default = column.server_default.arg
+        return f" DEFAULT {default if isinstance(default, str) else default.text}"
+    if column.default is not None and column.default.is_scalar:
+        value = literal(column.default.arg, column.type).compile(
+            dialect=engine.dialect, compile_kwargs={"literal_binds": True}
+        )
+        return f" DEFAULT {value}"
+    return ""
+
+
+def upgrade_schema(engine: Engine) -> List[str]:
+    """
+    Add the columns and indexes existing tables are missing (run after create_all)
+
+    Returns:
+        The DDL steps applied (empty when the schema is current)
+    """
+    inspector = inspect(engine)
+    existing = set(inspector.get_table_names())
+    preparer = engine.dialect.identifier_preparer
+    applied = []
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing:
+                continue
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in columns:
+                    continue
+                if isinstance(column.type, SchemaType):
+                    column.type.create(conn, checkfirst=True)  # e.g. a PostgreSQL enum type
+                default = _column_default(column, engine)
+                if not column.nullable and not default:
+                    raise RuntimeError(f"Cannot add NOT NULL column {table.name}.{column.name} without a default")
+                ddl = (
+                    f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} "
+                    f"{column.type.compile(dialect=engine.dialect)}{default}{'' if column.nullable else ' NOT NULL'}"
+                )
+                conn.execute(text(ddl))
+                applied.append(ddl)
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(conn)
+                    applied.append(f"CREATE INDEX {index.name} ON {table.name}")
+    for step in applied:
+        logger.info("Schema upgrade: %s", step)
+    return applied
+
+
+def migrate_health_markers(session_factory: Callable[[], Session]) -> int:
+    """
+    Copy legacy health_markers rows into marker_genotypes (once, while it is empty)
+
+    Calls on panel markers with a known genotype are kept; anything else is
+    logged and skipped. The legacy table is left in place.
+
+    Returns:
+        Number of calls copied
+    """
+    db = session_factory()
+    try:
+        if LEGACY_HEALTH_MARKERS_TABLE not in inspect(db.connection()).get_table_names():
+            return 0
+        if db.query(HealthMarker).first() is not None:
+            return 0
+        rows = db.execute(text(
+            f"SELECT sample_id, variant_rsid, genotype FROM {LEGACY_HEALTH_MARKERS_TABLE}"
+        )).all()
+        if not rows:
+            return 0
+
+        panel = {marker.variant: marker for marker in MARKER_PANEL}
+        calls = {}
+        skipped = 0
+        for sample_id, rsid, genotype in rows:
+            marker = panel.get(rsid)
+            if marker is None or genotype not in marker.genotypes:
+                skipped += 1
+                continue
+            variant = variant_catalogue.ensure(db, marker)
+            calls[(sample_id, variant.id)] = marker.genotypes.index(genotype)
+        db.bulk_insert_mappings(HealthMarker, [
+            {"sample_id": sample_id, "variant_id": variant_id, "genotype_code": code}
+            for (sample_id, variant_id), code in calls.items()
+        ])
+        db.commit()
+    finally:
+        db.close()
+    logger.info("Migrated %d legacy health marker calls (%d skipped)", len(calls), skipped)
+    return len(calls)
@@ -12,6 +12,8 @@ from models import (
     User, Institution, ConsentRecord, Sample, AncestryResult, HealthMarker,
     UserRole, SampleStatus, ConsentWithdrawalStatus
 )
+from panels import MARKER_PANEL, REFERENCE_PANEL
+from catalogue import variant_catalogue
 import uuid
 
 
@@ -302,9 +304,9 @@ def generate_mock_data(db: Session):
                 percentage=pct,
                 confidence_interval_lower=lower,
                 confidence_interval_upper=upper,
-                reference_dataset="1KG-African-2023",
-                reference_sample_size=2847,
-                methodology_version="PCA v2.1",
+                reference_dataset=REFERENCE_PANEL.dataset,
+                reference_sample_size=REFERENCE_PANEL.sample_size,
+                methodology_version=REFERENCE_PANEL.methodology_version,
                 computed_at=sample.processed_at
             )
             db.add(result)
@@ -313,110 +315,59 @@ def generate_mock_data(db: Session):
     
     # ==================== HEALTH MARKERS ====================
     
-    health_marker_templates = [
-        {
-            "gene": "LCT",
-            "variant": "rs4988235",
-            "chromosome": "chr2",
-            "position": 136594750,
-            "genotypes": ["C/C", "C/T", "T/T"],
-            "phenotypes": ["Lactase Persistent", "Intermediate", "Lactose Intolerant"],
-            "significance": "Lactose tolerance phenotype",
-            "frequencies": {"East African": "0.70", "West African": "0.05", "North African": "0.02"}
-        },
-        {
-            "gene": "HBB",
-            "variant": "rs334",
-            "chromosome": "chr11",
-            "position": 5248232,
-            "genotypes": ["A/A", "A/S", "S/S"],
-            "phenotypes": ["Normal", "Sickle Cell Trait (AS)", "Sickle Cell Disease"],
-            "significance": "Sickle cell disease; potential malarial resistance",
-            "frequencies": {"East African": "0.18", "West African": "0.25", "North African": "0.02"}
-        },
-        {
-            "gene": "G6PD",
-            "variant": "rs1050829",
-            "chromosome": "chrX",
-            "position": 154519747,
-            "genotypes": ["A/A", "A/G", "G/G"],
-            "phenotypes": ["Deficiency", "Intermediate", "Normal"],
-            "significance": "G6PD deficiency; hemolysis risk with triggers",
-            "frequencies": {"East African": "0.08", "West African": "0.15", "North African": "0.10"}
-        },
-        {
-            "gene": "DUFFY",
-            "variant": "rs2814778",
-            "chromosome": "chr1",
-            "position": 159235043,
-            "genotypes": ["A/A", "A/-", "-/-"],
-            "phenotypes": ["Duffy Positive", "Intermediate", "Duffy Negative (P. vivax resistant)"],
-            "significance": "Plasmodium vivax malaria resistance",
-            "frequencies": {"East African": "0.88", "West African": "0.92", "North African": "0.40"}
-        },
-    ]
+    health_marker_templates = MARKER_PANEL
     
     for sample, pop_hint in samples:
         # Select genotypes based on population frequency
         selected_markers = []
         for template in health_marker_templates:
-            freqs = template["frequencies"]
-            
             # Simple logic: higher frequency populations get more positive markers
             if pop_hint in ["Kikuyu", "Luhya", "Luganda", "Zulu", "Igbo"]:  # Bantu-heavy
-                if template["gene"] == "LCT":
+                if template.gene == "LCT":
                     selected_markers.append((template, "C/T", "Intermediate"))
-                elif template["gene"] == "HBB":
+                elif template.gene == "HBB":
                     selected_markers.append((template, "A/S", "Sickle Cell Trait (AS)"))
-                elif template["gene"] == "G6PD":
+                elif template.gene == "G6PD":
                     selected_markers.append((template, "A/A", "Deficiency"))
-                elif template["gene"] == "DUFFY":
+                elif template.gene == "DUFFY":
                     selected_markers.append((template, "-/-", "Duffy Negative (P. vivax resistant)"))
             
             elif pop_hint in ["Yoruba"]:  # West African
-                if template["gene"] == "LCT":
+                if template.gene == "LCT":
                     selected_markers.append((template, "T/T", "Lactose Intolerant"))
-                elif template["gene"] == "HBB":
+                elif template.gene == "HBB":
                     selected_markers.append((template, "A/S", "Sickle Cell Trait (AS)"))
-                elif template["gene"] == "G6PD":
+                elif template.gene == "G6PD":
                     selected_markers.append((template, "A/G", "Intermediate"))
-                elif template["gene"] == "DUFFY":
+                elif template.gene == "DUFFY":
                     selected_markers.append((template, "-/-", "Duffy Negative (P. vivax resistant)"))
             
             elif pop_hint in ["Maasai"]:  # Nilotic
-                if template["gene"] == "LCT":
+                if template.gene == "LCT":
                     selected_markers.append((template, "C/T", "Intermediate"))
-                elif template["gene"] == "HBB":
+                elif template.gene == "HBB":
                     selected_markers.append((template, "A/A", "Normal"))
-                elif template["gene"] == "G6PD":
+                elif template.gene == "G6PD":
                     selected_markers.append((template, "A/A", "Deficiency"))
-                elif template["gene"] == "DUFFY":
+                elif template.gene == "DUFFY":
                     selected_markers.append((template, "-/-", "Duffy Negative (P. vivax resistant)"))
             
             elif pop_hint in ["Amhara"]:  # Afroasiatic
-                if template["gene"] == "LCT":
+                if template.gene == "LCT":
                     selected_markers.append((template, "C/T", "Intermediate"))
-                elif template["gene"] == "HBB":
+                elif template.gene == "HBB":
                     selected_markers.append((template, "A/A", "Normal"))
-                elif template["gene"] == "G6PD":
+                elif template.gene == "G6PD":
                     selected_markers.append((template, "A/G", "Intermediate"))
-                elif template["gene"] == "DUFFY":
+                elif template.gene == "DUFFY":
                     selected_markers.append((template, "A/-", "Intermediate"))
         
         for template, genotype, phenotype in selected_markers:
+            variant = variant_catalogue.ensure(db, template)
             marker = HealthMarker(
-                id=f"hlth_{uuid.uuid4().hex[:8]}",
                 sample_id=sample.id,
-                gene_name=template["gene"],
-                variant_rsid=template["variant"],
-                chromosome=template["chromosome"],
-                position=template["position"],
-                genotype=genotype,
-                phenotype=phenotype,
-                clinical_significance=template["significance"],
-                population_frequency=template["frequencies"],
-                disclaimer="For research use only. Not diagnostic. Phenotype prediction has error rates. Consult genetic counselor for clinical interpretation.",
-                computed_at=sample.processed_at
+                variant_id=variant.id,
+                genotype_code=variant.code(genotype)
             )
             db.add(marker)
     
@@ -13,10 +13,13 @@ This module defines the SQLAlchemy ORM models for:
 
 from datetime import datetime, timedelta
 from typing import Optional, List
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, JSON, Text, Enum, Index
+from sqlalchemy import (
+    Column, Integer, SmallInteger, BigInteger, String, Float, DateTime, Boolean, ForeignKey, JSON, Text, Enum, Index, LargeBinary
+)
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, validates
 import enum
+import re
 import uuid
 
 Base = declarative_base()
@@ -30,6 +33,13 @@ class SampleStatus(str, enum.Enum):
     ARCHIVED = "Archived"
 
 
+class RelatednessStatus(str, enum.Enum):
+    """Outcome of screening a sample against its institution's other samples"""
+    CLEAR = "Clear"
+    RELATED = "Related"
+    DUPLICATE = "Duplicate"
+
+
 class UserRole(str, enum.Enum):
     """User roles for RBAC"""
     LAB_ADMIN = "Lab Admin"
@@ -45,6 +55,47 @@ class ConsentWithdrawalStatus(str, enum.Enum):
     EXPIRED = "Expired"
 
 
+class PurgeStatus(str, enum.Enum):
+    """Data purge job status"""
+    PENDING = "Pending"
+    RUNNING = "Running"
+    COMPLETED = "Completed"
+
+
+class RecomputeStatus(str, enum.Enum):
+    """Ancestry recomputation job status"""
+    PENDING = "Pending"
+    RUNNING = "Running"
+    COMPLETED = "Completed"
+    FAILED = "Failed"
+
+
+_RETENTION_RE = re.compile(r"^\s*(\d+)\s*(day|days|month|months|mo|year|years|yr|yrs)\s*$", re.IGNORECASE)
+
+# ConsentRecord.retention_months of a legacy period the backfill could not parse (NULL means not yet backfilled)
+RETENTION_UNPARSABLE = -1
+
+
+def parse_retention_months(period: Optional[str]) -> Optional[int]:
+    """
+    Normalize a free-text retention period ("60 months", "5 years") to months
+    
+    Day-based periods are rounded up to whole months. Returns None when the
+    text cannot be parsed.
+    """
+    if not period:
+        return None
+    match = _RETENTION_RE.match(period)
+    if not match:
+        return None
+    amount, unit = int(match.group(1)), match.group(2).lower()
+    if unit.startswith("y"):
+        return amount * 12
+    if unit.startswith("d"):
+        return -(-amount // 30)
+    return amount
+
+
 class User(Base):
     """
     Lab users with role-based access control
@@ -121,8 +172,11 @@ class ConsentRecord(Base):
         - consent_version: Consent form version (v2.1, etc.)
         - signed_at: Timestamp of consent signature
         - data_retention_period: How long data retained
+        - retention_months: data_retention_period normalized to months (RETENTION_UNPARSABLE if unparsable)
         - permitted_uses: JSON object defining allowed uses
         - withdrawal_status: Active | Withdrawn | Expired
+        - withdrawn_at: When consent was withdrawn
+        - deletion_scheduled_for: When linked sample data will be purged
         - irb_reference: Link to IRB approval
     """
     __tablename__ = "consent_records"
@@ -133,6 +187,7 @@ class ConsentRecord(Base):
     
     signed_at = Column(DateTime, default=datetime.utcnow)
     data_retention_period = Column(String(50), nullable=False)  # "60 months", "5 years"
+    retention_months = Column(Integer, nullable=True)  # Parsed from data_retention_period
     
     # JSON object: {research: bool, publication: bool, secondary_research: bool, third_party_sharing: bool}
     permitted_uses = Column(JSON, nullable=False, default={
@@ -143,6 +198,8 @@ class ConsentRecord(Base):
     })
     
     withdrawal_status = Column(Enum(ConsentWithdrawalStatus), default=ConsentWithdrawalStatus.ACTIVE)
+    withdrawn_at = Column(DateTime, nullable=True)
+    deletion_scheduled_for = Column(DateTime, nullable=True)
     irb_reference = Column(String(100), nullable=True)
     
     notes = Column(Text, nullable=True)
@@ -151,11 +208,17 @@ class ConsentRecord(Base):
     # Relationships
     user = relationship("User", back_populates="consent_records")
     samples = relationship("Sample", back_populates="consent_record")
+    purge_job = relationship("PurgeJob", back_populates="consent_record", uselist=False)
 
     __table_args__ = (
         Index("idx_user_active_consent", "user_id", "withdrawal_status"),
     )
 
+    @validates("data_retention_period")
+    def _normalize_retention(self, key, value):
+        self.retention_months = parse_retention_months(value)
+        return value
+
 
 class Sample(Base):
     """
@@ -170,11 +233,15 @@ class Sample(Base):
         - status: Received | Processing | Results Available | Archived
         - uploaded_at: Upload timestamp
         - processed_at: Results computation timestamp
+        - archived_at: When the retention policy archived the sample
+        - relatedness_status: Clear | Related | Duplicate once screened (relatedness.py)
+        - change_seq: Institution's change sequence at the last change to the
+          sample or its results (delta sync, see sync.py); 0 until first changed
     """
     __tablename__ = "samples"
 
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    sample_id = Column(String(50), nullable=False, index=True)  # e.g., "KEN-2024-00523"
+    sample_id = Column(String(50), nullable=False)  # e.g., "KEN-2024-00523"; indexed by idx_sample_id_institution
     participant_id = Column(String(50), nullable=True)  # De-identified if applicable
     
     user_id = Column(String(36), ForeignKey("users.id"), nullable=False)
@@ -185,7 +252,10 @@ class Sample(Base):
     
     uploaded_at = Column(DateTime, default=datetime.utcnow)
     processed_at = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime, nullable=True)
     notes = Column(Text, nullable=True)
+    relatedness_status = Column(Enum(RelatednessStatus), nullable=True)  # None until screened
+    change_seq = Column(Integer, nullable=False, default=0, server_default="0")
     
     # Relationships
     user = relationship("User", back_populates="samples")
@@ -196,7 +266,9 @@ class Sample(Base):
 
     __table_args__ = (
         Index("idx_institution_status", "institution_id", "status"),
-        Index("idx_sample_id_institution", "sample_id", "institution_id"),
+        Index("idx_sample_id_institution", "sample_id", "institution_id", unique=True),  # One row per lab sample ID
+        Index("idx_sample_institution_uploaded", "institution_id", "uploaded_at"),
+        Index("idx_sample_institution_change", "institution_id", "change_seq", "id"),
     )
 
 
@@ -211,6 +283,9 @@ class AncestryResult(Base):
         - confidence_interval_lower/upper: 95% CI bounds
         - reference_dataset: Dataset used for inference
         - methodology_version: Algorithm/method version
+        - is_active: Result set currently served; superseded versions are
+          kept inactive for provenance
+        - recompute_job_id: Recomputation job that wrote this row, if any
     """
     __tablename__ = "ancestry_results"
 
@@ -226,37 +301,136 @@ class AncestryResult(Base):
     reference_sample_size = Column(Integer, nullable=False)
     methodology_version = Column(String(50), nullable=False)
     
+    is_active = Column(Boolean, nullable=False, default=True)
+    recompute_job_id = Column(String(36), ForeignKey("ancestry_recompute_jobs.id"), nullable=True)
+    
     computed_at = Column(DateTime, default=datetime.utcnow)
 
     # Relationships
     sample = relationship("Sample", back_populates="ancestry_results")
 
+    __table_args__ = (
+        # Stale-result planner: active rows by version, keyset-paginated on sample_id
+        Index("idx_ancestry_version", "is_active", "reference_dataset", "methodology_version", "sample_id"),
+        Index("idx_ancestry_recompute_job", "recompute_job_id"),
+    )
 
-class HealthMarker(Base):
+
+class AncestryReference(Base):
     """
-    Health-relevant genetic markers (non-diagnostic, research-use only)
+    Ancestry reference dataset / methodology versions
+    
+    Exactly one version is current; new results are computed against it and
+    a recomputation job flips it when its results go live.
     
     Fields:
-        - sample_id: Parent sample
+        - reference_dataset: e.g. "1KG-African-2023"
+        - methodology_version: e.g. "PCA v2.1"
+        - reference_sample_size: Reference panel size
+        - is_current: Version new results use
+    """
+    __tablename__ = "ancestry_references"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    reference_dataset = Column(String(100), nullable=False)
+    methodology_version = Column(String(50), nullable=False)
+    reference_sample_size = Column(Integer, nullable=False)
+    is_current = Column(Boolean, nullable=False, default=False)
+    activated_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("idx_ancestry_reference_version", "reference_dataset", "methodology_version", unique=True),
+    )
+
+
+class AncestryRecomputeJob(Base):
+    """
+    Recomputation of stale ancestry results against a reference version
+    
+    New rows are written inactive next to the old ones and the whole job is
+    activated in one transaction at the end. Progress and the keyset cursor
+    are committed per batch, so an interrupted job resumes where it stopped.
+    
+    Fields:
+        - reference_id: Target AncestryReference
+        - total_samples: Stale samples when the job was planned
+        - processed_samples / failed_samples: Progress counters
+        - shard: Shard the cursor belongs to (shards are recomputed in turn, see shards.py)
+        - cursor: Last sample id processed (keyset pagination)
+    """
+    __tablename__ = "ancestry_recompute_jobs"
+
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    reference_id = Column(Integer, ForeignKey("ancestry_references.id"), nullable=False)
+    requested_by = Column(String(36), ForeignKey("users.id"), nullable=True)
+    
+    status = Column(Enum(RecomputeStatus), nullable=False, default=RecomputeStatus.PENDING)
+    total_samples = Column(Integer, nullable=False, default=0)
+    processed_samples = Column(Integer, nullable=False, default=0)
+    failed_samples = Column(Integer, nullable=False, default=0)
+    shard = Column(String(50), nullable=True)
+    cursor = Column(String(36), nullable=True)
+    error = Column(Text, nullable=True)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
+
+    # Relationships
+    reference = relationship("AncestryReference")
+
+    __table_args__ = (
+        Index("idx_recompute_status", "status", "created_at"),
+    )
+
+
+class AncestryRecomputeFailure(Base):
+    """
+    Sample a recomputation job could not recompute
+    
+    Recorded with the batch's progress so the flip does not retry the
+    sample as a straggler and count it a second time. Kept in the directory
+    database next to the job, wherever the sample lives.
+    
+    Fields:
+        - job_id: Recomputation job
+        - sample_id: Sample that failed (stays on its old rows)
+    """
+    __tablename__ = "ancestry_recompute_failures"
+
+    job_id = Column(String(36), ForeignKey("ancestry_recompute_jobs.id"), primary_key=True)
+    sample_id = Column(String(36), primary_key=True)
+
+
+class Variant(Base):
+    """
+    Variant catalogue: one row per genotyped site, shared by every sample
+    
+    Annotation and interpretation text live here once instead of being
+    repeated on each sample's call. Calls store an index into `genotypes`;
+    `phenotypes` is aligned with it.
+    
+    Fields:
+        - variant_rsid: dbSNP identifier (unique)
         - gene_name: Gene symbol (LCT, HBB, G6PD, etc.)
-        - variant_rsid: dbSNP identifier
-        - genotype: Diploid genotype (0/0, 0/1, 1/1)
-        - phenotype: Inferred phenotype
+        - chromosome / position: Site coordinates
+        - genotypes: Genotype code table, e.g. ["A/A", "A/S", "S/S"]
+        - phenotypes: Inferred phenotype per genotype code
         - clinical_significance: ACMG classification (mock)
         - population_frequency: JSON object of pop frequencies
     """
-    __tablename__ = "health_markers"
+    __tablename__ = "variants"
 
-    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    sample_id = Column(String(36), ForeignKey("samples.id"), nullable=False)
-    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    variant_rsid = Column(String(20), nullable=False, unique=True)  # rs334, rs4988235, etc.
     gene_name = Column(String(50), nullable=False)  # LCT, HBB, G6PD, DUFFY, etc.
-    variant_rsid = Column(String(20), nullable=False)  # rs334, rs4988235, etc.
     chromosome = Column(String(5), nullable=True)  # chr2, chr11, etc.
     position = Column(Integer, nullable=True)
     
-    genotype = Column(String(10), nullable=False)  # 0/0, 0/1, 1/1
-    phenotype = Column(String(255), nullable=False)  # Lactase Persistent, Carrier, etc.
+    genotypes = Column(JSON, nullable=False)
+    phenotypes = Column(JSON, nullable=False)
     
     clinical_significance = Column(String(255), nullable=True)
     
@@ -265,10 +439,256 @@ class HealthMarker(Base):
     
     disclaimer = Column(Text, nullable=False, default="For research use only. Not diagnostic.")
     
-    computed_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("idx_variant_region", "chromosome", "position"),
+        Index("idx_variant_gene", "gene_name"),
+    )
+
+
+class HealthMarker(Base):
+    """
+    Health-relevant genotype call of one sample at one catalogued variant
+    (non-diagnostic, research-use only)
+    
+    Rows hold only (sample, variant, genotype code); gene, coordinates,
+    phenotype and interpretation come from the Variant catalogue, cached
+    in memory by catalogue.py.
+    
+    Fields:
+        - sample_id: Parent sample
+        - variant_id: Catalogued variant
+        - genotype_code: Index into Variant.genotypes / Variant.phenotypes
+    """
+    __tablename__ = "marker_genotypes"
+
+    sample_id = Column(String(36), ForeignKey("samples.id"), primary_key=True)
+    variant_id = Column(Integer, ForeignKey("variants.id"), primary_key=True)
+    genotype_code = Column(SmallInteger, nullable=False)
 
     # Relationships
     sample = relationship("Sample", back_populates="health_markers")
+    variant = relationship("Variant")
+
+    __table_args__ = (
+        Index("idx_marker_variant_genotype", "variant_id", "genotype_code"),
+    )
+
+
+class GenotypeCount(Base):
+    """
+    Running genotype counts per variant, population group and institution
+
+    Maintained incrementally as calls are stored or deleted (frequencies.py);
+    population and institution frequencies are sums over one of the two axes.
+
+    Fields:
+        - population_group: Sample's predominant active ancestry population
+        - genotype_code: Index into Variant.genotypes
+        - sample_count: Samples with this call
+    """
+    __tablename__ = "genotype_counts"
+
+    variant_id = Column(Integer, ForeignKey("variants.id"), primary_key=True)
+    population_group = Column(String(100), primary_key=True)
+    institution_id = Column(String(36), ForeignKey("institutions.id"), primary_key=True)
+    genotype_code = Column(SmallInteger, primary_key=True)
+    sample_count = Column(Integer, nullable=False, default=0)
+
+
+class RelatednessSketch(Base):
+    """
+    Per-sample genotype sketch used for relatedness screening
+
+    Fields:
+        - site_list_version: Site list the sketch sites were drawn from
+        - planes: Hom-ref, het and hom-alt bit planes (uint64 words) over the
+          sketch sites, compared pairwise with popcount
+    """
+    __tablename__ = "relatedness_sketches"
+
+    sample_id = Column(String(36), ForeignKey("samples.id"), primary_key=True)
+    institution_id = Column(String(36), ForeignKey("institutions.id"), nullable=False)
+    site_list_version = Column(Integer, ForeignKey("genotype_site_lists.version"), nullable=False)
+    planes = Column(LargeBinary, nullable=False)
+    screened_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("idx_sketch_institution_version", "institution_id", "site_list_version"),
+    )
+
+
+class RelatednessIndex(Base):
+    """
+    LSH calibration of one institution's sketches on one site list
+
+    Fields:
+        - rare_sites: Packed bit mask of sketch sites whose alt-carrier
+          frequency was below RELATEDNESS_RARE_FREQUENCY at calibration;
+          MinHash signatures are taken over a sample's carriers at these sites
+        - calibrated_samples: Sketches the frequencies were estimated from
+    """
+    __tablename__ = "relatedness_indexes"
+
+    institution_id = Column(String(36), ForeignKey("institutions.id"), primary_key=True)
+    site_list_version = Column(Integer, ForeignKey("genotype_site_lists.version"), primary_key=True)
+    rare_sites = Column(LargeBinary, nullable=False)
+    calibrated_samples = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class RelatednessBucket(Base):
+    """LSH band bucket membership of a sketch (one row per band; bucket keys include the site list)"""
+    __tablename__ = "relatedness_buckets"
+
+    institution_id = Column(String(36), ForeignKey("institutions.id"), primary_key=True)
+    bucket = Column(BigInteger, primary_key=True)
+    sample_id = Column(String(36), ForeignKey("samples.id"), primary_key=True)
+
+    __table_args__ = (
+        Index("idx_bucket_sample", "sample_id"),
+    )
+
+
+class RelatedSamplePair(Base):
+    """
+    Pair of samples flagged as duplicates or relatives (stored in both directions)
+
+    Fields:
+        - kinship: KING-robust kinship coefficient (0.5 for duplicates)
+        - ibs0: Fraction of jointly called sites with opposite homozygotes
+        - concordance: Fraction of jointly called sites with identical calls
+        - relationship: Duplicate, 1st/2nd/3rd Degree
+    """
+    __tablename__ = "related_sample_pairs"
+
+    sample_id = Column(String(36), ForeignKey("samples.id"), primary_key=True)
+    related_sample_id = Column(String(36), ForeignKey("samples.id"), primary_key=True)
+    kinship = Column(Float, nullable=False)
+    ibs0 = Column(Float, nullable=False)
+    concordance = Column(Float, nullable=False)
+    shared_sites = Column(Integer, nullable=False)
+    relationship = Column(String(30), nullable=False)
+    detected_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("idx_related_pair_reverse", "related_sample_id"),
+    )
+
+
+class GenotypeSiteList(Base):
+    """
+    Versioned, immutable list of sites that genotype blobs are keyed to
+    
+    A genotyping array design (or imputation panel) is one version; blobs
+    store calls in this list's order, so a site is addressed by its index.
+    
+    Fields:
+        - name: Array / panel name, e.g. "H3Africa-v2"
+        - site_count: Number of sites
+        - data: Compressed NumPy archive of chromosome, position and rsid arrays
+        - checksum: SHA-256 of data
+    """
+    __tablename__ = "genotype_site_lists"
+
+    version = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String(100), nullable=False)
+    site_count = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+    checksum = Column(String(64), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class GenotypeBlob(Base):
+    """
+    All genotype calls of one sample as a 2-bit packed, block-compressed blob
+    (see genotype_store.py for the format)
+    
+    Fields:
+        - sample_id: Parent sample
+        - site_list_version: Site list the calls are ordered by
+        - called_sites: Sites with a non-missing call
+        - data: Packed blob
+    """
+    __tablename__ = "genotype_blobs"
+
+    sample_id = Column(String(36), ForeignKey("samples.id"), primary_key=True)
+    site_list_version = Column(Integer, ForeignKey("genotype_site_lists.version"), nullable=False)
+    called_sites = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("idx_genotype_blob_site_list", "site_list_version"),
+    )
+
+
+class PcaModel(Base):
+    """
+    Principal axes of a reference panel, fitted once and used to project samples
+    (see pca.py)
+
+    Fields:
+        - site_list_version: Site list the model's sites index into
+        - reference_dataset: Panel the axes were fitted on
+        - reference_samples / sites / components: Fit dimensions
+        - explained_variance: Fraction of total variance per component
+        - data: Uncompressed NumPy archive of sites, means and weights; each
+          worker materializes it once as .npy files and memory-maps them
+        - checksum: SHA-256 of data
+        - is_current: Model the projection endpoint uses
+    """
+    __tablename__ = "pca_models"
+
+    version = Column(Integer, primary_key=True, autoincrement=True)
+    site_list_version = Column(Integer, ForeignKey("genotype_site_lists.version"), nullable=False)
+    reference_dataset = Column(String(100), nullable=False)
+    reference_samples = Column(Integer, nullable=False)
+    sites = Column(Integer, nullable=False)
+    components = Column(Integer, nullable=False)
+    explained_variance = Column(JSON, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+    checksum = Column(String(64), nullable=False)
+    is_current = Column(Boolean, nullable=False, default=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class PurgeJob(Base):
+    """
+    Scheduled deletion of all sample data linked to a withdrawn consent
+    
+    Progress is committed after every chunk so a purge interrupted by a
+    restart resumes where it stopped.
+    
+    Fields:
+        - consent_id: Withdrawn consent whose samples are purged
+        - scheduled_for: Earliest time the purge may run
+        - status: Pending | Running | Completed
+        - samples_purged / rows_deleted: Progress counters
+    """
+    __tablename__ = "purge_jobs"
+
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    consent_id = Column(String(36), ForeignKey("consent_records.id"), nullable=False, unique=True)
+    
+    scheduled_for = Column(DateTime, nullable=False)
+    status = Column(Enum(PurgeStatus), nullable=False, default=PurgeStatus.PENDING)
+    
+    samples_purged = Column(Integer, nullable=False, default=0)
+    rows_deleted = Column(Integer, nullable=False, default=0)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
+
+    # Relationships
+    consent_record = relationship("ConsentRecord", back_populates="purge_job")
+
+    __table_args__ = (
+        Index("idx_purge_status_schedule", "status", "scheduled_for"),
+    )
 
 
 class AuditLog(Base):
@@ -282,6 +702,9 @@ class AuditLog(Base):
         - timestamp: When action occurred
         - ip_address: Source IP (privacy-preserving format)
         - user_agent: Browser/client identifier
+    
+    Partitioned by month on timestamp (see audit_store), so the primary key
+    includes timestamp as PostgreSQL requires for range partitions.
     """
     __tablename__ = "audit_logs"
 
@@ -291,11 +714,12 @@ class AuditLog(Base):
     action = Column(String(100), nullable=False)  # accessed_results, exported_data, etc.
     resource_accessed = Column(String(100), nullable=True)  # sample_id, consent_id, etc.
     
-    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
+    timestamp = Column(DateTime, primary_key=True, default=datetime.utcnow, index=True)
     ip_address = Column(String(45), nullable=True)  # Supports IPv6
     user_agent = Column(String(500), nullable=True)
     
     details = Column(JSON, nullable=True)  # Additional context
+    batch_seq = Column(Integer, nullable=True)  # Hash-chain batch, set when sealed
 
     # Relationships
     user = relationship("User", back_populates="audit_logs")
@@ -303,10 +727,212 @@ class AuditLog(Base):
     __table_args__ = (
         Index("idx_audit_user_timestamp", "user_id", "timestamp"),
         Index("idx_audit_resource", "resource_accessed", "timestamp"),
+        Index("idx_audit_batch", "batch_seq"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
+
+
+class AuditBatch(Base):
+    """
+    Sealed batch of audit entries in the tamper-evident hash chain
+    
+    Fields:
+        - seq: Batch sequence number (1, 2, ...)
+        - prev_hash: batch_hash of batch seq - 1
+        - merkle_root: Merkle root over the batch's entry hashes
+        - batch_hash: Hash of (seq, prev_hash, merkle_root, count, time span)
+        - first/last_timestamp: Time span of the batch's entries
+        - pruned: Entries removed wholesale by retention (chain links still checked)
+        - pruned_signature: HMAC vouching for the pruned flag (set by retention only)
+    """
+    __tablename__ = "audit_batches"
+
+    seq = Column(Integer, primary_key=True, autoincrement=False)
+    prev_hash = Column(String(64), nullable=False)
+    merkle_root = Column(String(64), nullable=False)
+    batch_hash = Column(String(64), nullable=False)
+    entry_count = Column(Integer, nullable=False)
+    
+    first_timestamp = Column(DateTime, nullable=False)
+    last_timestamp = Column(DateTime, nullable=False)
+    sealed_at = Column(DateTime, default=datetime.utcnow)
+    pruned = Column(Boolean, nullable=False, default=False)
+    pruned_signature = Column(String(64), nullable=True)
+
+    __table_args__ = (
+        Index("idx_audit_batch_span", "last_timestamp", "first_timestamp"),
     )
 
 
+class AuditCheckpoint(Base):
+    """
+    Signed checkpoint of the audit hash chain
+    
+    Fields:
+        - seq: Batch sequence number the checkpoint vouches for
+        - batch_hash: That batch's hash
+        - signature: HMAC-SHA256 over (seq, batch_hash)
+    """
+    __tablename__ = "audit_checkpoints"
+
+    seq = Column(Integer, ForeignKey("audit_batches.seq"), primary_key=True, autoincrement=False)
+    batch_hash = Column(String(64), nullable=False)
+    signature = Column(String(64), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class AuditRedaction(Base):
+    """
+    Entry hash of a sealed audit row removed by retention
+    
+    Keeps the batch Merkle root verifiable after lawful deletion. The HMAC
+    signature stops a redaction from being forged to cover a deleted entry.
+    """
+    __tablename__ = "audit_redactions"
+
+    batch_seq = Column(Integer, ForeignKey("audit_batches.seq"), primary_key=True)
+    entry_id = Column(String(36), primary_key=True)
+    leaf_hash = Column(String(64), nullable=False)
+    signature = Column(String(64), nullable=True)
+    redacted_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ReplicationHeartbeat(Base):
+    """
+    Single row stamped on the primary; read back from replicas to measure lag
+    (see replicas.py)
+
+    Fields:
+        - stamped_at: Unix time of the last stamp
+    """
+    __tablename__ = "replication_heartbeat"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    stamped_at = Column(Float, nullable=False)
+
+
+class InstitutionShard(Base):
+    """
+    Shard holding an institution's samples and consents (see shards.py)
+
+    Institutions without a row live on the default shard (the directory database).
+
+    Fields:
+        - shard: Shard name from DATABASE_SHARD_URLS
+        - moving_to: Target shard while a move is in progress
+        - frozen: Writes to the institution's sharded rows are paused (final phase of a move)
+    """
+    __tablename__ = "institution_shards"
+
+    institution_id = Column(String(36), ForeignKey("institutions.id"), primary_key=True)
+    shard = Column(String(50), nullable=False)
+    moving_to = Column(String(50), nullable=True)
+    frozen = Column(Boolean, nullable=False, default=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+
+class IdempotencyKey(Base):
+    """
+    Response to a request sent with an Idempotency-Key header (see idempotency.py)
+
+    Retries with the same key get this response back instead of repeating the request.
+
+    Fields:
+        - user_id, key: The sender and its key (keys are scoped per user)
+        - fingerprint: SHA-256 of the route and request body; a key reused for another request is refused
+        - status_code, response: What the original request returned (response as JSON text)
+        - expires_at: When the key may be forgotten
+    """
+    __tablename__ = "idempotency_keys"
+
+    user_id = Column(String(36), primary_key=True)
+    key = Column(String(255), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    status_code = Column(SmallInteger, nullable=False)
+    response = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+class SyncCounter(Base):
+    """
+    Per-institution change sequence for delta sync (see sync.py)
+
+    Incremented (and its row locked until commit) by every transaction that
+    changes one of the institution's samples, so changes commit in sequence
+    order. Sharded with the institution's samples.
+    """
+    __tablename__ = "sync_counters"
+
+    institution_id = Column(String(36), ForeignKey("institutions.id"), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+
+class SampleTombstone(Base):
+    """
+    Deleted sample, kept so delta sync can tell clients to drop it
+
+    Fields:
+        - id / sample_id: The deleted sample's id and lab sample ID
+        - change_seq: Institution's change sequence of the deletion
+    """
+    __tablename__ = "sample_tombstones"
+
+    id = Column(String(36), primary_key=True)
+    sample_id = Column(String(50), nullable=False)
+    institution_id = Column(String(36), ForeignKey("institutions.id"), nullable=False)
+    change_seq = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("idx_tombstone_institution_change", "institution_id", "change_seq", "id"),
+    )
+
+
+class ChangeEvent(Base):
+    """
+    One entry of the change feed for downstream consumers (see changes.py)
+
+    Each database (directory or shard) keeps its own feed of the rows it holds.
+
+    Fields:
+        - seq: Position in the database's feed, assigned at commit (commit order)
+        - entity / entity_id: "sample", "consent", or "results" of sample entity_id
+        - op: insert, update or delete
+        - fields: Attributes an ORM update changed (null for bulk statements)
+    """
+    __tablename__ = "change_events"
+
+    seq = Column(Integer, primary_key=True, autoincrement=False)
+    entity = Column(String(20), nullable=False)
+    entity_id = Column(String(36), nullable=False)
+    institution_id = Column(String(36), nullable=True)
+    op = Column(String(10), nullable=False)
+    fields = Column(JSON, nullable=True)
+    changed_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        Index("idx_change_event_institution_seq", "institution_id", "seq"),
+    )
+
+
+class ChangeSequence(Base):
+    """
+    Change feed counter of one database (a single row, id 1)
+
+    Locked from the moment a transaction numbers its events until it commits.
+    pruned_through is the highest seq deleted by retention: consumers behind
+    it have missed events and must rescan.
+    """
+    __tablename__ = "change_sequence"
+
+    id = Column(Integer, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+    pruned_through = Column(Integer, nullable=False, default=0)
+
+
 # Index definitions for common queries
 Index("idx_sample_upload_date", Sample.uploaded_at)
+Index("idx_sample_consent", Sample.consent_id)
+Index("idx_ancestry_sample", AncestryResult.sample_id)
 Index("idx_ancestry_population", AncestryResult.population_group)
-Index("idx_health_gene", HealthMarker.gene_name)
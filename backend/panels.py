@@ -0,0 +1,86 @@
+"""
+AFRO-GENOMICS Research Platform
+Reference and Marker Panels
+
+Read-only reference data used when generating and interpreting results.
+Panels are built once at import time as immutable tuples/mappings. Under the
+multi-worker launcher (serve.py) the app is preloaded in the master process,
+so workers share these pages copy-on-write instead of each holding a copy.
+"""
+
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class MarkerDefinition:
+    """One health-relevant variant with its genotype -> phenotype interpretation"""
+    gene: str
+    variant: str
+    chromosome: str
+    position: int
+    phenotypes: Mapping[str, str]  # genotype -> phenotype, in reference order
+    significance: str
+    frequencies: Mapping[str, str]
+
+    @property
+    def genotypes(self) -> Tuple[str, ...]:
+        return tuple(self.phenotypes)
+
+    def phenotype(self, genotype: str) -> Optional[str]:
+        return self.phenotypes.get(genotype)
+
+
+@dataclass(frozen=True)
+class ReferencePanel:
+    """Ancestry reference dataset and the population groups it resolves"""
+    dataset: str
+    sample_size: int
+    methodology_version: str
+    populations: Tuple[str, ...]
+
+
+def _marker(gene, variant, chromosome, position, phenotypes, significance, frequencies) -> MarkerDefinition:
+    return MarkerDefinition(
+        gene=gene, variant=variant, chromosome=chromosome, position=position,
+        phenotypes=MappingProxyType(dict(phenotypes)), significance=significance,
+        frequencies=MappingProxyType(dict(frequencies))
+    )
+
+
+MARKER_PANEL: Tuple[MarkerDefinition, ...] = (
+    _marker(
+        "LCT", "rs4988235", "chr2", 136594750,
+        [("C/C", "Lactase Persistent"), ("C/T", "Intermediate"), ("T/T", "Lactose Intolerant")],
+        "Lactose tolerance phenotype",
+        {"East African": "0.70", "West African": "0.05", "North African": "0.02"}
+    ),
+    _marker(
+        "HBB", "rs334", "chr11", 5248232,
+        [("A/A", "Normal"), ("A/S", "Sickle Cell Trait (AS)"), ("S/S", "Sickle Cell Disease")],
+        "Sickle cell disease; potential malarial resistance",
+        {"East African": "0.18", "West African": "0.25", "North African": "0.02"}
+    ),
+    _marker(
+        "G6PD", "rs1050829", "chrX", 154519747,
+        [("A/A", "Deficiency"), ("A/G", "Intermediate"), ("G/G", "Normal")],
+        "G6PD deficiency; hemolysis risk with triggers",
+        {"East African": "0.08", "West African": "0.15", "North African": "0.10"}
+    ),
+    _marker(
+        "DUFFY", "rs2814778", "chr1", 159235043,
+        [("A/A", "Duffy Positive"), ("A/-", "Intermediate"), ("-/-", "Duffy Negative (P. vivax resistant)")],
+        "Plasmodium vivax malaria resistance",
+        {"East African": "0.88", "West African": "0.92", "North African": "0.40"}
+    ),
+)
+
+MARKERS_BY_GENE: Mapping[str, MarkerDefinition] = MappingProxyType({m.gene: m for m in MARKER_PANEL})
+
+REFERENCE_PANEL = ReferencePanel(
+    dataset="1KG-African-2023",
+    sample_size=2847,
+    methodology_version="PCA v2.1",
+    populations=("Bantu", "Nilotic", "Cushitic", "Afroasiatic", "West African", "North African"),
+)
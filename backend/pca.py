@@ -0,0 +1,319 @@
+"""
+AFRO-GENOMICS Research Platform
+Principal Component Projection
+
+Ancestry PCA against a fixed reference panel:
+
+1. Fit (once per panel): reference calls at up to PCA_MAX_SITES evenly spaced
+   sites with minor allele frequency >= PCA_MIN_MAF are standardized per site,
+   (g - 2p) / sqrt(2p(1 - p)) with missing calls at the mean, and the top
+   PCA_COMPONENTS principal axes are found by randomized SVD (Halko,
+   Martinsson & Tropp, 2011): a Gaussian range sketch refined by power
+   iterations, then an exact SVD of a (k + PCA_OVERSAMPLES)-row matrix.
+2. Persist: site indices, means and weights are stored on a PcaModel row.
+   Each worker writes them once to PCA_MODEL_DIR as .npy files and
+   memory-maps them, so workers on one host share the same pages.
+3. Project: the standardization is folded into the weights
+   (W = V / scale, offset = means @ W), so a batch of M samples is a single
+   (M, sites) @ (sites, k) product once missing calls are mean-filled,
+   evaluated in cache-sized row blocks.
+
+Projected samples take no part in the fit, so their coordinates sit slightly
+closer to the origin than the reference's (the usual out-of-sample shrinkage).
+
+Usage (from backend/):
+    python pca.py --site-list 1                       # fit on every sample genotyped on site list 1
+    python pca.py --site-list 1 --samples panel.txt   # fit on the sample ids listed in a file
+"""
+
+import argparse
+import hashlib
+import io
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session, defer
+
+from models import GenotypeBlob, PcaModel
+from genotype_store import extract, load_site_list, MISSING
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+PCA_MODEL_DIR = os.getenv("PCA_MODEL_DIR", "./pca_models")
+PCA_COMPONENTS = int(os.getenv("PCA_COMPONENTS", "10"))
+PCA_MAX_SITES = int(os.getenv("PCA_MAX_SITES", "20000"))
+PCA_MIN_MAF = float(os.getenv("PCA_MIN_MAF", "0.05"))
+PCA_MIN_CALL_RATE = float(os.getenv("PCA_MIN_CALL_RATE", "0.9"))
+PCA_OVERSAMPLES = int(os.getenv("PCA_OVERSAMPLES", "10"))
+PCA_POWER_ITERATIONS = int(os.getenv("PCA_POWER_ITERATIONS", "4"))
+PCA_PROJECTION_BATCH = int(os.getenv("PCA_PROJECTION_BATCH", "1000"))
+PCA_PROJECTION_MAX_SAMPLES = int(os.getenv("PCA_PROJECTION_MAX_SAMPLES", "1000"))
+
+_ARRAYS = ("sites", "means", "weights")
+_ROW_BLOCK = 32  # Samples per projection block (32 x 20k sites of float32 ~ 2.5 MiB)
+
+
+class PcaError(ValueError):
+    """Not enough reference data to fit, or a corrupt model"""
+
+
+# ==================== FITTING ====================
+
+def standardize(codes: np.ndarray, means: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    """(g - mean) / scale per site as float32; missing calls become 0 (the mean)"""
+    matrix = codes.astype(np.float32)
+    matrix -= means
+    matrix /= scales
+    matrix[codes == MISSING] = 0.0
+    return matrix
+
+
+def randomized_svd(
+    matrix: np.ndarray,
+    components: int,
+    oversamples: int = PCA_OVERSAMPLES,
+    power_iterations: int = PCA_POWER_ITERATIONS,
+    seed: int = 0
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Top `components` singular triplets (U, S, Vt) of `matrix`
+
+    Power iterations re-orthonormalize at every step so the sketch keeps its
+    precision in float32 when singular values decay slowly, as they do for
+    genotype matrices.
+    """
+    rng = np.random.default_rng(seed)
+    width = min(components + oversamples, *matrix.shape)
+    basis, _ = np.linalg.qr(matrix @ rng.standard_normal((matrix.shape[1], width), dtype=np.float32))
+    for _ in range(power_iterations):
+        basis, _ = np.linalg.qr(matrix.T @ basis)
+        basis, _ = np.linalg.qr(matrix @ basis)
+    u, s, vt = np.linalg.svd(basis.T @ matrix, full_matrices=False)
+    return (basis @ u)[:, :components], s[:components], vt[:components]
+
+
+def _pack_arrays(**arrays: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def fit_model(
+    db: Session,
+    site_list_version: int,
+    sample_ids: Sequence[str],
+    reference_dataset: str,
+    components: int = PCA_COMPONENTS,
+    max_sites: int = PCA_MAX_SITES,
+    min_maf: float = PCA_MIN_MAF
+) -> PcaModel:
+    """
+    Fit the principal axes of `sample_ids` and make the model current (caller commits)
+
+    Raises:
+        PcaError: too few genotyped samples or informative sites
+    """
+    site_list = load_site_list(db, site_list_version)
+    candidates = np.unique(np.linspace(0, len(site_list) - 1, min(max_sites, len(site_list))).astype(np.int64))
+    codes = extract(db, list(sample_ids), site_list, candidates)
+    codes = codes[(codes != MISSING).any(axis=1)]
+    if codes.shape[0] <= components:
+        raise PcaError(f"{codes.shape[0]} genotyped reference samples; more than {components} are needed")
+
+    called = codes != MISSING
+    call_count = called.sum(axis=0)
+    frequency = np.where(called, codes, 0).sum(axis=0, dtype=np.int64) / np.maximum(2 * call_count, 1)
+    keep = (
+        (np.minimum(frequency, 1 - frequency) >= min_maf)
+        & (call_count >= PCA_MIN_CALL_RATE * codes.shape[0])
+    )
+    if keep.sum() <= components:
+        raise PcaError(f"{int(keep.sum())} sites pass the frequency and call-rate filters")
+
+    means = (2 * frequency[keep]).astype(np.float32)
+    scales = np.sqrt(means * (1 - frequency[keep])).astype(np.float32)
+    matrix = standardize(codes[:, keep], means, scales)
+    _, singular_values, axes = randomized_svd(matrix, components)
+    # SVD signs are arbitrary: fix them so refits of the same panel give the same picture
+    axes *= np.sign(axes[np.arange(axes.shape[0]), np.abs(axes).argmax(axis=1)])[:, None]
+    total_variance = float(np.square(matrix, dtype=np.float64).sum())
+
+    data = _pack_arrays(
+        sites=candidates[keep],
+        means=means,
+        weights=np.ascontiguousarray((axes.T / scales[:, None]).astype(np.float32)),
+    )
+    db.execute(update(PcaModel).values(is_current=False))
+    model = PcaModel(
+        site_list_version=site_list_version,
+        reference_dataset=reference_dataset,
+        reference_samples=codes.shape[0],
+        sites=int(keep.sum()),
+        components=axes.shape[0],
+        explained_variance=[round(float(s * s) / total_variance, 6) for s in singular_values],
+        data=data,
+        checksum=hashlib.sha256(data).hexdigest(),
+        is_current=True,
+    )
+    db.add(model)
+    db.flush()
+    return model
+
+
+# ==================== PROJECTION ====================
+
+class PcaProjector:
+    """A model's arrays, memory-mapped from PCA_MODEL_DIR"""
+
+    def __init__(self, version: int, directory: str):
+        self.version = version
+        self.sites, self.means, self.weights = (
+            np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in _ARRAYS
+        )
+        self.offset = np.asarray(self.means @ self.weights)
+
+    @property
+    def components(self) -> int:
+        return int(self.weights.shape[1])
+
+    def project(self, codes: np.ndarray) -> np.ndarray:
+        """
+        (M, sites) call codes -> (M, components) coordinates
+
+        Rows are converted and multiplied in blocks of _ROW_BLOCK through one
+        reused buffer that stays in cache; converting the whole batch to
+        float32 first would be memory-bound and several times slower.
+        """
+        out = np.empty((codes.shape[0], self.components), dtype=np.float32)
+        buffer = np.empty((min(_ROW_BLOCK, codes.shape[0]), codes.shape[1]), dtype=np.float32)
+        for start in range(0, codes.shape[0], _ROW_BLOCK):
+            rows = codes[start:start + _ROW_BLOCK]
+            dosage = buffer[:rows.shape[0]]
+            np.copyto(dosage, rows)
+            np.copyto(dosage, self.means, where=rows == MISSING)
+            np.matmul(dosage, self.weights, out=out[start:start + rows.shape[0]])
+        out -= self.offset
+        return out
+
+
+_projector: Optional[PcaProjector] = None
+_projector_lock = threading.Lock()
+
+
+def _materialize(model: PcaModel) -> str:
+    """Model directory under PCA_MODEL_DIR, written from the database row on first use"""
+    directory = os.path.join(PCA_MODEL_DIR, f"v{model.version}-{model.checksum[:16]}")
+    if os.path.isdir(directory):
+        return directory
+    if hashlib.sha256(model.data).hexdigest() != model.checksum:
+        raise PcaError(f"PCA model {model.version} failed its checksum")
+    os.makedirs(PCA_MODEL_DIR, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".staging-", dir=PCA_MODEL_DIR)
+    with np.load(io.BytesIO(model.data), allow_pickle=False) as arrays:
+        for name in _ARRAYS:
+            np.save(os.path.join(staging, f"{name}.npy"), arrays[name])
+    try:
+        os.rename(staging, directory)
+    except OSError:
+        # Another worker got there first; its copy is identical
+        shutil.rmtree(staging, ignore_errors=True)
+    return directory
+
+
+def current_model(db: Session) -> Optional[PcaModel]:
+    """The current model's metadata (the array payload is loaded only if needed)"""
+    return db.query(PcaModel).options(defer(PcaModel.data)).filter(PcaModel.is_current.is_(True)).first()
+
+
+def get_projector(model: PcaModel) -> PcaProjector:
+    """Projector for `model`, mapped once per worker and swapped when a new model goes live"""
+    global _projector
+    projector = _projector
+    if projector is not None and projector.version == model.version:
+        return projector
+    with _projector_lock:
+        if _projector is None or _projector.version != model.version:
+            _projector = PcaProjector(model.version, _materialize(model))
+            logger.info("Mapped PCA model %d (%d sites x %d components)",
+                        model.version, model.sites, model.components)
+        return _projector
+
+
+def project_samples(
+    db: Session,
+    model: PcaModel,
+    sample_ids: Sequence[str]
+) -> Tuple[Dict[str, List[float]], List[str]]:
+    """
+    Coordinates of every sample genotyped on the model's site list, plus the
+    ids of the samples that are not (in input order)
+    """
+    genotyped = set()
+    for start in range(0, len(sample_ids), 1000):
+        genotyped.update(db.execute(
+            select(GenotypeBlob.sample_id).where(
+                GenotypeBlob.sample_id.in_(list(sample_ids[start:start + 1000])),
+                GenotypeBlob.site_list_version == model.site_list_version
+            )
+        ).scalars())
+    projector = get_projector(model)
+    site_list = load_site_list(db, model.site_list_version)
+    ordered = [sample_id for sample_id in sample_ids if sample_id in genotyped]
+
+    coordinates: Dict[str, List[float]] = {}
+    for start in range(0, len(ordered), PCA_PROJECTION_BATCH):
+        batch = ordered[start:start + PCA_PROJECTION_BATCH]
+        projected = projector.project(extract(db, batch, site_list, projector.sites))
+        coordinates.update(zip(batch, np.round(projected.astype(np.float64), 5).tolist()))
+    return coordinates, [sample_id for sample_id in sample_ids if sample_id not in genotyped]
+
+
+# ==================== COMMAND LINE ====================
+
+def main(argv=None) -> int:
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from models import Base
+    from panels import REFERENCE_PANEL
+
+    parser = argparse.ArgumentParser(description="Fit the reference PCA model and make it current")
+    parser.add_argument("--site-list", type=int, required=True, help="Site list version the panel is genotyped on")
+    parser.add_argument("--samples", help="File with one reference sample id per line (default: every genotyped sample)")
+    parser.add_argument("--reference-dataset", default=REFERENCE_PANEL.dataset)
+    parser.add_argument("--components", type=int, default=PCA_COMPONENTS)
+    args = parser.parse_args(argv)
+
+    engine = create_engine(os.getenv("DATABASE_URL", "sqlite:///./afro_genomics.db"))
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        if args.samples:
+            with open(args.samples) as f:
+                sample_ids = [line.strip() for line in f if line.strip()]
+        else:
+            sample_ids = db.execute(
+                select(GenotypeBlob.sample_id).where(GenotypeBlob.site_list_version == args.site_list)
+            ).scalars().all()
+        try:
+            model = fit_model(db, args.site_list, sample_ids, args.reference_dataset, components=args.components)
+        except PcaError as e:
+            print(f"error: {e}", file=sys.stderr)
+            return 1
+        db.commit()
+        print(f"PCA model {model.version}: {model.reference_samples} samples x {model.sites} sites, "
+              f"explained variance {', '.join(f'{v:.2%}' for v in model.explained_variance)}")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+"""
+AFRO-GENOMICS Research Platform
+Consent Withdrawal Data Purge
+
+Deletes samples, ancestry results and health markers linked to withdrawn
+consents once their deletion deadline passes. Work is done in bounded chunks,
+each in its own short transaction, so no table is locked for long and a purge
+interrupted by a restart resumes from its recorded progress.
+"""
+
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from models import (
+    ConsentRecord, Sample, AncestryResult, HealthMarker, GenotypeBlob, AuditLog, PurgeJob,
+    ConsentWithdrawalStatus, PurgeStatus
+)
+from cohort import cohort_index
+from frequencies import allele_frequencies
+from relatedness import delete_relatedness_rows
+from events import sample_events, sample_event
+from sync import record_tombstones
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+DELETION_GRACE_DAYS = 7
+PURGE_CHUNK_SIZE = int(os.getenv("PURGE_CHUNK_SIZE", "500"))
+PURGE_INTERVAL_SECONDS = int(os.getenv("PURGE_INTERVAL_SECONDS", "300"))
+
+
+# ==================== SCHEDULING ====================
+
+def schedule_withdrawal(
+    db: Session, consent: ConsentRecord, now: Optional[datetime] = None
+) -> Tuple[datetime, List[int]]:
+    """
+    Mark consent withdrawn and schedule its purge (caller commits)
+
+    The consent's samples stop counting towards population frequencies
+    now, not when they are purged. Withdrawing an already-withdrawn consent
+    keeps the original deadline.
+
+    Returns:
+        The scheduled deletion time, and the variant ids whose counts
+        changed (publish them after commit)
+    """
+    now = now or datetime.utcnow()
+    changed_variants: List[int] = []
+
+    if consent.withdrawal_status != ConsentWithdrawalStatus.WITHDRAWN:
+        # Before the status changes: withdrawn consents are not counted
+        changed_variants = allele_frequencies.stage_removal(
+            db, db.execute(select(Sample.id).where(Sample.consent_id == consent.id)).scalars().all()
+        )
+
+    if consent.withdrawal_status != ConsentWithdrawalStatus.WITHDRAWN or not consent.deletion_scheduled_for:
+        consent.withdrawal_status = ConsentWithdrawalStatus.WITHDRAWN
+        consent.withdrawn_at = now
+        consent.deletion_scheduled_for = now + timedelta(days=DELETION_GRACE_DAYS)
+
+    if consent.purge_job is None:
+        db.add(PurgeJob(
+            consent_id=consent.id,
+            scheduled_for=consent.deletion_scheduled_for,
+            status=PurgeStatus.PENDING
+        ))
+
+    return consent.deletion_scheduled_for, changed_variants
+
+
+# ==================== DELETION ====================
+
+def delete_sample_rows(db: Session, sample_ids: List[str]) -> int:
+    """
+    Delete samples and their dependent result rows, leaving sync tombstones (caller commits)
+
+    Returns:
+        Total number of rows deleted
+    """
+    if not sample_ids:
+        return 0
+
+    deleted = delete_relatedness_rows(db, sample_ids)
+    for model in (HealthMarker, GenotypeBlob, AncestryResult):
+        result = db.execute(
+            delete(model).where(model.sample_id.in_(sample_ids)).execution_options(synchronize_session=False)
+        )
+        deleted += result.rowcount
+
+    record_tombstones(db, sample_ids)
+    result = db.execute(
+        delete(Sample).where(Sample.id.in_(sample_ids)).execution_options(synchronize_session=False)
+    )
+    return deleted + result.rowcount
+
+
+def purge_consent(
+    db: Session,
+    job: PurgeJob,
+    chunk_size: int = PURGE_CHUNK_SIZE,
+    should_stop: Callable[[], bool] = lambda: False
+) -> bool:
+    """
+    Purge one consent's samples chunk by chunk
+
+    Returns:
+        True if the job completed, False if interrupted by `should_stop`
+    """
+    if job.status != PurgeStatus.RUNNING:
+        job.status = PurgeStatus.RUNNING
+        job.started_at = job.started_at or datetime.utcnow()
+        db.commit()
+
+    while not should_stop():
+        samples = db.execute(
+            select(Sample.id, Sample.institution_id).where(Sample.consent_id == job.consent_id).limit(chunk_size)
+        ).all()
+
+        if not samples:
+            job.status = PurgeStatus.COMPLETED
+            job.completed_at = datetime.utcnow()
+            job.updated_at = job.completed_at
+            db.add(AuditLog(
+                user_id=job.consent_record.user_id,
+                action="purged_withdrawn_data",
+                resource_accessed=job.consent_id,
+                timestamp=job.completed_at,
+                details={"samples_purged": job.samples_purged, "rows_deleted": job.rows_deleted}
+            ))
+            db.commit()
+            return True
+
+        # One short transaction per chunk; progress is committed with the delete.
+        # The calls left the frequency counts when the consent was withdrawn.
+        sample_ids = [sample_id for sample_id, _ in samples]
+        job.rows_deleted += delete_sample_rows(db, sample_ids)
+        job.samples_purged += len(sample_ids)
+        job.updated_at = datetime.utcnow()
+        db.commit()
+
+        cohort_index.remove_samples(sample_ids)
+        sample_events.publish([sample_event("sample.deleted", s, institution) for s, institution in samples])
+
+    return False
+
+
+def run_due_purges(
+    session_factory: Callable[[], Session],
+    should_stop: Callable[[], bool] = lambda: False,
+    now: Optional[datetime] = None
+) -> int:
+    """
+    Run every purge job whose deadline has passed, resuming interrupted ones
+
+    Returns:
+        Number of jobs completed
+    """
+    now = now or datetime.utcnow()
+    db = session_factory()
+    completed = 0
+    try:
+        due_jobs = db.query(PurgeJob).filter(
+            PurgeJob.status != PurgeStatus.COMPLETED,
+            PurgeJob.scheduled_for <= now
+        ).order_by(PurgeJob.scheduled_for).all()
+
+        for job in due_jobs:
+            if should_stop():
+                break
+            if purge_consent(db, job, should_stop=should_stop):
+                completed += 1
+                logger.info(
+                    "Purged consent %s: %d samples, %d rows",
+                    job.consent_id, job.samples_purged, job.rows_deleted
+                )
+    finally:
+        db.close()
+
+    return completed
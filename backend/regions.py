@@ -0,0 +1,193 @@
+"""
+AFRO-GENOMICS Research Platform
+Genomic Region Index
+
+Answers "which variant sites lie in chr11:5,200,000-5,300,000" from memory.
+Distinct sites are kept per chromosome as a sorted position array searched
+with bisect, so a region lookup costs O(log n + k) however many markers have
+been called. Per-institution genotype counts for the matching sites are then
+read with a range scan on the variant catalogue's (chromosome, position)
+index.
+
+Regions use UCSC-style text, 1-based and inclusive: chr11:5200000-5300000
+(commas allowed, "chr" prefix optional).
+"""
+
+import logging
+import re
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import HealthMarker, Variant, Sample, ConsentRecord, ConsentWithdrawalStatus
+from catalogue import variant_catalogue
+
+logger = logging.getLogger(__name__)
+
+_REGION_RE = re.compile(r"^\s*(?:chr)?(2[0-2]|1[0-9]|[1-9]|X|Y|M|MT)\s*:\s*([\d,]+)\s*-\s*([\d,]+)\s*$", re.IGNORECASE)
+
+Site = Tuple[str, int, str, str]  # (chromosome, position, rsid, gene)
+
+
+class RegionQueryError(ValueError):
+    """Malformed region string"""
+
+
+def normalize_chromosome(name: str) -> str:
+    """'11', 'chr11', 'CHR11' -> 'chr11'; 'x' -> 'chrX'; 'MT' -> 'chrM'"""
+    name = name.strip()
+    if name.lower().startswith("chr"):
+        name = name[3:]
+    name = name.upper()
+    if name == "MT":
+        name = "M"
+    return f"chr{name}"
+
+
+def parse_region(text: str) -> Tuple[str, int, int]:
+    """Parse 'chr11:5,200,000-5,300,000' into (chromosome, start, end)"""
+    match = _REGION_RE.match(text or "")
+    if not match:
+        raise RegionQueryError("Expected a region like chr11:5200000-5300000")
+    start, end = int(match.group(2).replace(",", "")), int(match.group(3).replace(",", ""))
+    if start < 1 or end < start:
+        raise RegionQueryError("Region start must be >= 1 and not after its end")
+    return normalize_chromosome(match.group(1)), start, end
+
+
+class VariantSiteIndex:
+    """
+    Sorted per-chromosome arrays of distinct variant sites
+
+    Positions live in a compact array('q'); the (rsid, gene) of each site sits
+    at the same offset in a parallel list. Several variants may share a
+    position, so entries are ordered by (position, rsid).
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._bus = None
+        self._positions: Dict[str, array] = {}
+        self._labels: Dict[str, List[Tuple[str, str]]] = {}
+
+    # ---------- maintenance ----------
+
+    def rebuild(self, db: Session):
+        """Rebuild from the sites in the variant catalogue"""
+        rows = db.query(Variant.chromosome, Variant.position, Variant.variant_rsid, Variant.gene_name).filter(
+            Variant.chromosome.isnot(None), Variant.position.isnot(None)
+        )
+        self.load(rows)
+
+    def load(self, sites: Iterable[Site]):
+        """Replace the index contents with the given sites"""
+        by_chromosome: Dict[str, set] = {}
+        for chromosome, position, rsid, gene in sites:
+            by_chromosome.setdefault(normalize_chromosome(chromosome), set()).add((int(position), rsid, gene))
+        positions, labels = {}, {}
+        for chromosome, entries in by_chromosome.items():
+            ordered = sorted(entries)
+            positions[chromosome] = array("q", (position for position, _, _ in ordered))
+            labels[chromosome] = [(rsid, gene) for _, rsid, gene in ordered]
+        with self._lock:
+            self._positions, self._labels = positions, labels
+
+    def add_sites(self, sites: Iterable[Site]):
+        """Insert newly called sites (no-op for sites already indexed)"""
+        sites = [(chromosome, int(position), rsid, gene) for chromosome, position, rsid, gene in sites
+                 if chromosome and position is not None]
+        if self._apply_sites(sites):
+            self._publish({"sites": sites})
+
+    def _apply_sites(self, sites: Iterable[Site]) -> bool:
+        added = False
+        with self._lock:
+            for chromosome, position, rsid, gene in sites:
+                chromosome = normalize_chromosome(chromosome)
+                positions = self._positions.setdefault(chromosome, array("q"))
+                labels = self._labels.setdefault(chromosome, [])
+                index = bisect_left(positions, position)
+                end = bisect_right(positions, position, index)
+                if any(labels[i][0] == rsid for i in range(index, end)):
+                    continue
+                while index < end and labels[index][0] < rsid:
+                    index += 1
+                positions.insert(index, position)
+                labels.insert(index, (rsid, gene))
+                added = True
+        return added
+
+    # ---------- cross-worker sync ----------
+
+    def attach(self, bus):
+        """Mirror new sites to the other workers on an InvalidationBus (see coordination.py)"""
+        self._bus = bus
+        bus.subscribe("sites", lambda message: self._apply_sites(tuple(site) for site in message.get("sites", [])))
+
+    def _publish(self, message: dict):
+        if self._bus is not None:
+            try:
+                self._bus.publish("sites", message)
+            except Exception:
+                logger.exception("Could not publish variant site change")
+
+    # ---------- queries ----------
+
+    def query(self, chromosome: str, start: int, end: int, limit: int, offset: int) -> Tuple[int, List[Site]]:
+        """
+        Sites with start <= position <= end
+
+        Returns:
+            (total sites in region, sites for the requested page)
+        """
+        chromosome = normalize_chromosome(chromosome)
+        with self._lock:
+            positions = self._positions.get(chromosome)
+            if not positions:
+                return 0, []
+            lo = bisect_left(positions, start)
+            hi = bisect_right(positions, end)
+            page = range(lo + offset, min(hi, lo + offset + limit))
+            labels = self._labels[chromosome]
+            return hi - lo, [(chromosome, positions[i], labels[i][0], labels[i][1]) for i in page]
+
+
+def region_genotype_counts(
+    db: Session,
+    institution_id: str,
+    chromosome: str,
+    start: int,
+    end: int
+) -> Dict[Tuple[int, str], Dict[str, int]]:
+    """
+    Genotype counts per (position, rsid) within one institution, active consents only
+
+    Returns:
+        {(position, rsid): {genotype: sample count}}
+    """
+    rows = db.query(
+        HealthMarker.variant_id, HealthMarker.genotype_code, func.count()
+    ).join(Variant, HealthMarker.variant_id == Variant.id).join(
+        Sample, HealthMarker.sample_id == Sample.id
+    ).join(
+        ConsentRecord, Sample.consent_id == ConsentRecord.id
+    ).filter(
+        Variant.chromosome == chromosome,
+        Variant.position.between(start, end),
+        Sample.institution_id == institution_id,
+        ConsentRecord.withdrawal_status == ConsentWithdrawalStatus.ACTIVE
+    ).group_by(HealthMarker.variant_id, HealthMarker.genotype_code).all()
+
+    variants = variant_catalogue.get_many(db, (variant_id for variant_id, _, _ in rows))
+    counts: Dict[Tuple[int, str], Dict[str, int]] = {}
+    for variant_id, code, count in rows:
+        variant = variants[variant_id]
+        counts.setdefault((variant.position, variant.rsid), {})[variant.genotype(code)] = count
+    return counts
+
+
+site_index = VariantSiteIndex()
@@ -0,0 +1,420 @@
+"""
+AFRO-GENOMICS Research Platform
+Relatedness and Duplicate Screening
+
+Each sample with packed genotypes is screened once against the other samples
+of its institution genotyped on the same site list:
+
+1. Sketch: calls at up to RELATEDNESS_SKETCH_SITES evenly spaced sites become
+   three bit planes (hom-ref, het, hom-alt) packed into uint64 words.
+2. Candidates: small cohorts are compared exhaustively; larger ones only
+   against samples sharing an LSH band bucket with the new sample, so the
+   work grows with the number of near neighbours, not the cohort size.
+   Buckets come from a MinHash signature of the sites where the sample
+   carries a rare alt allele: relatives share rare alleles far more often
+   than unrelated people (carrier-set Jaccard ~0.3 vs ~0.03), while common
+   alleles barely separate them. Which sites are rare is calibrated once per
+   institution and site list from the first RELATEDNESS_CALIBRATION_SAMPLES
+   sketches (RelatednessIndex); existing sketches are bucketed then.
+3. Verify: KING-robust kinship, IBS0 and concordance for every candidate at
+   once, from popcounts over ANDed planes.
+
+Pairs at third degree or closer are stored in both directions and the worst
+relationship is flagged on each sample (Sample.relatedness_status).
+
+KING-robust kinship (Manichaikul et al., 2010), over jointly called sites:
+    phi = (N[het, het] - 2 * N[opposite homozygotes]) / (N[het in i] + N[het in j])
+    > 0.354 duplicate / MZ twin, > 0.177 1st degree, > 0.0884 2nd, > 0.0442 3rd
+"""
+
+import hashlib
+import logging
+import os
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from models import (
+    Sample, GenotypeBlob, RelatednessSketch, RelatednessIndex, RelatednessBucket, RelatedSamplePair,
+    RelatednessStatus
+)
+from genotype_store import open_calls, HOM_REF, HET, HOM_ALT
+from sync import stamp_samples
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+RELATEDNESS_SKETCH_SITES = int(os.getenv("RELATEDNESS_SKETCH_SITES", "16384"))
+RELATEDNESS_LSH_BANDS = int(os.getenv("RELATEDNESS_LSH_BANDS", "50"))
+RELATEDNESS_LSH_ROWS = int(os.getenv("RELATEDNESS_LSH_ROWS", "2"))
+RELATEDNESS_RARE_FREQUENCY = float(os.getenv("RELATEDNESS_RARE_FREQUENCY", "0.1"))
+RELATEDNESS_CALIBRATION_SAMPLES = int(os.getenv("RELATEDNESS_CALIBRATION_SAMPLES", "200"))
+RELATEDNESS_EXHAUSTIVE_MAX = int(os.getenv("RELATEDNESS_EXHAUSTIVE_MAX", "2000"))
+RELATEDNESS_MIN_SHARED_SITES = int(os.getenv("RELATEDNESS_MIN_SHARED_SITES", "500"))
+RELATEDNESS_INTERVAL_SECONDS = int(os.getenv("RELATEDNESS_INTERVAL_SECONDS", "60"))
+RELATEDNESS_BATCH_SIZE = int(os.getenv("RELATEDNESS_BATCH_SIZE", "200"))
+
+# KING kinship thresholds, closest relationship first
+KINSHIP_THRESHOLDS: Tuple[Tuple[float, str], ...] = (
+    (0.354, "Duplicate"),
+    (0.177, "1st Degree"),
+    (0.0884, "2nd Degree"),
+    (0.0442, "3rd Degree"),
+)
+
+_SEVERITY = {None: 0, RelatednessStatus.CLEAR: 1, RelatednessStatus.RELATED: 2, RelatednessStatus.DUPLICATE: 3}
+
+# SWAR popcount constants (np.bitwise_count needs NumPy 2)
+_M1, _M2, _M4, _H01 = (np.uint64(m) for m in (
+    0x5555555555555555, 0x3333333333333333, 0x0F0F0F0F0F0F0F0F, 0x0101010101010101
+))
+
+# MinHash family h(x) = (a * x + b) mod p; fixed so signatures are comparable across processes
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(0x4B494E47)
+_HASH_A = _rng.integers(1, _PRIME, size=(RELATEDNESS_LSH_BANDS * RELATEDNESS_LSH_ROWS, 1), dtype=np.int64)
+_HASH_B = _rng.integers(0, _PRIME, size=(RELATEDNESS_LSH_BANDS * RELATEDNESS_LSH_ROWS, 1), dtype=np.int64)
+
+
+# ==================== SKETCHES ====================
+
+def sketch_indices(site_count: int, max_sites: int = RELATEDNESS_SKETCH_SITES) -> np.ndarray:
+    """Evenly spaced site indices used for every sketch of a site list"""
+    if site_count <= max_sites:
+        return np.arange(site_count, dtype=np.int64)
+    return np.unique(np.linspace(0, site_count - 1, max_sites).astype(np.int64))
+
+
+def bit_planes(calls: np.ndarray) -> np.ndarray:
+    """(3, words) uint64 planes marking hom-ref, het and hom-alt calls"""
+    words = -(-calls.size // 64)
+    planes = np.zeros((3, words * 8), dtype=np.uint8)
+    for plane, code in enumerate((HOM_REF, HET, HOM_ALT)):
+        packed = np.packbits(calls == code, bitorder="little")
+        planes[plane, :packed.size] = packed
+    return planes.view(np.uint64)
+
+
+def popcount(words: np.ndarray) -> np.ndarray:
+    """Set bits per row of a (..., words) uint64 array"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+    x = words - ((words >> np.uint64(1)) & _M1)
+    x = (x & _M2) + ((x >> np.uint64(2)) & _M2)
+    x = (x + (x >> np.uint64(4))) & _M4
+    return ((x * _H01) >> np.uint64(56)).sum(axis=-1, dtype=np.int64)
+
+
+def _bits(words: np.ndarray) -> np.ndarray:
+    """uint64 words -> bool array, site i at bit i"""
+    return np.unpackbits(words.view(np.uint8), bitorder="little").astype(bool)
+
+
+def minhash(features: np.ndarray) -> np.ndarray:
+    """MinHash signature of a set of site indices"""
+    features = features.astype(np.int64)
+    return ((_HASH_A * features + _HASH_B) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+def band_buckets(version: int, planes: np.ndarray, rare_sites: np.ndarray) -> List[int]:
+    """
+    Signed 64-bit LSH bucket keys (site list and band are part of the key)
+
+    Empty when the sample carries no rare allele; such samples are only
+    found by exhaustive comparison.
+    """
+    carriers = np.flatnonzero(_bits((planes[1] | planes[2]) & rare_sites))
+    if not carriers.size:
+        return []
+    bands = minhash(carriers).reshape(RELATEDNESS_LSH_BANDS, RELATEDNESS_LSH_ROWS)
+    prefix = version.to_bytes(4, "little")
+    return [
+        int.from_bytes(
+            hashlib.blake2b(prefix + band.to_bytes(2, "little") + rows.tobytes(), digest_size=8).digest(),
+            "little", signed=True
+        )
+        for band, rows in enumerate(bands)
+    ]
+
+
+def kinship(planes: np.ndarray, others: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    KING-robust kinship, IBS0 and concordance of one sample against many
+
+    Args:
+        planes: (3, words) planes of the sample
+        others: (K, 3, words) planes of the candidates
+    """
+    ref, het, alt = planes
+    o_ref, o_het, o_alt = others[:, 0], others[:, 1], others[:, 2]
+    called = ref | het | alt
+    o_called = o_ref | o_het | o_alt
+
+    shared = popcount(called & o_called)
+    het_het = popcount(het & o_het)
+    opposite = popcount((ref & o_alt) | (alt & o_ref))
+    same = het_het + popcount(ref & o_ref) + popcount(alt & o_alt)
+    hets = popcount(het & o_called) + popcount(o_het & called)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {
+            "kinship": np.where(hets > 0, (het_het - 2 * opposite) / np.maximum(hets, 1), 0.0),
+            "ibs0": np.where(shared > 0, opposite / np.maximum(shared, 1), 0.0),
+            "concordance": np.where(shared > 0, same / np.maximum(shared, 1), 0.0),
+            "shared_sites": shared,
+        }
+
+
+def classify(phi: float) -> Optional[str]:
+    for threshold, relationship in KINSHIP_THRESHOLDS:
+        if phi > threshold:
+            return relationship
+    return None
+
+
+# ==================== SCREENING ====================
+
+def _cohort_size(db: Session, institution_id: str, version: int) -> int:
+    return db.execute(
+        select(func.count()).select_from(RelatednessSketch).where(
+            RelatednessSketch.institution_id == institution_id,
+            RelatednessSketch.site_list_version == version
+        )
+    ).scalar()
+
+
+def _insert_buckets(db: Session, institution_id: str, sample_id: str, buckets: List[int]):
+    if buckets:
+        db.execute(RelatednessBucket.__table__.insert(), [
+            {"institution_id": institution_id, "bucket": bucket, "sample_id": sample_id} for bucket in set(buckets)
+        ])
+
+
+def calibrate(db: Session, institution_id: str, version: int) -> np.ndarray:
+    """
+    Fix the rare-site mask from the existing sketches and bucket them all (caller commits)
+
+    Returns:
+        The mask as uint64 words
+    """
+    counts, samples = None, 0
+    rows = db.execute(
+        select(RelatednessSketch.sample_id, RelatednessSketch.planes).where(
+            RelatednessSketch.institution_id == institution_id,
+            RelatednessSketch.site_list_version == version
+        )
+    ).all()
+    for _, data in rows:
+        planes = np.frombuffer(data, dtype=np.uint64).reshape(3, -1)
+        carriers = _bits(planes[1] | planes[2])
+        counts = carriers.astype(np.int64) if counts is None else counts + carriers
+        samples += 1
+    rare = counts < RELATEDNESS_RARE_FREQUENCY * samples
+    rare_sites = np.packbits(rare, bitorder="little").view(np.uint64)
+
+    db.merge(RelatednessIndex(
+        institution_id=institution_id, site_list_version=version,
+        rare_sites=rare_sites.tobytes(), calibrated_samples=samples
+    ))
+    for sample_id, data in rows:
+        planes = np.frombuffer(data, dtype=np.uint64).reshape(3, -1)
+        _insert_buckets(db, institution_id, sample_id, band_buckets(version, planes, rare_sites))
+    logger.info("Calibrated relatedness LSH for %s (site list %d) on %d samples, %d rare sites",
+                institution_id, version, samples, int(rare.sum()))
+    return rare_sites
+
+
+def _rare_sites(db: Session, institution_id: str, version: int, cohort: int) -> Optional[np.ndarray]:
+    """The calibrated rare-site mask, calibrating once the cohort is large enough"""
+    data = db.execute(
+        select(RelatednessIndex.rare_sites).where(
+            RelatednessIndex.institution_id == institution_id,
+            RelatednessIndex.site_list_version == version
+        )
+    ).scalar()
+    if data is not None:
+        return np.frombuffer(data, dtype=np.uint64)
+    if cohort >= RELATEDNESS_CALIBRATION_SAMPLES:
+        return calibrate(db, institution_id, version)
+    return None
+
+
+def _candidates(
+    db: Session,
+    institution_id: str,
+    version: int,
+    sample_id: str,
+    cohort: int,
+    buckets: Optional[List[int]]
+) -> List[str]:
+    """Samples to verify exactly: the whole cohort when small, LSH bucket neighbours otherwise"""
+    if buckets is None or cohort <= RELATEDNESS_EXHAUSTIVE_MAX:
+        query = select(RelatednessSketch.sample_id).where(
+            RelatednessSketch.institution_id == institution_id,
+            RelatednessSketch.site_list_version == version
+        )
+    else:
+        query = select(RelatednessBucket.sample_id).where(
+            RelatednessBucket.institution_id == institution_id,
+            RelatednessBucket.bucket.in_(buckets)
+        ).distinct()
+    return [s for s in db.execute(query).scalars() if s != sample_id]
+
+
+def _set_status(db: Session, sample_ids: Sequence[str], status: RelatednessStatus, only_if_worse: bool):
+    current = dict(db.execute(select(Sample.id, Sample.relatedness_status).where(Sample.id.in_(sample_ids))).all())
+    changed = [
+        sample_id for sample_id in sample_ids
+        if current.get(sample_id) != status
+        and (not only_if_worse or _SEVERITY[status] > _SEVERITY[current.get(sample_id)])
+    ]
+    if changed:
+        db.execute(
+            update(Sample).where(Sample.id.in_(changed)).values(relatedness_status=status)
+            .execution_options(synchronize_session=False)
+        )
+        stamp_samples(db, Sample.id.in_(changed))
+
+
+def screen_sample(db: Session, sample_id: str) -> Optional[RelatednessStatus]:
+    """
+    Sketch one sample and flag it against its institution (caller commits)
+
+    Returns:
+        The sample's status, or None if it has no packed genotypes
+    """
+    opened = open_calls(db, sample_id)
+    institution_id = db.execute(select(Sample.institution_id).where(Sample.id == sample_id)).scalar()
+    if opened is None or institution_id is None:
+        return None
+    version, reader = opened
+    planes = bit_planes(reader.take(sketch_indices(reader.site_count)))
+    db.execute(delete(RelatednessBucket).where(RelatednessBucket.sample_id == sample_id))
+    db.execute(delete(RelatednessSketch).where(RelatednessSketch.sample_id == sample_id))
+
+    cohort = _cohort_size(db, institution_id, version)
+    rare_sites = _rare_sites(db, institution_id, version, cohort)
+    buckets = band_buckets(version, planes, rare_sites) if rare_sites is not None else None
+
+    candidates = _candidates(db, institution_id, version, sample_id, cohort, buckets)
+    pairs = []
+    for start in range(0, len(candidates), 1000):
+        rows = db.execute(
+            select(RelatednessSketch.sample_id, RelatednessSketch.planes).where(
+                RelatednessSketch.sample_id.in_(candidates[start:start + 1000]),
+                RelatednessSketch.site_list_version == version
+            )
+        ).all()
+        if not rows:
+            continue
+        others = np.stack([np.frombuffer(data, dtype=np.uint64).reshape(planes.shape) for _, data in rows])
+        stats = kinship(planes, others)
+        for i, (other_id, _) in enumerate(rows):
+            relationship = classify(float(stats["kinship"][i]))
+            if relationship and stats["shared_sites"][i] >= RELATEDNESS_MIN_SHARED_SITES:
+                pairs.append((other_id, relationship, {key: values[i] for key, values in stats.items()}))
+
+    db.add(RelatednessSketch(
+        sample_id=sample_id, institution_id=institution_id, site_list_version=version,
+        planes=planes.tobytes(), screened_at=datetime.utcnow()
+    ))
+    _insert_buckets(db, institution_id, sample_id, buckets or [])
+
+    status = RelatednessStatus.CLEAR
+    for other_id, relationship, stats in pairs:
+        values = {
+            "kinship": round(float(stats["kinship"]), 4), "ibs0": round(float(stats["ibs0"]), 4),
+            "concordance": round(float(stats["concordance"]), 4), "shared_sites": int(stats["shared_sites"]),
+            "relationship": relationship,
+        }
+        db.merge(RelatedSamplePair(sample_id=sample_id, related_sample_id=other_id, **values))
+        db.merge(RelatedSamplePair(sample_id=other_id, related_sample_id=sample_id, **values))
+        pair_status = RelatednessStatus.DUPLICATE if relationship == "Duplicate" else RelatednessStatus.RELATED
+        _set_status(db, [other_id], pair_status, only_if_worse=True)
+        if _SEVERITY[pair_status] > _SEVERITY[status]:
+            status = pair_status
+    _set_status(db, [sample_id], status, only_if_worse=False)
+    return status
+
+
+def run_relatedness_screening(
+    session_factory: Callable[[], Session],
+    should_stop: Callable[[], bool] = lambda: False,
+    batch_size: int = RELATEDNESS_BATCH_SIZE
+) -> int:
+    """
+    Screen every sample whose genotypes have been stored but not yet sketched
+
+    Each sample is committed on its own, so later samples are screened
+    against earlier ones from the same batch.
+
+    Returns:
+        Number of samples screened
+    """
+    db = session_factory()
+    screened = 0
+    try:
+        while not should_stop():
+            pending = db.execute(
+                select(GenotypeBlob.sample_id).outerjoin(
+                    RelatednessSketch, RelatednessSketch.sample_id == GenotypeBlob.sample_id
+                ).where(RelatednessSketch.sample_id.is_(None)).limit(batch_size)
+            ).scalars().all()
+            if not pending:
+                break
+            for sample_id in pending:
+                if should_stop():
+                    break
+                status = screen_sample(db, sample_id)
+                db.commit()
+                screened += 1
+                if status not in (None, RelatednessStatus.CLEAR):
+                    logger.info("Sample %s flagged %s", sample_id, status.value)
+    finally:
+        db.close()
+    return screened
+
+
+# ==================== CLEANUP ====================
+
+def delete_relatedness_rows(db: Session, sample_ids: List[str]) -> int:
+    """
+    Drop sketches, buckets and pairs of deleted samples and re-flag their partners (caller commits)
+
+    Returns:
+        Number of rows deleted
+    """
+    if not sample_ids:
+        return 0
+    partners = set(db.execute(
+        select(RelatedSamplePair.related_sample_id).where(RelatedSamplePair.sample_id.in_(sample_ids))
+    ).scalars()) - set(sample_ids)
+
+    deleted = db.execute(
+        delete(RelatedSamplePair).where(or_(
+            RelatedSamplePair.sample_id.in_(sample_ids), RelatedSamplePair.related_sample_id.in_(sample_ids)
+        )).execution_options(synchronize_session=False)
+    ).rowcount
+    for model in (RelatednessBucket, RelatednessSketch):
+        deleted += db.execute(
+            delete(model).where(model.sample_id.in_(sample_ids)).execution_options(synchronize_session=False)
+        ).rowcount
+
+    remaining = dict(db.execute(
+        select(RelatedSamplePair.sample_id, func.max(RelatedSamplePair.kinship))
+        .where(RelatedSamplePair.sample_id.in_(partners)).group_by(RelatedSamplePair.sample_id)
+    ).all())
+    for partner in partners:
+        if partner not in remaining:
+            status = RelatednessStatus.CLEAR
+        elif classify(remaining[partner]) == "Duplicate":
+            status = RelatednessStatus.DUPLICATE
+        else:
+            status = RelatednessStatus.RELATED
+        db.execute(update(Sample).where(Sample.id == partner).values(relatedness_status=status))
+    if partners:
+        stamp_samples(db, Sample.id.in_(partners))
+    return deleted
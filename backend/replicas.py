@@ -0,0 +1,225 @@
+"""
+AFRO-GENOMICS Research Platform
+Read-Replica Session Routing
+
+Every session is a RoutingSession bound to the primary. Endpoints that mostly
+read open it with read intent (get_read_db in main.py): its SELECTs go to a
+replica, while flushes, bulk writes and everything after the session's first
+write go to the primary. Write-intent sessions, and all background work, only
+ever use the primary.
+
+A read session falls back to the primary when
+- no replica is within REPLICA_MAX_LAG_SECONDS, or
+- its user committed data the replicas have not replayed yet (read-your-writes)
+
+Lag comes from a heartbeat: the maintenance leader stamps
+replication_heartbeat on the primary every REPLICA_HEARTBEAT_SECONDS and every
+worker reads it back from each replica. A replica showing stamp h has replayed
+every commit that finished before h was taken, so a user whose last data
+write finished at t may read from it once h > t. Write times are shared with
+the other workers over the InvalidationBus. Audit entries are not data
+writes here; otherwise every request would pin its user to the primary.
+
+Stamps and write times are wall-clock seconds, so hosts need synchronized
+clocks. Without DATABASE_REPLICA_URLS all sessions use the primary.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import event, select, update, insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from models import AuditLog, ReplicationHeartbeat
+from instrumentation import metrics
+from shards import ROUTED_TABLES, SHARDED_TABLES, shard_router
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_HEARTBEAT_SECONDS = float(os.getenv("REPLICA_HEARTBEAT_SECONDS", "1"))
+REPLICA_LAG_CHECK_SECONDS = float(os.getenv("REPLICA_LAG_CHECK_SECONDS", "1"))
+
+# Writes of these don't make their user's next reads go to the primary
+_NOT_READ_BACK = (AuditLog,)
+_NOT_READ_BACK_TABLES = frozenset(model.__tablename__ for model in _NOT_READ_BACK)
+
+metrics.counter("db_read_sessions_total", "Read-intent sessions by target (replica or primary) and reason")
+metrics.gauge("db_replica_lag_seconds", "Age of the heartbeat last read from each replica")
+
+
+class RoutingSession(Session):
+    """
+    Session that sends reads to the replica chosen when it was opened
+
+    `info["replica"]` is that engine (None: primary only) and `info["user_id"]`
+    the user whose data writes are recorded for read-your-writes. Statements
+    on sharded tables go to `info["shard"]` when set (see shards.py).
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        shard = self.info.get("shard")
+        if shard is not None and _table_name(mapper, clause) in ROUTED_TABLES:
+            return shard
+        replica = self.info.get("replica")
+        if replica is None or self._flushing or self.info.get("wrote"):
+            return super().get_bind(mapper, clause=clause, **kw)
+        return replica
+
+
+def _table_name(mapper, clause) -> Optional[str]:
+    if mapper is not None:
+        return mapper.local_table.name
+    table = getattr(clause, "table", None)  # Core insert / update / delete
+    return getattr(table, "name", None)
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _note_bulk_write(state):
+    if state.is_insert or state.is_update or state.is_delete:
+        state.session.info["wrote"] = True
+        table = _table_name(state.bind_arguments.get("mapper"), state.statement)
+        if table not in _NOT_READ_BACK_TABLES:
+            state.session.info["wrote_data"] = True
+        if table in SHARDED_TABLES:
+            shard_router.check_writable(state.session.info.get("institution_id"))
+
+
+@event.listens_for(RoutingSession, "before_flush")
+def _note_flush(session, flush_context, instances):
+    changed = (*session.new, *session.dirty, *session.deleted)
+    if any(obj.__table__.name in SHARDED_TABLES for obj in changed):
+        shard_router.check_writable(session.info.get("institution_id"))
+    session.info["wrote"] = True
+    if any(not isinstance(obj, _NOT_READ_BACK) for obj in changed):
+        session.info["wrote_data"] = True
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _record_commit(session):
+    user_id = session.info.get("user_id")
+    if session.info.pop("wrote_data", False) and user_id:
+        session_router.record_write(user_id)
+
+
+@event.listens_for(RoutingSession, "after_soft_rollback")
+def _forget_rollback(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop("wrote_data", None)
+
+
+class SessionRouter:
+    """Per-worker replica health and read-your-writes state"""
+
+    def __init__(self):
+        self.primary: Optional[Engine] = None
+        self.replicas: List[Engine] = []
+        self._stamps: Dict[int, float] = {}  # replica index -> heartbeat stamp last read
+        self._last_write: Dict[str, float] = {}  # user_id -> end of their last data commit
+        self._lock = threading.Lock()
+        self._turn = 0
+        self._bus = None
+
+    def configure(self, primary: Engine, replicas: List[Engine]):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self._stamps = {}
+
+    # ---------- routing ----------
+
+    def read_bind(self, user_id: Optional[str] = None) -> Optional[Engine]:
+        """Replica for a read-intent session, or None for the primary"""
+        if not self.replicas:
+            return None
+        floor = time.time() - REPLICA_MAX_LAG_SECONDS
+        with self._lock:
+            current = [i for i, stamp in self._stamps.items() if stamp > floor]
+            if not current:
+                metrics.inc("db_read_sessions_total", target="primary", reason="lag")
+                return None
+            written = self._last_write.get(user_id) if user_id else None
+            if written is not None:
+                current = [i for i in current if self._stamps[i] > written]
+                if not current:
+                    metrics.inc("db_read_sessions_total", target="primary", reason="read_your_writes")
+                    return None
+            self._turn += 1
+            index = current[self._turn % len(current)]
+        metrics.inc("db_read_sessions_total", target="replica", reason="current")
+        return self.replicas[index]
+
+    def record_write(self, user_id: str):
+        """Keep the user's reads on the primary until the replicas catch up (called after commit)"""
+        if not self.replicas:
+            return
+        written = time.time()
+        self._apply_write(user_id, written)
+        if self._bus is not None:
+            try:
+                self._bus.publish("read_your_writes", {"user_id": user_id, "at": written})
+            except Exception:
+                logger.exception("Could not publish read-your-writes marker")
+
+    def _apply_write(self, user_id: str, written: float):
+        with self._lock:
+            if written > self._last_write.get(user_id, 0.0):
+                self._last_write[user_id] = written
+
+    # ---------- heartbeat (maintenance leader) and lag checks (every worker) ----------
+
+    def stamp_heartbeat(self, should_stop: Callable[[], bool] = lambda: False):
+        """Stamp the primary's heartbeat row"""
+        with self.primary.begin() as conn:
+            stamped = conn.execute(
+                update(ReplicationHeartbeat).where(ReplicationHeartbeat.id == 1).values(stamped_at=time.time())
+            ).rowcount
+            if not stamped:
+                conn.execute(insert(ReplicationHeartbeat).values(id=1, stamped_at=time.time()))
+
+    def check_replicas(self, should_stop: Callable[[], bool] = lambda: False):
+        """Read every replica's heartbeat; unreachable replicas stop receiving reads"""
+        for index, replica in enumerate(self.replicas):
+            try:
+                with replica.connect() as conn:
+                    stamp = conn.execute(
+                        select(ReplicationHeartbeat.stamped_at).where(ReplicationHeartbeat.id == 1)
+                    ).scalar()
+            except Exception:
+                logger.warning("Replica %d unreachable; reading from the primary", index, exc_info=True)
+                stamp = None
+            with self._lock:
+                if stamp is None:
+                    self._stamps.pop(index, None)
+                else:
+                    self._stamps[index] = stamp
+            if stamp is not None:
+                metrics.set("db_replica_lag_seconds", max(0.0, time.time() - stamp), replica=str(index))
+
+        # Writes older than the lag limit are behind every replica still in use
+        floor = time.time() - REPLICA_MAX_LAG_SECONDS
+        with self._lock:
+            self._last_write = {user_id: at for user_id, at in self._last_write.items() if at > floor}
+
+    def dispose(self, close: bool = True):
+        for replica in self.replicas:
+            replica.dispose(close=close)
+
+    # ---------- cross-worker sync ----------
+
+    def attach(self, bus):
+        """Share read-your-writes markers with the other workers (see coordination.py)"""
+        self._bus = bus
+        bus.subscribe("read_your_writes", self._apply_remote)
+
+    def _apply_remote(self, message: dict):
+        self._apply_write(message["user_id"], message["at"])
+
+
+# Global router instance
+session_router = SessionRouter()
@@ -0,0 +1,124 @@
+"""
+AFRO-GENOMICS Research Platform
+Hot-Path Data Access
+
+Queries behind the busiest endpoints (principal lookup, sample by id, the
+institution's sample list, a sample's ancestry results and marker calls)
+and the audit insert every request makes. They are built with
+`lambda_stmt`, so SQLAlchemy caches each statement's construction and
+compilation by the lambda's code location and only binds the parameters
+per call. The equivalent `db.query(...).filter(...)` is rebuilt, and its
+cache key recomputed, on every request.
+
+Values the statements depend on are passed in as closure variables (bound
+parameters). Do not branch inside a lambda: conditional criteria are
+appended as their own lambdas (see samples_page).
+
+List endpoints read plain column rows (`*_rows` / `samples_page`) rather
+than entities: no identity map, no change tracking, no attribute
+instrumentation. Each row comes back as a dict keyed like the response
+schema, which FastAPI validates once against the endpoint's response_model.
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, insert, lambda_stmt, select
+from sqlalchemy.engine import Result, Row
+from sqlalchemy.orm import Session
+
+from models import AncestryResult, AuditLog, HealthMarker, Institution, Sample, User
+
+# One statement object for every audit insert (compiled once per dialect)
+_INSERT_AUDIT = insert(AuditLog)
+
+# Columns of the list responses (SampleResponse, InstitutionResponse)
+_SAMPLE_COLUMNS = (
+    Sample.id, Sample.sample_id, Sample.participant_id, Sample.user_id, Sample.institution_id, Sample.status,
+    Sample.uploaded_at, Sample.processed_at, Sample.notes, Sample.relatedness_status
+)
+_INSTITUTION_COLUMNS = (
+    Institution.id, Institution.name, Institution.country, Institution.irb_approval_number,
+    Institution.contact_person, Institution.data_retention_months, Institution.created_at
+)
+
+
+def _dicts(result: Result) -> List[Dict]:
+    keys = list(result.keys())
+    return [dict(zip(keys, row)) for row in result]
+
+
+# ==================== PRINCIPALS ====================
+
+def user_by_id(db: Session, user_id: str) -> Optional[User]:
+    return db.execute(lambda_stmt(lambda: select(User).where(User.id == user_id))).scalars().first()
+
+
+def user_by_email(db: Session, email: str) -> Optional[User]:
+    return db.execute(lambda_stmt(lambda: select(User).where(User.email == email))).scalars().first()
+
+
+# ==================== SAMPLES ====================
+
+def sample_by_id(db: Session, sample_id: str) -> Optional[Sample]:
+    return db.execute(lambda_stmt(lambda: select(Sample).where(Sample.id == sample_id))).scalars().first()
+
+
+def samples_page(
+    db: Session, institution_id: str, status: Optional[str], limit: int, offset: int
+) -> Tuple[int, List[Dict]]:
+    """(total matching, one page as SampleResponse dicts) of an institution's samples, optionally of one status"""
+    count = lambda_stmt(
+        lambda: select(func.count()).select_from(Sample).where(Sample.institution_id == institution_id)
+    )
+    page = lambda_stmt(lambda: select(*_SAMPLE_COLUMNS).where(Sample.institution_id == institution_id))
+    if status:
+        count += lambda s: s.where(Sample.status == status)
+        page += lambda s: s.where(Sample.status == status)
+    page += lambda s: s.offset(offset).limit(limit)
+    return db.execute(count).scalar(), _dicts(db.execute(page))
+
+
+# ==================== INSTITUTIONS ====================
+
+def institution_rows(db: Session) -> List[Dict]:
+    """Every institution as an InstitutionResponse dict"""
+    return _dicts(db.execute(lambda_stmt(lambda: select(*_INSTITUTION_COLUMNS))))
+
+
+def institution_user_emails(db: Session, institution_id: str) -> Dict[str, str]:
+    """user_id -> email of an institution's users"""
+    return dict(db.execute(lambda_stmt(
+        lambda: select(User.id, User.email).where(User.institution_id == institution_id)
+    )).all())
+
+
+# ==================== RESULTS ====================
+
+def active_ancestry_results(db: Session, sample_id: str) -> List[AncestryResult]:
+    return db.execute(lambda_stmt(
+        lambda: select(AncestryResult).where(
+            AncestryResult.sample_id == sample_id, AncestryResult.is_active.is_(True)
+        )
+    )).scalars().all()
+
+
+def health_marker_calls(db: Session, sample_id: str) -> List[Row]:
+    """(variant_id, genotype_code) of a sample's marker calls"""
+    return db.execute(lambda_stmt(
+        lambda: select(HealthMarker.variant_id, HealthMarker.genotype_code).where(HealthMarker.sample_id == sample_id)
+    )).all()
+
+
+# ==================== AUDIT ====================
+
+def insert_audit_rows(db: Session, rows: Iterable[dict]):
+    """
+    Insert audit entries with one executemany in the current transaction (caller commits)
+
+    Rows are AuditLog column values; id and timestamp take the column
+    defaults when absent. Unlike db.add(AuditLog(...)) no ORM objects are
+    created or flushed, and nothing is loaded back.
+    """
+    rows = list(rows)
+    if rows:
+        db.execute(_INSERT_AUDIT, rows)
@@ -0,0 +1,281 @@
+"""
+AFRO-GENOMICS Research Platform
+Data Retention Enforcement
+
+Periodic sweeper enforcing Institution.data_retention_months and the
+normalized ConsentRecord.retention_months. Expired samples are found with
+index-backed range scans on (institution_id, uploaded_at) and expired audit
+logs with (user_id, timestamp); both are archived or deleted in small batches
+paced by an I/O budget so the sweep never competes with interactive traffic.
+"""
+
+import calendar
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from sqlalchemy import select, update, delete
+from sqlalchemy.orm import Session
+
+from models import (
+    Institution, User, ConsentRecord, Sample, AncestryResult, HealthMarker, GenotypeBlob,
+    SampleStatus, RETENTION_UNPARSABLE, parse_retention_months
+)
+from purge import delete_sample_rows
+from frequencies import allele_frequencies
+from relatedness import delete_relatedness_rows
+from audit_store import live_tables, drop_archives_before
+from audit_chain import record_redactions, mark_pruned_before
+from cohort import cohort_index
+from events import sample_events, sample_event
+from sync import stamp_samples
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+RETENTION_INTERVAL_SECONDS = int(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+RETENTION_ACTION = os.getenv("RETENTION_ACTION", "archive")  # archive | delete
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "200"))
+RETENTION_MAX_ROWS_PER_SECOND = float(os.getenv("RETENTION_MAX_ROWS_PER_SECOND", "1000"))
+RETENTION_MAX_ROWS_PER_SWEEP = int(os.getenv("RETENTION_MAX_ROWS_PER_SWEEP", "50000"))
+
+
+# ==================== I/O BUDGET ====================
+
+class IOBudget:
+    """
+    Pace a sweep to a maximum row rate and cap the rows touched per run
+
+    Args:
+        batch_size: Rows per transaction
+        max_rows_per_second: Average write rate ceiling (sleeps to stay under it)
+        max_rows_per_sweep: Hard cap per sweep; remaining work waits for the next run
+    """
+
+    def __init__(
+        self,
+        batch_size: int = RETENTION_BATCH_SIZE,
+        max_rows_per_second: float = RETENTION_MAX_ROWS_PER_SECOND,
+        max_rows_per_sweep: int = RETENTION_MAX_ROWS_PER_SWEEP,
+        should_stop: Callable[[], bool] = lambda: False
+    ):
+        self.batch_size = batch_size
+        self.max_rows_per_second = max_rows_per_second
+        self.max_rows_per_sweep = max_rows_per_sweep
+        self.should_stop = should_stop
+        self.spent = 0
+        self._started = time.monotonic()
+
+    @property
+    def exhausted(self) -> bool:
+        return self.spent >= self.max_rows_per_sweep or self.should_stop()
+
+    def next_batch_size(self) -> int:
+        return max(0, min(self.batch_size, self.max_rows_per_sweep - self.spent))
+
+    def consume(self, rows: int):
+        """Account for rows written and sleep if running ahead of the allowed rate"""
+        self.spent += rows
+        if self.max_rows_per_second <= 0:
+            return
+        ahead = self.spent / self.max_rows_per_second - (time.monotonic() - self._started)
+        while ahead > 0 and not self.should_stop():
+            time.sleep(min(ahead, 0.5))
+            ahead -= 0.5
+
+
+# ==================== HELPERS ====================
+
+def subtract_months(moment: datetime, months: int) -> datetime:
+    """Calendar-aware month subtraction (clamps to the last day of short months)"""
+    month_index = moment.year * 12 + moment.month - 1 - months
+    year, month = divmod(month_index, 12)
+    day = min(moment.day, calendar.monthrange(year, month + 1)[1])
+    return moment.replace(year=year, month=month + 1, day=day)
+
+
+def normalize_retention_periods(db: Session, batch_size: int = 1000) -> int:
+    """
+    Backfill ConsentRecord.retention_months for rows written before it existed
+
+    New rows are normalized on assignment, so this only ever parses each
+    legacy period once. Periods that cannot be parsed are marked
+    RETENTION_UNPARSABLE (the institution's retention applies to them) so
+    they are not selected again.
+    """
+    updated = unparsable = 0
+    while True:
+        rows = db.execute(
+            select(ConsentRecord.id, ConsentRecord.data_retention_period).where(
+                ConsentRecord.retention_months.is_(None),
+                ConsentRecord.data_retention_period.isnot(None)
+            ).limit(batch_size)
+        ).all()
+        for consent_id, period in rows:
+            months = parse_retention_months(period)
+            if months is None:
+                months = RETENTION_UNPARSABLE
+                unparsable += 1
+            db.execute(update(ConsentRecord).where(ConsentRecord.id == consent_id).values(retention_months=months))
+        db.commit()
+        updated += len(rows)
+        if len(rows) < batch_size:
+            if unparsable:
+                logger.warning("Retention: %d consent retention periods could not be parsed", unparsable)
+            return updated
+
+
+# ==================== SWEEPS ====================
+
+def _expire_samples(
+    db: Session,
+    institution: Institution,
+    consent_months: Optional[int],
+    now: datetime,
+    action: str,
+    budget: IOBudget
+) -> int:
+    """
+    Archive/delete one institution's samples under one consent retention class
+
+    The shorter of the two periods applies. A consent period of 0 months
+    expires samples at once; an institution without a period (None or 0)
+    sets no limit of its own.
+    """
+    months = institution.data_retention_months or None
+    if consent_months not in (None, RETENTION_UNPARSABLE):
+        months = consent_months if months is None else min(months, consent_months)
+    if months is None:
+        return 0
+    cutoff = subtract_months(now, months)
+
+    consent_ids = select(ConsentRecord.id).where(
+        ConsentRecord.retention_months.is_(None) if consent_months is None
+        else ConsentRecord.retention_months == consent_months
+    )
+    query = select(Sample.id, Sample.sample_id).where(
+        Sample.institution_id == institution.id,
+        Sample.uploaded_at < cutoff,
+        Sample.consent_id.in_(consent_ids)
+    )
+    if action == "archive":
+        query = query.where(Sample.status != SampleStatus.ARCHIVED)
+
+    expired = 0
+    while not budget.exhausted:
+        samples = db.execute(query.order_by(Sample.uploaded_at).limit(budget.next_batch_size())).all()
+        if not samples:
+            break
+        sample_ids = [sample_id for sample_id, _ in samples]
+
+        changed_variants = allele_frequencies.stage_removal(db, sample_ids)
+        if action == "delete":
+            rows = delete_sample_rows(db, sample_ids)
+        else:
+            # Archive keeps the sample record as a provenance stub but drops genomic results
+            rows = delete_relatedness_rows(db, sample_ids)
+            for model in (HealthMarker, GenotypeBlob, AncestryResult):
+                rows += db.execute(
+                    delete(model).where(model.sample_id.in_(sample_ids)).execution_options(synchronize_session=False)
+                ).rowcount
+            rows += db.execute(
+                update(Sample).where(Sample.id.in_(sample_ids)).values(
+                    status=SampleStatus.ARCHIVED, archived_at=now
+                ).execution_options(synchronize_session=False)
+            ).rowcount
+            stamp_samples(db, Sample.id.in_(sample_ids))
+        db.commit()
+
+        cohort_index.remove_samples(sample_ids)
+        allele_frequencies.publish(changed_variants)
+        if action == "delete":
+            sample_events.publish([sample_event("sample.deleted", s, institution.id) for s in sample_ids])
+        else:
+            sample_events.publish([
+                sample_event("sample.status", s, institution.id, sample_id=external, status=SampleStatus.ARCHIVED.value)
+                for s, external in samples
+            ])
+        expired += len(sample_ids)
+        budget.consume(rows)
+
+    return expired
+
+
+def _expire_audit_logs(db: Session, institution: Institution, now: datetime, budget: IOBudget) -> int:
+    """Delete one institution's audit entries older than its retention period"""
+    if not institution.data_retention_months:
+        return 0
+    cutoff = subtract_months(now, institution.data_retention_months)
+
+    user_ids = db.execute(select(User.id).where(User.institution_id == institution.id)).scalars().all()
+    expired = 0
+    for table in live_tables(db.connection()):
+        for user_id in user_ids:
+            while not budget.exhausted:
+                # Range scan on the (user_id, timestamp) index of each partition
+                rows = db.execute(
+                    select(*table.columns).where(table.c.user_id == user_id, table.c.timestamp < cutoff)
+                    .order_by(table.c.timestamp).limit(budget.next_batch_size())
+                ).mappings().all()
+                if not rows:
+                    break
+                log_ids = [row["id"] for row in rows]
+                record_redactions(db, rows)
+                db.execute(delete(table).where(table.c.id.in_(log_ids)))
+                db.commit()
+                expired += len(log_ids)
+                budget.consume(len(log_ids))
+    return expired
+
+
+def run_retention_sweep(
+    session_factory: Callable[[], Session],
+    should_stop: Callable[[], bool] = lambda: False,
+    now: Optional[datetime] = None,
+    action: str = RETENTION_ACTION,
+    budget: Optional[IOBudget] = None
+) -> dict:
+    """
+    Enforce retention for every institution within one I/O budget
+
+    Returns:
+        Counts of expired samples and audit logs
+    """
+    if action not in ("archive", "delete"):
+        raise ValueError(f"Unknown retention action: {action}")
+    now = now or datetime.utcnow()
+    budget = budget or IOBudget(should_stop=should_stop)
+    stats = {"samples": 0, "audit_logs": 0}
+
+    db = session_factory()
+    try:
+        normalize_retention_periods(db)
+        consent_classes: List[Optional[int]] = db.execute(
+            select(ConsentRecord.retention_months).distinct()
+        ).scalars().all()
+        institutions = db.query(Institution).all()
+
+        for institution in institutions:
+            for consent_months in consent_classes:
+                if budget.exhausted:
+                    break
+                stats["samples"] += _expire_samples(db, institution, consent_months, now, action, budget)
+            if budget.exhausted:
+                break
+            stats["audit_logs"] += _expire_audit_logs(db, institution, now, budget)
+
+        # Archive files mix institutions, so a month is dropped once every institution's retention has passed it
+        longest = max((i.data_retention_months or 0 for i in institutions), default=0)
+        if longest and not budget.exhausted:
+            archive_cutoff = subtract_months(now, longest)
+            stats["archives"] = drop_archives_before(archive_cutoff)
+            mark_pruned_before(db, archive_cutoff)
+            db.commit()
+    finally:
+        db.close()
+
+    if stats["samples"] or stats["audit_logs"]:
+        logger.info("Retention sweep (%s): %d samples, %d audit logs", action, stats["samples"], stats["audit_logs"])
+    return stats
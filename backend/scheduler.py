@@ -0,0 +1,58 @@
+"""
+AFRO-GENOMICS Research Platform
+Background Task Scheduler
+
+Minimal periodic task runner for maintenance workers (data purges, etc.)
+running alongside the API process.
+"""
+
+import logging
+import threading
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+    """
+    Run a function every `interval_seconds` on a daemon thread
+
+    The function receives a `should_stop` callable so long-running work can
+    exit cleanly between batches when the application shuts down. An optional
+    `gate` is checked on every tick; the run is skipped while it returns False
+    (e.g. this worker is not the maintenance leader).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        interval_seconds: float,
+        func: Callable[[Callable[[], bool]], None],
+        gate: Optional[Callable[[], bool]] = None
+    ):
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self.func = func
+        self.gate = gate
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def should_stop(self) -> bool:
+        return self._stop_event.is_set()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval_seconds):
+            try:
+                if self.gate is not None and not self.gate():
+                    continue
+                self.func(self.should_stop)
+            except Exception:
+                logger.exception("Periodic task %s failed", self.name)
@@ -27,12 +27,32 @@ class SampleStatusEnum(str, Enum):
     ARCHIVED = "Archived"
 
 
+class RelatednessStatusEnum(str, Enum):
+    CLEAR = "Clear"
+    RELATED = "Related"
+    DUPLICATE = "Duplicate"
+
+
 class ConsentStatusEnum(str, Enum):
     ACTIVE = "Active"
     WITHDRAWN = "Withdrawn"
     EXPIRED = "Expired"
 
 
+class SyncUploadStatusEnum(str, Enum):
+    CREATED = "Created"
+    EXISTS = "Exists"  # Sample ID already uploaded (e.g. a retried batch); id is the existing sample
+    REJECTED = "Rejected"
+
+
+class ExportPurposeEnum(str, Enum):
+    """Use an export is for; must be permitted by every sample's consent (permitted_uses keys)"""
+    RESEARCH = "research"
+    PUBLICATION = "publication"
+    SECONDARY_RESEARCH = "secondary_research"
+    THIRD_PARTY_SHARING = "third_party_sharing"
+
+
 # ==================== AUTH SCHEMAS ====================
 
 class LoginRequest(BaseModel):
@@ -51,6 +71,12 @@ class LoginResponse(BaseModel):
     user: "UserResponse"
 
 
+class StreamTicketResponse(BaseModel):
+    """Short-lived ticket for opening an event stream (EventSource cannot send headers)"""
+    ticket: str
+    expires_in: int  # Seconds the ticket can be used to connect
+
+
 class RefreshTokenRequest(BaseModel):
     """Refresh token request"""
     refresh_token: str
@@ -136,6 +162,7 @@ class ConsentRecordResponse(BaseModel):
     permitted_uses: Dict[str, bool]
     withdrawal_status: ConsentStatusEnum
     irb_reference: Optional[str]
+    deletion_scheduled_for: Optional[datetime] = None
 
     class Config:
         from_attributes = True
@@ -154,6 +181,18 @@ class ConsentWithdrawResponse(BaseModel):
     deletion_scheduled_for: datetime
 
 
+class ConsentBatchWithdrawRequest(BaseModel):
+    """Withdraw consent for a group of participants in one call"""
+    consent_ids: List[str] = Field(..., min_length=1, max_length=1000)
+    reason: Optional[str] = None
+
+
+class ConsentBatchWithdrawResponse(BaseModel):
+    """Batch consent withdrawal response"""
+    withdrawn: List[ConsentWithdrawResponse]
+    not_found: List[str] = []
+
+
 # ==================== SAMPLE SCHEMAS ====================
 
 class SampleCreate(BaseModel):
@@ -175,11 +214,31 @@ class SampleResponse(BaseModel):
     uploaded_at: datetime
     processed_at: Optional[datetime] = None
     notes: Optional[str] = None
+    relatedness_status: Optional[RelatednessStatusEnum] = None  # None until genotypes are screened
 
     class Config:
         from_attributes = True
 
 
+class RelatedSampleResponse(BaseModel):
+    """Another sample of the institution flagged as a duplicate or relative"""
+    id: str
+    sample_id: str
+    relationship: str  # Duplicate, 1st Degree, 2nd Degree, 3rd Degree
+    kinship: float  # KING-robust kinship coefficient
+    ibs0: float
+    concordance: float
+    shared_sites: int
+    detected_at: datetime
+
+
+class SampleRelativesResponse(BaseModel):
+    """Relatedness screening outcome for one sample"""
+    sample_id: str
+    relatedness_status: Optional[RelatednessStatusEnum] = None
+    relatives: List[RelatedSampleResponse]
+
+
 class SampleListResponse(BaseModel):
     """Paginated sample list"""
     samples: List[SampleResponse]
@@ -188,6 +247,79 @@ class SampleListResponse(BaseModel):
     offset: int
 
 
+# ==================== SYNC SCHEMAS ====================
+
+class SyncResults(BaseModel):
+    """Sample results in the short form delta sync sends"""
+    ancestry: List[List[Any]]  # [population, percentage, ci_lower, ci_upper], largest first
+    markers: Dict[str, str]  # rsid -> genotype
+
+
+class SyncSampleResponse(SampleResponse):
+    """Changed sample; results are included once available while consent is active"""
+    consent_id: str
+    change_seq: int
+    results: Optional[SyncResults] = None
+
+
+class SyncDeletedSample(BaseModel):
+    """Sample deleted by a consent purge or retention policy"""
+    id: str
+    sample_id: str
+
+
+class SyncPullResponse(BaseModel):
+    """One page of changes; send `watermark` back as `since` for the next one"""
+    watermark: str
+    has_more: bool
+    samples: List[SyncSampleResponse]
+    deleted: List[SyncDeletedSample]
+
+
+class SyncUploadRequest(BaseModel):
+    """Batch of samples recorded offline"""
+    samples: List[SampleCreate] = Field(..., min_length=1)
+
+
+class SyncUploadItemResponse(BaseModel):
+    """Outcome for one sample of a batch"""
+    sample_id: str
+    status: SyncUploadStatusEnum
+    id: Optional[str] = None
+    detail: Optional[str] = None
+
+
+class SyncUploadResponse(BaseModel):
+    """Per-sample outcomes of a batch upload, in request order"""
+    results: List[SyncUploadItemResponse]
+    created: int
+
+
+# ==================== CHANGE FEED SCHEMAS ====================
+
+class ChangeEventResponse(BaseModel):
+    """A committed change to a sample, its results or a consent"""
+    shard: str
+    seq: int
+    entity: str  # sample | results | consent
+    entity_id: str  # results: the sample's id
+    op: str  # insert | update | delete
+    fields: Optional[List[str]] = None  # Attributes an update changed, when known
+    changed_at: datetime
+
+
+class ChangeFeedResponse(BaseModel):
+    """One batch of changes; send `cursor` back for the next one"""
+    cursor: str
+    has_more: bool
+    events: List[ChangeEventResponse]
+
+
+class ChangeFeedHeadResponse(BaseModel):
+    """Cursor at the current end of the feed"""
+    cursor: str
+
+
 # ==================== ANCESTRY RESULT SCHEMAS ====================
 
 class ConfidenceInterval(BaseModel):
@@ -274,6 +406,141 @@ class AuditLogListResponse(BaseModel):
     offset: int
 
 
+class AuditChainVerifyResponse(BaseModel):
+    """Hash-chain verification report for a time range"""
+    verified: bool
+    batches_checked: int
+    entries_checked: int
+    first_seq: Optional[int] = None
+    last_seq: Optional[int] = None
+    anchored: bool  # Range is covered by a signed checkpoint after it
+    errors: List[str] = []
+
+
+# ==================== COHORT QUERY SCHEMAS ====================
+
+class CohortQueryRequest(BaseModel):
+    """Cohort filter over ancestry and genotype, e.g. 'ancestry:Nilotic > 70 AND HBB = A/S'"""
+    query: str = Field(..., min_length=1, max_length=1000)
+    limit: int = Field(50, ge=1, le=100)
+    offset: int = Field(0, ge=0)
+
+
+class CohortQueryResponse(BaseModel):
+    """Paginated cohort query result"""
+    query: str
+    samples: List[SampleResponse]
+    total: int
+    limit: int
+    offset: int
+
+
+# ==================== REGION QUERY SCHEMAS ====================
+
+class VariantSiteResponse(BaseModel):
+    """One variant site in a region with genotype counts for the caller's institution"""
+    chromosome: str
+    position: int
+    variant: str
+    gene: str
+    samples: int
+    genotype_counts: Dict[str, int]
+
+
+class RegionQueryResponse(BaseModel):
+    """Paginated variant sites within a genomic region"""
+    region: str
+    chromosome: str
+    start: int
+    end: int
+    variants: List[VariantSiteResponse]
+    total: int
+    limit: int
+    offset: int
+
+
+class FrequencyStatistics(BaseModel):
+    """Genotype/allele frequencies and Hardy-Weinberg statistics for one group of samples"""
+    group: str  # Population group or institution id
+    samples: int
+    genotype_counts: Dict[str, int]
+    genotype_frequencies: Dict[str, float]
+    allele_frequencies: Dict[str, float]
+    observed_heterozygosity: Optional[float] = None
+    expected_heterozygosity: Optional[float] = None
+    inbreeding_coefficient: Optional[float] = None  # F = 1 - Ho/He
+    hwe_chi_square: Optional[float] = None
+    hwe_p_value: Optional[float] = None  # Exact test
+
+
+class VariantFrequencyResponse(BaseModel):
+    """Platform-derived frequencies of a variant per population and for your institution"""
+    variant: str
+    gene: str
+    populations: List[FrequencyStatistics]
+    institution: FrequencyStatistics
+    min_group_size: int  # Smaller population groups are suppressed
+
+
+# ==================== ANCESTRY RECOMPUTE SCHEMAS ====================
+
+class AncestryRecomputeRequest(BaseModel):
+    """Recompute every sample whose active ancestry is on another reference version"""
+    reference_dataset: str = Field(..., min_length=1, max_length=100)
+    methodology_version: str = Field(..., min_length=1, max_length=50)
+    reference_sample_size: int = Field(..., gt=0)
+
+
+class AncestryRecomputeJobResponse(BaseModel):
+    """Recompute job status and progress"""
+    job_id: str
+    status: str  # Pending, Running, Completed, Failed
+    reference_dataset: str
+    methodology_version: str
+    total_samples: int
+    processed_samples: int
+    failed_samples: int
+    percent_complete: float
+    samples_per_second: Optional[float] = None
+    eta_seconds: Optional[float] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    error: Optional[str] = None
+
+
+class PcaProjectionRequest(BaseModel):
+    """Samples to place on the reference PCA (default: the institution's most recent genotyped samples)"""
+    sample_ids: Optional[List[str]] = Field(None, max_length=1000)
+
+
+class PcaModelResponse(BaseModel):
+    """Reference PCA model the coordinates are in"""
+    version: int
+    reference_dataset: str
+    site_list_version: int
+    reference_samples: int
+    sites: int
+    explained_variance: List[float]  # Fraction of reference variance per component
+    created_at: datetime
+
+
+class PcaCoordinate(BaseModel):
+    """One sample's principal component scores"""
+    id: str
+    sample_id: str
+    population: Optional[str] = None  # Predominant ancestry population, for colouring
+    components: List[float]  # PC1, PC2, ...
+
+
+class PcaProjectionResponse(BaseModel):
+    """Samples projected onto the reference principal axes"""
+    model: PcaModelResponse
+    coordinates: List[PcaCoordinate]
+    not_genotyped: List[str]  # Requested samples with no calls on the model's site list
+    consent_withdrawn: List[str] = []  # Samples left out because their consent is withdrawn
+
+
 # ==================== DATA EXPORT SCHEMAS ====================
 
 class DataExportRequest(BaseModel):
@@ -282,6 +549,7 @@ class DataExportRequest(BaseModel):
     export_format: str = "JSON"  # JSON, CSV, VCF
     justification: str = Field(..., min_length=50)
     export_scope: str = "metadata_and_results"  # metadata_only, metadata_and_results
+    purpose: ExportPurposeEnum = ExportPurposeEnum.RESEARCH
 
 
 class DataExportResponse(BaseModel):
@@ -0,0 +1,118 @@
+"""
+AFRO-GENOMICS Research Platform
+Production Server Launcher
+
+Runs the API under gunicorn with uvicorn workers, one per available core by
+default. The application is preloaded in the master process: the schema is
+created, demo data seeded and read-only panels (panels.py) imported once,
+then the heap is frozen so forked workers share those pages copy-on-write.
+
+Per-worker caches stay coherent through the invalidation bus in
+coordination.py; this launcher provides the shared Unix socket directory
+when the database is not PostgreSQL.
+
+Usage (from backend/):
+    python serve.py
+    WEB_CONCURRENCY=8 PORT=8080 python serve.py
+"""
+
+import gc
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+from gunicorn.app.base import BaseApplication
+
+# Configuration
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "0"))  # 0 = one worker per available core
+WORKER_TIMEOUT_SECONDS = int(os.getenv("WORKER_TIMEOUT_SECONDS", "60"))
+GRACEFUL_TIMEOUT_SECONDS = int(os.getenv("GRACEFUL_TIMEOUT_SECONDS", "30"))
+MAX_REQUESTS = int(os.getenv("MAX_REQUESTS", "0"))  # Recycle workers after N requests (0 = never)
+
+
+def default_workers() -> int:
+    """Cores available to this process (respects CPU affinity / container cpusets)"""
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except AttributeError:
+        return max(1, multiprocessing.cpu_count())
+
+
+# ==================== GUNICORN HOOKS ====================
+
+def when_ready(server):
+    # Everything allocated while preloading moves to the permanent generation,
+    # so the collector in each worker never touches (and un-shares) those pages
+    gc.freeze()
+    server.log.info("Preloaded app frozen; %d objects shared with workers", gc.get_freeze_count())
+
+
+def post_fork(server, worker):
+    gc.enable()
+    from main import engine
+    from replicas import session_router
+    from shards import shard_router
+    # Connections must never cross a fork; the master's pool was emptied after preload
+    engine.dispose(close=False)
+    session_router.dispose(close=False)
+    shard_router.dispose(close=False)
+
+
+class PreloadedApplication(BaseApplication):
+    """gunicorn application that imports and seeds the API once in the master"""
+
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        gc.disable()
+        import main
+
+        db = main.SessionLocal()
+        try:
+            main.seed_mock_data(db)
+        finally:
+            db.close()
+        main.engine.dispose()
+        main.shard_router.dispose()
+        return main.app
+
+
+def run():
+    socket_dir = None
+    database_url = os.getenv("DATABASE_URL", "sqlite:///./afro_genomics.db")
+    if not database_url.startswith("postgresql") and not os.getenv("INVALIDATION_SOCKET_DIR"):
+        # Must be set before main (and coordination) is imported by the preload
+        socket_dir = tempfile.mkdtemp(prefix="afro-genomics-bus-")
+        os.environ["INVALIDATION_SOCKET_DIR"] = socket_dir
+
+    options = {
+        "bind": f"{HOST}:{PORT}",
+        "workers": WEB_CONCURRENCY or default_workers(),
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "preload_app": True,
+        "timeout": WORKER_TIMEOUT_SECONDS,
+        "graceful_timeout": GRACEFUL_TIMEOUT_SECONDS,
+        "max_requests": MAX_REQUESTS,
+        "max_requests_jitter": MAX_REQUESTS // 10,
+        "when_ready": when_ready,
+        "post_fork": post_fork,
+        "accesslog": "-",
+    }
+    try:
+        PreloadedApplication(options).run()
+    finally:
+        if socket_dir:
+            shutil.rmtree(socket_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,499 @@
+"""
+AFRO-GENOMICS Research Platform
+Institution Sharding
+
+An institution's consents, samples, sync state and every row hanging off a sample
+(SHARDED_TABLES) can live in a database of its own. The directory database
+(DATABASE_URL) keeps everything else: users, institutions, the variant
+catalogue and reference panels, audit logs and jobs. It is also the
+"default" shard for institutions that were never moved.
+
+- Shards are named in DATABASE_SHARD_URLS ("name=url,..."). Each has the full
+  schema plus a copy of the REFERENCE_TABLES sharded rows join against or
+  reference by foreign key, refreshed every SHARD_REFERENCE_SYNC_SECONDS and
+  before a move (`python shards.py sync-reference` forces it).
+- institution_shards maps institutions to shards. Every worker caches the map
+  and reloads it every SHARD_MAP_REFRESH_SECONDS.
+- Request sessions carry their principal's shard: RoutingSession (replicas.py)
+  sends statements on sharded tables there and everything else to the directory.
+- Maintenance runs once per shard (each_shard); fan_out() runs a function on
+  every shard in parallel and returns the results per shard for merging.
+- move_institution() copies an institution to another shard while it stays
+  online, pauses writes to its sharded rows for a final reconciliation pass,
+  switches the map and then deletes the old copy. Maintenance is paused
+  while any move is in progress.
+- The change feed (SHARD_LOCAL_TABLES, see changes.py) is written on the
+  database holding the changed rows and stays there when they move.
+
+Replicas (replicas.py) serve the directory database only; sharded reads of
+moved institutions go to their shard.
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+from sqlalchemy import LargeBinary, bindparam, delete, func, insert, select, tuple_, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from models import (
+    Institution, User, Variant, AncestryReference, AncestryRecomputeJob, GenotypeSiteList, InstitutionShard,
+    ConsentRecord, Sample, AncestryResult, HealthMarker, GenotypeBlob, RelatednessSketch, RelatednessIndex,
+    RelatednessBucket, RelatedSamplePair, PurgeJob, SyncCounter, SampleTombstone, ChangeEvent, ChangeSequence
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Configuration
+DATABASE_SHARD_URLS = dict(
+    entry.strip().split("=", 1) for entry in os.getenv("DATABASE_SHARD_URLS", "").split(",") if entry.strip()
+)
+SHARD_MAP_REFRESH_SECONDS = float(os.getenv("SHARD_MAP_REFRESH_SECONDS", "2"))
+SHARD_FAN_OUT_THREADS = int(os.getenv("SHARD_FAN_OUT_THREADS", "8"))
+SHARD_MOVE_BATCH_SIZE = int(os.getenv("SHARD_MOVE_BATCH_SIZE", "500"))  # Samples / consents per copy batch
+SHARD_REFERENCE_SYNC_SECONDS = float(os.getenv("SHARD_REFERENCE_SYNC_SECONDS", "60"))
+
+DEFAULT_SHARD = "default"
+
+# Institution-owned tables in copy order (parents first), with the column that ties a row to the institution
+_OWNERSHIP = (
+    (ConsentRecord, "user_id", "user"),
+    (Sample, "institution_id", "institution"),
+    (SyncCounter, "institution_id", "institution"),
+    (SampleTombstone, "institution_id", "institution"),
+    (AncestryResult, "sample_id", "sample"),
+    (HealthMarker, "sample_id", "sample"),
+    (GenotypeBlob, "sample_id", "sample"),
+    (RelatednessIndex, "institution_id", "institution"),
+    (RelatednessSketch, "institution_id", "institution"),
+    (RelatednessBucket, "institution_id", "institution"),
+    (RelatedSamplePair, "sample_id", "sample"),
+    (PurgeJob, "consent_id", "consent"),
+)
+SHARDED_TABLES = frozenset(model.__tablename__ for model, _, _ in _OWNERSHIP)
+
+# Written next to the sharded rows they describe but never moved: each database keeps its own (see changes.py)
+SHARD_LOCAL_TABLES = frozenset(model.__tablename__ for model in (ChangeEvent, ChangeSequence))
+ROUTED_TABLES = SHARDED_TABLES | SHARD_LOCAL_TABLES
+
+# Directory tables copied to every shard (parents first)
+REFERENCE_TABLES = (Institution, User, Variant, AncestryReference, GenotypeSiteList, AncestryRecomputeJob)
+
+
+class ShardError(Exception):
+    """Unknown shard or invalid move"""
+    pass
+
+
+class InstitutionMoving(Exception):
+    """Writes to an institution's sharded rows are paused while it moves between shards"""
+
+    def __init__(self, institution_id: str):
+        super().__init__(f"Institution {institution_id} is being moved between shards")
+        self.institution_id = institution_id
+
+
+class ShardRouter:
+    """Per-worker shard engines and institution -> shard map"""
+
+    def __init__(self):
+        self.directory: Optional[Engine] = None
+        self.engines: Dict[str, Engine] = {}
+        self._session_factory: Optional[Callable[..., Session]] = None
+        self._map: Dict[str, Tuple[str, Optional[str], bool]] = {}  # institution -> (shard, moving_to, frozen)
+        self._user_institutions: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def configure(self, directory: Engine, shards: Dict[str, Engine], session_factory: Callable[..., Session]):
+        if DEFAULT_SHARD in shards:
+            raise ShardError(f"'{DEFAULT_SHARD}' is the directory database and cannot be configured as a shard")
+        self.directory = directory
+        self.engines = dict(shards)
+        self._session_factory = session_factory
+
+    @property
+    def names(self) -> List[str]:
+        return [DEFAULT_SHARD, *self.engines]
+
+    def engine(self, name: str) -> Engine:
+        if name == DEFAULT_SHARD:
+            return self.directory
+        engine = self.engines.get(name)
+        if engine is None:
+            raise ShardError(f"Shard '{name}' is not configured on this worker")
+        return engine
+
+    # ---------- map ----------
+
+    def refresh(self, should_stop: Callable[[], bool] = lambda: False):
+        """Reload the institution -> shard map from the directory"""
+        with self.directory.connect() as conn:
+            rows = conn.execute(select(
+                InstitutionShard.institution_id, InstitutionShard.shard,
+                InstitutionShard.moving_to, InstitutionShard.frozen
+            )).all()
+        shard_map = {institution_id: (shard, moving_to, bool(frozen)) for institution_id, shard, moving_to, frozen in rows}
+        with self._lock:
+            self._map = shard_map
+
+    def shard_of(self, institution_id: Optional[str]) -> str:
+        with self._lock:
+            entry = self._map.get(institution_id)
+        return entry[0] if entry else DEFAULT_SHARD
+
+    def move_in_progress(self) -> bool:
+        with self._lock:
+            return any(moving_to is not None for _, moving_to, _ in self._map.values())
+
+    def check_writable(self, institution_id: Optional[str]):
+        """Raise InstitutionMoving while the institution's sharded rows are frozen"""
+        with self._lock:
+            entry = self._map.get(institution_id)
+        if entry is not None and entry[2]:
+            raise InstitutionMoving(institution_id)
+
+    def institution_of(self, user_id: str) -> Optional[str]:
+        """User's institution (cached; users don't change institutions)"""
+        institution_id = self._user_institutions.get(user_id)
+        if institution_id is None:
+            with self.directory.connect() as conn:
+                institution_id = conn.execute(select(User.institution_id).where(User.id == user_id)).scalar()
+            if institution_id is not None:
+                self._user_institutions[user_id] = institution_id
+        return institution_id
+
+    # ---------- sessions ----------
+
+    def session_info(self, institution_id: Optional[str]) -> dict:
+        """Session info routing an institution's sharded rows (see RoutingSession)"""
+        shard = self.shard_of(institution_id)
+        return {
+            "institution_id": institution_id,
+            "shard": None if shard == DEFAULT_SHARD else self.engine(shard)
+        }
+
+    def session_factory(self, name: str) -> Callable[[], Session]:
+        """Factory for sessions whose sharded rows are those of shard `name`"""
+        if name == DEFAULT_SHARD:
+            return self._session_factory
+        engine = self.engine(name)
+        return lambda: self._session_factory(info={"shard": engine})
+
+    def each_shard(self, func: Callable[[Callable[[], Session]], T]) -> Dict[str, T]:
+        """Run `func(session_factory)` once per shard, one shard after another (maintenance jobs)"""
+        results = {}
+        for name in self.names:
+            try:
+                results[name] = func(self.session_factory(name))
+            except Exception:
+                logger.exception("Shard %s: maintenance run failed", name)
+        return results
+
+    def fan_out(self, func: Callable[[Session], T]) -> Dict[str, T]:
+        """Run `func(db)` on every shard in parallel; results by shard name for the caller to merge"""
+        if not self.engines:
+            return {DEFAULT_SHARD: self._run(DEFAULT_SHARD, func)}
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=SHARD_FAN_OUT_THREADS, thread_name_prefix="shard-fan-out")
+        futures = {name: self._pool.submit(self._run, name, func) for name in self.names}
+        return {name: future.result() for name, future in futures.items()}
+
+    def _run(self, name: str, func: Callable[[Session], T]) -> T:
+        db = self.session_factory(name)()
+        try:
+            return func(db)
+        finally:
+            db.close()
+
+    @contextmanager
+    def shard_sessions(self, db: Session) -> Iterator[List[Session]]:
+        """One session per shard, reusing `db` for the shard it routes to; opened ones are closed on exit"""
+        routed = db.info.get("shard")
+        opened = [
+            self.session_factory(name)() for name in self.names
+            if (self.engines.get(name) if name != DEFAULT_SHARD else None) is not routed
+        ]
+        try:
+            yield [db, *opened]
+        finally:
+            for shard_db in opened:
+                shard_db.close()
+
+    def dispose(self, close: bool = True):
+        for engine in self.engines.values():
+            engine.dispose(close=close)
+
+    # ---------- reference tables ----------
+
+    def sync_reference(self, name: str) -> int:
+        """Copy new and changed reference rows from the directory to shard `name`"""
+        target = self.engine(name)
+        changed = 0
+        with self.directory.connect() as source, target.begin() as conn:
+            for model in REFERENCE_TABLES:
+                table = model.__table__
+                rows = _keyed_rows(source, table, None)
+                inserts, updates, _ = _diff(rows, _keyed_rows(conn, table, None))
+                changed += _apply(source, conn, table, inserts, updates)
+        return changed
+
+    def sync_references(self, should_stop: Callable[[], bool] = lambda: False):
+        """sync_reference() for every shard but the directory (maintenance leader)"""
+        for name in self.engines:
+            if should_stop():
+                return
+            changed = self.sync_reference(name)
+            if changed:
+                logger.info("Shard %s: %d reference rows synced", name, changed)
+
+    # ---------- moving ----------
+
+    def move_institution(self, institution_id: str, target: str, progress: Callable[[str], None] = logger.info) -> Dict:
+        """
+        Move an institution's sharded rows to shard `target` while it stays online
+
+        1. Copy everything (reads and writes continue on the source)
+        2. Freeze writes, wait for every worker to see it, copy what changed
+        3. Point the institution at the target, wait, delete the source copy
+
+        Returns:
+            Rows copied per phase and the length of the freeze in seconds
+        """
+        source = self.shard_of(institution_id)
+        if source == target:
+            raise ShardError(f"Institution {institution_id} is already on shard '{target}'")
+        source_engine, target_engine = self.engine(source), self.engine(target)
+        with self.directory.connect() as conn:
+            if conn.execute(select(Institution.id).where(Institution.id == institution_id)).scalar() is None:
+                raise ShardError(f"Unknown institution {institution_id}")
+            user_ids = conn.execute(select(User.id).where(User.institution_id == institution_id)).scalars().all()
+        settle = 2 * SHARD_MAP_REFRESH_SECONDS
+
+        if target != DEFAULT_SHARD:
+            progress(f"reference rows synced: {self.sync_reference(target)}")
+        self._set_entry(institution_id, source, moving_to=target, frozen=False)
+        report = {"copied": 0, "reconciled": 0, "deleted": 0}
+        try:
+            report["copied"] = _sync_institution(source_engine, target_engine, institution_id, user_ids)
+            progress(f"copied {report['copied']} rows to '{target}'")
+
+            self._set_entry(institution_id, source, moving_to=target, frozen=True)
+            frozen_at = time.monotonic()
+            time.sleep(settle)
+            report["reconciled"] = _sync_institution(source_engine, target_engine, institution_id, user_ids)
+            self._set_entry(institution_id, target, moving_to=None, frozen=False)
+            report["frozen_seconds"] = round(time.monotonic() - frozen_at, 2)
+            progress(f"reconciled {report['reconciled']} rows; writes were paused {report['frozen_seconds']}s")
+        except Exception:
+            self._set_entry(institution_id, source, moving_to=None, frozen=False)
+            raise
+
+        time.sleep(settle)  # Workers still routing to the source only read from it until they refresh
+        report["deleted"] = _delete_institution(source_engine, institution_id, user_ids)
+        progress(f"deleted {report['deleted']} rows from '{source}'")
+        return report
+
+    def _set_entry(self, institution_id: str, shard: str, moving_to: Optional[str], frozen: bool):
+        with self.directory.begin() as conn:
+            updated = conn.execute(
+                update(InstitutionShard).where(InstitutionShard.institution_id == institution_id)
+                .values(shard=shard, moving_to=moving_to, frozen=frozen)
+            ).rowcount
+            if not updated:
+                conn.execute(insert(InstitutionShard).values(
+                    institution_id=institution_id, shard=shard, moving_to=moving_to, frozen=frozen
+                ))
+        self.refresh()
+
+
+# ==================== ROW COPYING ====================
+
+def _keyed_rows(conn: Connection, table, where) -> Dict[tuple, tuple]:
+    """{primary key: row} with binary columns reduced to a digest of their bytes for comparison"""
+    key = list(table.primary_key.columns)
+    binary = [isinstance(c.type, LargeBinary) for c in table.columns]
+    query = select(*key, *table.columns)
+    if where is not None:
+        query = query.where(where)
+    rows = {}
+    for row in conn.execute(query):
+        rows[tuple(row[:len(key)])] = tuple(
+            _digest(value) if is_binary else value for value, is_binary in zip(row[len(key):], binary)
+        )
+    return rows
+
+
+def _digest(value) -> Optional[bytes]:
+    """SHA-256 of a binary value, so a same-length rewrite still compares unequal"""
+    return None if value is None else hashlib.sha256(bytes(value)).digest()
+
+
+def _diff(source: Dict[tuple, tuple], target: Dict[tuple, tuple]) -> Tuple[List[tuple], List[tuple], List[tuple]]:
+    """(keys to insert, keys to update, keys to delete) to make target match source"""
+    inserts = [k for k in source if k not in target]
+    updates = [k for k, row in source.items() if k in target and target[k] != row]
+    deletes = [k for k in target if k not in source]
+    return inserts, updates, deletes
+
+
+def _key_condition(table, keys: Sequence[tuple]):
+    columns = list(table.primary_key.columns)
+    if len(columns) == 1:
+        return columns[0].in_([k[0] for k in keys])
+    return tuple_(*columns).in_(keys)
+
+
+def _apply(source: Connection, target: Connection, table, inserts: List[tuple], updates: List[tuple]) -> int:
+    """Copy full rows for `inserts` and `updates` from source to target"""
+    for keys, is_update in ((inserts, False), (updates, True)):
+        for start in range(0, len(keys), SHARD_MOVE_BATCH_SIZE):
+            rows = [dict(row._mapping) for row in source.execute(
+                select(table).where(_key_condition(table, keys[start:start + SHARD_MOVE_BATCH_SIZE]))
+            )]
+            if not rows:
+                continue
+            if not is_update:
+                target.execute(insert(table), rows)
+                continue
+            key_names = [c.name for c in table.primary_key.columns]
+            statement = update(table).where(
+                *(table.c[name] == bindparam(f"key_{name}") for name in key_names)
+            ).values({c.name: bindparam(f"value_{c.name}") for c in table.columns if c.name not in key_names})
+            target.execute(statement, [
+                {**{f"key_{k}": v for k, v in row.items() if k in key_names},
+                 **{f"value_{k}": v for k, v in row.items() if k not in key_names}}
+                for row in rows
+            ])
+    return len(inserts) + len(updates)
+
+
+def _chunks(values: Sequence, size: int) -> Iterator[Sequence]:
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _owned_keys(conn: Connection, institution_id: str, user_ids: Sequence[str]) -> Dict[str, List[str]]:
+    """Values of each ownership column that tie rows to the institution on one database"""
+    sample_ids = conn.execute(select(Sample.id).where(Sample.institution_id == institution_id)).scalars().all()
+    consent_ids = []
+    for chunk in _chunks(list(user_ids), SHARD_MOVE_BATCH_SIZE):
+        consent_ids += conn.execute(select(ConsentRecord.id).where(ConsentRecord.user_id.in_(chunk))).scalars().all()
+    return {"institution": [institution_id], "user": list(user_ids), "sample": sample_ids, "consent": consent_ids}
+
+
+def _sync_institution(source_engine: Engine, target_engine: Engine, institution_id: str, user_ids: Sequence[str]) -> int:
+    """
+    Make the institution's rows on target match source, batch by batch
+
+    Inserts and updates run parents first, deletes children first. Every batch
+    is its own transaction on both sides, so neither database sees a long
+    transaction from the copy.
+    """
+    changed = 0
+    with source_engine.connect() as source, target_engine.connect() as target:
+        source_keys = _owned_keys(source, institution_id, user_ids)
+        target_keys = _owned_keys(target, institution_id, user_ids)
+        source.rollback()
+        target.rollback()
+        doomed: List[Tuple[object, List[tuple]]] = []
+        for model, column, kind in _OWNERSHIP:
+            table = model.__table__
+            keys = sorted(set(source_keys[kind]) | set(target_keys[kind]))
+            stale = []
+            for chunk in _chunks(keys, SHARD_MOVE_BATCH_SIZE):
+                where = table.c[column].in_(chunk)
+                inserts, updates, deletes = _diff(_keyed_rows(source, table, where), _keyed_rows(target, table, where))
+                changed += _apply(source, target, table, inserts, updates)
+                target.commit()
+                source.rollback()
+                stale += deletes
+            doomed.append((table, stale))
+        for table, keys in reversed(doomed):
+            for chunk in _chunks(keys, SHARD_MOVE_BATCH_SIZE):
+                target.execute(delete(table).where(_key_condition(table, chunk)))
+                target.commit()
+            changed += len(keys)
+    return changed
+
+
+def _delete_institution(engine: Engine, institution_id: str, user_ids: Sequence[str]) -> int:
+    """Delete the institution's sharded rows from one database, children first"""
+    deleted = 0
+    with engine.connect() as conn:
+        keys = _owned_keys(conn, institution_id, user_ids)
+        conn.rollback()
+        for model, column, kind in reversed(_OWNERSHIP):
+            table = model.__table__
+            for chunk in _chunks(keys[kind], SHARD_MOVE_BATCH_SIZE):
+                deleted += conn.execute(delete(table).where(table.c[column].in_(chunk))).rowcount
+                conn.commit()
+    return deleted
+
+
+# ==================== SHARD STATUS ====================
+
+def institution_sample_counts(db: Session) -> Dict[str, int]:
+    """Samples per institution on the session's shard"""
+    return dict(db.execute(select(Sample.institution_id, func.count()).group_by(Sample.institution_id)).all())
+
+
+# Global router instance
+shard_router = ShardRouter()
+
+
+# ==================== CLI ====================
+
+def main(argv=None) -> int:
+    """
+    Shard administration against the configured databases
+
+    Usage (from backend/):
+        python shards.py status
+        python shards.py sync-reference
+        python shards.py move <institution_id> <shard>
+    """
+    parser = argparse.ArgumentParser(description="Institution shard administration")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="Samples per institution on every shard")
+    commands.add_parser("sync-reference", help="Copy reference tables to every shard")
+    move = commands.add_parser("move", help="Move an institution to another shard online")
+    move.add_argument("institution_id")
+    move.add_argument("shard")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    # The instance main configured; run as a script, this module is __main__ and not `shards`
+    from main import shard_router as router
+    router.refresh()
+
+    if args.command == "status":
+        started = time.perf_counter()
+        counts = router.fan_out(institution_sample_counts)
+        for name, by_institution in counts.items():
+            print(f"{name}: {sum(by_institution.values())} samples")
+            for institution_id, n in sorted(by_institution.items()):
+                marker = "" if router.shard_of(institution_id) == name else "  (not mapped here)"
+                print(f"  {institution_id}  {n}{marker}")
+        print(f"({len(counts)} shards queried in parallel in {1000 * (time.perf_counter() - started):.0f} ms)")
+    elif args.command == "sync-reference":
+        for name in router.engines:
+            print(f"{name}: {router.sync_reference(name)} rows copied")
+    else:
+        report = router.move_institution(args.institution_id, args.shard, progress=print)
+        print(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,291 @@
+"""
+AFRO-GENOMICS Research Platform
+Delta Sync for Partner Labs
+
+Lets labs on intermittent, low-bandwidth links keep a local copy of their
+institution's samples and results up to date with few, small requests:
+
+- Every change to a sample (upload, status, relatedness flag, results
+  generated or recomputed, archival) stamps it with the next value of its
+  institution's change sequence (Sample.change_seq). Deletions leave a
+  SampleTombstone with a sequence number too.
+- The counter row (SyncCounter) stays locked from the increment until
+  commit, so an institution's changes commit in sequence order and a client
+  that has seen sequence N can never miss a change numbered below N.
+- Clients pull everything after their watermark ("seq:id" of the last
+  change they applied) in pages ordered by (change_seq, id), and push new
+  samples in batches. Both directions are gzip-compressed: responses when
+  the client sends Accept-Encoding: gzip, request bodies when it sends
+  Content-Encoding: gzip (GzipRequestMiddleware).
+
+ORM flushes are stamped automatically; bulk UPDATEs of samples call
+stamp_samples() and bulk deletes go through purge.delete_sample_rows(),
+which records the tombstones.
+"""
+
+import gzip
+import json
+import logging
+import os
+import zlib
+from datetime import datetime
+from itertools import chain
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+from sqlalchemy import event, insert, select, tuple_, update
+from sqlalchemy.orm import Session
+
+from models import AncestryResult, HealthMarker, Sample, SampleStatus, SampleTombstone, SyncCounter
+from catalogue import variant_catalogue
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+SYNC_PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", "500"))  # Changes per pull unless the client asks for fewer
+SYNC_MAX_PAGE_SIZE = int(os.getenv("SYNC_MAX_PAGE_SIZE", "2000"))
+SYNC_UPLOAD_MAX_SAMPLES = int(os.getenv("SYNC_UPLOAD_MAX_SAMPLES", "500"))  # Samples per pushed batch
+SYNC_MAX_BODY_BYTES = int(os.getenv("SYNC_MAX_BODY_BYTES", str(10 * 1024 * 1024)))  # Decompressed request body
+SYNC_GZIP_MIN_BYTES = int(os.getenv("SYNC_GZIP_MIN_BYTES", "512"))  # Smaller responses are sent uncompressed
+
+
+class SyncError(ValueError):
+    """Malformed watermark or sync request"""
+
+
+# ==================== CHANGE SEQUENCE ====================
+
+def next_change_seq(db: Session, institution_id: str) -> int:
+    """
+    Take the institution's next change sequence number (caller commits)
+
+    Locks the institution's counter until the transaction ends.
+    """
+    bumped = db.execute(
+        update(SyncCounter).where(SyncCounter.institution_id == institution_id)
+        .values(value=SyncCounter.value + 1).execution_options(synchronize_session=False)
+    ).rowcount
+    if not bumped:
+        # First change of the institution (a concurrent first change fails on the key and is retried by its client)
+        db.execute(insert(SyncCounter).values(institution_id=institution_id, value=1))
+        return 1
+    return db.execute(select(SyncCounter.value).where(SyncCounter.institution_id == institution_id)).scalar()
+
+
+def stamp_samples(db: Session, condition) -> int:
+    """
+    Mark samples matching `condition` as changed after a bulk UPDATE (caller commits)
+
+    Samples of one institution share one sequence number.
+
+    Returns:
+        Number of samples stamped
+    """
+    institution_ids = db.execute(select(Sample.institution_id).where(condition).distinct()).scalars().all()
+    stamped = 0
+    for institution_id in sorted(institution_ids):  # Fixed lock order across institutions
+        stamped += db.execute(
+            update(Sample).where(Sample.institution_id == institution_id, condition)
+            .values(change_seq=next_change_seq(db, institution_id))
+            .execution_options(synchronize_session=False, change_events=False)
+        ).rowcount
+    return stamped
+
+
+def record_tombstones(db: Session, sample_ids: Sequence[str]):
+    """Leave tombstones for samples about to be deleted (caller deletes and commits)"""
+    doomed = db.execute(
+        select(Sample.id, Sample.sample_id, Sample.institution_id).where(Sample.id.in_(sample_ids))
+    ).all()
+    now = datetime.utcnow()
+    for institution_id in sorted({row.institution_id for row in doomed}):
+        seq = next_change_seq(db, institution_id)
+        db.execute(insert(SampleTombstone), [
+            {"id": row.id, "sample_id": row.sample_id, "institution_id": institution_id, "change_seq": seq,
+             "deleted_at": now}
+            for row in doomed if row.institution_id == institution_id
+        ])
+
+
+@event.listens_for(Session, "before_flush")
+def _stamp_flushed_samples(session, flush_context, instances):
+    changed: Dict[str, List[Sample]] = {}
+    for obj in chain(session.new, session.dirty):
+        if isinstance(obj, Sample) and (obj in session.new or session.is_modified(obj, include_collections=False)):
+            changed.setdefault(obj.institution_id, []).append(obj)
+    for institution_id in sorted(changed):
+        seq = next_change_seq(session, institution_id)
+        for sample in changed[institution_id]:
+            sample.change_seq = seq
+
+
+# ==================== PULL ====================
+
+_SYNC_COLUMNS = (
+    Sample.id, Sample.sample_id, Sample.participant_id, Sample.user_id, Sample.institution_id, Sample.consent_id,
+    Sample.status, Sample.uploaded_at, Sample.processed_at, Sample.notes, Sample.relatedness_status,
+    Sample.change_seq
+)
+
+
+def parse_watermark(watermark: Optional[str]) -> Tuple[int, str]:
+    """(change_seq, id) after which to send changes; None or "" means from the beginning"""
+    if not watermark:
+        return 0, ""
+    seq, _, last_id = watermark.partition(":")
+    try:
+        return int(seq), last_id
+    except ValueError:
+        raise SyncError(f"Invalid sync watermark '{watermark}'")
+
+
+def format_watermark(seq: int, last_id: str) -> str:
+    return f"{seq}:{last_id}"
+
+
+def changes_since(
+    db: Session, institution_id: str, watermark: Optional[str], limit: int
+) -> Tuple[List[Dict], List[Dict], str, bool]:
+    """
+    One page of an institution's sample changes and deletions after `watermark`
+
+    Returns:
+        (changed sample row dicts, deleted {id, sample_id}, watermark after this page, more pages follow)
+    """
+    after = parse_watermark(watermark)
+    samples = db.execute(
+        select(*_SYNC_COLUMNS).where(
+            Sample.institution_id == institution_id, tuple_(Sample.change_seq, Sample.id) > after
+        ).order_by(Sample.change_seq, Sample.id).limit(limit + 1)
+    ).mappings().all()
+    tombstones = db.execute(
+        select(SampleTombstone.id, SampleTombstone.sample_id, SampleTombstone.change_seq).where(
+            SampleTombstone.institution_id == institution_id,
+            tuple_(SampleTombstone.change_seq, SampleTombstone.id) > after
+        ).order_by(SampleTombstone.change_seq, SampleTombstone.id).limit(limit + 1)
+    ).mappings().all()
+
+    # Merge both streams in (change_seq, id) order and cut one page
+    merged = sorted(
+        chain(((row["change_seq"], row["id"], False, row) for row in samples),
+              ((row["change_seq"], row["id"], True, row) for row in tombstones)),
+        key=lambda entry: entry[:2]
+    )
+    page, has_more = merged[:limit], len(merged) > limit
+    changed = [dict(row) for _, _, deleted, row in page if not deleted]
+    deleted = [{"id": row["id"], "sample_id": row["sample_id"]} for _, _, gone, row in page if gone]
+    last = page[-1] if page else None
+    next_watermark = format_watermark(last[0], last[1]) if last else format_watermark(*after)
+    return changed, deleted, next_watermark, has_more
+
+
+def compact_results(db: Session, sample_ids: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Results of samples in the short form sync sends
+
+    Returns:
+        sample id -> {"ancestry": [[population, percentage, ci_lower, ci_upper], ...], "markers": {rsid: genotype}}
+    """
+    if not sample_ids:
+        return {}
+    results = {sample_id: {"ancestry": [], "markers": {}} for sample_id in sample_ids}
+    for row in db.execute(
+        select(
+            AncestryResult.sample_id, AncestryResult.population_group, AncestryResult.percentage,
+            AncestryResult.confidence_interval_lower, AncestryResult.confidence_interval_upper
+        ).where(AncestryResult.sample_id.in_(sample_ids), AncestryResult.is_active.is_(True))
+        .order_by(AncestryResult.sample_id, AncestryResult.percentage.desc())
+    ):
+        results[row[0]]["ancestry"].append(list(row[1:]))
+    calls = db.execute(
+        select(HealthMarker.sample_id, HealthMarker.variant_id, HealthMarker.genotype_code)
+        .where(HealthMarker.sample_id.in_(sample_ids))
+    ).all()
+    variants = variant_catalogue.get_many(db, {variant_id for _, variant_id, _ in calls})
+    for sample_id, variant_id, code in calls:
+        if variant_id in variants:
+            results[sample_id]["markers"][variants[variant_id].rsid] = variants[variant_id].genotype(code)
+    return results
+
+
+def has_results(row: Dict) -> bool:
+    return row["status"] == SampleStatus.RESULTS_AVAILABLE
+
+
+# ==================== COMPRESSION ====================
+
+def encode_json(payload: Any) -> bytes:
+    return json.dumps(jsonable_encoder(payload), separators=(",", ":")).encode()
+
+
+def compressed_response(
+    body: bytes, accept_encoding: Optional[str], status_code: int = 200, headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """JSON response, gzip-compressed if the client accepts it and it is worth it"""
+    headers = {**(headers or {}), "Vary": "Accept-Encoding"}
+    if "gzip" in (accept_encoding or "") and len(body) >= SYNC_GZIP_MIN_BYTES:
+        body = gzip.compress(body, compresslevel=6)
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
+
+
+class GzipRequestMiddleware:
+    """
+    Decompress request bodies sent with Content-Encoding: gzip (pure ASGI)
+
+    Bodies over SYNC_MAX_BODY_BYTES once decompressed are refused with 413
+    without inflating the rest; corrupt ones with 400.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        if headers.get(b"content-encoding", b"").strip().lower() != b"gzip":
+            return await self.app(scope, receive, send)
+
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        body = bytearray()
+        try:
+            more = True
+            while more:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+                more = message.get("more_body", False)
+                body += inflater.decompress(message.get("body", b""), SYNC_MAX_BODY_BYTES + 1 - len(body))
+                if len(body) > SYNC_MAX_BODY_BYTES or inflater.unconsumed_tail:
+                    return await _reject(send, 413, "Request body too large")
+            body += inflater.flush()
+            if len(body) > SYNC_MAX_BODY_BYTES:
+                return await _reject(send, 413, "Request body too large")
+        except zlib.error:
+            return await _reject(send, 400, "Invalid gzip request body")
+
+        scope = dict(scope)
+        scope["headers"] = [
+            (name, value) for name, value in scope["headers"] if name not in (b"content-encoding", b"content-length")
+        ] + [(b"content-length", str(len(body)).encode())]
+        sent = False
+
+        async def inflated():
+            nonlocal sent
+            if sent:
+                return await receive()
+            sent = True
+            return {"type": "http.request", "body": bytes(body), "more_body": False}
+
+        await self.app(scope, inflated, send)
+
+
+async def _reject(send, status_code: int, detail: str):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start", "status": status_code,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    })
+    await send({"type": "http.response.body", "body": body})
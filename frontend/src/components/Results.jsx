@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import { BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer, PieChart, Pie, Cell } from 'recharts';
+import { BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer, PieChart, Pie, Cell, ScatterChart, Scatter } from 'recharts';
 import { ConfidenceInterval, HealthMarkerCard, ResearchDisclaimer } from './Common';
 
 const COLORS = ['#3B82F6', '#10B981', '#F59E0B', '#EF4444', '#8B5CF6', '#EC4899'];
@@ -86,6 +86,49 @@ export const AncestryChart = ({ populations }) => {
   );
 };
 
+export const PcaScatterPlot = ({ projection }) => {
+  if (!projection || projection.coordinates.length === 0) {
+    return <div className="p-4 text-gray-600">No genotyped samples to plot</div>;
+  }
+
+  const { model, coordinates } = projection;
+  const groups = {};
+  coordinates.forEach((c) => {
+    const population = c.population || 'Unassigned';
+    (groups[population] = groups[population] || []).push({
+      sample_id: c.sample_id,
+      pc1: c.components[0],
+      pc2: c.components[1],
+    });
+  });
+  const axisLabel = (i) => `PC${i + 1} (${(100 * model.explained_variance[i]).toFixed(1)}%)`;
+
+  return (
+    <div>
+      <ResponsiveContainer width="100%" height={400}>
+        <ScatterChart margin={{ top: 10, right: 20, bottom: 30, left: 20 }}>
+          <CartesianGrid strokeDasharray="3 3" />
+          <XAxis type="number" dataKey="pc1" name="PC1" label={{ value: axisLabel(0), position: 'bottom' }} />
+          <YAxis type="number" dataKey="pc2" name="PC2" label={{ value: axisLabel(1), angle: -90, position: 'insideLeft' }} />
+          <Tooltip
+            cursor={{ strokeDasharray: '3 3' }}
+            formatter={(value) => value.toFixed(2)}
+            labelFormatter={() => ''}
+          />
+          <Legend verticalAlign="top" />
+          {Object.entries(groups).map(([population, points], index) => (
+            <Scatter key={population} name={population} data={points} fill={COLORS[index % COLORS.length]} />
+          ))}
+        </ScatterChart>
+      </ResponsiveContainer>
+      <p className="text-xs text-gray-500 mt-2">
+        Projected onto {model.reference_dataset} ({model.reference_samples.toLocaleString()} reference samples,{' '}
+        {model.sites.toLocaleString()} sites)
+      </p>
+    </div>
+  );
+};
+
 export const HealthMarkersSection = ({ markers }) => {
   if (!markers || markers.length === 0) {
     return <div className="p-4 text-gray-600">No health markers identified</div>;
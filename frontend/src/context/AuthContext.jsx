@@ -46,6 +46,47 @@ export const AuthProvider = ({ children }) => {
     }
   }, [api]);
 
+  // EventSource cannot send headers, so each connection uses a short-lived stream ticket in the
+  // query string (never the access token). A ticket only opens a connection: after an error the
+  // stream is reopened with a new one instead of letting EventSource retry with the old URL.
+  const openEventStream = useCallback((path) => {
+    const listeners = [];
+    let source = null;
+    let retry = null;
+    let closed = false;
+
+    const reconnect = () => {
+      if (!closed) retry = setTimeout(connect, 3000);
+    };
+    const connect = async () => {
+      try {
+        const response = await api.post(`${path}/ticket`);
+        if (closed) return;
+        source = new EventSource(`${API_BASE}${path}?ticket=${encodeURIComponent(response.data.ticket)}`);
+        listeners.forEach(([type, listener]) => source.addEventListener(type, listener));
+        source.onerror = () => {
+          source.close();
+          reconnect();
+        };
+      } catch (err) {
+        reconnect();
+      }
+    };
+    connect();
+
+    return {
+      addEventListener: (type, listener) => {
+        listeners.push([type, listener]);
+        if (source) source.addEventListener(type, listener);
+      },
+      close: () => {
+        closed = true;
+        clearTimeout(retry);
+        if (source) source.close();
+      },
+    };
+  }, [token]);
+
   const logout = useCallback(() => {
     localStorage.removeItem('access_token');
     localStorage.removeItem('refresh_token');
@@ -63,6 +104,7 @@ export const AuthProvider = ({ children }) => {
       login,
       logout,
       api,
+      openEventStream,
       isAuthenticated: !!token,
     }}>
       {children}
@@ -1,30 +1,83 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import { useAuth } from '../context/AuthContext';
-import { ResultsVisualization } from '../components/Results';
+import { ResultsVisualization, PcaScatterPlot } from '../components/Results';
 import { AuditLog, ResearchDisclaimer, ConsentBanner } from '../components/Common';
 
 export const DashboardPage = () => {
-  const { user, api } = useAuth();
+  const { user, api, openEventStream } = useAuth();
   const [samples, setSamples] = useState([]);
   const [loading, setLoading] = useState(true);
   const [selectedStatus, setSelectedStatus] = useState(null);
+  const [projection, setProjection] = useState(null);
+
+  const fetchSamples = useCallback(async () => {
+    try {
+      const params = selectedStatus ? { status: selectedStatus } : {};
+      const response = await api.get('/samples', { params });
+      setSamples(response.data.samples);
+    } catch (err) {
+      console.error('Failed to load samples', err);
+    } finally {
+      setLoading(false);
+    }
+  }, [api, selectedStatus]);
+
+  useEffect(() => {
+    fetchSamples();
+  }, [fetchSamples]);
+
+  // Live updates instead of polling: patch the list from pushed sample events
+  const connected = useRef(false);
+  useEffect(() => {
+    const source = openEventStream('/samples/events');
+    connected.current = false;
+
+    // `ready` follows every (re)connect; events may have been missed while disconnected
+    source.addEventListener('ready', () => {
+      if (connected.current) fetchSamples();
+      connected.current = true;
+    });
+    source.addEventListener('resync', fetchSamples);
+
+    const applyEvent = (message) => {
+      const event = JSON.parse(message.data);
+      setSamples((previous) => {
+        const others = previous.filter((s) => s.id !== event.id);
+        if (event.type === 'sample.deleted' || (selectedStatus && event.status !== selectedStatus)) {
+          return others;
+        }
+        if (others.length < previous.length) {
+          return previous.map((s) => (s.id === event.id ? { ...s, status: event.status } : s));
+        }
+        return [
+          { id: event.id, sample_id: event.sample_id, status: event.status, uploaded_at: event.uploaded_at },
+          ...previous,
+        ];
+      });
+    };
+    ['sample.created', 'sample.status', 'sample.results_ready', 'sample.deleted'].forEach((type) =>
+      source.addEventListener(type, applyEvent)
+    );
+
+    return () => source.close();
+  }, [openEventStream, fetchSamples, selectedStatus]);
 
   useEffect(() => {
-    const fetchSamples = async () => {
+    const fetchProjection = async () => {
       try {
-        const params = selectedStatus ? { status: selectedStatus } : {};
-        const response = await api.get('/samples', { params });
-        setSamples(response.data.samples);
+        const response = await api.post('/ancestry/pca', {});
+        setProjection(response.data);
       } catch (err) {
-        console.error('Failed to load samples', err);
-      } finally {
-        setLoading(false);
+        // 404 until a reference PCA model has been fitted
+        if (err.response?.status !== 404) {
+          console.error('Failed to load PCA projection', err);
+        }
       }
     };
 
-    fetchSamples();
-  }, [api, selectedStatus]);
+    fetchProjection();
+  }, [api]);
 
   const statusCounts = {
     'Received': samples.filter(s => s.status === 'Received').length,
@@ -57,6 +110,14 @@ export const DashboardPage = () => {
         </div>
       </div>
 
+      {/* Ancestry PCA */}
+      {projection && (
+        <div className="bg-white border border-gray-200 rounded-lg p-6">
+          <h2 className="text-xl font-bold text-gray-900 mb-4">Ancestry PCA</h2>
+          <PcaScatterPlot projection={projection} />
+        </div>
+      )}
+
       {/* Samples Table */}
       <div className="bg-white border border-gray-200 rounded-lg p-6">
         <h2 className="text-xl font-bold text-gray-900 mb-4">Samples</h2>
@@ -120,7 +181,7 @@ export const DashboardPage = () => {
                       </span>
                     </td>
                     <td className="p-3 text-sm text-gray-600">
-                      {new Date(sample.uploaded_at).toLocaleDateString()}
+                      {sample.uploaded_at ? new Date(sample.uploaded_at).toLocaleDateString() : '—'}
                     </td>
                     <td className="p-3">
                       <SampleResultLink sampleId={sample.id} />